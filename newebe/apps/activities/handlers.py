@@ -1,8 +1,12 @@
 import logging
 
-from newebe.lib import date_util
+from tornado import gen
+from tornado.web import asynchronous
+
+from newebe.lib import date_util, async_db
+from newebe.lib.response_cache import cached
 from newebe.apps.core.handlers import NewebeAuthHandler
-from newebe.apps.activities.models import ActivityManager, Activity
+from newebe.apps.activities.models import ActivityManager
 
 
 logger = logging.getLogger("newebe.activities")
@@ -14,6 +18,9 @@ class ActivityHandler(NewebeAuthHandler):
     GET : Retrieves last LIMIT activities published before a given date.
     '''
 
+    @cached("Activity", "MicroPost", "Picture", "Common")
+    @asynchronous
+    @gen.coroutine
     def get(self, startKey=None):
         '''
         Return activities by pack of LIMIT at JSON format. If a start key
@@ -26,21 +33,15 @@ class ActivityHandler(NewebeAuthHandler):
         '''
         if startKey:
             dateString = date_util.get_db_utc_date_from_url_date(startKey)
-            docs = ActivityManager.get_all(startKey=dateString, tag="all")
+            docs = yield async_db.run(ActivityManager.get_all,
+                                      startKey=dateString, tag="all")
         else:
-            docs = ActivityManager.get_all()
-
-        for doc in docs:
-            try:
-                subdoc = Activity.get_db().get(doc.docId)
-                doc.subdoc = subdoc
-            except:
-                pass
+            docs = yield async_db.run(ActivityManager.get_all)
 
+        yield async_db.run(ActivityManager.set_subdocs, docs)
         self.return_documents(docs)
 
 
-
 class MyActivityHandler(NewebeAuthHandler):
     '''
     This handler handles requests that retrieve lists of activities of
@@ -48,6 +49,7 @@ class MyActivityHandler(NewebeAuthHandler):
     GET : Retrieve last LIMIT activities published before a given date.
     '''
 
+    @cached("Activity")
     def get(self, startKey=None):
         '''
         Return activities by pack of LIMIT at JSON format. If a start key
@@ -44,6 +44,24 @@ class ActivityManager:
         return DocumentManager.get_documents(Activity, "activities/all",
                 startKey=startKey, limit=activity_settings.LIMIT + 1)
 
+    @staticmethod
+    def set_subdocs(activities):
+        '''
+        Sets on each activity the document it is linked to (as *subdoc*
+        field). Linked documents are retrieved with a single request.
+        '''
+
+        ids = [activity.docId for activity in activities]
+        if ids:
+            rows = Activity.get_db().all_docs(keys=ids, include_docs=True)
+            subdocs = dict((row["key"], row["doc"]) for row in rows
+                           if row.get("doc"))
+
+            for activity in activities:
+                subdoc = subdocs.get(activity.docId)
+                if subdoc is not None:
+                    activity.subdoc = subdoc
+
 
 class Activity(NewebeDocument):
     '''
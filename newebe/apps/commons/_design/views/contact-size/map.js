@@ -0,0 +1,9 @@
+function(doc) {
+  if("Common" == doc.doc_type && false == doc.isMine) {
+    var size = 0;
+    for(var name in doc._attachments) {
+      size += doc._attachments[name].length;
+    }
+    emit(doc._id, size);
+  }
+}
@@ -0,0 +1,5 @@
+function(doc) {
+  if("Common" == doc.doc_type && false == doc.isMine && !doc.isFile) {
+      emit(doc.date, doc);
+  }
+}
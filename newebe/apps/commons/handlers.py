@@ -1,9 +1,9 @@
 import logging
 import mimetypes
+import functools
 
 from tornado import gen
 from tornado.web import asynchronous
-from tornado.httpclient import HTTPError
 from tornado.escape import json_decode, json_encode
 from couchdbkit.exceptions import ResourceNotFound
 
@@ -14,8 +14,13 @@ from newebe.apps.contacts.models import ContactManager
 from newebe.apps.activities.models import ActivityManager
 from newebe.apps.commons.models import CommonManager, Common
 from newebe.apps.news.models import MicroPostManager
-from newebe.lib import date_util
+from newebe.lib import date_util, async_db
 from newebe.lib.http_util import ContactClient
+from newebe.lib.rate_limit import rate_limited
+from newebe.lib.response_cache import cached
+from newebe.lib.couchdb_util import save_with_attachments
+from newebe.lib.download_manager import download_manager
+from newebe.lib.prefetcher import prefetcher
 
 logger = logging.getLogger("newebe.commons")
 
@@ -30,6 +35,7 @@ class CommonsHandler(NewebeAuthHandler):
     * POST: Create a common.
     '''
 
+    @cached("Common")
     def get(self, startKey=None, tag=None):
         '''
         Returns last posted commons.  If *startKey* is provided, it returns
@@ -87,6 +93,7 @@ class CommonsMyHandler(NewebeAuthHandler):
     * GET: Retrieves last commons posted by newebe owner.
     * POST: Creates a common.
     '''
+    @cached("Common")
     def get(self, startKey=None, tag=None):
         '''
         Returns last posted commons.
@@ -156,6 +163,7 @@ class CommonContactHandler(NewebeHandler):
     * PUT :  Deletes a common.
     '''
 
+    @rate_limited
     def post(self):
         '''
         Extract common and file linked to the common from request, then
@@ -205,6 +213,7 @@ class CommonContactHandler(NewebeHandler):
         else:
             self.return_failure("No data sent.", 405)
 
+    @rate_limited
     def put(self):
         '''
         Delete common of which data are given inside request.
@@ -276,6 +285,9 @@ class CommonFileHandler(NewebeAuthHandler):
         '''
         Returns file linked to given common.
         '''
+        if not common.isMine:
+            prefetcher.record_view(common.authorKey)
+
         try:
             file = common.fetch_attachment(self.filename)
             self.set_header("Content-Type", common.contentType)
@@ -319,49 +331,81 @@ class CommonHandler(CommonObjectHandler):
             self.return_failure("Common not found.", 404)
 
 
-class CommonDownloadHandler(CommonObjectHandler):
+@gen.coroutine
+def download_common(common):
     '''
-    Handler that allows newebe owner to download original file of the common
-    inside its newebe to make it available through UI.
+    Downloads file of contact *common* from its author. Calls made while the
+    common is downloading wait for the running download. Returns the size
+    of downloaded file.
     '''
+    user = yield async_db.run(UserManager.getUser)
+    contact = yield async_db.run(
+        ContactManager.getTrustedContact, common.authorKey)
+    if contact is None:
+        raise ValueError("Common author is not a trusted contact.")
 
-    @asynchronous
-    def on_common_found(self, common, id):
-        '''
-        '''
-        self.common = common
+    data = dict()
+    data["common"] = common.toDict(localized=False)
+    data["contact"] = user.asContact().toDict()
 
-        data = dict()
-        data["common"] = common.toDict(localized=False)
-        data["contact"] = UserManager.getUser().asContact().toDict()
+    size = yield download_manager.download(
+        common._id, contact, u"commons/contact/download/",
+        json_encode(data), functools.partial(save_common_file, common))
+    raise gen.Return(size)
 
-        contact = ContactManager.getTrustedContact(common.authorKey)
 
-        client = ContactClient()
-        body = json_encode(data)
+def save_common_file(common, common_file):
+    '''
+    Attaches downloaded file to *common*, then marks it as downloaded inside
+    its micropost. Returns the size of the file. Blocking, it is run inside
+    the database thread pool.
+    '''
+    content = common_file.read()
+    common.isFile = True
+    save_with_attachments(common, {common.path: content})
 
-        try:
-            client.post(contact,  u"commons/contact/download/",
-                        body, self.on_download_finished)
-        except HTTPError:
-            self.return_failure("Cannot download common from contact.")
+    micropost = MicroPostManager.get_common_micropost(common._id)
+    if micropost is not None and \
+       common._id in micropost.commons_to_download:
+        micropost.commons.append(common._id)
+        micropost.commons_to_download.remove(common._id)
+        micropost.save()
+
+    return len(content)
+
+
+class CommonPrefetchSource(object):
+    '''
+    Contact commons of which file is downloaded in background by the
+    prefetcher.
+    '''
 
-    def on_download_finished(self, response):
-        logger.info(self.common)
+    def get_candidates(self, limit):
+        return CommonManager.get_commons_to_download(limit=limit)
 
-        if response.code == 200:
-            self.common.put_attachment(response.body, self.common.path)
-            self.common.isFile = True
-            self.common.save()
+    def get_disk_usage(self):
+        return CommonManager.get_contact_files_size()
 
-            micropost = MicroPostManager.get_common_micropost(self.common._id)
-            if micropost is not None:
-                micropost.commons.append(self.common._id)
-                micropost.commons_to_download.remove(self.common._id)
-                micropost.save()
+    def download(self, common):
+        return download_common(common)
 
+
+class CommonDownloadHandler(CommonObjectHandler):
+    '''
+    Handler that allows newebe owner to download original file of the common
+    inside its newebe to make it available through UI.
+    '''
+
+    @asynchronous
+    @gen.coroutine
+    def on_common_found(self, common, id):
+        '''
+        Downloads file from common author.
+        '''
+        try:
+            yield download_common(common)
             self.return_success("Common successfuly downloaded.")
-        else:
+        except Exception:
             self.return_failure("Common cannot be retrieved.")
 
 
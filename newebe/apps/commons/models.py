@@ -54,6 +54,25 @@ class CommonManager():
 
         return None
 
+    @staticmethod
+    def get_commons_to_download(limit=COMMON_LIMIT):
+        '''
+        Returns most recent contact commons of which file is not
+        downloaded yet.
+        '''
+        return Common.view("commons/to-download", descending=True,
+                           limit=limit)
+
+    @staticmethod
+    def get_contact_files_size():
+        '''
+        Returns size in bytes of files attached to contact commons.
+        '''
+        rows = Common.get_db().view("commons/contact-size").all()
+        if rows:
+            return rows[0]["value"]
+        return 0
+
 
 class Common(NewebeDocument):
     '''
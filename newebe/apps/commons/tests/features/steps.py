@@ -18,7 +18,7 @@ from newebe.lib.upload_util import encode_multipart_formdata
 from newebe.lib import date_util
 from newebe.lib.slugify import slugify
 from newebe.lib.test_util import NewebeClient, reset_documents, \
-                                 SECOND_NEWEBE_ROOT_URL, db2
+                                 SECOND_NEWEBE_ROOT_URL, get_db2
 
 TEST_COMMON = "newebe/apps/commons/tests/vimqrc.pdf"
 
@@ -26,7 +26,7 @@ TEST_COMMON = "newebe/apps/commons/tests/vimqrc.pdf"
 def set_browsers():
 
     reset_documents(Contact, ContactManager.getContacts)
-    reset_documents(Contact, ContactManager.getContacts, db2)
+    reset_documents(Contact, ContactManager.getContacts, get_db2())
 
     world.browser = NewebeClient()
     world.browser.set_default_user()
@@ -52,10 +52,10 @@ def set_browsers():
 def delete_commons(scenario):
 
     reset_documents(Common, CommonManager.get_last_commons)
-    reset_documents(Common, CommonManager.get_last_commons, db2)
+    reset_documents(Common, CommonManager.get_last_commons, get_db2())
 
     reset_documents(Activity, ActivityManager.get_all)
-    reset_documents(Activity, ActivityManager.get_all, db2)
+    reset_documents(Activity, ActivityManager.get_all, get_db2())
 
 
 # Models
@@ -3,44 +3,32 @@ import logging
 
 from tornado.web import asynchronous
 from tornado.escape import json_decode
-from tornado.websocket import WebSocketHandler
 
 from newebe.lib.slugify import slugify
 from newebe.lib.http_util import ContactClient
+from newebe.lib.rate_limit import rate_limited, rate_limiter
+from newebe.lib.contact_health import contact_health
+from newebe.lib.events import channel
+from newebe.lib.response_cache import cached
 
 from newebe.apps.profile.models import UserManager
 from newebe.apps.contacts.models import Contact, ContactManager, ContactTag, \
                                STATE_WAIT_APPROVAL, STATE_ERROR, \
                                STATE_TRUSTED, STATE_PENDING
-from newebe.apps.core.handlers import NewebeAuthHandler, NewebeHandler
+from newebe.apps.core.handlers import NewebeAuthHandler, NewebeHandler, \
+                                      NewebePublishingHandler
 
 
 # Template handlers for contact pages.
 logger = logging.getLogger(__name__)
 
-# Long polling queue
-websocket_clients = []
 
-
-class ContactPublishingHandler(WebSocketHandler):
+class ContactPublishingHandler(NewebePublishingHandler):
     '''
-    Handler that manages websocket connections
-    TODO: Set authentication there.
+    Websocket handler that pushes contact updates to connected clients.
     '''
 
-    def open(self):
-        '''
-        Add a websocket client to the websocket pool.
-        '''
-        websocket_clients.append(self)
-        logger.info("New web socket client")
-
-    def on_close(self):
-        '''
-        Remove leaving websocket client from the websocket pool.
-        '''
-        websocket_clients.remove(self)
-        logger.info("A web socket client left")
+    topics = ["contacts"]
 
 
 class ContactUpdateHandler(NewebeHandler):
@@ -151,6 +139,26 @@ class ContactsTrustedHandler(NewebeAuthHandler):
         self.return_documents(contacts)
 
 
+class ContactsHealthHandler(NewebeAuthHandler):
+    '''
+     * GET : retrieve health (error rate, latency, circuit state) of contacts
+       requested by current worker.
+    '''
+
+    def get(self):
+        self.return_list(contact_health.get_status())
+
+
+class ContactsLimitsHandler(NewebeAuthHandler):
+    '''
+     * GET : retrieve counters of requests from contacts accepted or rejected
+       by rate limiting and load shedding on current worker.
+    '''
+
+    def get(self):
+        self.return_json(rate_limiter.metrics())
+
+
 class ContactHandler(NewebeAuthHandler):
     '''
     Resource to manage specific contacts.
@@ -256,6 +264,7 @@ class ContactsHandler(NewebeAuthHandler):
      * POST : creates a new contact.
     '''
 
+    @cached("Contact")
     def get(self):
         '''
         Retrieves whole contact list at JSON format.
@@ -394,6 +403,7 @@ class ContactPushHandler(NewebeHandler):
      * POST : asks for a contact authorization.
     '''
 
+    @rate_limited
     def post(self):
         '''
         Create a new contact from sent data (contact object at JSON format).
@@ -426,8 +436,7 @@ class ContactPushHandler(NewebeHandler):
                 contact.state = STATE_WAIT_APPROVAL
                 contact.save()
 
-                for websocket_client in websocket_clients:
-                    websocket_client.write_message(contact.toJson())
+                channel.publish("contacts", contact.toJson())
 
                 self.return_success("Request received.")
 
@@ -466,8 +475,7 @@ class ContactConfirmHandler(NewebeHandler):
                 #self.send_picture_to_contact(contact)
                 self.return_success("Contact trusted.")
 
-                for websocket_client in websocket_clients:
-                    websocket_client.write_message(contact.toJson())
+                channel.publish("contacts", contact.toJson())
 
             else:
                 self.return_failure("No contact for this slug.", 400)
@@ -17,7 +17,8 @@ from newebe.apps.activities.models import ActivityManager
 from newebe.apps.contacts.models import STATE_WAIT_APPROVAL, STATE_TRUSTED
 from newebe.apps.contacts.models import STATE_PENDING, STATE_ERROR
 
-from newebe.lib.test_util import NewebeClient, db, db2, reset_documents
+from newebe.lib.test_util import NewebeClient, get_db, get_db2, \
+    reset_documents
 from newebe.lib import date_util
 
 
@@ -27,13 +28,13 @@ from newebe.lib.test_util import ROOT_URL, SECOND_NEWEBE_ROOT_URL
 @step(u'Clear contacts')
 def clear_contacts(step):
     reset_documents(Contact, ContactManager.getContacts)
-    reset_documents(Contact, ContactManager.getContacts, db2)
+    reset_documents(Contact, ContactManager.getContacts, get_db2())
 
 @before.all
 def set_browers():
 
     reset_documents(Contact, ContactManager.getContacts)
-    reset_documents(Contact, ContactManager.getContacts, db2)
+    reset_documents(Contact, ContactManager.getContacts, get_db2())
     reset_documents(ContactTag, ContactManager.getTags)
 
     world.browser = NewebeClient()
@@ -67,7 +68,7 @@ def check_that_contact_has_same_properties_as_default_user(step):
 @step(u'Deletes contacts')
 def deletes_contacts(step):
     reset_documents(Contact, ContactManager.getContacts)
-    reset_documents(Contact, ContactManager.getContacts, db2)
+    reset_documents(Contact, ContactManager.getContacts, get_db2())
 
 
 @step(u'Creates contacts')
@@ -304,9 +305,9 @@ def send_a_retry_request_for_this_contact(step):
 # Timezone
 @step(u'Check that request date is set to "([a-zA-Z//]+)" timezone')
 def check_that_request_date_is_set_to_europe_paris_timezone(step, timezone):
-    Contact._db = db2
+    Contact._db = get_db2()
     contact = ContactManager.getRequestedContacts().first()
-    Contact._db = db
+    Contact._db = get_db()
 
     date = date_util.get_date_from_db_date(world.contacts[0]["requestDate"])
     tz = pytz.timezone(timezone)
@@ -0,0 +1,7 @@
+function(doc) {
+  if(!doc.isMine && ("MicroPost" == doc.doc_type
+                     || "Picture" == doc.doc_type
+                     || "Common" == doc.doc_type)) {
+    emit([doc.doc_type, doc.authorKey, doc.date], null);
+  }
+}
@@ -1,5 +1,5 @@
 function(doc) {
   if("LastSequence" == doc.doc_type) {
-    emit(doc.lastSequence, doc);
+    emit(doc.contactKey, doc);
   }
 }
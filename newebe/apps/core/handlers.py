@@ -1,23 +1,54 @@
 import logging
 import os
+import base64
 import hashlib
 import mimetypes
 
 
+from tornado import gen
 from tornado.escape import json_decode, json_encode
 from tornado.web import RequestHandler, asynchronous
+from tornado.websocket import WebSocketHandler
 from tornado.httpclient import HTTPError
-
-
-from newebe.lib import json_util, date_util
-from newebe.lib.http_util import ContactClient
-
+from tornado.httputil import parse_body_arguments
+from tornado.ioloop import IOLoop
+
+
+from newebe.lib import json_util, date_util, async_db, changes, gzip_util, \
+    assets
+from newebe.lib.http_util import ContactClient, GZIP_SUPPORT_HEADER
+from newebe.lib.events import channel
+from newebe.lib.websocket_hub import hub, is_topic_list
+from newebe.lib.response_cache import response_cache
+from newebe.lib.couchdb_util import view_stats
+from newebe.lib.view_warmer import view_warmer
+from newebe.lib.download_manager import download_manager
+from newebe.lib.prefetcher import prefetcher
+from newebe.lib.rate_limit import rate_limiter
+from newebe.lib.metrics import metrics, RequestStats, request_context, \
+    phase
+from newebe.lib.profiler import sampling_profiler, request_profiler
+
+from newebe.config import CONFIG
+from newebe.apps.core.models import get_db_server
 from newebe.apps.profile.models import UserManager
 from newebe.apps.contacts.models import ContactManager
 from newebe.apps.activities.models import Activity
 
 logger = logging.getLogger("newebe.core")
 
+metrics.gauge("newebe_websocket_clients", "Connected websocket clients.",
+              lambda: len(hub.clients))
+metrics.gauge("newebe_websocket_queued_messages",
+              "Messages waiting to be sent to websocket clients.",
+              lambda: hub.metrics()["queued"])
+metrics.gauge("newebe_rate_limited_in_flight",
+              "Rate limited requests being processed.",
+              lambda: rate_limiter.in_flight)
+metrics.gauge("newebe_contact_downloads",
+              "Running and queued downloads of contact files.",
+              lambda: len(download_manager.downloads))
+
 
 class NewebeHandler(RequestHandler):
     '''
@@ -25,16 +56,149 @@ class NewebeHandler(RequestHandler):
     by the newebe application.
     '''
 
+    # ETag of the response when it is known without hashing the body.
+    etag = None
+    # Set by the cached decorator: response is stored in the response cache
+    # under this key.
+    cache_key = None
+    cache_doc_types = ()
+    cache_generation = None
+    # Theme stylesheet presence, checked once.
+    theme_exists = None
+    # Set by the rate_limited decorator: request counts as in-flight until
+    # it finishes.
+    rate_limited = False
+    # Route pattern that matched the request, set by lazy handlers. It
+    # labels request metrics.
+    route = None
+    # Set when request is recorded by the request profiler.
+    profile = None
+
+    def set_default_headers(self):
+        '''
+        Tells other Newebes that request bodies can be sent compressed with
+        gzip.
+        '''
+
+        self.set_header(GZIP_SUPPORT_HEADER, "gzip")
+
+    def get_template_namespace(self):
+        '''
+        Makes URLs of hashed static assets available to templates.
+        '''
+
+        namespace = RequestHandler.get_template_namespace(self)
+        namespace["asset_url"] = assets.asset_url
+        return namespace
+
+    def prepare(self):
+        '''
+        Uncompresses request body if it is gzipped.
+        '''
+
+        if self.request.headers.get("Content-Encoding") == "gzip":
+            try:
+                self.request.body = gzip_util.decompress(
+                    self.request.body, CONFIG.main.max_body_size)
+            except (IOError, ValueError):
+                self.return_failure("Request body cannot be uncompressed.",
+                                    400)
+                return
+
+            del self.request.headers["Content-Encoding"]
+            content_type = self.request.headers.get("Content-Type", "")
+            parse_body_arguments(content_type, self.request.body,
+                                 self.request.body_arguments,
+                                 self.request.files)
+            for name, values in self.request.body_arguments.items():
+                self.request.arguments.setdefault(name, []).extend(values)
+
     def return_json(self, json, statusCode=200):
         '''
         Return a response containing json (content-type already set).
         '''
 
+        if not isinstance(json, basestring):
+            with phase("serialization"):
+                json = json_encode(json)
+
+        if self.cache_key is not None and statusCode == 200:
+            entry = response_cache.set(
+                self.cache_key, json, self.cache_doc_types,
+                self.cache_generation)
+            if entry is not None:
+                self.etag = entry.etag
+
         self.set_status(statusCode)
         self.set_header("Content-Type", "application/json")
         self.write(json)
         self.finish()
 
+    def compute_etag(self):
+        '''
+        Uses ETag set by handler (document revision or cached response ETag)
+        if any, else the hash of the response body.
+        '''
+
+        if self.etag is not None:
+            return self.etag
+        return RequestHandler.compute_etag(self)
+
+    def set_document_etag(self, document):
+        '''
+        Sets response ETag from *document* revision.
+        '''
+
+        rev = document._doc.get("_rev")
+        if rev:
+            self.etag = '"%s"' % rev
+
+    def _execute(self, transforms, *args, **kwargs):
+        '''
+        Serves request inside a stack context that counts its CouchDB calls
+        and times its phases. If its route is profiled, request is served
+        inside the stack context of the request profiler too.
+        '''
+
+        self.request_stats = RequestStats()
+        with request_context(self.request_stats):
+            self.profile = request_profiler.get_profile(self.route)
+            if self.profile is None:
+                RequestHandler._execute(self, transforms, *args, **kwargs)
+            else:
+                with self.profile.context():
+                    RequestHandler._execute(self, transforms, *args,
+                                            **kwargs)
+
+    def on_finish(self):
+        '''
+        Cached responses that depend on documents modified by the request
+        are dropped. Other workers are notified later by the changes
+        watcher. Request duration is given to the prefetcher, which pauses
+        when server is slow, and rate limited requests stop counting as
+        in-flight. Request metrics are recorded and phase timings of slow
+        requests are logged.
+        '''
+
+        duration = self.request.request_time()
+        route = self.route or type(self).__name__
+        metrics.observe_request(route, self.request.method,
+                                self.get_status(), duration,
+                                self.request_stats)
+        if duration > CONFIG.main.slow_request_threshold:
+            logger.warning("Slow request %s %s: %.3fs (%s)" % (
+                self.request.method, route, duration,
+                self.request_stats.get_summary()))
+        if self.profile is not None:
+            self.profile.request_finished()
+            self.profile = None
+        prefetcher.record_request(duration)
+        if self.rate_limited:
+            rate_limiter.release()
+            self.rate_limited = False
+        for doc_type in self.request_stats.doc_types:
+            response_cache.invalidate(doc_type)
+
     def return_list(self, valueList, statusCode=200):
         '''
         Return a response containing a list of values at json format.
@@ -47,23 +211,29 @@ class NewebeHandler(RequestHandler):
         Return a response containing a list of newebe documents at json format.
         '''
 
-        self.return_json(
-                json_util.get_json_from_doc_list(documents), statusCode)
+        with phase("serialization"):
+            json = json_util.get_json_from_doc_list(documents)
+        self.return_json(json, statusCode)
 
     def return_document(self, document, statusCode=200):
         '''
         Return a response containing a list of newebe documents at json format.
         '''
 
-        self.return_json(json_util.get_json_from_doc_list([document]),
-                                                          statusCode)
+        self.set_document_etag(document)
+        with phase("serialization"):
+            json = json_util.get_json_from_doc_list([document])
+        self.return_json(json, statusCode)
 
     def return_one_document(self, document, statusCode=200):
         '''
         Return document at JSON format.
         '''
 
-        self.return_json(document.toJson(), statusCode)
+        self.set_document_etag(document)
+        with phase("serialization"):
+            json = document.toJson()
+        self.return_json(json, statusCode)
 
     def return_one_document_or_404(self, document, text):
         '''
@@ -72,7 +242,7 @@ class NewebeHandler(RequestHandler):
         '''
 
         if document:
-            self.return_json(document.toJson())
+            self.return_one_document(document)
         else:
             self.return_failure(text, 404)
 
@@ -96,6 +266,22 @@ class NewebeHandler(RequestHandler):
 
         self.return_documents(docs)
 
+    @gen.coroutine
+    def return_documents_since_async(self, get_doc, startKey, tag=None):
+        '''
+        Same as return_documents_since, except that documents are retrieved
+        from the database thread pool. The IOLoop keeps serving other
+        requests while CouchDB answers.
+        '''
+
+        if startKey:
+            dateString = date_util.get_db_utc_date_from_url_date(startKey)
+            docs = yield async_db.run(get_doc, startKey=dateString, tag=tag)
+        else:
+            docs = yield async_db.run(get_doc)
+
+        self.return_documents(docs)
+
     def return_success(self, text, statusCode=200):
         '''
         Return a success response containing a JSON object that describes
@@ -208,6 +394,7 @@ class NewebeHandler(RequestHandler):
             method="POST"
         )
         self.activity.save()
+        channel.publish("activities", self.activity.toJson())
 
     def create_owner_deletion_activity(self, doc, verb, docType):
         '''
@@ -244,6 +431,7 @@ class NewebeHandler(RequestHandler):
             isMine=isMine
         )
         self.activity.save()
+        channel.publish("activities", self.activity.toJson())
 
     def create_modify_activity(self, contact, verb, docType, doc=None):
         '''
@@ -265,23 +453,41 @@ class NewebeHandler(RequestHandler):
              isMine=False
         )
         activity.save()
+        channel.publish("activities", activity.toJson())
 
-    @asynchronous
     def send_creation_to_contacts(self, path, doc):
         '''
         Sends a POST request to all trusted contacts.
 
-        Request body contains object to post at JSON format.
+        Request body contains object to post at JSON format. Sending goes on
+        in background, failures are logged.
+        '''
+
+        IOLoop.instance().add_future(
+            self._send_creation_to_contacts(path, doc), self.on_sending_done)
+
+    def on_sending_done(self, future):
+        '''
+        Logs errors raised while sending documents to contacts: nothing
+        yields these futures, so they would be lost otherwise.
         '''
 
+        if future.exception() is not None:
+            logger.error("Sending to contacts failed",
+                         exc_info=future.exc_info())
+
+    @gen.coroutine
+    def _send_creation_to_contacts(self, path, doc):
         tag = None
         if doc.tags:
             tag = doc.tags[0]
-        contacts = ContactManager.getTrustedContacts(tag=tag)
+        contacts = yield async_db.run(ContactManager.getTrustedContacts,
+                                      tag=tag)
         client = ContactClient(self.activity)
+        body = doc.toJson(localized=False)
         for contact in contacts:
             try:
-                client.post(contact, path, doc.toJson(localized=False))
+                client.post(contact, path, body)
             except HTTPError:
                 self.activity.add_error(contact)
                 self.activity.save()
@@ -302,16 +508,23 @@ class NewebeHandler(RequestHandler):
             self.activity.add_error(contact)
             self.activity.save()
 
-    @asynchronous
     def send_files_to_contacts(self, path, fields, files, tag=None):
         '''
         Sends in a form given file and fields to all trusted contacts (at given
         path).
 
-        If any error occurs, it is stored in linked activity.
+        If any error occurs, it is stored in linked activity. Sending goes on
+        in background, failures are logged.
         '''
 
-        contacts = ContactManager.getTrustedContacts(tag=tag)
+        IOLoop.instance().add_future(
+            self._send_files_to_contacts(path, fields, files, tag),
+            self.on_sending_done)
+
+    @gen.coroutine
+    def _send_files_to_contacts(self, path, fields, files, tag=None):
+        contacts = yield async_db.run(ContactManager.getTrustedContacts,
+                                      tag=tag)
         if not hasattr(self, "activity"):
             self.activity = None
         client = ContactClient(self.activity)
@@ -350,10 +563,13 @@ class NewebeHandler(RequestHandler):
         optional. So, for templates, it is useful to know if it exists.
         '''
 
-        import newebe
-        dirpath, filename = os.path.split(os.path.abspath(newebe.__file__))
-        return os.path.isfile(os.path.join(
-            dirpath, "static", "css", "theme.css"))
+        if NewebeHandler.theme_exists is None:
+            import newebe
+            dirpath, filename = \
+                os.path.split(os.path.abspath(newebe.__file__))
+            NewebeHandler.theme_exists = os.path.isfile(os.path.join(
+                dirpath, "static", "css", "theme.css"))
+        return NewebeHandler.theme_exists
 
 
 class NewebeAuthHandler(NewebeHandler):
@@ -369,7 +585,12 @@ class NewebeAuthHandler(NewebeHandler):
         Simple turn around to finish the request if user is not authenticated.
         '''
 
-        user = self.current_user
+        NewebeHandler.prepare(self)
+        if self._finished:
+            return
+
+        with phase("auth"):
+            user = self.current_user
         if not user:
             self._finished = True
 
@@ -401,6 +622,293 @@ class NewebeAuthHandler(NewebeHandler):
             logger.error("User is not registered")
             self.redirect("/#register")
 
+
+class NewebePublishingHandler(WebSocketHandler):
+    '''
+    Base handler for websocket connections. Connected clients receive events
+    of the topics they are subscribed to through the websocket hub. Default
+    topics are set by *topics* attribute, then client can change its
+    subscriptions by sending messages like:
+
+        {"subscribe": ["activities", "pictures"]}
+        {"unsubscribe": ["microposts"]}
+
+    Only the authenticated owner can open a connection.
+    '''
+
+    topics = []
+
+    def open(self):
+        '''
+        Registers websocket client to the hub if it is authenticated.
+        '''
+
+        user = UserManager.getUser()
+        password = self.get_secure_cookie("password")
+
+        if not user or not user.password or not password or \
+           user.password != hashlib.sha224(password).hexdigest():
+            logger.error("Web socket client is not authenticated")
+            self.close()
+
+        else:
+            self.register()
+            logger.info("New web socket client")
+
+    def register(self):
+        '''
+        Adds authenticated client to the hub.
+        '''
+
+        hub.register(self, self.topics)
+
+    def on_message(self, message):
+        '''
+        Updates client subscriptions.
+        '''
+
+        try:
+            data = json_decode(message)
+        except ValueError:
+            logger.error("Malformed web socket message")
+            return
+
+        if not isinstance(data, dict):
+            logger.error("Malformed web socket message")
+            return
+
+        subscribed = data.get("subscribe", [])
+        unsubscribed = data.get("unsubscribe", [])
+        if not is_topic_list(subscribed) or not is_topic_list(unsubscribed):
+            logger.error("Web socket subscriptions are not lists of topics")
+            return
+
+        hub.subscribe(self, subscribed)
+        hub.unsubscribe(self, unsubscribed)
+
+    def on_pong(self, data):
+        hub.on_pong(self)
+
+    def on_close(self):
+        '''
+        Removes leaving websocket client from the hub.
+        '''
+
+        hub.unregister(self)
+        logger.info("A web socket client left")
+
+
+class ChangesPublishingHandler(NewebePublishingHandler):
+    '''
+    Websocket handler that streams changes of every document type. When a
+    client reconnects with a *since* argument set to the last sequence it
+    received, missed changes are sent before live ones. Live changes that
+    occur during this catch-up may be received twice, clients should ignore
+    events with an already received sequence.
+
+    If too many changes were missed, a reset message is sent instead:
+    client should reload its data then resume from given sequence.
+
+        {"reset": true, "seq": 42}
+
+    If too many live changes occur during catch-up, connection is closed
+    instead of dropping some of them: client should reconnect with the last
+    sequence it received.
+    '''
+
+    topics = ["changes"]
+
+    def register(self):
+        since = self.get_argument("since", None)
+        hub.register(self, self.topics, paused=since is not None)
+        if since is not None:
+            self.send_changes_since(since)
+
+    @gen.coroutine
+    def send_changes_since(self, since):
+        '''
+        Sends changes that occured after sequence *since* then resumes
+        delivery of live changes.
+        '''
+
+        try:
+            events, last_seq, has_more = yield async_db.run(
+                changes.get_changes, get_db_server()[CONFIG.db.name],
+                since)
+        except Exception:
+            logger.exception("Cannot read changes since %s" % since)
+            self.close()
+            return
+
+        if self not in hub.clients:
+            # Connection was closed while changes were read.
+            return
+
+        if has_more:
+            self.write_message({"reset": True, "seq": last_seq})
+        else:
+            for event in events:
+                self.write_message(event)
+        hub.resume(self)
+
+
+class PublisherMetricsHandler(NewebeAuthHandler):
+    '''
+    GET: Returns websocket hub counters (connected clients, subscriptions by
+    topic, queued, sent and dropped messages).
+    '''
+
+    def get(self):
+        self.return_json(hub.metrics())
+
+
+class DatabaseMetricsHandler(NewebeAuthHandler):
+    '''
+    GET: Returns view query timings and view warm-up counters (pending
+    writes, lag of indexes...). Warm-ups run on the main worker only.
+    '''
+
+    def get(self):
+        self.return_json({
+            "views": view_stats.report(),
+            "warmup": view_warmer.metrics()
+        })
+
+
+class MetricsHandler(NewebeAuthHandler):
+    '''
+    GET: Returns metrics of current worker at Prometheus text format.
+    Scrapers can authenticate with HTTP basic auth: password is the Newebe
+    password, user name is ignored.
+
+    Metrics are not aggregated: when several workers serve Newebe, a scrape
+    of the main port reaches one of them only. Each worker serves its own
+    metrics on metrics port plus its number when *metrics_port* is set.
+    '''
+
+    def get_current_user(self):
+        authorization = self.request.headers.get("Authorization", "")
+        if not authorization.startswith("Basic "):
+            return NewebeAuthHandler.get_current_user(self)
+
+        try:
+            password = base64.b64decode(authorization[6:]).split(":", 1)[1]
+        except (TypeError, IndexError):
+            password = None
+
+        user = UserManager.getUser()
+        if user and user.password and password and \
+           user.password == hashlib.sha224(password).hexdigest():
+            return user
+
+        self.set_status(401)
+        self.set_header("WWW-Authenticate", 'Basic realm="Newebe"')
+        self.finish()
+        return None
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(metrics.export())
+
+
+class ProfilerHandler(NewebeAuthHandler):
+    '''
+    Base handler for profiling of current worker.
+    '''
+
+    def get_duration(self, default):
+        '''
+        Returns duration argument (seconds), None if it is not valid (and
+        an error response is sent).
+        '''
+        try:
+            duration = float(self.get_argument("duration", default))
+        except ValueError:
+            duration = None
+
+        if duration is None or duration <= 0 or \
+           duration > CONFIG.main.profiler_max_duration:
+            self.return_failure("Duration must be a number of seconds, "
+                                "between 0 and %s." %
+                                CONFIG.main.profiler_max_duration, 400)
+            return None
+        return duration
+
+
+class ProfilerSamplingHandler(ProfilerHandler):
+    '''
+    POST: Samples stacks of every thread of current worker during given
+    duration (duration argument, 10 seconds by default). Returns stacks at
+    collapsed format (flamegraph.pl, speedscope).
+    '''
+
+    @asynchronous
+    @gen.coroutine
+    def post(self):
+        duration = self.get_duration(10)
+        if duration is None:
+            return
+        if sampling_profiler.is_running():
+            self.return_failure("Sampling is already running.", 409)
+            return
+
+        stacks = yield sampling_profiler.start(duration)
+        self.set_header("Content-Type", "text/plain")
+        self.write(stacks)
+        self.finish()
+
+
+class ProfilerRequestsHandler(ProfilerHandler):
+    '''
+    POST: Profiles with cProfile the next requests (count argument, 10 by
+    default) of given route (route argument, a pattern from routes.py).
+    Profiling stops after given duration (duration argument, maximum
+    duration by default) if less requests are received. Returns a pstats
+    dump.
+    '''
+
+    @asynchronous
+    @gen.coroutine
+    def post(self):
+        route = self.get_argument("route", None)
+        try:
+            count = int(self.get_argument("count", 10))
+        except ValueError:
+            count = 0
+        duration = self.get_duration(CONFIG.main.profiler_max_duration)
+        if duration is None:
+            return
+        if not route or count <= 0:
+            self.return_failure("A route and a positive request count are "
+                                "required.", 400)
+            return
+        if request_profiler.is_running():
+            self.return_failure("Requests are already profiled.", 409)
+            return
+
+        stats = yield request_profiler.start(route, count, duration)
+        self.set_header("Content-Type", "application/octet-stream")
+        self.set_header("Content-Disposition",
+                        'attachment; filename="newebe.pstats"')
+        self.write(stats)
+        self.finish()
+
+
+class DownloadsHandler(NewebeAuthHandler):
+    '''
+    GET: Returns progress of running and queued downloads of contact files
+    handled by current worker, and state of background prefetch.
+    '''
+
+    def get(self):
+        downloads = download_manager.get_progress()
+        self.return_json({
+            "rows": downloads,
+            "total_rows": len(downloads),
+            "prefetch": prefetcher.get_status()
+        })
+
+
 class IndexTHandler(NewebeHandler):
     def get(self):
         self.render("templates/base.html")
@@ -6,19 +6,32 @@ utc = pytz.utc
 
 from tornado.escape import json_encode
 
-from couchdbkit import Server
 from couchdbkit.schema import Document, StringProperty, \
                                          DateTimeProperty, \
                                          ListProperty
 
 from newebe.config import CONFIG
 
+from newebe.lib.couchdb_util import get_server
+from newebe.lib.metrics import record_write
 from newebe.lib.date_util import get_date_from_db_date, \
                                  get_db_date_from_date, \
                                  convert_utc_date_to_timezone
 
 logger = logging.getLogger("newebe.core")
-server = Server()
+
+# Created at first use, once config is loaded.
+server = None
+
+
+def get_db_server():
+    '''
+    Returns the CouchDB server that stores Newebe documents.
+    '''
+    global server
+    if server is None:
+        server = get_server()
+    return server
 
 # Base document
 
@@ -81,11 +94,40 @@ class NewebeDocument(Document):
     def save(self):
         '''
         When document is saved if its date is null, it is set to now.
+        Modifications are recorded in current request statistics, so
+        cached responses depending on this document type are dropped.
         '''
 
         if self.date is None:
             self.date = datetime.datetime.utcnow()
         super(Document, self).save()
+        record_write(self.doc_type)
+
+    def delete(self):
+        '''
+        Deletions are recorded in current request statistics, like saves.
+        '''
+        super(NewebeDocument, self).delete()
+        record_write(self.doc_type)
+
+    def put_attachment(self, *args, **kwargs):
+        '''
+        Attachment modifications are recorded in current request statistics,
+        like saves.
+        '''
+        result = super(NewebeDocument, self).put_attachment(*args, **kwargs)
+        record_write(self.doc_type)
+        return result
+
+    def delete_attachment(self, *args, **kwargs):
+        '''
+        Attachment modifications are recorded in current request statistics,
+        like saves.
+        '''
+        result = super(NewebeDocument, self).delete_attachment(*args,
+                                                               **kwargs)
+        record_write(self.doc_type)
+        return result
 
     @classmethod
     def get_db(cls):
@@ -94,7 +136,7 @@ class NewebeDocument(Document):
         '''
         db = getattr(cls, '_db', None)
         if db is None:
-            db = server.get_or_create_db(CONFIG.db.name)
+            db = get_db_server().get_or_create_db(CONFIG.db.name)
             cls._db = db
         return db
 
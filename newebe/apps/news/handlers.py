@@ -1,19 +1,21 @@
 import logging
-import markdown
 
 from tornado import gen
 from tornado.web import asynchronous
-from tornado.websocket import WebSocketHandler
 from tornado.escape import json_encode
 from couchdbkit.exceptions import ResourceNotFound
 
-from newebe.lib import date_util, indexer
+from newebe.lib import date_util, indexer, async_db, markdown_util
+from newebe.lib.events import channel
+from newebe.lib.response_cache import cached
 from newebe.lib.http_util import ContactClient
+from newebe.lib.rate_limit import rate_limited
 from newebe.apps.news.models import MicroPostManager, MicroPost
 from newebe.apps.activities.models import ActivityManager
 from newebe.apps.contacts.models import ContactManager
 from newebe.apps.profile.models import UserManager
-from newebe.apps.core.handlers import NewebeHandler, NewebeAuthHandler
+from newebe.apps.core.handlers import NewebeHandler, NewebeAuthHandler, \
+                                      NewebePublishingHandler
 from newebe.apps.core.attach import Converter
 
 logger = logging.getLogger("newebe.news")
@@ -23,29 +25,13 @@ logger = logging.getLogger("newebe.news")
 # (contact URI + CONTACT_PATH).
 CONTACT_PATH = 'microposts/contacts/'
 
-# Long polling queue
-websocket_clients = []
 
-
-class MicropostPublishingHandler(WebSocketHandler):
+class MicropostPublishingHandler(NewebePublishingHandler):
     '''
-    Handler that manages websocket connections
-    TODO: Set authentication there.
+    Websocket handler that pushes new microposts to connected clients.
     '''
 
-    def open(self):
-        '''
-        Add a websocket client to the websocket pool.
-        '''
-        websocket_clients.append(self)
-        logger.info("New web socket client")
-
-    def on_close(self):
-        '''
-        Remove leaving websocket client from the websocket pool.
-        '''
-        websocket_clients.remove(self)
-        logger.info("A web socket client left")
+    topics = ["microposts"]
 
 
 class MicropostHandler(NewebeAuthHandler):
@@ -85,8 +71,7 @@ class MicropostHandler(NewebeAuthHandler):
                 self.create_owner_deletion_activity(
                     micropost, "deletes", "micropost")
                 self.send_deletion_to_contacts(CONTACT_PATH, micropost)
-            postIndexer = indexer.Indexer()
-            postIndexer.remove_doc(micropost)
+            indexer.index_writer.remove_doc(micropost)
             micropost.delete()
             self.return_success("Micropost deletion succeeds.")
 
@@ -101,7 +86,9 @@ class NewsHandler(NewebeAuthHandler):
     POST : Creates a new microposts and forward the activity to contacts.
     '''
 
+    @cached("MicroPost")
     @asynchronous
+    @gen.coroutine
     def get(self, startKey=None, tag=None):
         '''
         Return microposts by pack of NEWS_LIMIT at JSON format. If a start key
@@ -112,9 +99,11 @@ class NewsHandler(NewebeAuthHandler):
             *startKey* The date from where news should be returned.
         '''
 
-        self.return_documents_since(MicroPostManager.get_list, startKey, tag)
+        yield self.return_documents_since_async(
+            MicroPostManager.get_list, startKey, tag)
 
     @asynchronous
+    @gen.coroutine
     def post(self):
         '''
         When post request is received, micropost data are expected as
@@ -130,25 +119,10 @@ class NewsHandler(NewebeAuthHandler):
         data = self.get_body_as_dict(expectedFields=["content", "tags"])
 
         if data and data["content"]:
-            user = UserManager.getUser()
-            converter = Converter()
-            micropost = MicroPost(
-                authorKey=user.key,
-                author=user.name,
-                content=data['content'],
-                attachments=converter.convert(data),
-                tags=data["tags"],
-                pictures=data.get("pictures", []),
-                commons=data.get("commons", [])
-            )
-            micropost.save()
-            converter.add_files(micropost)
-
-            self.create_owner_creation_activity(micropost,
-                                                "writes", "micropost")
+            micropost = yield async_db.run(self.save_micropost, data)
+
             self.send_creation_to_contacts(CONTACT_PATH, micropost)
-            postIndexer = indexer.Indexer()
-            postIndexer.index_micropost(micropost)
+            yield indexer.index_writer.index_micropost(micropost)
 
             logger.info("Micropost successfuly posted.")
             self.return_json(micropost.toJson())
@@ -157,12 +131,40 @@ class NewsHandler(NewebeAuthHandler):
             self.return_failure(
                     "Sent data were incorrects. No post was created.", 400)
 
+    def save_micropost(self, data):
+        '''
+        Creates a micropost from *data*, attaches to it linked files and
+        creates the corresponding activity. Blocking, it is run inside the
+        database thread pool.
+        '''
+
+        user = UserManager.getUser()
+        converter = Converter()
+        micropost = MicroPost(
+            authorKey=user.key,
+            author=user.name,
+            content=data['content'],
+            attachments=converter.convert(data),
+            tags=data["tags"],
+            pictures=data.get("pictures", []),
+            commons=data.get("commons", [])
+        )
+        micropost.save()
+        converter.add_files(micropost)
+
+        self.create_owner_creation_activity(micropost,
+                                            "writes", "micropost")
+        return micropost
+
 
 class NewsContactHandler(NewebeHandler):
     '''
     This resource allows authorized contacts to send their microposts.
     '''
 
+    @rate_limited
+    @asynchronous
+    @gen.coroutine
     def post(self):
         '''
         When post request is received, micropost content is expected inside
@@ -175,36 +177,22 @@ class NewsContactHandler(NewebeHandler):
 
         if data:
             db_date = data.get("date")
-            date = date_util.get_date_from_db_date(db_date)
             authorKey = data.get("authorKey")
 
-            contact = ContactManager.getTrustedContact(authorKey)
-            micropost = MicroPostManager.get_contact_micropost(
+            contact, micropost = yield [
+                async_db.run(ContactManager.getTrustedContact, authorKey),
+                async_db.run(MicroPostManager.get_contact_micropost,
                              authorKey, db_date)
+            ]
 
             if contact:
                 if not micropost:
-                    micropost = MicroPost(
-                        authorKey=authorKey,
-                        author=data["author"],
-                        content=data['content'],
-                        date=date,
-                        attachments=data.get("attachments", []),
-                        pictures_to_download=data.get("pictures", []),
-                        commons_to_download=data.get("commons", []),
-                        isMine=False,
-                        tags=contact.tags
-                    )
-                    micropost.save()
-
-                    self.create_creation_activity(contact, micropost,
-                                                  "writes", "micropost")
+                    micropost = yield async_db.run(
+                        self.save_contact_micropost, contact, data)
                     self._write_create_log(micropost)
 
-                    postIndexer = indexer.Indexer()
-                    postIndexer.index_micropost(micropost)
-                    for websocket_client in websocket_clients:
-                        websocket_client.write_message(micropost.toJson())
+                    yield indexer.index_writer.index_micropost(micropost)
+                    channel.publish("microposts", micropost.toJson())
 
                 self.return_json(micropost.toJson(), 201)
 
@@ -214,6 +202,29 @@ class NewsContactHandler(NewebeHandler):
         else:
             self.return_failure("No data sent.", 405)
 
+    def save_contact_micropost(self, contact, data):
+        '''
+        Creates a micropost from data sent by *contact* and the corresponding
+        activity. Blocking, it is run inside the database thread pool.
+        '''
+
+        micropost = MicroPost(
+            authorKey=data["authorKey"],
+            author=data["author"],
+            content=data['content'],
+            date=date_util.get_date_from_db_date(data["date"]),
+            attachments=data.get("attachments", []),
+            pictures_to_download=data.get("pictures", []),
+            commons_to_download=data.get("commons", []),
+            isMine=False,
+            tags=contact.tags
+        )
+        micropost.save()
+
+        self.create_creation_activity(contact, micropost,
+                                      "writes", "micropost")
+        return micropost
+
     def _write_create_log(self, micropost):
         '''
         Print a log telling that an incoming micropost has been saved.
@@ -221,6 +232,7 @@ class NewsContactHandler(NewebeHandler):
 
         logger.info("Micropost from %s received" % micropost.author)
 
+    @rate_limited
     def put(self):
         '''
         When a delete request from a contact is incoming, it executes the
@@ -240,8 +252,7 @@ class NewsContactHandler(NewebeHandler):
             if micropost and contact:
                 self.create_deletion_activity(contact, micropost, "deletes",
                         "micropost")
-                postIndexer = indexer.Indexer()
-                postIndexer.remove_doc(micropost)
+                indexer.index_writer.remove_doc(micropost)
                 micropost.delete()
 
                 self._write_delete_log(micropost)
@@ -380,8 +391,7 @@ class MicropostTHandler(NewebeAuthHandler):
 
         micropost = MicroPostManager.get_micropost(postId)
         if micropost:
-            if micropost.content:
-                micropost.content = markdown.markdown(micropost.content)
+            micropost.content = markdown_util.get_html(micropost)
 
             self.render("templates/micropost.html", micropost=micropost)
         else:
@@ -525,6 +535,7 @@ class MyNewsHandler(NewebeAuthHandler):
     GET : Retrieve last 10 microposts published before a given date by owner.
     '''
 
+    @cached("MicroPost")
     def get(self, startKey=None, tag=None):
         '''
         Return microposts by pack of NEWS_LIMIT at JSON format. If a start key
@@ -1,5 +1,6 @@
 from couchdbkit.schema import StringProperty, BooleanProperty, ListProperty
 
+from newebe.lib import markdown_util
 from newebe.apps.core.models import NewebeDocument, DocumentManager
 from newebe.apps.news import news_settings
 
@@ -109,12 +110,21 @@ class MicroPost(NewebeDocument):
 
     author = StringProperty()
     content = StringProperty(required=True)
+    htmlContent = StringProperty(required=False)
     isMine = BooleanProperty(required=True, default=True)
     pictures = ListProperty(required=False)
     pictures_to_download = ListProperty(required=False)
     commons = ListProperty(required=False)
     commons_to_donwload = ListProperty(required=False)
 
+    def save(self):
+        '''
+        When document is saved, its content is rendered to HTML.
+        '''
+
+        self.htmlContent = markdown_util.render(self.content)
+        NewebeDocument.save(self)
+
     def get_path(self):
         '''
         Return path where micropost could be found.
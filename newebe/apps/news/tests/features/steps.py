@@ -14,7 +14,7 @@ from newebe.apps.news.models import MicroPost, MicroPostManager
 from newebe.apps.notes.models import Note
 from newebe.apps.activities.models import Activity, ActivityManager
 
-from newebe.lib.test_util import db2, reset_documents
+from newebe.lib.test_util import get_db2, reset_documents
 from newebe.lib import date_util
 
 
@@ -24,10 +24,10 @@ CONFIG.main.path = '.'
 @before.each_scenario
 def delete_posts(scenario):
     reset_documents(MicroPost, MicroPostManager.get_list)
-    reset_documents(MicroPost, MicroPostManager.get_list, db2)
+    reset_documents(MicroPost, MicroPostManager.get_list, get_db2())
 
     reset_documents(Activity, ActivityManager.get_all)
-    reset_documents(Activity, ActivityManager.get_all, db2)
+    reset_documents(Activity, ActivityManager.get_all, get_db2())
 
 
 # Models
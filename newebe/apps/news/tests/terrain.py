@@ -17,7 +17,7 @@ from tornado.httpclient import HTTPError
 
 from newebe.lib.slugify import slugify
 from newebe.lib.test_util import NewebeClient, SECOND_NEWEBE_ROOT_URL,\
-                                 db2, reset_documents
+                                 get_db2, reset_documents
 
 
 class Server(Thread):
@@ -70,7 +70,7 @@ def kill_server(total):
 @before.all
 def set_browers():
     reset_documents(Contact, ContactManager.getContacts)
-    reset_documents(Contact, ContactManager.getContacts, db2)
+    reset_documents(Contact, ContactManager.getContacts, get_db2())
 
     world.browser = NewebeClient()
     world.browser.set_default_user()
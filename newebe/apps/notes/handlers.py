@@ -3,6 +3,7 @@ import markdown
 
 from tornado.escape import json_decode
 
+from newebe.lib.response_cache import cached
 from newebe.apps.profile.models import UserManager
 from newebe.apps.contacts.handlers import NewebeAuthHandler
 from newebe.apps.notes.models import Note, NoteManager
@@ -20,6 +21,7 @@ class NotesHandler(NewebeAuthHandler):
     * POST: Create a new note.
     '''
 
+    @cached("Note")
     def get(self):
         '''
         Returns all notes ordered by title at JSON format.
@@ -3,6 +3,7 @@ import datetime
 from couchdbkit.schema import StringProperty, BooleanProperty, \
                                          DateTimeProperty
 
+from newebe.lib import markdown_util
 from newebe.apps.core.models import NewebeDocument
 from newebe.apps.profile.models import UserManager
 
@@ -55,6 +56,7 @@ class Note(NewebeDocument):
     author = StringProperty()
     title = StringProperty(required=True)
     content = StringProperty(required=False)
+    htmlContent = StringProperty(required=False)
     lastModified = DateTimeProperty(required=True,
                                     default=datetime.datetime.now())
     isMine = BooleanProperty(required=True, default=True)
@@ -62,7 +64,8 @@ class Note(NewebeDocument):
     def save(self):
         '''
         When document is saved, the last modified field is updated to
-        make sure it is always correct.
+        make sure it is always correct and content is rendered to HTML.
+        Notes are written by the owner only, so their raw HTML is kept.
         '''
 
         if not self.authorKey:
@@ -71,6 +74,7 @@ class Note(NewebeDocument):
             self.author = user.name
 
         self.lastModified = datetime.datetime.utcnow()
+        self.htmlContent = markdown_util.render(self.content, escape=False)
         NewebeDocument.save(self)
 
     def toDict(self, localized=True):
@@ -0,0 +1,5 @@
+function(doc) {
+  if("Picture" == doc.doc_type && false == doc.isMine && !doc.isFile) {
+      emit(doc.date, doc);
+  }
+}
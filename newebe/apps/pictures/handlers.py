@@ -1,10 +1,12 @@
 import os
 import logging
 import mimetypes
+import functools
+
+from StringIO import StringIO
 
 from tornado import gen
 from tornado.web import asynchronous
-from tornado.httpclient import HTTPError
 from tornado.escape import json_decode, json_encode
 from couchdbkit.exceptions import ResourceNotFound
 from PIL import Image
@@ -16,8 +18,15 @@ from newebe.apps.contacts.models import ContactManager
 from newebe.apps.activities.models import ActivityManager
 from newebe.apps.news.models import MicroPostManager
 from newebe.apps.pictures.models import PictureManager, Picture
-from newebe.lib import date_util
+from newebe.lib import date_util, async_db
 from newebe.lib.http_util import ContactClient
+from newebe.lib.rate_limit import rate_limited
+from newebe.lib.events import channel
+from newebe.lib.response_cache import cached
+from newebe.lib.picture import get_oriented_attachment, get_next_orientation
+from newebe.lib.couchdb_util import save_with_attachments
+from newebe.lib.download_manager import download_manager
+from newebe.lib.prefetcher import prefetcher
 
 from newebe.config import CONFIG
 
@@ -33,16 +42,20 @@ class PicturesHandler(NewebeAuthHandler):
     * GET: Retrieves all pictures ordered by title.
     * POST: Create a picture.
     '''
+    @cached("Picture")
+    @asynchronous
+    @gen.coroutine
     def get(self, startKey=None, tag=None):
         '''
         Returns last posted pictures.  If *startKey* is provided, it returns
         last picture posted until *startKey*.
         '''
 
-        self.return_documents_since(PictureManager.get_last_pictures, startKey,
-                tag)
+        yield self.return_documents_since_async(
+            PictureManager.get_last_pictures, startKey, tag)
 
     @asynchronous
+    @gen.coroutine
     def post(self):
         '''
         Creates a picture and corresponding activity. Then picture is
@@ -56,31 +69,20 @@ class PicturesHandler(NewebeAuthHandler):
         if file:
             filebody = file["body"]
 
+            user = yield async_db.run(UserManager.getUser)
             picture = Picture(
                 title="New Picture",
                 contentType=file["content_type"],
-                authorKey=UserManager.getUser().key,
-                author=UserManager.getUser().name,
+                authorKey=user.key,
+                author=user.name,
                 isFile=True
             )
-            picture.save()
-
+            yield async_db.run(picture.save)
 
             filename = '%s.jpg' % picture._id
             picture.path = filename
-            picture.put_attachment(filebody, filename)
-            thumbnail = self.get_thumbnail(filebody, filename, (200, 200))
-            thbuffer = thumbnail.read()
-            picture.put_attachment(thbuffer, "th_" + filename)
-            thpath = os.path.join(CONFIG.main.path, "th_" + filename)
-            os.remove(thpath)
-            preview = self.get_thumbnail(filebody, filename, (1000, 1000))
-            picture.put_attachment(preview.read(), "prev_" + filename)
-            os.remove(thpath)
-            picture.save()
-
-            self.create_owner_creation_activity(
-                picture, "publishes", "picture")
+            thbuffer = yield async_db.run(
+                self.save_picture_files, picture, filebody, filename)
 
             self.send_files_to_contacts("pictures/contact/",
                 fields={"json": str(picture.toJson(localized=False))},
@@ -92,6 +94,29 @@ class PicturesHandler(NewebeAuthHandler):
         else:
             self.return_failure("No picture posted.", 400)
 
+    def save_picture_files(self, picture, filebody, filename):
+        '''
+        Attaches to *picture* the original file, its thumbnail and its
+        preview, then creates corresponding activity. Returns thumbnail
+        content. Blocking, it is run inside the database thread pool.
+        '''
+
+        picture.put_attachment(filebody, filename)
+        thumbnail = self.get_thumbnail(filebody, filename, (200, 200))
+        thbuffer = thumbnail.read()
+        picture.put_attachment(thbuffer, "th_" + filename)
+        thpath = os.path.join(CONFIG.main.path, "th_" + filename)
+        os.remove(thpath)
+        preview = self.get_thumbnail(filebody, filename, (1000, 1000))
+        picture.put_attachment(preview.read(), "prev_" + filename)
+        os.remove(thpath)
+        picture.save()
+        channel.publish("pictures", picture.toJson())
+
+        self.create_owner_creation_activity(
+            picture, "publishes", "picture")
+        return thbuffer
+
     def get_thumbnail(self, filebody, filename, size):
         path = os.path.join(CONFIG.main.path, filename)
         thpath = os.path.join(CONFIG.main.path, "th_" + filename)
@@ -114,6 +139,7 @@ class PicturesMyHandler(NewebeAuthHandler):
     * GET: Retrieves last pictures posted by newebe owner.
     * POST: Creates a picture.
     '''
+    @cached("Picture")
     def get(self, startKey=None, tag=None):
         '''
         Returns last posted pictures.
@@ -129,6 +155,7 @@ class PicturesQQHandler(PicturesHandler):
     * POST: Create a picture.
     '''
     @asynchronous
+    @gen.coroutine
     def post(self):
         '''
         Creates a picture and corresponding activity. Then picture is
@@ -148,32 +175,21 @@ class PicturesQQHandler(PicturesHandler):
 
         if filebody:
 
+            user = yield async_db.run(UserManager.getUser)
             picture = Picture(
                 title="New Picture",
                 path=filename,
                 contentType=filetype,
-                authorKey=UserManager.getUser().key,
-                author=UserManager.getUser().name,
+                authorKey=user.key,
+                author=user.name,
                 isMine=True,
                 isFile=True,
                 tags=[tag]
             )
-            picture.save()
-
-            picture.put_attachment(content=filebody, name=filename)
-            thumbnail = self.get_thumbnail(filebody, filename, (200, 200))
-            thbuffer = thumbnail.read()
-            picture.put_attachment(thbuffer, "th_" + filename)
-            thpath = os.path.join(CONFIG.main.path, "th_" + filename)
+            yield async_db.run(picture.save)
 
-            os.remove(thpath)
-            preview = self.get_thumbnail(filebody, filename, (1000, 1000))
-            picture.put_attachment(preview.read(), "prev_" + filename)
-            os.remove(thpath)
-            picture.save()
-
-            self.create_owner_creation_activity(
-                    picture, "publishes", "picture")
+            thbuffer = yield async_db.run(
+                self.save_picture_files, picture, filebody, filename)
 
             self.send_files_to_contacts("pictures/contact/",
                         fields={"json": str(picture.toJson(localized=False))},
@@ -195,6 +211,7 @@ class PictureContactHandler(NewebeHandler):
     * PUT :  Delete a picture.
     '''
 
+    @rate_limited
     def post(self):
         '''
         Extract picture and file linked to the picture from request, then
@@ -234,6 +251,7 @@ class PictureContactHandler(NewebeHandler):
                     picture.put_attachment(content=file["body"],
                                            name="th_" + picture._id)
                     picture.save()
+                    channel.publish("pictures", picture.toJson())
 
                     self.create_creation_activity(contact,
                             picture, "publishes", "picture")
@@ -246,6 +264,7 @@ class PictureContactHandler(NewebeHandler):
         else:
             self.return_failure("No data sent.", 405)
 
+    @rate_limited
     def put(self):
         '''
         Delete picture of which data are given inside request.
@@ -313,12 +332,19 @@ class PictureFileHandler(NewebeAuthHandler):
         else:
             self.return_failure("Picture not found.", 404)
 
+    @asynchronous
+    @gen.coroutine
     def on_picture_found(self, picture, id):
         '''
-        Returns file linked to given picture.
+        Returns file linked to given picture, turned following picture
+        orientation.
         '''
+        if not picture.isMine:
+            prefetcher.record_view(picture.authorKey)
+
         try:
-            picfile = picture.fetch_attachment(self.filename)
+            picfile = yield async_db.run(
+                get_oriented_attachment, picture, self.filename)
             self.set_header("Content-Type", picture.contentType)
             self.write(picfile)
             self.finish()
@@ -359,85 +385,94 @@ class PictureHandler(PictureObjectHandler):
         else:
             self.return_failure("Picture not found.", 404)
 
-CURRENT_DOWNLOADS=[]
+@gen.coroutine
+def download_picture(picture):
+    '''
+    Downloads original file of contact *picture* from its author. Calls made
+    while the picture is downloading wait for the running download. Returns
+    the size of attached files.
+    '''
+    user = yield async_db.run(UserManager.getUser)
+    contact = yield async_db.run(
+        ContactManager.getTrustedContact, picture.authorKey)
+    if contact is None:
+        raise ValueError("Picture author is not a trusted contact.")
 
-class PictureDownloadHandler(PictureObjectHandler):
+    data = dict()
+    data["picture"] = picture.toDict(localized=False)
+    data["contact"] = user.asContact().toDict()
+
+    size = yield download_manager.download(
+        picture._id, contact, u"pictures/contact/download/",
+        json_encode(data), functools.partial(save_picture_file, picture))
+    raise gen.Return(size)
+
+
+def save_picture_file(picture, picture_file):
     '''
-    Handler that allows newebe owner to download original file of the picture
-    inside its newebe to make it available through UI.
+    Attaches downloaded original file and its preview to *picture* in a
+    single write, then marks it as downloaded inside its micropost. Returns
+    the size of attached files. Blocking, it is run inside the database
+    thread pool.
     '''
+    filename = '%s.jpg' % picture._id
+    content = picture_file.read()
 
-    @asynchronous
-    def on_picture_found(self, picture, id):
-        '''
-        '''
-        self.picture = picture
+    picture_file.seek(0)
+    image = Image.open(picture_file)
+    image.thumbnail((1000, 1000), Image.ANTIALIAS)
+    preview = StringIO()
+    image.save(preview, "JPEG")
 
-        data = dict()
-        data["picture"] = picture.toDict(localized=False)
-        data["contact"] = UserManager.getUser().asContact().toDict()
+    picture.isFile = True
+    save_with_attachments(picture, {
+        filename: content,
+        "prev_" + filename: preview.getvalue()
+    })
 
-        print CURRENT_DOWNLOADS
-        print "data picture id %s" % data["picture"]["_id"]
-        for download in CURRENT_DOWNLOADS:
-            print "download %s " % download
+    micropost = MicroPostManager.get_picture_micropost(picture._id)
+    if micropost is not None and \
+       picture._id in micropost.pictures_to_download:
+        micropost.pictures.append(picture._id)
+        micropost.pictures_to_download.remove(picture._id)
+        micropost.save()
 
-            if download == data["picture"]["_id"]:
-                return self.return_success('already downloading')
+    return len(content) + len(preview.getvalue())
 
-        CURRENT_DOWNLOADS.append(data["picture"]["_id"])
 
-        contact = ContactManager.getTrustedContact(picture.authorKey)
+class PicturePrefetchSource(object):
+    '''
+    Contact pictures of which original file is downloaded in background by
+    the prefetcher.
+    '''
 
-        client = ContactClient()
-        body = json_encode(data)
+    def get_candidates(self, limit):
+        return PictureManager.get_pictures_to_download(limit=limit)
 
-        try:
-            client.post(contact,  u"pictures/contact/download/",
-                        body, self.on_download_finished)
-        except HTTPError:
-            self.return_failure("Cannot download picture from contact.")
-
-    def on_download_finished(self, response):
-        logger.info(self.picture)
-
-        if response.code == 200:
-            filename = '%s.jpg' % self.picture._id
-            self.picture.put_attachment(response.body, filename)
-            thumbnail = self.get_thumbnail(
-                response.body, filename, (1000, 1000))
-            thbuffer = thumbnail.read()
-            self.picture.put_attachment(thbuffer, "prev_" + filename)
-            thpath = os.path.join(CONFIG.main.path, "th_" + filename)
-            os.remove(thpath)
-            self.picture.isFile = True
-            self.picture.save()
-
-            micropost = MicroPostManager.get_picture_micropost(self.picture._id)
-            if micropost is not None:
-                micropost.pictures.append(self.picture._id)
-                micropost.pictures_to_download.remove(self.picture._id)
-                micropost.save()
-
-            CURRENT_DOWNLOADS.remove(self.picture.toDict()["_id"])
-            self.return_success("Picture successfuly downloaded.")
+    def get_disk_usage(self):
+        return PictureManager.get_contact_files_size()
 
-        else:
-            CURRENT_DOWNLOADS.remove(self.picture.toDict()["_id"])
-            self.return_failure("Picture cannot be retrieved.")
+    def download(self, picture):
+        return download_picture(picture)
 
-    def get_thumbnail(self, filebody, filename, size):
-        path = os.path.join(CONFIG.main.path, filename)
-        thpath = os.path.join(CONFIG.main.path, "th_" + filename)
 
-        file = open(path, "w")
-        file.write(filebody)
-        file.close()
-        image = Image.open(path)
-        image.thumbnail(size, Image.ANTIALIAS)
-        image.save(thpath)
-        os.remove(path)
-        return open(thpath)
+class PictureDownloadHandler(PictureObjectHandler):
+    '''
+    Handler that allows newebe owner to download original file of the picture
+    inside its newebe to make it available through UI.
+    '''
+
+    @asynchronous
+    @gen.coroutine
+    def on_picture_found(self, picture, id):
+        '''
+        Downloads original file from picture author.
+        '''
+        try:
+            yield download_picture(picture)
+            self.return_success("Picture successfuly downloaded.")
+        except Exception:
+            self.return_failure("Picture cannot be retrieved.")
 
 
 class PictureContactDownloadHandler(NewebeHandler):
@@ -468,6 +503,7 @@ class PictureContactDownloadHandler(NewebeHandler):
             self.return_failure("Picture not found", 404)
 
     @asynchronous
+    @gen.coroutine
     def on_picture_found(self, picture, id):
         '''
         When picture is found, a download request is sent to the contact.
@@ -475,9 +511,11 @@ class PictureContactDownloadHandler(NewebeHandler):
 
         file = None
         try:
-            file = picture.fetch_attachment('%s.jpg' % picture._id)
+            file = yield async_db.run(
+                get_oriented_attachment, picture, '%s.jpg' % picture._id)
         except ResourceNotFound:
-            file = picture.fetch_attachment(picture.path)
+            file = yield async_db.run(
+                get_oriented_attachment, picture, picture.path)
 
         self.set_status(200)
         self.set_header("Content-Type", picture.contentType)
@@ -506,25 +544,15 @@ class PictureTHandler(PictureObjectHandler):
 
 class PictureRotateHandler(PictureObjectHandler):
     '''
-    Rotate picture 90 degrees on the right. Update thumbnail and preview too.
+    Rotate picture 90 degrees on the right. Only picture orientation is
+    updated, files are turned when they are served.
     '''
 
+    @asynchronous
+    @gen.coroutine
     def on_picture_found(self, picture, id):
-        for path in ["th_%s.jpg" % id, "prev_%s.jpg" % id, "%s.jpg" % id]:
-
-            file_path = os.path.join(CONFIG.main.path, path)
-            pic_file = picture.fetch_attachment(path)
-
-            import StringIO
-            image = Image.open(StringIO.StringIO(pic_file))
-            image = image.rotate(-90)
-            image.save(file_path)
-
-            file_buffer = open(file_path)
-            picture.put_attachment(file_buffer.read(), path)
-            picture.save()
-            os.remove(file_path)
-
+        picture.orientation = get_next_orientation(picture.orientation)
+        yield async_db.run(picture.save)
         self.return_success('Image rotated')
 
 
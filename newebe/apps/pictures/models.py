@@ -1,4 +1,5 @@
-from couchdbkit.schema import StringProperty, BooleanProperty
+from couchdbkit.schema import StringProperty, BooleanProperty, \
+                              IntegerProperty
 
 from newebe.apps.core.models import NewebeDocument, DocumentManager
 
@@ -54,6 +55,25 @@ class PictureManager():
 
         return None
 
+    @staticmethod
+    def get_pictures_to_download(limit=PICTURE_LIMIT):
+        '''
+        Returns most recent contact pictures of which file is not
+        downloaded yet.
+        '''
+        return Picture.view("pictures/to-download", descending=True,
+                            limit=limit)
+
+    @staticmethod
+    def get_contact_files_size():
+        '''
+        Returns size in bytes of files attached to contact pictures.
+        '''
+        rows = Picture.get_db().view("pictures/contact-size").all()
+        if rows:
+            return rows[0]["value"]
+        return 0
+
 
 class Picture(NewebeDocument):
     '''
@@ -67,6 +87,8 @@ class Picture(NewebeDocument):
     path = StringProperty()
     contentType = StringProperty()
     isFile = BooleanProperty(required=True, default=False)
+    # Clockwise rotation in degrees applied when picture files are served.
+    orientation = IntegerProperty(default=0)
 
     def get_path(self):
         '''
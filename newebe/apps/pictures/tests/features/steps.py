@@ -17,7 +17,7 @@ from newebe.lib.upload_util import encode_multipart_formdata
 from newebe.lib import date_util
 from newebe.lib.slugify import slugify
 from newebe.lib.test_util import NewebeClient, reset_documents, \
-                                 SECOND_NEWEBE_ROOT_URL, db2
+                                 SECOND_NEWEBE_ROOT_URL, get_db2
 
 
 from newebe.config import CONFIG
@@ -28,7 +28,7 @@ CONFIG.main.path = os.path.dirname(os.path.abspath(__file__))
 def set_browsers():
 
     reset_documents(Contact, ContactManager.getContacts)
-    reset_documents(Contact, ContactManager.getContacts, db2)
+    reset_documents(Contact, ContactManager.getContacts, get_db2())
 
     world.browser = NewebeClient()
     world.browser.set_default_user()
@@ -53,10 +53,10 @@ def set_browsers():
 def delete_pictures(scenario):
 
     reset_documents(Picture, PictureManager.get_last_pictures)
-    reset_documents(Picture, PictureManager.get_last_pictures, db2)
+    reset_documents(Picture, PictureManager.get_last_pictures, get_db2())
 
     reset_documents(Activity, ActivityManager.get_all)
-    reset_documents(Activity, ActivityManager.get_all, db2)
+    reset_documents(Activity, ActivityManager.get_all, get_db2())
 
 
 # Models
@@ -1,11 +1,15 @@
+import time
 import logging
 
-from threading import Timer
-
-from tornado.httpclient import HTTPClient, HTTPRequest
+from tornado import gen
+from tornado.ioloop import IOLoop
 from couchdbkit.exceptions import ResourceNotFound
 
+from newebe.config import CONFIG
+from newebe.lib import async_db
 from newebe.lib.picture import Resizer
+from newebe.lib.http_util import ContactClient, run_concurrently
+from newebe.lib.response_cache import cached
 from newebe.apps.core.handlers import NewebeAuthHandler
 from newebe.apps.profile.models import UserManager
 from newebe.apps.contacts.models import ContactManager
@@ -21,69 +25,103 @@ class ProfileUpdater:
     log inside activity when error occurs.
     '''
 
-    sending_data = False
-    contact_requests = {}
+    def __init__(self):
+        self.timeout = None
+        self.sending_data = False
+        self.send_picture = False
 
+    def forward_profile(self, picture=False):
+        '''
+        Because profile modification occurs a lot in a short time. The
+        profile is forwarded only after a delay (profile_forward_delay in
+        config), modifications made meanwhile are sent in the same batch.
+        It avoids to create too much activities for this profile
+        modification. If *picture* is True, profile picture is sent too.
+        '''
+        self.send_picture = self.send_picture or picture
+
+        if self.timeout is None:
+            io_loop = IOLoop.instance()
+            self.timeout = io_loop.add_timeout(
+                time.time() + CONFIG.main.profile_forward_delay,
+                self.on_timeout)
+
+    def on_timeout(self):
+        self.timeout = None
+        if self.sending_data:
+            # Modifications made while sending will be sent after.
+            self.forward_profile()
+        else:
+            self.send_profile_to_contacts()
+
+    @gen.coroutine
     def send_profile_to_contacts(self):
         '''
-        External methods to not send too much times the changed profile.
-        A timer is set to wait for other modifications before running this
-        function that sends modification requests to every contacts.
+        Sends profile modification requests to every trusted contact, with
+        a bounded number of requests running at the same time. If profile
+        picture changed, it is sent to each contact right after the
+        profile.
         '''
-        client = HTTPClient()
-        self.sending_data = False
+        self.sending_data = True
+        send_picture = self.send_picture
+        self.send_picture = False
 
-        user = UserManager.getUser()
-        jsonbody = user.toJson()
-
-        activity = Activity(
-            authorKey=user.key,
-            author=user.name,
-            verb="modifies",
-            docType="profile",
-            method="PUT",
-            docId="none",
-            isMine=True
-        )
-        activity.save()
-
-        for contact in ContactManager.getTrustedContacts():
-
-            try:
-                request = HTTPRequest(
-                    "%scontacts/update-profile/" % contact.url,
-                    method="PUT",
-                    body=jsonbody,
-                    validate_cert=False)
-                response = client.fetch(request)
+        try:
+            user = yield async_db.run(UserManager.getUser)
+            jsonbody = user.toJson()
+            picture = None
+            if send_picture:
+                picture = yield async_db.run(user.fetch_attachment,
+                                             "small_picture.jpg")
+
+            activity = Activity(
+                authorKey=user.key,
+                author=user.name,
+                verb="modifies",
+                docType="profile",
+                method="PUT",
+                docId="none",
+                isMine=True
+            )
+            yield async_db.run(activity.save)
+
+            contacts = yield async_db.run(ContactManager.getTrustedContacts)
+            client = ContactClient()
+            failed_contacts = []
+
+            @gen.coroutine
+            def send_to_contact(contact):
+                response = yield gen.Task(client.put, contact,
+                                          "contacts/update-profile/",
+                                          jsonbody)
+                if not response.error and picture is not None:
+                    response = yield gen.Task(
+                        client.put_files, contact,
+                        "contacts/update-profile/picture/",
+                        fields={"key": user.key},
+                        files=[("small_picture", "small_picture.jpg",
+                                picture)])
 
                 if response.error:
-                    logger.error("""
-                        Profile sending to a contact failed, error infos are
-                        stored inside activity.
-                    """)
-                    activity.add_error(contact)
-                    activity.save()
-            except:
+                    failed_contacts.append(contact)
+
+            yield run_concurrently(send_to_contact, contacts,
+                                   CONFIG.main.profile_forward_concurrency)
+
+            if failed_contacts:
                 logger.error("""
                     Profile sending to a contact failed, error infos are
                     stored inside activity.
                 """)
-                activity.add_error(contact)
-                activity.save()
+                for contact in failed_contacts:
+                    activity.add_error(contact)
+                yield async_db.run(activity.save)
 
             logger.info("Profile update sent to all contacts.")
-
-    def forward_profile(self):
-        '''
-        Because profile modification occurs a lot in a short time. The
-        profile is forwarded only every two minutes. It avoids to create
-        too much activities for this profile modification.
-        '''
-        t = Timer(1.0 * 60, self.send_profile_to_contacts)
-        if not self.sending_data:
-            self.sending_data = True
-            t.start()
+        except Exception:
+            logger.exception("Profile cannot be sent to contacts.")
+        finally:
+            self.sending_data = False
 
 
 profile_updater = ProfileUpdater()
@@ -98,6 +136,7 @@ class UserHandler(NewebeAuthHandler):
      after a pre-defined time.
     '''
 
+    @cached("User")
     def get(self):
         '''
         Retrieves current user (newebe owner) data at JSON format.
@@ -162,13 +201,7 @@ class ProfilePictureHandler(NewebeAuthHandler):
         user.save()
         self.return_success("File uploaded")
 
-        small_picture = resizer.resize_and_get_file(filebody, 100, 100).read()
-        self.send_files_to_contacts(
-            "contacts/update-profile/picture/",
-            fields={"key": user.key},
-            files=[("small_picture", "small_picture.jpg",
-                small_picture)]
-        )
+        profile_updater.forward_profile(picture=True)
 
 
         #file = self.request.files['picture'][0]
@@ -4,6 +4,7 @@ import datetime
 from couchdbkit.schema import StringProperty
 
 from newebe.apps.core.models import NewebeDocument
+from newebe.lib.metrics import record_write
 from newebe.apps.contacts.models import Contact
 
 logger = logging.getLogger("newebe.profile")
@@ -54,6 +55,7 @@ class User(NewebeDocument):
             self.date = datetime.datetime.now()
 
         super(NewebeDocument, self).save()
+        record_write(self.doc_type)
 
     def asContact(self):
         '''
@@ -1,16 +1,24 @@
+import base64
 import datetime
 import logging
 
+from tornado import gen
+from tornado.ioloop import IOLoop
 from tornado.web import asynchronous
+from tornado.escape import json_encode, json_decode
 
-from newebe.lib import date_util
+from newebe.config import CONFIG
+from newebe.lib import date_util, async_db, changes
 from newebe.lib.http_util import ContactClient
+from newebe.lib.rate_limit import rate_limited, NDJSON_TYPE
 
 from newebe.apps.profile.models import UserManager
 from newebe.apps.contacts.models import ContactManager
 from newebe.apps.news.models import MicroPostManager
-from newebe.apps.pictures.models import PictureManager
+from newebe.apps.pictures.models import PictureManager, Picture
 from newebe.apps.commons.models import CommonManager
+from newebe.apps.sync.models import LastSequenceManager
+from newebe.apps.sync import ingest
 from newebe.apps.core.handlers import NewebeAuthHandler, NewebeHandler
 
 from newebe.apps.news.handlers import CONTACT_PATH as MICROPOST_PATH
@@ -20,62 +28,245 @@ from newebe.apps.commons.handlers import CONTACT_PATH as COMMON_PATH
 
 logger = logging.getLogger("newebe.sync")
 
+# Path of the incremental synchronization service.
+SYNC_PATH = "synchronize/contact/changes/"
+
+# Document types sent during synchronization.
+SYNC_TYPES = ingest.INGESTED_TYPES.keys()
+
 
 class SynchronizeHandler(NewebeAuthHandler):
     '''
     Handles synchronization request.
 
-    * GET: Asks for all contacts to resend their data from last month. As
-    answer contacts send their profile. So contact data are updated, then
-    contacts resend all their from their last month just like they were posted
-    now.
-    Current newebe has to check himself if he already has these data.
+    * GET: Asks every trusted contact for the documents modified since last
+    synchronization with it. Each contact answers with batches of changes
+    (and its profile), a watermark is saved after each batch so an
+    interrupted synchronization resumes where it stopped.
+    Contacts that do not support incremental synchronization are asked to
+    resend their data from last month.
     '''
 
-    @asynchronous
     def get(self):
         '''
-        Asks for all contacts to resend their data from last month.
-        As answer contacts send their profile. So contact data are updated,
-        then contacts resend all their from their last month just like they
-        were posted now.
-        Current newebe has to check himself if he already has these data.
+        Starts synchronization with all trusted contacts, then returns
+        immediately.
         '''
-        client = ContactClient()
         user = UserManager.getUser()
 
-        self.contacts = dict()
+        io_loop = IOLoop.instance()
         for contact in ContactManager.getTrustedContacts():
-            self.ask_to_contact_for_sync(client, user, contact)
+            io_loop.add_future(self.sync_with_contact(user, contact),
+                               self.on_sync_done)
 
         self.return_success("", 200)
 
-    @asynchronous
-    def ask_to_contact_for_sync(self, client, user, contact):
+    def on_sync_done(self, future):
+        try:
+            future.result()
+        except Exception:
+            logger.exception("Sync with a contact failed")
+
+    @gen.coroutine
+    def sync_with_contact(self, user, contact):
         '''
-        Sends a sync request to *contact*.
+        Requests changes from *contact* since last synchronization until
+        there are no more changes to retrieve.
         '''
-        body = user.asContact().toJson()
+        client = ContactClient()
         logger.info("Start syncing with : " + contact.url)
-        url = "%ssynchronize/contact/" % contact.url
-        self.contacts[url] = contact
+
+        sequence = yield async_db.run(
+            LastSequenceManager.get_last_sequence, contact.key)
+
+        more = True
+        while more:
+            body = json_encode({"key": user.key,
+                                "since": sequence.lastSequence})
+            response = yield gen.Task(client.post, contact, SYNC_PATH, body)
+
+            if response.code == 404:
+                self.ask_to_contact_for_legacy_sync(client, user, contact)
+                return
+
+            elif response.error:
+                logger.error("Sync with %s failed: %s" %
+                             (contact.url, response.error))
+                return
+
+            batch = json_decode(response.body)
+            if batch.get("profile"):
+                yield async_db.run(
+                    self.update_profile, contact, batch["profile"])
+
+            documents, activities = yield async_db.run(
+                ingest.ingest_documents, contact, batch["rows"])
+            yield ingest.publish_documents(documents, activities)
+
+            sequence.lastSequence = str(batch["seq"])
+            yield async_db.run(sequence.save)
+            more = batch["more"]
+
+        logger.info("Sync with %s done." % contact.url)
+
+    def update_profile(self, contact, profile):
+        '''
+        Updates *contact* with *profile* data it sent. Blocking, it is run
+        inside the database thread pool.
+        '''
+        contact.name = profile.get("name", "")
+        contact.description = profile.get("description", "")
+        contact.save()
+
+    def ask_to_contact_for_legacy_sync(self, client, user, contact):
+        '''
+        Sends a sync request to *contact*, which will resend all its data
+        from last month.
+        '''
+        body = user.asContact().toJson()
+        logger.info("Start legacy syncing with : " + contact.url)
         client.post(contact, "synchronize/contact/", body,
-                    callback=self.on_synchronize)
+                    callback=lambda response: self.on_synchronize(
+                        contact, response))
 
-    def on_synchronize(self, response, **kwargs):
+    def on_synchronize(self, contact, response):
         '''
         When sync response is received, it extracts contact data from it
         then update local contact with it.
         '''
         if not response.error:
-            contact = self.contacts[response.request.url]
+            json_from_response = self.get_json_from_response(response)
+            remoteContact = json_from_response["rows"][0]
+            contact.name = remoteContact.get("name", "")
+            contact.description = remoteContact.get("description", "")
+            contact.save()
+
+
+def get_sync_batch(contact, since):
+    '''
+    Returns owner documents shared with *contact* (microposts, pictures with
+    their thumbnail and commons) modified after database sequence *since*.
+    At most CONFIG.main.sync_page_size changes are read, *more* field of the
+    batch tells if there are more changes to request.
+    '''
+    db = Picture.get_db()
+    events, last_seq, more = changes.get_changes(
+        db, since, CONFIG.main.sync_page_size)
+
+    rows = []
+    for event in events:
+        doc = event.get("doc")
+        if doc is None or event["docType"] not in SYNC_TYPES \
+           or not doc.get("isMine", False) \
+           or not any(tag in contact.tags for tag in doc.get("tags", [])):
+            continue
+
+        doc.pop("_rev", None)
+        row = {"docType": event["docType"], "doc": doc}
+        if event["docType"] == "Picture":
+            thumbnail = db.fetch_attachment(doc["_id"], "th_" + doc["path"])
+            if thumbnail is not None:
+                row["thumbnail"] = base64.b64encode(thumbnail)
+        rows.append(row)
+
+    return {
+        "rows": rows,
+        "seq": last_seq,
+        "more": more,
+        "profile": UserManager.getUser().asContact().toDict()
+    }
+
+
+class SynchronizeChangesHandler(NewebeHandler):
+    '''
+    Handler used to answer incremental sync requests.
+
+    * POST: Returns to a trusted contact a batch of documents modified since
+    the sequence given in request (compressed by the gzip transform).
+    '''
+
+    @rate_limited
+    @asynchronous
+    @gen.coroutine
+    def post(self):
+        '''
+        Expects contact key and last sequence received by this contact
+        (*key* and *since* fields).
+        '''
+        data = self.get_body_as_dict(expectedFields=["key"])
+
+        if data:
+            contact = yield async_db.run(
+                ContactManager.getTrustedContact, data["key"])
 
             if contact:
-                json_from_response = self.get_json_from_response(response)
-                remoteContact = json_from_response["rows"][0]
-                contact.name = remoteContact.get("name", "")
-                contact.description = remoteContact.get("description", "")
-                contact.save()
+                batch = yield async_db.run(
+                    get_sync_batch, contact, data.get("since", "0"))
+                self.return_json(batch)
+            else:
+                self.return_failure("Contact does not exist.", 403)
+        else:
+            self.return_failure("No data sent.", 400)
+
+
+class SynchronizeBatchHandler(NewebeHandler):
+    '''
+    Handler used by contacts to send many documents in one request.
+
+    * POST: Stores documents sent by a trusted contact. Body is a JSON object
+    like {"key": contactKey, "rows": [row, ...]} or, with
+    application/x-ndjson content type, the contact key object followed by one
+    row per line. Rows have the format of synchronization batches:
+    {"docType": "MicroPost", "doc": {...}, "thumbnail": base64 string}.
+    Response gives the number of created, skipped (already stored or not
+    written by the contact) and invalid rows.
+    '''
+
+    @rate_limited
+    @asynchronous
+    @gen.coroutine
+    def post(self):
+        try:
+            key, rows = self.get_batch()
+        except (ValueError, KeyError, TypeError, IndexError):
+            self.return_failure("Malformed batch.", 400)
+            return
+
+        valid_rows = [row for row in rows if ingest.is_valid_row(row)]
+        contact = yield async_db.run(ContactManager.getTrustedContact, key)
+
+        if contact:
+            documents, activities = yield async_db.run(
+                ingest.ingest_documents, contact, valid_rows)
+            yield ingest.publish_documents(documents, activities)
+
+            self.return_json({
+                "created": len(documents),
+                "skipped": len(valid_rows) - len(documents),
+                "invalid": len(rows) - len(valid_rows)
+            }, 201)
+        else:
+            self.return_failure("Contact is not trusted.", 403)
+
+    def get_batch(self):
+        '''
+        Extracts sender key and document rows from request body.
+        '''
+        body = self.request.body
+        if self.request.headers.get("Content-Type", "").startswith(
+                NDJSON_TYPE):
+            lines = [line for line in body.splitlines() if line.strip()]
+            key = json_decode(lines[0])["key"]
+            rows = [json_decode(line) for line in lines[1:]]
+        else:
+            data = json_decode(body)
+            key = data["key"]
+            rows = data["rows"]
+
+        if not isinstance(rows, list):
+            raise TypeError("Rows should be a list")
+        return key, rows
+
 
 def tags_match(doc, contact):
     '''
@@ -91,9 +282,11 @@ def tags_match(doc, contact):
 
 class SynchronizeContactHandler(NewebeHandler):
     '''
-    Handler used to handle sync request.
+    Handler used to handle sync request from contacts that do not support
+    incremental synchronization.
     '''
 
+    @rate_limited
     @asynchronous
     def post(self):
         '''
@@ -0,0 +1,216 @@
+'''
+Batch ingestion of documents sent by contacts.
+
+Documents received during synchronization or through the batch endpoint
+are stored in a few requests whatever their number: already stored
+documents are detected with one multi-key query on the core/contactdocs
+view, new documents and their activities are written with one _bulk_docs
+request each. Picture thumbnails are sent as inline attachments.
+'''
+
+import datetime
+import logging
+
+from tornado import gen
+
+from newebe.lib import date_util, indexer, markdown_util
+from newebe.lib.events import channel
+from newebe.lib.metrics import record_write
+from newebe.apps.core.models import NewebeDocument
+from newebe.apps.news.models import MicroPost
+from newebe.apps.pictures.models import Picture
+from newebe.apps.commons.models import Common
+from newebe.apps.activities.models import Activity
+
+logger = logging.getLogger("newebe.sync")
+
+# Document types that can be ingested and the verb of their activity.
+INGESTED_TYPES = {
+    "MicroPost": "writes",
+    "Picture": "publishes",
+    "Common": "publishes"
+}
+
+
+# Types of the document fields read during ingestion. Missing and null
+# fields are allowed.
+DOC_FIELD_TYPES = {
+    "_id": basestring,
+    "author": basestring,
+    "content": basestring,
+    "title": basestring,
+    "path": basestring,
+    "contentType": basestring,
+    "attachments": list,
+    "pictures": list,
+    "commons": list
+}
+
+
+def is_valid_row(row):
+    '''
+    Returns True if *row* can be read by ingestion: a dict with a *docType*
+    string, a *doc* dict that has a database formatted date (and an id for
+    pictures and commons) and an optional *thumbnail* string.
+    '''
+    if not isinstance(row, dict) or \
+       not isinstance(row.get("docType"), basestring) or \
+       not isinstance(row.get("doc"), dict) or \
+       not isinstance(row.get("thumbnail", ""), basestring):
+        return False
+
+    doc = row["doc"]
+    for field, field_type in DOC_FIELD_TYPES.items():
+        if doc.get(field) is not None and \
+           not isinstance(doc[field], field_type):
+            return False
+
+    if row["docType"] in ("Picture", "Common") and not doc.get("_id"):
+        return False
+
+    try:
+        date_util.get_date_from_db_date(doc.get("date"))
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def get_row_key(contact, row):
+    return [row["docType"], contact.key, row["doc"]["date"]]
+
+
+def get_stored_keys(db, keys):
+    '''
+    Returns keys (doc type, author key, date) of *keys* that are already
+    stored, with a single view query.
+    '''
+    if not keys:
+        return set()
+
+    rows = db.view("core/contactdocs", keys=keys).all()
+    return set(tuple(row["key"]) for row in rows)
+
+
+def build_document(contact, row):
+    '''
+    Builds local document corresponding to *row* sent by *contact*.
+    '''
+    doc = row["doc"]
+    date = date_util.get_date_from_db_date(doc["date"])
+
+    if row["docType"] == "MicroPost":
+        return MicroPost(
+            authorKey=contact.key,
+            author=doc.get("author", ""),
+            content=doc.get("content", ""),
+            htmlContent=markdown_util.render(doc.get("content", "")),
+            date=date,
+            attachments=doc.get("attachments", []),
+            pictures_to_download=doc.get("pictures", []),
+            commons_to_download=doc.get("commons", []),
+            isMine=False,
+            tags=contact.tags
+        )
+
+    docType = {"Picture": Picture, "Common": Common}[row["docType"]]
+    document = docType(
+        _id=doc["_id"],
+        title=doc.get("title", ""),
+        path=doc.get("path", ""),
+        contentType=doc.get("contentType", ""),
+        authorKey=contact.key,
+        author=doc.get("author", ""),
+        tags=contact.tags,
+        date=date,
+        isMine=False,
+        isFile=False
+    )
+
+    if row["docType"] == "Picture" and row.get("thumbnail"):
+        document._doc["_attachments"] = {
+            "th_" + document._id: {
+                "content_type": document.contentType or "image/jpeg",
+                "data": row["thumbnail"]
+            }
+        }
+    return document
+
+
+def build_activity(contact, row, document):
+    return Activity(
+        authorKey=contact.key,
+        author=contact.name,
+        verb=INGESTED_TYPES[row["docType"]],
+        docType=row["docType"].lower(),
+        docId=document._id,
+        isMine=False,
+        method="POST",
+        date=datetime.datetime.utcnow()
+    )
+
+
+def ingest_documents(contact, rows):
+    '''
+    Stores documents of *rows* (dicts with *docType*, *doc* and optional
+    base64 *thumbnail* fields) sent by *contact*. Invalid rows, documents
+    not written by *contact* and documents already stored are skipped.
+
+    Returns created documents and their activities. Blocking, it should be
+    run inside database thread pool.
+    '''
+    rows = [row for row in rows
+            if is_valid_row(row)
+            and row["docType"] in INGESTED_TYPES
+            and row["doc"].get("authorKey") == contact.key]
+
+    db = NewebeDocument.get_db()
+    keys = [get_row_key(contact, row) for row in rows]
+    stored_keys = get_stored_keys(db, keys)
+
+    documents = []
+    activities = []
+    for row, key in zip(rows, keys):
+        if tuple(key) in stored_keys:
+            continue
+        stored_keys.add(tuple(key))
+
+        document = build_document(contact, row)
+        documents.append(document)
+        activities.append((row, document))
+
+    if not documents:
+        return [], []
+
+    db.save_docs(documents)
+    for document in documents:
+        record_write(document.doc_type)
+        # Inline attachment data are no longer needed once saved.
+        for attachment in document._doc.get("_attachments", {}).values():
+            attachment.pop("data", None)
+            attachment["stub"] = True
+
+    activities = [build_activity(contact, row, document)
+                  for row, document in activities]
+    db.save_docs(activities)
+    record_write("Activity")
+
+    logger.info("%d documents from %s stored" %
+                (len(documents), contact.name))
+    return documents, activities
+
+
+@gen.coroutine
+def publish_documents(documents, activities):
+    '''
+    Indexes ingested microposts and notifies websocket clients of new
+    documents and activities.
+    '''
+    for document in documents:
+        if isinstance(document, MicroPost):
+            yield indexer.index_writer.index_micropost(document)
+            channel.publish("microposts", document.toJson())
+        elif isinstance(document, Picture):
+            channel.publish("pictures", document.toJson())
+
+    for activity in activities:
+        channel.publish("activities", activity.toJson())
@@ -0,0 +1,35 @@
+from couchdbkit.schema import StringProperty
+
+from newebe.apps.core.models import NewebeDocument, DocumentManager
+
+
+class LastSequenceManager():
+    '''
+    Utility methods to retrieve synchronization watermarks.
+    '''
+
+    @staticmethod
+    def get_last_sequence(contactKey):
+        '''
+        Returns last sequence received from contact of which key is
+        *contactKey*. If no synchronization occured yet, a new (unsaved)
+        sequence set to 0 is returned.
+        '''
+        sequence = DocumentManager.get_document(
+            LastSequence, "core/lastsequence", key=contactKey)
+
+        if sequence is None:
+            sequence = LastSequence(contactKey=contactKey, lastSequence="0")
+
+        return sequence
+
+
+class LastSequence(NewebeDocument):
+    '''
+    Sequence of the contact database until which data were synchronized.
+    Next synchronization with this contact will request only changes that
+    occured after this sequence.
+    '''
+
+    contactKey = StringProperty(required=True)
+    lastSequence = StringProperty(default="0")
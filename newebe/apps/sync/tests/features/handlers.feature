@@ -19,6 +19,31 @@ Feature: Manage notes through handlers
         And 3 pictures from first newebe are stored in second newebe
         And 3 commons from first newebe are stored in second newebe
 
+    Scenario: Synchronize only new posts
+        Given My contact is tagged with "friend"
+        Given 2 posts are created on first newebe with tag "friend"
+        When I ask for synchronization
+        And Wait for 3 seconds
+        Then 2 posts from first newebe are stored in second newebe
+        Given 3 posts are created on first newebe with tag "friend"
+        When I ask for synchronization
+        And Wait for 3 seconds
+        Then 5 posts from first newebe are stored in second newebe
+
+    Scenario: Receive posts in batch
+        When first newebe sends 4 posts in batch to second newebe
+        Then 4 posts from first newebe are stored in second newebe
+        When first newebe sends 4 posts in batch to second newebe
+        Then 4 posts from first newebe are stored in second newebe
+
+    Scenario: Skip invalid rows of a batch
+        When first newebe sends 4 posts and 3 invalid rows in batch to second newebe
+        Then batch response counts 4 created, 0 skipped and 3 invalid rows
+        And 4 posts from first newebe are stored in second newebe
+        When first newebe sends 4 posts and 3 invalid rows in batch to second newebe
+        Then batch response counts 0 created, 4 skipped and 3 invalid rows
+        And 4 posts from first newebe are stored in second newebe
+
     Scenario: Synchronize profiles
         Modify first newebe profile directly to DB
         When I ask for synchronization
@@ -3,11 +3,11 @@ import time
 import datetime
 
 from lettuce import step, world, before
-from tornado.escape import json_encode
+from tornado.escape import json_encode, json_decode
 
 sys.path.append("../")
 
-from newebe.lib.test_util import NewebeClient, db2, SECOND_NEWEBE_ROOT_URL
+from newebe.lib.test_util import NewebeClient, get_db2, SECOND_NEWEBE_ROOT_URL
 
 from newebe.apps.news.models import MicroPost, MicroPostManager
 from newebe.apps.pictures.models import Picture, PictureManager
@@ -28,7 +28,7 @@ def set_browser():
 @before.all
 def set_default_user():
     reset_documents(Contact, ContactManager.getContacts)
-    reset_documents(Contact, ContactManager.getContacts, db2)
+    reset_documents(Contact, ContactManager.getContacts, get_db2())
 
     world.browser.set_default_user()
     world.user = world.browser.user
@@ -46,18 +46,18 @@ def set_default_user():
 @before.each_scenario
 def delete_all_posts(scenario):
     reset_documents(MicroPost, MicroPostManager.get_list)
-    reset_documents(MicroPost, MicroPostManager.get_list, db2)
+    reset_documents(MicroPost, MicroPostManager.get_list, get_db2())
 
 
 @before.each_scenario
 def delete_all_pictures(scenario):
     reset_documents(Picture, PictureManager.get_last_pictures)
-    reset_documents(Picture, PictureManager.get_last_pictures, db2)
+    reset_documents(Picture, PictureManager.get_last_pictures, get_db2())
 
 @before.each_scenario
 def delete_all_commons(scenario):
     reset_documents(Picture, CommonManager.get_last_commons)
-    reset_documents(Picture, CommonManager.get_last_commons, db2)
+    reset_documents(Picture, CommonManager.get_last_commons, get_db2())
 
 
 # Microposts
@@ -85,6 +85,48 @@ def check_that_5_posts_from_first_newebe_are_stored_in_second_newebe(step,
     posts = world.browser2.fetch_documents("microposts/all/")
     assert_equals(len(posts), int(nbposts))
 
+def get_batch_rows(nbposts):
+    rows = []
+    for i in range(int(nbposts)):
+        rows.append({
+            "docType": "MicroPost",
+            "doc": {
+                "author": world.user.name,
+                "authorKey": world.user.key,
+                "content": "batch content %s" % i,
+                "date": "2012-01-0%dT10:00:00Z" % (i + 1),
+                "tags": ["all"]
+            }
+        })
+    return rows
+
+@step(u'first newebe sends (\d) posts in batch to second newebe')
+def first_newebe_sends_posts_in_batch_to_second_newebe(step, nbposts):
+    rows = get_batch_rows(nbposts)
+    response = world.browser2.post("synchronize/contact/batch/",
+        body=json_encode({"key": world.user.key, "rows": rows}))
+    assert_equals(201, response.code)
+
+@step(u'first newebe sends (\d) posts and 3 invalid rows in batch to second')
+def first_newebe_sends_posts_and_invalid_rows_in_batch(step, nbposts):
+    rows = get_batch_rows(nbposts) + [
+        "not a row",
+        {"docType": "MicroPost", "doc": "not a doc"},
+        {"docType": "MicroPost",
+         "doc": {"authorKey": world.user.key, "date": "yesterday"}}
+    ]
+    response = world.browser2.post("synchronize/contact/batch/",
+        body=json_encode({"key": world.user.key, "rows": rows}))
+    assert_equals(201, response.code)
+    world.batch_result = json_decode(response.body)
+
+@step(u'batch response counts (\d) created, (\d) skipped and (\d) invalid')
+def batch_response_counts_created_skipped_and_invalid_rows(
+        step, created, skipped, invalid):
+    assert_equals(int(created), world.batch_result["created"])
+    assert_equals(int(skipped), world.batch_result["skipped"])
+    assert_equals(int(invalid), world.batch_result["invalid"])
+
 # Pictures
 
 @step(u'(\d) pictures are created on first newebe with tag "([^"]*)"')
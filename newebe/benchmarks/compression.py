@@ -0,0 +1,90 @@
+"""
+Measures bytes sent on the wire for Newebe API responses with and without
+gzip compression, and for a federation payload sent to a contact.
+
+Run it from the newebe folder against a running Newebe instance:
+
+    python benchmarks/compression.py --url=http://localhost:8000/ \\
+                                     --password=password
+"""
+
+import sys
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.escape import json_encode
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.options import define, options, parse_command_line
+
+sys.path.append("../")
+
+define('url', default="http://localhost:8000/", help="Newebe root URL")
+define('password', default="password", help="Newebe owner password")
+define('paths', default="microposts/all/,activities/all/,pictures/all/,"
+                        "commons/all/,contacts/all/,user/",
+       help="Comma separated list of paths to measure")
+define('documents', default=100,
+       help="Number of microposts in measured federation payload")
+
+from newebe.lib import gzip_util
+
+
+@gen.coroutine
+def login(client):
+    '''
+    Logs in and returns authentication cookie.
+    '''
+    request = HTTPRequest(options.url + "login/json/", method="POST",
+                          body=json_encode({"password": options.password}),
+                          validate_cert=False)
+    response = yield client.fetch(request)
+    raise gen.Return(response.headers["Set-Cookie"])
+
+
+@gen.coroutine
+def get_size(client, cookie, path, gzip):
+    '''
+    Returns number of body bytes received for *path*. Response is not
+    uncompressed by the client, so it is the size sent on the wire.
+    '''
+    headers = {"Cookie": cookie}
+    if gzip:
+        headers["Accept-Encoding"] = "gzip"
+    request = HTTPRequest(options.url + path, headers=headers,
+                          use_gzip=False, validate_cert=False)
+    response = yield gen.Task(client.fetch, request)
+    raise gen.Return(len(response.body or ""))
+
+
+def print_sizes(name, raw, compressed):
+    ratio = 0
+    if raw:
+        ratio = 100 - compressed * 100 / raw
+    print "%-30s %10d %10d %5d%%" % (name, raw, compressed, ratio)
+
+
+@gen.coroutine
+def main():
+    client = AsyncHTTPClient()
+    cookie = yield login(client)
+
+    print "%-30s %10s %10s %6s" % ("", "raw", "gzip", "saved")
+    for path in options.paths.split(","):
+        raw = yield get_size(client, cookie, path, False)
+        compressed = yield get_size(client, cookie, path, True)
+        print_sizes(path, raw, compressed)
+
+    rows = [{"docType": "MicroPost",
+             "doc": {"authorKey": "key", "author": "Newebe owner",
+                     "content": "Micropost number %d sent to contacts." % i,
+                     "date": "2013-01-01T10:%02d:%02dZ" % (i / 60, i % 60),
+                     "tags": ["all"]}}
+            for i in range(options.documents)]
+    body = json_encode({"key": "key", "rows": rows})
+    print_sizes("federation batch", len(body),
+                len(gzip_util.compress(body)))
+
+
+if __name__ == '__main__':
+    parse_command_line()
+    IOLoop.instance().run_sync(main)
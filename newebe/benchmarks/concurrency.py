@@ -0,0 +1,83 @@
+"""
+Benchmark of request latency when many clients query Newebe concurrently.
+
+Run it from the newebe folder against a running Newebe instance:
+
+    python benchmarks/concurrency.py --url=http://localhost:8000/ \
+                                     --password=password --clients=100
+"""
+
+import sys
+import time
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.escape import json_encode
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.options import define, options, parse_command_line
+
+sys.path.append("../")
+
+define('url', default="http://localhost:8000/", help="Newebe root URL")
+define('password', default="password", help="Newebe owner password")
+define('clients', default=100, help="Number of parallel clients")
+define('requests', default=10, help="Number of requests sent by each client")
+define('path', default="microposts/all/", help="Path to query")
+
+
+def percentile(values, ratio):
+    '''
+    Returns the value below which *ratio* of sorted *values* fall.
+    '''
+    index = min(len(values) - 1, int(len(values) * ratio))
+    return values[index]
+
+
+@gen.coroutine
+def login(client):
+    '''
+    Logs in and returns authentication cookie.
+    '''
+    request = HTTPRequest(options.url + "login/json/", method="POST",
+                          body=json_encode({"password": options.password}),
+                          validate_cert=False)
+    response = yield client.fetch(request)
+    raise gen.Return(response.headers["Set-Cookie"])
+
+
+@gen.coroutine
+def run_client(client, cookie, latencies):
+    '''
+    Sends requests one after another and stores their latency.
+    '''
+    for i in range(options.requests):
+        request = HTTPRequest(options.url + options.path,
+                              headers={"Cookie": cookie},
+                              validate_cert=False)
+        start = time.time()
+        yield gen.Task(client.fetch, request)
+        latencies.append(time.time() - start)
+
+
+@gen.coroutine
+def main():
+    client = AsyncHTTPClient(max_clients=options.clients)
+    cookie = yield login(client)
+
+    latencies = []
+    start = time.time()
+    yield [run_client(client, cookie, latencies)
+           for i in range(options.clients)]
+    duration = time.time() - start
+
+    latencies.sort()
+    print "%d clients, %d requests in %.2fs: %.1f req/s" % \
+        (options.clients, len(latencies), duration, len(latencies) / duration)
+    print "latency p50 %.3fs, p99 %.3fs, max %.3fs" % \
+        (percentile(latencies, 0.5), percentile(latencies, 0.99),
+         latencies[-1])
+
+
+if __name__ == '__main__':
+    parse_command_line()
+    IOLoop.instance().run_sync(main)
@@ -0,0 +1,75 @@
+"""
+Benchmark of CouchDB request throughput with and without the connection pool.
+
+Run it from the newebe folder while CouchDB is running:
+
+    python benchmarks/couchdb_pool.py --requests=2000 --threads=8
+"""
+
+import sys
+import time
+import threading
+
+from tornado.options import define, options
+
+sys.path.append("../")
+
+define('requests', default=1000, help="Number of view requests to send")
+define('threads', default=4, help="Number of concurrent threads")
+define('view', default="core/user", help="View to query")
+
+from couchdbkit import Server
+from couchdbkit.resource import CouchdbResource
+
+from newebe.config import CONFIG, load_config
+from newebe.lib.couchdb_util import get_server, view_stats
+
+
+def query_view(get_db, nb_requests):
+    '''
+    Queries benchmark view *nb_requests* times. *get_db* is called before
+    each request to retrieve the database to query.
+    '''
+    for i in range(nb_requests):
+        get_db().view(options.view, limit=1).all()
+
+
+def run(name, get_db):
+    '''
+    Spreads requests among threads and prints throughput.
+    '''
+    per_thread = options.requests / options.threads
+    threads = [threading.Thread(target=query_view, args=(get_db, per_thread))
+               for i in range(options.threads)]
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.time() - start
+
+    total = per_thread * options.threads
+    print "%-10s %6d requests in %.2fs: %.1f req/s" % \
+        (name, total, duration, total / duration)
+
+
+def get_unpooled_db():
+    '''
+    Opens a new connection for each request, like before pooling.
+    '''
+    server = Server(CONFIG.db.uri,
+                    resource_instance=CouchdbResource(CONFIG.db.uri))
+    return server.get_or_create_db(CONFIG.db.name)
+
+
+if __name__ == '__main__':
+    load_config()
+    pooled_db = get_server().get_or_create_db(CONFIG.db.name)
+
+    run("no pool", get_unpooled_db)
+    run("pool", lambda: pooled_db)
+
+    for line in view_stats.report():
+        print "%(view)s: %(count)d calls, mean %(mean).4fs, max %(max).4fs" \
+            % line
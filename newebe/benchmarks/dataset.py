@@ -0,0 +1,408 @@
+"""
+Generator of synthetic Newebe datasets for benchmarks: owner, contacts,
+microposts, pictures (with original, preview and thumbnail attachments),
+commons (with their file), notes and activities.
+
+A dataset only depends on its sizes and on the random seed: document ids,
+dates and contents are the same on every run, so benchmark results of
+different commits can be compared. Documents are written by batches with
+bulk requests. A manifest describing the dataset (sizes, seed, ids of
+generated documents) is written for the benchmark suite.
+
+Run it from the newebe folder while CouchDB is running. Use a dedicated
+database, --reset deletes it first:
+
+    python benchmarks/dataset.py --dbname=newebe_benchmark --reset \\
+                                 --microposts=5000 --contacts=2000
+
+With the in-memory database, no CouchDB is needed: the dataset only lives
+inside the generator process, so it serves it with Newebe once generated
+(on --port, without SSL) until it is interrupted:
+
+    python benchmarks/dataset.py --dburi=memory:// --port=8000
+"""
+
+import sys
+import json
+import base64
+import random
+import hashlib
+import datetime
+
+from StringIO import StringIO
+
+from tornado.options import define, options
+
+sys.path.append("../")
+
+define('seed', default=42, help="Random seed")
+define('microposts', default=2000, help="Number of microposts")
+define('pictures', default=200, help="Number of pictures")
+define('commons', default=100, help="Number of commons")
+define('notes', default=300, help="Number of notes")
+define('contacts', default=2000, help="Number of contacts")
+define('activities', default=3000, help="Number of activities")
+define('common_size', default=100 * 1024, help="Size of common files")
+define('batch', default=200, help="Number of documents saved per request")
+define('password', default="password", help="Owner password")
+define('manifest', default="benchmark-dataset.json",
+       help="Path of the dataset manifest")
+define('reset', default=False, help="Delete database before generation")
+
+from PIL import Image, ImageDraw
+from tornado.ioloop import IOLoop
+from tornado.httpserver import HTTPServer
+
+from newebe.config import CONFIG, load_config
+from newebe.newebe_server import Newebe
+from newebe.tools.syncdb import CouchdbkitHandler
+from newebe.lib import markdown_util
+from newebe.lib.changes import changes_watcher
+from newebe.lib.couchdb_util import get_server
+from newebe.lib.memory_couchdb import is_memory_uri
+from newebe.lib.date_util import get_db_date_from_date
+
+# Dates of generated documents are computed from this date, not from now.
+START_DATE = datetime.datetime(2014, 1, 1)
+
+WORDS = """
+newebe social network micropost picture common note contact friend share
+python tornado couchdb server peer distributed owner federation activity
+garden music travel photo coffee weekend project release bug feature test
+""".split()
+
+TAGS = ["all", "friends", "family", "work"]
+
+
+def get_id(kind, index):
+    '''
+    Returns id of *index*-th document of *kind*, shaped like CouchDB ids.
+    '''
+    return hashlib.md5("%s-%d" % (kind, index)).hexdigest()
+
+
+def get_date(index, minutes):
+    return get_db_date_from_date(
+        START_DATE + datetime.timedelta(minutes=index * minutes))
+
+
+def get_text(rng, nb_words):
+    return " ".join(rng.choice(WORDS) for i in range(nb_words))
+
+
+def get_markdown(rng):
+    '''
+    Returns micropost or note content with some markdown.
+    '''
+    lines = [get_text(rng, rng.randint(5, 30))]
+    if rng.random() < 0.3:
+        lines.append("")
+        lines.extend("* " + get_text(rng, 4) for i in range(3))
+    if rng.random() < 0.3:
+        lines.append("[%s](http://newebe.org/%s)" %
+                     (get_text(rng, 2), rng.choice(WORDS)))
+    return "\n".join(lines)
+
+
+def get_attachment(content, content_type):
+    return {"content_type": content_type,
+            "data": base64.b64encode(content)}
+
+
+def get_image(rng, size):
+    '''
+    Returns a JPEG image of *size* with random shapes.
+    '''
+    image = Image.new("RGB", size, tuple(rng.randint(0, 255)
+                                         for i in range(3)))
+    draw = ImageDraw.Draw(image)
+    for i in range(20):
+        x, y = rng.randint(0, size[0]), rng.randint(0, size[1])
+        draw.rectangle([x, y, x + rng.randint(10, size[0] / 2),
+                        y + rng.randint(10, size[1] / 2)],
+                       fill=tuple(rng.randint(0, 255) for i in range(3)))
+    buffer = StringIO()
+    image.save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def get_renditions(content):
+    '''
+    Returns preview and thumbnail of JPEG *content*.
+    '''
+    renditions = []
+    for size in [(1000, 1000), (200, 200)]:
+        image = Image.open(StringIO(content))
+        image.thumbnail(size, Image.ANTIALIAS)
+        buffer = StringIO()
+        image.save(buffer, "JPEG")
+        renditions.append(buffer.getvalue())
+    return renditions
+
+
+class DatasetGenerator(object):
+    '''
+    Builds documents of a dataset and saves them by batches.
+    '''
+
+    def __init__(self, db, seed, batch_size):
+        self.db = db
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.docs = []
+        self.owner_key = get_id("user", 0)
+        self.contact_keys = []
+        self.ids = {}
+
+    def add(self, kind, doc):
+        self.ids.setdefault(kind, []).append(doc["_id"])
+        self.docs.append(doc)
+        if len(self.docs) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.docs:
+            self.db.save_docs(self.docs)
+            self.docs = []
+
+    def get_author(self):
+        '''
+        Returns author key and isMine flag: a third of documents come from
+        contacts.
+        '''
+        if self.contact_keys and self.rng.random() < 0.33:
+            return self.rng.choice(self.contact_keys), False
+        return self.owner_key, True
+
+    def generate_owner(self, password):
+        self.add("user", {
+            "_id": self.owner_key,
+            "doc_type": "User",
+            "name": "Benchmark Owner",
+            "description": "Owner of benchmark dataset",
+            "url": "http://localhost:8000/",
+            "key": self.owner_key,
+            "password": hashlib.sha224(password).hexdigest(),
+            "date": get_date(0, 0),
+            "tags": ["all"],
+            "attachments": []
+        })
+
+    def generate_contacts(self, nb_contacts):
+        for i in range(nb_contacts):
+            key = get_id("contact", i)
+            state = "Trusted" if self.rng.random() < 0.9 else "Pending"
+            if state == "Trusted":
+                self.contact_keys.append(key)
+            self.add("contact", {
+                "_id": key,
+                "doc_type": "Contact",
+                "name": "Contact %d" % i,
+                "key": key,
+                # Nothing listens there: requests to contacts fail fast.
+                "url": "http://127.0.0.1:9/contact-%d/" % i,
+                "state": state,
+                "slug": "contact-%d" % i,
+                "requestDate": get_date(i, 1),
+                "description": get_text(self.rng, 10),
+                "date": get_date(i, 1),
+                "tags": ["all", self.rng.choice(TAGS[1:])],
+                "attachments": []
+            })
+
+    def generate_microposts(self, nb_microposts):
+        for i in range(nb_microposts):
+            author_key, is_mine = self.get_author()
+            content = get_markdown(self.rng)
+            self.add("micropost", {
+                "_id": get_id("micropost", i),
+                "doc_type": "MicroPost",
+                "author": "Benchmark Owner" if is_mine else "Contact",
+                "authorKey": author_key,
+                "content": content,
+                "htmlContent": markdown_util.render(content),
+                "isMine": is_mine,
+                "date": get_date(i, 10),
+                "tags": ["all", self.rng.choice(TAGS[1:])],
+                "pictures": [],
+                "pictures_to_download": [],
+                "commons": [],
+                # Like microposts posted through handlers: schema property
+                # and the field read by news/common view.
+                "commons_to_donwload": [],
+                "commons_to_download": [],
+                "attachments": []
+            })
+
+    def generate_pictures(self, nb_pictures):
+        # A few images are generated, then reused: encoding is slow.
+        images = [get_image(self.rng, (1600, 1200)) for i in range(5)]
+        renditions = [get_renditions(image) for image in images]
+
+        for i in range(nb_pictures):
+            author_key, is_mine = self.get_author()
+            index = self.rng.randrange(len(images))
+            preview, thumbnail = renditions[index]
+            path = "picture-%d.jpg" % i
+            self.add("picture", {
+                "_id": get_id("picture", i),
+                "doc_type": "Picture",
+                "author": "Benchmark Owner" if is_mine else "Contact",
+                "authorKey": author_key,
+                "title": get_text(self.rng, 3),
+                "path": path,
+                "contentType": "image/jpeg",
+                "isMine": is_mine,
+                "isFile": True,
+                "orientation": 0,
+                "date": get_date(i, 60),
+                "tags": ["all"],
+                "attachments": [],
+                "_attachments": {
+                    path: get_attachment(images[index], "image/jpeg"),
+                    "prev_" + path: get_attachment(preview, "image/jpeg"),
+                    "th_" + path: get_attachment(thumbnail, "image/jpeg")
+                }
+            })
+
+    def generate_commons(self, nb_commons, size):
+        for i in range(nb_commons):
+            author_key, is_mine = self.get_author()
+            path = "common-%d.bin" % i
+            content = ("%0*x" % (size * 2, self.rng.getrandbits(size * 8))) \
+                .decode("hex")
+            self.add("common", {
+                "_id": get_id("common", i),
+                "doc_type": "Common",
+                "author": "Benchmark Owner" if is_mine else "Contact",
+                "authorKey": author_key,
+                "title": get_text(self.rng, 3),
+                "path": path,
+                "contentType": "application/octet-stream",
+                "isMine": is_mine,
+                "isFile": True,
+                "date": get_date(i, 120),
+                "tags": ["all"],
+                "attachments": [],
+                "_attachments": {
+                    path: get_attachment(content, "application/octet-stream")
+                }
+            })
+
+    def generate_notes(self, nb_notes):
+        for i in range(nb_notes):
+            content = "\n\n".join(get_markdown(self.rng)
+                                  for j in range(self.rng.randint(1, 5)))
+            self.add("note", {
+                "_id": get_id("note", i),
+                "doc_type": "Note",
+                "author": "Benchmark Owner",
+                "authorKey": self.owner_key,
+                "title": get_text(self.rng, 4),
+                "content": content,
+                "htmlContent": markdown_util.render(content),
+                "lastModified": get_date(i, 30),
+                "isMine": True,
+                "date": get_date(i, 30),
+                "tags": ["all"],
+                "attachments": []
+            })
+
+    def generate_activities(self, nb_activities):
+        kinds = [(kind, doc_type, verb) for kind, doc_type, verb in [
+            ("micropost", "MicroPost", "writes"),
+            ("picture", "Picture", "publishes"),
+            ("common", "Common", "shares"),
+            ("note", "Note", "writes")] if self.ids.get(kind)]
+        if not kinds:
+            return
+
+        for i in range(nb_activities):
+            kind, doc_type, verb = self.rng.choice(kinds)
+            author_key, is_mine = self.get_author()
+            self.add("activity", {
+                "_id": get_id("activity", i),
+                "doc_type": "Activity",
+                "author": "Benchmark Owner" if is_mine else "Contact",
+                "authorKey": author_key,
+                "verb": verb,
+                "docType": doc_type,
+                "docId": self.rng.choice(self.ids[kind]),
+                "method": "POST",
+                "isMine": is_mine,
+                "errors": [],
+                "date": get_date(i, 5),
+                "tags": ["all"],
+                "attachments": []
+            })
+
+    def get_manifest(self, sizes, seed):
+        return {
+            "seed": seed,
+            "sizes": sizes,
+            "ownerKey": self.owner_key,
+            "ids": self.ids
+        }
+
+
+def generate(db, sizes, seed, batch_size, password, common_size):
+    '''
+    Generates a dataset of given *sizes* (number of documents by kind)
+    inside *db*. Returns its manifest.
+    '''
+    generator = DatasetGenerator(db, seed, batch_size)
+    generator.generate_owner(password)
+    generator.generate_contacts(sizes["contacts"])
+    generator.generate_microposts(sizes["microposts"])
+    generator.generate_pictures(sizes["pictures"])
+    generator.generate_commons(sizes["commons"], common_size)
+    generator.generate_notes(sizes["notes"])
+    generator.generate_activities(sizes["activities"])
+    generator.flush()
+    return generator.get_manifest(sizes, seed)
+
+
+def serve():
+    '''
+    Serves the database with Newebe until interrupted.
+    '''
+    server = HTTPServer(Newebe(), xheaders=True)
+    server.listen(CONFIG.main.port)
+    io_loop = IOLoop.instance()
+    io_loop.add_callback(changes_watcher.start)
+    print "Newebe serves the dataset on port %d." % CONFIG.main.port
+    try:
+        io_loop.start()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    load_config()
+    server = get_server()
+    if options.reset and CONFIG.db.name in server:
+        server.delete_db(CONFIG.db.name)
+    db = server.get_or_create_db(CONFIG.db.name)
+    if db.info()["doc_count"]:
+        print "Database %s is not empty, use --reset to replace it." % \
+            CONFIG.db.name
+        sys.exit(1)
+    CouchdbkitHandler().sync_all_app(CONFIG.db.uri, CONFIG.db.name,
+                                     CONFIG.db.views)
+
+    sizes = dict((kind, getattr(options, kind)) for kind in [
+        "contacts", "microposts", "pictures", "commons", "notes",
+        "activities"])
+    manifest = generate(db, sizes, options.seed, options.batch,
+                        options.password, options.common_size)
+    manifest["database"] = CONFIG.db.name
+
+    with open(options.manifest, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+    print "Dataset generated in %s: %s" % (
+        CONFIG.db.name, ", ".join("%d %s" % (size, kind)
+                                  for kind, size in sorted(sizes.items())))
+
+    if is_memory_uri(CONFIG.db.uri):
+        serve()
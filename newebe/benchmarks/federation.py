@@ -0,0 +1,610 @@
+"""
+Federation harness: starts several Newebe nodes, makes them trusted contacts
+of each other, then runs federation workloads and writes delivery success
+rate and propagation latency of each workload to a JSON results file.
+
+Propagation latency is the time between the request sent to the author node
+and the arrival of the document on a contact, seen from the contact
+websocket (/publisher/). Workloads, run in this order by default:
+
+ * broadcast: every node posts microposts.
+ * sync: a new node joins the federation and synchronizes with its
+   contacts, it should receive every micropost they still publish.
+ * retry: last node is paused (SIGSTOP) while other nodes post. Once it
+   resumes, failed deliveries are sent again through the retry service of
+   their author.
+ * deletion: every node deletes its microposts, copies of its contacts
+   should be deleted too.
+
+Each node is a newebe_server.py subprocess listening on a free port, with
+its own database and working directory (config file, indexes, logs): nodes
+cannot share a process because configuration and database bindings are
+process wide. With the default memory:// database URI no CouchDB is needed,
+with a CouchDB URI node databases are named after --dbname and reset before
+start. Run it from the newebe folder:
+
+    python benchmarks/federation.py --nodes=4 --posts=10 \\
+                                    --results=federation-results.json
+
+Contacts identify a micropost by its author and its date, to the second, so
+a node posts at most one micropost every --interval seconds. Paused node
+must stay paused longer than contact requests timeout (20s) for deliveries
+to fail: see --outage.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import datetime
+import tempfile
+import subprocess
+
+import yaml
+
+from couchdbkit import Server
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.escape import json_encode, json_decode
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPError
+from tornado.websocket import websocket_connect
+from tornado.options import define, options, parse_command_line
+
+sys.path.append("../")
+
+from newebe.lib.slugify import slugify
+from newebe.lib.memory_couchdb import is_memory_uri
+
+define('nodes', default=3, help="Number of nodes started before workloads")
+define('dburi', default="memory://", help="Database URI of nodes")
+define('dbname', default="newebe_federation",
+       help="Prefix of node database names")
+define('password', default="password", help="Password of node owners")
+define('workloads', default="broadcast,sync,retry,deletion",
+       help="Workloads to run (comma separated names)")
+define('posts', default=10, help="Microposts posted by each node")
+define('interval', default=1.2,
+       help="Delay between two microposts of a node (seconds)")
+define('outage', default=25, help="Pause duration of retry workload node")
+define('timeout', default=60,
+       help="Time given to deliveries to arrive (seconds)")
+define('results', default="federation-results.json",
+       help="Path of the results file")
+define('keep', default=False,
+       help="Keep node folders (logs) and databases after the run")
+
+NEWEBE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Node settings that differ from defaults: federation traffic comes from a
+# single address and is much denser than real contact traffic, and retries
+# should not wait for the circuit of a paused contact to half-open.
+NODE_SETTINGS = {
+    "debug": False,
+    "ssl": False,
+    "workers": 1,
+    "ip_rate": 10000,
+    "ip_burst": 10000,
+    "contact_rate": 10000,
+    "contact_burst": 10000,
+    "shed_in_flight": 10000,
+    "websocket_queue_size": 10000,
+    "contact_circuit_reset": 1
+}
+
+# Time given to a resumed node before failed deliveries are retried.
+RECOVERY_DELAY = 2
+
+
+def sleep(seconds):
+    return gen.Task(IOLoop.instance().add_timeout, time.time() + seconds)
+
+
+def get_free_port():
+    '''
+    Returns a port that is free when called, node binds it later.
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def get_url_date(date):
+    '''
+    Converts a document date to the date format of URLs.
+    '''
+    return date.rstrip("Z").replace("T", "-").replace(":", "-")
+
+
+def percentile(values, ratio):
+    '''
+    Returns the value below which *ratio* of sorted *values* fall.
+    '''
+    index = min(len(values) - 1, int(len(values) * ratio))
+    return values[index]
+
+
+class Node(object):
+    '''
+    A Newebe server run as subprocess, driven through its REST API. Documents
+    it receives from contacts are reported to *tracker*.
+    '''
+
+    def __init__(self, index, client, tracker):
+        self.name = "node%d" % index
+        self.port = get_free_port()
+        self.url = "http://127.0.0.1:%d/" % self.port
+        self.dbname = "%s_%d" % (options.dbname, index)
+        self.path = tempfile.mkdtemp(prefix="newebe-%s-" % self.name)
+        self.client = client
+        self.tracker = tracker
+        self.process = None
+        self.cookie = None
+        self.key = None
+        self.websocket = None
+        # Content of received microposts, by local id.
+        self.received = {}
+
+    def write_config(self):
+        '''
+        Writes node config file inside node folder, returns its path.
+        '''
+        main = dict(NODE_SETTINGS, port=self.port, path=self.path,
+                    logpath=self.path)
+        config = {"main": main,
+                  "db": {"uri": options.dburi, "name": self.dbname}}
+
+        config_path = os.path.join(self.path, "config.yaml")
+        with open(config_path, "w") as config_file:
+            yaml.safe_dump(config, config_file, default_flow_style=False)
+        return config_path
+
+    @gen.coroutine
+    def start(self):
+        '''
+        Starts node server and waits until it answers.
+        '''
+        if not is_memory_uri(options.dburi):
+            server = Server(options.dburi)
+            if self.dbname in server:
+                server.delete_db(self.dbname)
+
+        with open(os.path.join(self.path, "output.log"), "w") as log_file:
+            self.process = subprocess.Popen(
+                [sys.executable, "newebe_server.py",
+                 "--configfile=%s" % self.write_config()],
+                cwd=NEWEBE_PATH, stdout=log_file, stderr=subprocess.STDOUT)
+
+        deadline = time.time() + options.timeout
+        while True:
+            response = yield gen.Task(self.client.fetch,
+                                      self.url + "user/state/")
+            if response.code == 200:
+                break
+            if self.process.poll() is not None or time.time() > deadline:
+                raise Exception("%s did not start, see logs in %s." %
+                                (self.name, self.path))
+            yield sleep(0.2)
+
+    @gen.coroutine
+    def fetch(self, path, method="GET", body=None):
+        '''
+        Sends a request to the node as its owner, returns decoded JSON
+        response.
+        '''
+        headers = {}
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        if body is not None:
+            body = json_encode(body)
+
+        request = HTTPRequest(self.url + path, method=method, body=body,
+                              headers=headers,
+                              request_timeout=options.timeout)
+        response = yield self.client.fetch(request)
+        if "Set-Cookie" in response.headers:
+            self.cookie = response.headers["Set-Cookie"]
+        raise gen.Return(json_decode(response.body))
+
+    @gen.coroutine
+    def register(self):
+        '''
+        Creates node owner and sets node URL in its profile.
+        '''
+        user = yield self.fetch("register/", "POST", {"name": self.name})
+        self.key = user["key"]
+        yield self.fetch("register/password/", "POST",
+                         {"password": options.password})
+        yield self.fetch("user/", "PUT", {"name": self.name, "url": self.url,
+                                          "description": "Federation node"})
+
+    @gen.coroutine
+    def listen(self):
+        '''
+        Subscribes to microposts and activities published by the node.
+        '''
+        request = HTTPRequest("ws://127.0.0.1:%d/publisher/" % self.port,
+                              headers={"Cookie": self.cookie})
+        self.websocket = yield websocket_connect(request)
+        self.websocket.write_message(
+            json_encode({"subscribe": ["microposts", "activities"]}))
+        IOLoop.instance().add_future(self.read_events(),
+                                     lambda future: future.result())
+
+    @gen.coroutine
+    def read_events(self):
+        while True:
+            message = yield self.websocket.read_message()
+            if message is None:
+                break
+            self.on_event(json_decode(message), time.time())
+
+    def on_event(self, doc, date):
+        '''
+        Reports microposts received from contacts and their deletion.
+        '''
+        if doc.get("isMine"):
+            return
+
+        if doc.get("doc_type") == "MicroPost":
+            self.received[doc["_id"]] = doc["content"]
+            self.tracker.arrive(("create", doc["content"], self.name), date)
+
+        elif doc.get("doc_type") == "Activity" and \
+                doc.get("docType") == "micropost" and \
+                doc.get("method") == "DELETE":
+            content = self.received.get(doc["docId"])
+            if content is not None:
+                self.tracker.arrive(("delete", content, self.name), date)
+
+    @gen.coroutine
+    def get_activities(self, doc_ids):
+        '''
+        Returns owner activities linked to documents of *doc_ids*. Activity
+        pages are read from the latest one until every document is found.
+        '''
+        doc_ids = set(doc_ids)
+        seen = set()
+        activities = []
+        path = "activities/mine/"
+
+        while doc_ids:
+            data = yield self.fetch(path)
+            rows = [row for row in data["rows"] if row["_id"] not in seen]
+            if not rows:
+                break
+
+            for row in rows:
+                seen.add(row["_id"])
+                if row["docId"] in doc_ids:
+                    activities.append(row)
+            doc_ids.difference_update(row["docId"] for row in rows)
+            path = "activities/mine/%s/" % get_url_date(rows[-1]["date"])
+
+        raise gen.Return(activities)
+
+    def pause(self):
+        os.kill(self.process.pid, signal.SIGSTOP)
+
+    def resume(self):
+        os.kill(self.process.pid, signal.SIGCONT)
+
+    def stop(self):
+        if self.websocket is not None:
+            self.websocket.close()
+        if self.process is not None and self.process.poll() is None:
+            self.resume()
+            self.process.terminate()
+            self.process.wait()
+
+        if not options.keep:
+            shutil.rmtree(self.path, ignore_errors=True)
+            if not is_memory_uri(options.dburi):
+                server = Server(options.dburi)
+                if self.dbname in server:
+                    server.delete_db(self.dbname)
+
+
+class Tracker(object):
+    '''
+    Arrival dates of deliveries. A delivery is identified by its kind
+    ("create" or "delete"), micropost content and receiving node name.
+    '''
+
+    def __init__(self):
+        self.arrivals = {}
+
+    def arrive(self, delivery, date):
+        self.arrivals.setdefault(delivery, date)
+
+    @gen.coroutine
+    def wait(self, deliveries):
+        '''
+        Waits until every delivery of *deliveries* arrived, at most
+        --timeout seconds.
+        '''
+        deadline = time.time() + options.timeout
+        while time.time() < deadline and \
+                any(delivery not in self.arrivals for delivery in deliveries):
+            yield sleep(0.1)
+
+    def get_stats(self, deliveries, start):
+        '''
+        Returns success rate and latencies of *deliveries*, a dict of
+        deliveries and the date their request was sent, for a workload
+        started at *start*.
+        '''
+        arrivals = [self.arrivals[delivery] for delivery in deliveries
+                    if delivery in self.arrivals]
+        latencies = sorted(self.arrivals[delivery] - sent
+                           for delivery, sent in deliveries.items()
+                           if delivery in self.arrivals)
+
+        stats = {"expected": len(deliveries), "delivered": len(latencies)}
+        if not latencies:
+            return stats
+
+        duration = max(arrivals) - start
+        stats.update({
+            "success_rate": len(latencies) / float(len(deliveries)),
+            "duration": duration,
+            "throughput": len(latencies) / duration,
+            "mean": sum(latencies) / len(latencies),
+            "p50": percentile(latencies, 0.5),
+            "p90": percentile(latencies, 0.9),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1]
+        })
+        return stats
+
+
+class Federation(object):
+    '''
+    Nodes that trust each other and the microposts they published.
+    '''
+
+    def __init__(self):
+        self.client = AsyncHTTPClient(max_clients=100)
+        self.tracker = Tracker()
+        self.nodes = []
+        # Published microposts (author, id and content).
+        self.posts = []
+
+    @gen.coroutine
+    def start(self, nb_nodes):
+        '''
+        Starts *nb_nodes* nodes and makes them contacts of each other.
+        First node builds static assets, other ones start in parallel.
+        '''
+        nodes = [Node(index, self.client, self.tracker)
+                 for index in range(nb_nodes)]
+        self.nodes.extend(nodes)
+
+        yield nodes[0].start()
+        yield [node.start() for node in nodes[1:]]
+        yield [node.register() for node in nodes]
+        yield [node.listen() for node in nodes]
+
+        for index, node in enumerate(nodes):
+            for contact in nodes[index + 1:]:
+                yield self.make_contacts(node, contact)
+
+    @gen.coroutine
+    def add_node(self):
+        '''
+        Starts a new node and makes it a contact of every node.
+        '''
+        node = Node(len(self.nodes), self.client, self.tracker)
+        nodes = list(self.nodes)
+        self.nodes.append(node)
+
+        yield node.start()
+        yield node.register()
+        yield node.listen()
+        for contact in nodes:
+            yield self.make_contacts(node, contact)
+        raise gen.Return(node)
+
+    @gen.coroutine
+    def make_contacts(self, node, contact):
+        '''
+        *node* sends a contact request to *contact* that accepts it.
+        '''
+        yield node.fetch("contacts/", "POST", {"url": contact.url})
+        yield contact.fetch("contacts/%s" % slugify(unicode(node.url)),
+                            "PUT", {"state": "Trusted"})
+
+        trusted = yield node.fetch("contacts/trusted/")
+        if contact.url not in [row["url"] for row in trusted["rows"]]:
+            raise Exception("%s could not trust %s." %
+                            (node.name, contact.name))
+
+    def stop(self):
+        for node in self.nodes:
+            node.stop()
+
+    @gen.coroutine
+    def post_microposts(self, authors, workload):
+        '''
+        Each node of *authors* posts --posts microposts. Returns expected
+        deliveries to other nodes and the date their micropost was sent.
+        '''
+        deliveries = {}
+
+        @gen.coroutine
+        def post(author):
+            for index in range(options.posts):
+                start = time.time()
+                content = "%s %s %d" % (workload, author.name, index)
+                for node in self.nodes:
+                    if node is not author:
+                        deliveries[("create", content, node.name)] = start
+
+                micropost = yield author.fetch(
+                    "microposts/all/", "POST",
+                    {"content": content, "tags": ["all"]})
+                self.posts.append((author, micropost["_id"], content))
+                yield sleep(max(0, start + options.interval - time.time()))
+
+        yield [post(author) for author in authors]
+        raise gen.Return(deliveries)
+
+    @gen.coroutine
+    def broadcast(self):
+        start = time.time()
+        deliveries = yield self.post_microposts(self.nodes, "broadcast")
+        yield self.tracker.wait(deliveries)
+        raise gen.Return(self.tracker.get_stats(deliveries, start))
+
+    @gen.coroutine
+    def sync(self):
+        if not self.posts:
+            deliveries = yield self.post_microposts(self.nodes, "sync")
+            yield self.tracker.wait(deliveries)
+
+        node = yield self.add_node()
+        start = time.time()
+        deliveries = dict((("create", content, node.name), start)
+                          for author, id, content in self.posts)
+        yield node.fetch("synchronize/")
+        yield self.tracker.wait(deliveries)
+        raise gen.Return(self.tracker.get_stats(deliveries, start))
+
+    @gen.coroutine
+    def retry(self):
+        paused = self.nodes[-1]
+        authors = self.nodes[:-1]
+        nb_posts = len(self.posts)
+
+        start = time.time()
+        paused.pause()
+        try:
+            deliveries = yield self.post_microposts(authors, "retry")
+            yield sleep(max(0, start + options.outage - time.time()))
+        finally:
+            paused.resume()
+
+        # The pause looks like a long IOLoop lag to the resumed node: it
+        # sheds requests until it measures lag again.
+        yield sleep(RECOVERY_DELAY)
+        retries, failures = yield self.retry_deliveries(
+            authors, paused, [post[1] for post in self.posts[nb_posts:]])
+        yield self.tracker.wait(deliveries)
+
+        stats = self.tracker.get_stats(deliveries, start)
+        stats.update({"retries": retries, "failed_retries": failures})
+        raise gen.Return(stats)
+
+    @gen.coroutine
+    def retry_deliveries(self, authors, contact, doc_ids):
+        '''
+        Asks *authors* to send again microposts of *doc_ids* of which
+        delivery to *contact* failed. Returns the number of retries and of
+        failed retries.
+        '''
+        counts = {"retries": 0, "failures": 0}
+
+        @gen.coroutine
+        def retry_author(author):
+            activities = yield author.get_activities(doc_ids)
+            for activity in activities:
+                errors = activity.get("errors") or []
+                if activity["method"] != "POST" or contact.key not in \
+                        [error["contactKey"] for error in errors]:
+                    continue
+
+                # One by one: first retry probes contact circuit.
+                counts["retries"] += 1
+                try:
+                    yield author.fetch(
+                        "microposts/%s/retry/" % activity["docId"], "POST",
+                        {"contactId": contact.key,
+                         "activityId": activity["_id"]})
+                except HTTPError:
+                    counts["failures"] += 1
+
+        yield [retry_author(author) for author in authors]
+        raise gen.Return((counts["retries"], counts["failures"]))
+
+    @gen.coroutine
+    def deletion(self):
+        start = time.time()
+        deliveries = {}
+
+        @gen.coroutine
+        def delete(author):
+            for post_author, id, content in self.posts:
+                if post_author is not author:
+                    continue
+
+                sent = time.time()
+                for node in self.nodes:
+                    if ("create", content, node.name) in \
+                            self.tracker.arrivals:
+                        deliveries[("delete", content, node.name)] = sent
+                yield author.fetch("microposts/%s/" % id, "DELETE")
+
+        yield [delete(author) for author in self.nodes]
+        self.posts = []
+        yield self.tracker.wait(deliveries)
+        raise gen.Return(self.tracker.get_stats(deliveries, start))
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@gen.coroutine
+def run_workloads(federation):
+    names = [name for name in options.workloads.split(",") if name]
+    for name in names:
+        if not hasattr(Federation, name):
+            raise Exception("Unknown workload: %s" % name)
+
+    yield federation.start(options.nodes)
+
+    results = {
+        "date": datetime.datetime.utcnow().isoformat(),
+        "commit": get_commit(),
+        "options": {
+            "nodes": options.nodes,
+            "dburi": options.dburi,
+            "posts": options.posts,
+            "interval": options.interval,
+            "outage": options.outage
+        },
+        "workloads": {}
+    }
+    for name in names:
+        stats = yield getattr(federation, name)()
+        results["workloads"][name] = stats
+        if stats["delivered"]:
+            print "%-10s %6.1f%% delivered (%d/%d)  p50 %8.1fms  " \
+                  "p99 %8.1fms" % (
+                      name, stats["success_rate"] * 100, stats["delivered"],
+                      stats["expected"], stats["p50"] * 1000,
+                      stats["p99"] * 1000)
+        else:
+            print "%-10s nothing delivered (%d expected)" % (
+                name, stats["expected"])
+        sys.stdout.flush()
+
+    with open(options.results, "w") as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    parse_command_line()
+    federation = Federation()
+    try:
+        IOLoop.instance().run_sync(lambda: run_workloads(federation))
+    finally:
+        federation.stop()
@@ -0,0 +1,97 @@
+"""
+Benchmark of document ingestion from a contact: microposts sent one by one
+to microposts/contacts/ versus the same amount sent in a single request to
+the batch endpoint.
+
+The target Newebe must have a trusted contact of which key is given in
+arguments. Run it from the newebe folder:
+
+    python benchmarks/ingest.py --url=http://localhost:8000/ \
+                                --key=contactkey --documents=500
+"""
+
+import sys
+import time
+import datetime
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.escape import json_encode
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.options import define, options, parse_command_line
+
+sys.path.append("../")
+
+define('url', default="http://localhost:8000/", help="Newebe root URL")
+define('key', default="", help="Key of a contact trusted by target Newebe")
+define('documents', default=200, help="Number of microposts to send")
+
+DB_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def get_microposts(start_date):
+    '''
+    Builds microposts with distinct dates so none of them is deduplicated.
+    '''
+    microposts = []
+    for i in range(options.documents):
+        date = start_date + datetime.timedelta(seconds=i)
+        microposts.append({
+            "authorKey": options.key,
+            "author": "benchmark",
+            "content": "Benchmark micropost %d" % i,
+            "date": date.strftime(DB_DATETIME_FORMAT),
+            "tags": ["all"]
+        })
+    return microposts
+
+
+@gen.coroutine
+def send_one_by_one(client, microposts):
+    for micropost in microposts:
+        request = HTTPRequest(options.url + "microposts/contacts/",
+                              method="POST", body=json_encode(micropost),
+                              validate_cert=False)
+        response = yield gen.Task(client.fetch, request)
+        if response.error:
+            raise response.error
+
+
+@gen.coroutine
+def send_batch(client, microposts):
+    body = json_encode({
+        "key": options.key,
+        "rows": [{"docType": "MicroPost", "doc": micropost}
+                 for micropost in microposts]
+    })
+    request = HTTPRequest(options.url + "synchronize/contact/batch/",
+                          method="POST", body=body, validate_cert=False,
+                          request_timeout=600)
+    response = yield gen.Task(client.fetch, request)
+    if response.error:
+        raise response.error
+
+
+@gen.coroutine
+def main():
+    client = AsyncHTTPClient()
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+
+    for name, send, start_date in [
+            ("single posts", send_one_by_one,
+             now - datetime.timedelta(days=2)),
+            ("batch", send_batch,
+             now - datetime.timedelta(days=1))]:
+        microposts = get_microposts(start_date)
+        start = time.time()
+        yield send(client, microposts)
+        duration = time.time() - start
+
+        print "%s: %d documents in %.2fs, %.2fms per document" % \
+            (name, len(microposts), duration,
+             duration * 1000 / len(microposts))
+
+
+if __name__ == '__main__':
+    parse_command_line()
+    IOLoop.instance().run_sync(main)
@@ -0,0 +1,77 @@
+"""
+Benchmark of micropost HTML page rendering: markdown rendered on every
+request (previous behaviour), rendered once and kept in the render cache,
+and stored inside the document at save time.
+
+No database is needed. Run it from the newebe folder:
+
+    python benchmarks/markdown_render.py --requests=500 --paragraphs=50
+"""
+
+import sys
+import time
+
+from tornado.options import define, options, parse_command_line
+from tornado.template import Loader
+
+sys.path.append("../")
+
+define('requests', default=500, help="Number of page renderings")
+define('paragraphs', default=30, help="Number of paragraphs of micropost")
+
+from newebe.lib import markdown_util
+from newebe.apps.news.models import MicroPost
+
+PARAGRAPH = """
+Some *markdown* content with a [link](http://newebe.org) and a list:
+
+* first item with `code`
+* second item with **bold text**
+"""
+
+
+def get_micropost(content, html=None):
+    micropost = MicroPost(content=content, htmlContent=html,
+                          tags=["all"])
+    micropost._doc["_id"] = "benchmark"
+    micropost._doc["_rev"] = "1-benchmark"
+    return micropost
+
+
+def render_page(template, micropost, get_content):
+    return template.generate(micropost=get_content(micropost))
+
+
+def main():
+    loader = Loader("apps/news/templates")
+    template = loader.load("micropost.html")
+    content = PARAGRAPH * options.paragraphs
+
+    def render_every_time(micropost):
+        micropost.content = markdown_util.render(content)
+        return micropost
+
+    def render_from_cache(micropost):
+        micropost.content = markdown_util.get_html(micropost)
+        return micropost
+
+    html = markdown_util.render(content)
+    for name, micropost, get_content in [
+            ("markdown on every request", get_micropost(content),
+             render_every_time),
+            ("render cache", get_micropost(content), render_from_cache),
+            ("stored HTML", get_micropost(content, html),
+             render_from_cache)]:
+
+        start = time.time()
+        for i in range(options.requests):
+            render_page(template, micropost, get_content)
+        duration = time.time() - start
+
+        print "%s: %.3fms per page" % \
+            (name, duration * 1000 / options.requests)
+
+
+if __name__ == '__main__':
+    parse_command_line()
+    main()
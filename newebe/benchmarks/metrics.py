@@ -0,0 +1,116 @@
+"""
+Benchmark of request metrics overhead: cost of recording metrics of a
+request (stack context, CouchDB calls and request observation), and
+duration of requests served by a handler that does three (fake) CouchDB
+calls, with and without metrics.
+
+No database is needed. Run it from the newebe folder:
+
+    python benchmarks/metrics.py --requests=2000
+"""
+
+import sys
+import time
+
+from tornado import gen
+from tornado.options import define, options, parse_command_line
+from tornado.web import Application, RequestHandler, asynchronous
+from tornado.ioloop import IOLoop
+from tornado.httpserver import HTTPServer
+from tornado.httpclient import AsyncHTTPClient
+
+sys.path.append("../")
+
+define('requests', default=2000, help="Number of requests")
+define('benchmark_port', default=18900, help="Port of benchmark server")
+
+from newebe.lib import async_db
+from newebe.lib.metrics import metrics, RequestStats, request_context
+from newebe.lib.lazy_handler import LazyHandler, set_routes
+from newebe.apps.core.handlers import NewebeHandler
+
+ROUTE = '/benchmark/$'
+
+
+def call_db():
+    metrics.observe_db_call(0.001)
+
+
+class BenchmarkHandler(NewebeHandler):
+
+    @asynchronous
+    @gen.coroutine
+    def get(self):
+        call_db()
+        yield async_db.run(call_db)
+        call_db()
+        self.write("ok")
+        self.finish()
+
+
+def record_request():
+    '''
+    Metrics work done for a request.
+    '''
+    stats = RequestStats()
+    with request_context(stats):
+        for i in range(3):
+            call_db()
+    metrics.observe_request(ROUTE, "GET", 200, 0.01, stats)
+
+
+def disable_metrics():
+    '''
+    Replaces metrics recording by no-ops.
+    '''
+    for name in ["observe_request", "observe_db_call"]:
+        setattr(metrics, name, lambda *args: None)
+    NewebeHandler._execute = RequestHandler._execute
+    NewebeHandler.request_stats = None
+
+
+@gen.coroutine
+def send_requests():
+    client = AsyncHTTPClient()
+    url = "http://127.0.0.1:%d/benchmark/" % options.benchmark_port
+    for i in range(options.requests):
+        yield client.fetch(url)
+
+
+def serve(name):
+    start = time.time()
+    IOLoop.instance().run_sync(send_requests)
+    duration = time.time() - start
+    print "%s: %.3fms per request" % \
+        (name, duration * 1000 / options.requests)
+
+
+def main():
+    start = time.time()
+    for i in range(options.requests):
+        record_request()
+    duration = time.time() - start
+    print "metrics recording: %.1fus per request" % \
+        (duration * 1000000 / options.requests)
+
+    start = time.time()
+    metrics.export()
+    print "metrics export: %.2fms" % ((time.time() - start) * 1000)
+
+    handler = LazyHandler("newebe.benchmarks.BenchmarkHandler")
+    handler.handler_class = BenchmarkHandler
+    routes = [(ROUTE, handler)]
+    set_routes(routes)
+    application = Application(routes, log_function=lambda handler: None)
+    server = HTTPServer(application)
+    server.listen(options.benchmark_port, "127.0.0.1")
+
+    serve("requests with metrics")
+    disable_metrics()
+    serve("requests without metrics")
+    server.stop()
+
+
+if __name__ == '__main__':
+    parse_command_line()
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark of picture rotation: previous handler (thumbnail, preview and
+original decoded, rotated, written to disk, read back and saved after each
+step) against orientation stored in the picture document and applied when
+files are served.
+
+Document writes are counted, not performed, so no database is needed. Run
+it from the newebe folder:
+
+    python benchmarks/picture_rotate.py --rotations=20
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from StringIO import StringIO
+
+from tornado.options import define, options, parse_command_line
+from PIL import Image
+
+sys.path.append("../")
+
+define('rotations', default=20, help="Number of rotations")
+define('views', default=10,
+       help="Number of times thumbnail and preview are served per rotation")
+
+from newebe.lib import picture as picture_util
+
+PICTURE = "apps/pictures/tests/test.jpg"
+
+
+class FakePicture(object):
+    '''
+    Picture document keeping attachments in memory and counting writes.
+    '''
+
+    def __init__(self, files):
+        self._id = "benchmark"
+        self.files = dict(files)
+        self.orientation = 0
+        self.writes = 0
+
+    def fetch_attachment(self, name):
+        return self.files[name]
+
+    def put_attachment(self, content, name):
+        self.files[name] = content
+        self.writes += 1
+
+    def save(self):
+        self.writes += 1
+
+
+def get_files():
+    content = open(PICTURE, "rb").read()
+    files = {"benchmark.jpg": content}
+    for prefix, size in [("th_", (200, 200)), ("prev_", (1000, 1000))]:
+        image = Image.open(StringIO(content))
+        image.thumbnail(size, Image.ANTIALIAS)
+        buffer = StringIO()
+        image.save(buffer, "JPEG")
+        files[prefix + "benchmark.jpg"] = buffer.getvalue()
+    return files
+
+
+def rotate_files(picture):
+    '''
+    Previous rotation handler. Files are written to the temporary folder
+    instead of CONFIG.main.path.
+    '''
+    for path in ["th_benchmark.jpg", "prev_benchmark.jpg", "benchmark.jpg"]:
+        file_path = os.path.join(tempfile.gettempdir(), path)
+        image = Image.open(StringIO(picture.fetch_attachment(path)))
+        image = image.rotate(-90)
+        image.save(file_path)
+
+        file_buffer = open(file_path)
+        picture.put_attachment(file_buffer.read(), path)
+        picture.save()
+        os.remove(file_path)
+
+
+def rotate_orientation(picture):
+    '''
+    Current rotation handler.
+    '''
+    picture.orientation = picture_util.get_next_orientation(
+        picture.orientation)
+    picture.save()
+
+
+def serve_renditions(picture):
+    for path in ["th_benchmark.jpg", "prev_benchmark.jpg"]:
+        picture_util.get_oriented_attachment(picture, path)
+
+
+def main():
+    files = get_files()
+
+    for name, rotate in [("re-encoded files", rotate_files),
+                         ("stored orientation", rotate_orientation)]:
+        picture = FakePicture(files)
+        picture_util.rotation_cache.entries.clear()
+
+        rotation_time = 0
+        serving_time = 0
+        for i in range(options.rotations):
+            start = time.time()
+            rotate(picture)
+            rotation_time += time.time() - start
+
+            start = time.time()
+            for j in range(options.views):
+                serve_renditions(picture)
+            serving_time += time.time() - start
+
+        print "%s: %.1fms per rotation, %d document writes per rotation, " \
+              "%.2fms to serve thumbnail and preview" % \
+            (name, rotation_time * 1000 / options.rotations,
+             picture.writes / options.rotations,
+             serving_time * 1000 / (options.rotations * options.views))
+
+
+if __name__ == '__main__':
+    parse_command_line()
+    main()
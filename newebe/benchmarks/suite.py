@@ -0,0 +1,274 @@
+"""
+Benchmark suite: drives the main HTTP routes of a running Newebe with
+concurrent clients and writes throughput and latency percentiles of each
+scenario to a JSON results file.
+
+Target Newebe must serve a dataset built by benchmarks/dataset.py, of which
+manifest gives document ids to request. Requests of a scenario are drawn
+with a fixed seed, so two runs send the same requests. Run it from the
+newebe folder:
+
+    python benchmarks/dataset.py --dbname=newebe_benchmark --reset
+    python newebe_server.py --dbname=newebe_benchmark --ssl=False &
+    python benchmarks/suite.py --url=http://localhost:8000/ \\
+                               --results=results-after.json
+
+Then compare results of two commits:
+
+    python benchmarks/suite.py --compare=results-before.json,results-after.json
+"""
+
+import sys
+import json
+import time
+import random
+import datetime
+import subprocess
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.escape import json_encode
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.options import define, options, parse_command_line
+
+sys.path.append("../")
+
+define('url', default="http://localhost:8000/", help="Newebe root URL")
+define('password', default="password", help="Newebe owner password")
+define('manifest', default="benchmark-dataset.json",
+       help="Path of the dataset manifest")
+define('scenarios', default="", help="Scenarios to run, all read "
+       "scenarios by default (comma separated names)")
+define('clients', default=20, help="Number of parallel clients")
+define('requests', default=1000, help="Number of requests by scenario")
+define('warmup', default=50, help="Requests sent before measuring")
+define('seed', default=42, help="Random seed of request choice")
+define('results', default="benchmark-results.json",
+       help="Path of the results file")
+define('compare', default="", help="Compare two results files "
+       "(comma separated paths) instead of running the suite")
+
+
+def get_path(kind, path):
+    '''
+    Returns a function that builds *path* for a random document of *kind*.
+    '''
+    def build(rng, ids):
+        return path % rng.choice(ids[kind])
+    return build
+
+
+def get_picture_file_path(prefix):
+    def build(rng, ids):
+        index = rng.randrange(len(ids["picture"]))
+        return "pictures/%s/%spicture-%d.jpg" % (
+            ids["picture"][index], prefix, index)
+    return build
+
+
+def post_micropost(rng, ids):
+    return "microposts/all/", json_encode(
+        {"content": "Benchmark micropost %d" % rng.randint(0, 1000000),
+         "tags": ["all"]})
+
+
+# Name, path (or function returning a path, or a path and a body to post)
+# and True for scenarios that write, which only run when asked.
+SCENARIOS = [
+    ("microposts_all", "microposts/all/", False),
+    ("microposts_mine", "microposts/mine/", False),
+    ("micropost", get_path("micropost", "microposts/%s/"), False),
+    ("micropost_html", get_path("micropost", "microposts/%s/html/"), False),
+    ("pictures_all", "pictures/all/", False),
+    ("picture_thumbnail", get_picture_file_path("th_"), False),
+    ("picture_preview", get_picture_file_path("prev_"), False),
+    ("commons_all", "commons/all/", False),
+    ("common", get_path("common", "commons/%s/"), False),
+    ("notes_all", "notes/all/", False),
+    ("notes_by_date", "notes/all/order-by-date/", False),
+    ("contacts", "contacts/", False),
+    ("contacts_trusted", "contacts/trusted/", False),
+    ("activities_all", "activities/all/", False),
+    ("activities_mine", "activities/mine/", False),
+    ("post_micropost", post_micropost, True),
+]
+
+
+def percentile(values, ratio):
+    '''
+    Returns the value below which *ratio* of sorted *values* fall.
+    '''
+    index = min(len(values) - 1, int(len(values) * ratio))
+    return values[index]
+
+
+def get_stats(latencies, errors, duration):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration": duration,
+        "throughput": len(latencies) / duration,
+        "mean": sum(latencies) / len(latencies),
+        "p50": percentile(latencies, 0.5),
+        "p90": percentile(latencies, 0.9),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1]
+    }
+
+
+@gen.coroutine
+def login(client):
+    '''
+    Logs in and returns authentication cookie.
+    '''
+    request = HTTPRequest(options.url + "login/json/", method="POST",
+                          body=json_encode({"password": options.password}),
+                          validate_cert=False)
+    response = yield client.fetch(request)
+    raise gen.Return(response.headers["Set-Cookie"])
+
+
+def get_requests(path, nb_requests, rng, ids, cookie):
+    '''
+    Returns *nb_requests* requests of a scenario.
+    '''
+    requests = []
+    for i in range(nb_requests):
+        body = None
+        url_path = path
+        if callable(path):
+            url_path = path(rng, ids)
+        if isinstance(url_path, tuple):
+            url_path, body = url_path
+        requests.append(HTTPRequest(
+            options.url + url_path, method="GET" if body is None else "POST",
+            body=body, headers={"Cookie": cookie}, validate_cert=False,
+            request_timeout=60))
+    return requests
+
+
+@gen.coroutine
+def run_requests(client, requests, latencies, errors):
+    '''
+    Sends *requests* with parallel clients, each client sends its next
+    request once previous one is answered.
+    '''
+    requests = iter(requests)
+
+    @gen.coroutine
+    def run_client():
+        for request in requests:
+            start = time.time()
+            response = yield gen.Task(client.fetch, request)
+            if response.error:
+                errors.append(response.code)
+            else:
+                latencies.append(time.time() - start)
+
+    yield [run_client() for i in range(options.clients)]
+
+
+@gen.coroutine
+def run_scenario(client, cookie, name, path, ids):
+    rng = random.Random("%s-%s" % (options.seed, name))
+    warmup = get_requests(path, options.warmup, rng, ids, cookie)
+    yield run_requests(client, warmup, [], [])
+
+    requests = get_requests(path, options.requests, rng, ids, cookie)
+    latencies = []
+    errors = []
+    start = time.time()
+    yield run_requests(client, requests, latencies, errors)
+    raise gen.Return(get_stats(latencies, len(errors),
+                               time.time() - start))
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@gen.coroutine
+def run_suite():
+    with open(options.manifest) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    names = [name for name in options.scenarios.split(",") if name]
+    scenarios = [(name, path) for name, path, writes in SCENARIOS
+                 if name in names or (not names and not writes)]
+
+    client = AsyncHTTPClient(max_clients=options.clients)
+    cookie = yield login(client)
+
+    results = {
+        "date": datetime.datetime.utcnow().isoformat(),
+        "commit": get_commit(),
+        "options": {
+            "clients": options.clients,
+            "requests": options.requests,
+            "warmup": options.warmup,
+            "seed": options.seed
+        },
+        "dataset": {"seed": manifest["seed"], "sizes": manifest["sizes"]},
+        "scenarios": {}
+    }
+    for name, path in scenarios:
+        stats = yield run_scenario(client, cookie, name, path,
+                                   manifest["ids"])
+        results["scenarios"][name] = stats
+        if stats["requests"]:
+            print "%-18s %8.1f req/s  p50 %7.1fms  p99 %7.1fms  %d errors" % \
+                (name, stats["throughput"], stats["p50"] * 1000,
+                 stats["p99"] * 1000, stats["errors"])
+        else:
+            print "%-18s failed: %d errors" % (name, stats["errors"])
+        sys.stdout.flush()
+
+    with open(options.results, "w") as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def get_change(before, after):
+    if not before:
+        return "     n/a"
+    return "%+7.1f%%" % ((after - before) * 100. / before)
+
+
+def compare(before_path, after_path):
+    '''
+    Prints throughput and latency changes of scenarios run in both results
+    files.
+    '''
+    with open(before_path) as before_file:
+        before = json.load(before_file)
+    with open(after_path) as after_file:
+        after = json.load(after_file)
+
+    if before["dataset"] != after["dataset"] or \
+       before["options"] != after["options"]:
+        print "Warning: results were run with different datasets or options."
+
+    print "%-18s %12s %12s %12s" % ("scenario", "throughput", "p50", "p99")
+    for name in sorted(before["scenarios"]):
+        old = before["scenarios"][name]
+        new = after["scenarios"].get(name)
+        if new is None or not old["requests"] or not new["requests"]:
+            continue
+        print "%-18s %12s %12s %12s" % (
+            name, get_change(old["throughput"], new["throughput"]),
+            get_change(old["p50"], new["p50"]),
+            get_change(old["p99"], new["p99"]))
+
+
+if __name__ == '__main__':
+    parse_command_line()
+    if options.compare:
+        compare(*options.compare.split(","))
+    else:
+        IOLoop.instance().run_sync(run_suite)
@@ -0,0 +1,56 @@
+"""
+Benchmark of Newebe throughput depending on the number of worker processes.
+
+For each worker count, a Newebe server is started in production mode (no
+SSL) then the concurrency benchmark is run against it. Run it from the
+newebe folder while CouchDB is running:
+
+    python benchmarks/workers.py --workers=1,2,4 --password=password
+"""
+
+import os
+import sys
+import time
+import signal
+import subprocess
+
+from tornado.options import define, options, parse_command_line
+
+define('workers', default="1,2,4", help="Worker counts to benchmark")
+define('port', default=8100, help="Port used by benchmarked server")
+define('password', default="password", help="Newebe owner password")
+define('clients', default=100, help="Number of parallel clients")
+define('requests', default=20, help="Number of requests sent by each client")
+define('path', default="microposts/all/", help="Path to query")
+
+
+def run(nb_workers):
+    '''
+    Starts a server with *nb_workers* workers and benchmarks it.
+    '''
+    server = subprocess.Popen([sys.executable, "newebe_server.py",
+                               "--port=%d" % options.port,
+                               "--workers=%d" % nb_workers,
+                               "--ssl=False", "--debug=False"],
+                              preexec_fn=os.setsid)
+    time.sleep(3)
+
+    try:
+        print "== %d worker(s)" % nb_workers
+        sys.stdout.flush()
+        subprocess.call([sys.executable, "benchmarks/concurrency.py",
+                         "--url=http://localhost:%d/" % options.port,
+                         "--password=%s" % options.password,
+                         "--clients=%d" % options.clients,
+                         "--requests=%d" % options.requests,
+                         "--path=%s" % options.path])
+    finally:
+        # Stop supervisor and its workers.
+        os.killpg(server.pid, signal.SIGINT)
+        server.wait()
+
+
+if __name__ == '__main__':
+    parse_command_line()
+    for nb_workers in options.workers.split(","):
+        run(int(nb_workers))
@@ -487,9 +487,12 @@ module.exports = Renderer = (function() {
     if (doc != null) {
       if (doc.get('doc_type') === 'MicroPost') {
         rawContent = doc.get('content');
-        rawContent = sanitize(rawContent).escape();
         content = '<div class="mod left w40">';
-        content = this.markdownConverter.makeHtml(rawContent);
+        if (doc.get('htmlContent') != null) {
+          content = doc.get('htmlContent');
+        } else {
+          content = this.markdownConverter.makeHtml(sanitize(rawContent).escape());
+        }
         if (((_ref = doc.get('pictures')) != null ? _ref.length : void 0) > 0 || ((_ref1 = doc.get('pictures_to_download')) != null ? _ref1.length : void 0) > 0) {
           content += '<img src="static/images/attachment.png" />';
         }
@@ -3232,7 +3235,9 @@ module.exports = NoteView = (function(_super) {
 
   NoteView.prototype.renderNote = function() {
     this.converter = new Showdown.converter();
-    if (this.model.get("content").length > 0) {
+    if (this.model.get("htmlContent") != null) {
+      return this.contentField.html(this.model.get("htmlContent"));
+    } else if (this.model.get("content").length > 0) {
       return this.contentField.html(this.converter.makeHtml(this.model.get('content')));
     } else {
       return this.contentField.html("new note content");
@@ -3244,6 +3249,7 @@ module.exports = NoteView = (function(_super) {
     this.contentField.keyup((function(_this) {
       return function() {
         _this.model.set("content", toMarkdown(_this.contentField.html()));
+        _this.model.set("htmlContent", _this.contentField.html());
         return _this.onNoteChanged();
       };
     })(this));
@@ -11,8 +11,6 @@ from tornado.options import define
 from tornado.options import options
 from tornado.options import parse_command_line
 
-from newebe.apps import news, core, activities, notes, commons, pictures
-
 
 class KeyDict(dict):
     """
@@ -30,6 +28,48 @@ class Config(KeyDict):
         TORNADO_PORT
         DEBUG
         TIMEZONE
+        WORKERS
+        RUNPATH
+        WEBSOCKET_QUEUE_SIZE
+        WEBSOCKET_QUEUE_POLICY
+        WEBSOCKET_PING_INTERVAL
+        CHANGES_CATCHUP_LIMIT
+        SYNC_PAGE_SIZE
+        GZIP
+        GZIP_MIN_LENGTH
+        GZIP_CONTENT_TYPES
+        MAX_BODY_SIZE
+        RESPONSE_CACHE_SIZE
+        PROFILE_FORWARD_DELAY
+        PROFILE_FORWARD_CONCURRENCY
+        MARKDOWN_CACHE_SIZE
+        PICTURE_ROTATION_CACHE_SIZE
+        CONTACT_DOWNLOAD_CONCURRENCY
+        DOWNLOAD_SPOOL_SIZE
+        DOWNLOAD_TIMEOUT
+        PREFETCH
+        PREFETCH_INTERVAL
+        PREFETCH_BATCH
+        PREFETCH_BYTES_PER_HOUR
+        PREFETCH_DISK_BUDGET
+        PREFETCH_MAX_LATENCY
+        CONTACT_HEALTH_WINDOW
+        CONTACT_FAILURE_THRESHOLD
+        CONTACT_ERROR_RATE
+        CONTACT_CIRCUIT_RESET
+        CONTACT_CIRCUIT_MAX_RESET
+        CONTACT_DEFERRED_LIMIT
+        IP_RATE
+        IP_BURST
+        CONTACT_RATE
+        CONTACT_BURST
+        RATE_LIMIT_BUCKETS
+        SHED_LOOP_LAG
+        SHED_IN_FLIGHT
+        SHED_RETRY_AFTER
+        PROFILER_INTERVAL
+        PROFILER_MAX_DURATION
+        SLOW_REQUEST_THRESHOLD
 
         [security]
         COOKIE_KEY
@@ -40,6 +80,15 @@ class Config(KeyDict):
         COUCHDB_DB_NAME
         COUCHDB_DB_URI
         COUCHDB_DATABASES
+        COUCHDB_POOL_SIZE
+        COUCHDB_KEEPALIVE
+        COUCHDB_TIMEOUT
+        COUCHDB_MAX_TRIES
+        COUCHDB_SLOW_VIEW_THRESHOLD
+        COUCHDB_WORKERS
+        COUCHDB_CHANGES_TIMEOUT
+        COUCHDB_WARMUP_THRESHOLD
+        COUCHDB_WARMUP_DELAY
     """
     def __init__(self, **kwargs):
         KeyDict.__init__(self, **kwargs)
@@ -100,6 +149,62 @@ CONFIG['main']['timezone'] = "Europe/Paris"
 CONFIG['main']['configfile'] = "./config.yaml"
 CONFIG['main']['path'] = "/home/newebe/newebe/"
 CONFIG['main']['logpath'] = None
+CONFIG['main']['workers'] = 1
+CONFIG['main']['runpath'] = None
+# Writable folder where hashed copies of static assets are built (default:
+# assets folder of main path).
+CONFIG['main']['assets_path'] = None
+# Metrics served on /metrics/ are the ones of the worker that accepts the
+# connection. When set, worker N also serves its own metrics on port
+# metrics_port + N, so that every worker can be scraped.
+CONFIG['main']['metrics_port'] = None
+CONFIG['main']['websocket_queue_size'] = 100
+CONFIG['main']['websocket_queue_policy'] = "drop"
+CONFIG['main']['websocket_ping_interval'] = 30
+CONFIG['main']['changes_catchup_limit'] = 500
+CONFIG['main']['sync_page_size'] = 100
+CONFIG['main']['gzip'] = True
+CONFIG['main']['gzip_min_length'] = 1024
+CONFIG['main']['gzip_content_types'] = [
+    "application/json", "application/x-ndjson", "application/javascript",
+    "text/html", "text/css", "text/plain", "text/javascript"]
+CONFIG['main']['max_body_size'] = 50 * 1024 * 1024
+CONFIG['main']['response_cache_size'] = 200
+CONFIG['main']['profile_forward_delay'] = 60
+CONFIG['main']['profile_forward_concurrency'] = 10
+CONFIG['main']['markdown_cache_size'] = 500
+CONFIG['main']['picture_rotation_cache_size'] = 100
+CONFIG['main']['contact_download_concurrency'] = 2
+CONFIG['main']['download_spool_size'] = 1024 * 1024
+CONFIG['main']['download_timeout'] = 300
+# Background download of files shared by contacts.
+CONFIG['main']['prefetch'] = False
+CONFIG['main']['prefetch_interval'] = 300
+CONFIG['main']['prefetch_batch'] = 50
+CONFIG['main']['prefetch_bytes_per_hour'] = 100 * 1024 * 1024
+CONFIG['main']['prefetch_disk_budget'] = 2 * 1024 * 1024 * 1024
+CONFIG['main']['prefetch_max_latency'] = 0.5
+# Circuit breaker of requests to contacts.
+CONFIG['main']['contact_health_window'] = 20
+CONFIG['main']['contact_failure_threshold'] = 3
+CONFIG['main']['contact_error_rate'] = 0.5
+CONFIG['main']['contact_circuit_reset'] = 30
+CONFIG['main']['contact_circuit_max_reset'] = 3600
+CONFIG['main']['contact_deferred_limit'] = 100
+# Limits of requests sent by contacts (requests per second and bursts).
+CONFIG['main']['ip_rate'] = 5
+CONFIG['main']['ip_burst'] = 100
+CONFIG['main']['contact_rate'] = 2
+CONFIG['main']['contact_burst'] = 50
+CONFIG['main']['rate_limit_buckets'] = 10000
+CONFIG['main']['shed_loop_lag'] = 0.5
+CONFIG['main']['shed_in_flight'] = 50
+CONFIG['main']['shed_retry_after'] = 5
+# Profiling: delay between stack samples, longest profiling and request
+# duration above which request phase timings are logged (seconds).
+CONFIG['main']['profiler_interval'] = 0.005
+CONFIG['main']['profiler_max_duration'] = 300
+CONFIG['main']['slow_request_threshold'] = 1
 
 chars = string.ascii_lowercase + string.ascii_uppercase + string.digits
 CONFIG['security']['cookie_key'] = \
@@ -107,13 +212,26 @@ CONFIG['security']['cookie_key'] = \
 CONFIG['security']['certificate'] = None
 CONFIG['security']['private_key'] = None
 CONFIG['db']['name'] = "newebe"
+# memory:// selects the in-memory database (tests and benchmarks).
 CONFIG['db']['uri'] = "http://127.0.0.1:5984"
-CONFIG['db']['views'] = {'newebe.apps.news': news,
-                         'newebe.apps.core': core,
-                         'newebe.apps.activities': activities,
-                         'newebe.apps.notes': notes,
-                         'newebe.apps.commons': commons,
-                         'newebe.apps.pictures': pictures}
+CONFIG['db']['pool_size'] = 10
+CONFIG['db']['keepalive'] = 600
+CONFIG['db']['timeout'] = 60
+CONFIG['db']['max_tries'] = 3
+CONFIG['db']['slow_view_threshold'] = 0.5
+CONFIG['db']['workers'] = 10
+CONFIG['db']['changes_timeout'] = 60
+# Number of writes, or seconds after a write, before view indexes are
+# updated in background (0 disables the delay).
+CONFIG['db']['warmup_threshold'] = 50
+CONFIG['db']['warmup_delay'] = 30
+# Applications of which design documents are synchronized with CouchDB.
+CONFIG['db']['views'] = ['newebe.apps.news',
+                         'newebe.apps.core',
+                         'newebe.apps.activities',
+                         'newebe.apps.notes',
+                         'newebe.apps.commons',
+                         'newebe.apps.pictures']
 
 
 # Define config from command line arguments
@@ -129,16 +247,26 @@ define('debug', default=CONFIG.main.debug,
                help="Debug mode                : --debug=False")
 define('ssl', default=CONFIG.main.ssl,
                help="Https enabled             : --ssl=True")
+define('workers', default=CONFIG.main.workers,
+               help="Worker processes (0=cpus) : --workers=1 (default)")
+
+
+def load_config(args=None):
+    '''
+    Fills config with command line arguments (*args*, sys.argv by default)
+    then with config file values. It is not done at import time: entry
+    points (server, tools, tests) call it before reading config.
+    '''
+    parse_command_line(args)
+    CONFIG.db.uri = options.dburi
+    CONFIG.db.name = options.dbname
+    CONFIG.main.port = options.port
+    CONFIG.main.debug = options.debug
+    CONFIG.main.ssl = options.ssl
+    CONFIG.main.workers = options.workers
 
-parse_command_line()
-CONFIG.db.uri = options.dburi
-CONFIG.db.name = options.dbname
-CONFIG.main.port = options.port
-CONFIG.main.debug = options.debug
-CONFIG.main.ssl = options.ssl
-
-config_file = "./config.yaml"
-if options.configfile is not None:
-    config_file = options.configfile
-if os.path.exists(config_file):
-    CONFIG.load(config_file)
+    config_file = "./config.yaml"
+    if options.configfile is not None:
+        config_file = options.configfile
+    if os.path.exists(config_file):
+        CONFIG.load(config_file)
@@ -0,0 +1,253 @@
+"""
+Static assets and templates preparation done once at startup.
+
+Compressible assets of client/public (scripts, stylesheets...) are copied
+to a dist folder under a name that contains a hash of their content, with
+a precompressed gzip sibling (and a brotli one if the brotli module is
+installed). The dist folder is built in a writable directory
+(*CONFIG.main.assets_path*, by default the assets folder of
+*CONFIG.main.path*) because the installed package may not be writable by
+the server user. If it cannot be built, regular static URLs are used.
+
+As their name changes with their content, hashed copies are served with
+far-future cache headers, under the /dist/ URL. Templates use *asset_url*
+to link to them:
+
+    <script src="{{ asset_url("javascripts/app.js") }}"></script>
+
+Templates of every handler are compiled at startup too, so the first
+requests do not pay for it.
+"""
+
+import os
+import re
+import gzip
+import hashlib
+import inspect
+import logging
+import posixpath
+import mimetypes
+
+from tornado import template
+from tornado.web import RequestHandler, StaticFileHandler
+
+from newebe.config import CONFIG
+from newebe.lib.lazy_handler import LazyHandler
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger("newebe.lib")
+
+DIST_FOLDER = "dist"
+ASSET_EXTENSIONS = [".js", ".css", ".html", ".svg", ".ttf", ".txt"]
+
+# Supported encodings of precompressed assets, by order of preference.
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+# Relative path of assets to relative path of their hashed copy.
+manifest = {}
+
+CSS_URL_REGEXP = re.compile(r"""url\((['"]?)([^'"()]+)\1\)""")
+
+
+def get_hashed_name(path, content):
+    '''
+    Returns *path* with a short hash of *content* inserted before its
+    extension: javascripts/app.js -> javascripts/app.0123456789ab.js.
+    '''
+    root, extension = os.path.splitext(path)
+    return "%s.%s%s" % (root, hashlib.md5(content).hexdigest()[:12],
+                        extension)
+
+
+def rewrite_css_urls(path, content):
+    '''
+    Makes relative URLs of *path* stylesheet absolute, so they still point
+    to the right files from its hashed copy.
+    '''
+    def rewrite(match):
+        quote, url = match.groups()
+        if url.startswith(("/", "#", "&")) or ":" in url:
+            return match.group(0)
+        url = posixpath.normpath(
+            posixpath.join(posixpath.dirname(path), url))
+        return "url(%s/static/%s%s)" % (quote, url, quote)
+
+    return CSS_URL_REGEXP.sub(rewrite, content)
+
+
+def write_compressed(path, content):
+    '''
+    Writes gzip and brotli compressed versions of *content* next to *path*.
+    '''
+    gzip_file = gzip.GzipFile(path + ".gz", mode="wb", compresslevel=9)
+    gzip_file.write(content)
+    gzip_file.close()
+
+    if brotli is not None:
+        with open(path + ".br", "wb") as brotli_file:
+            brotli_file.write(brotli.compress(content))
+
+
+def get_dist_path():
+    '''
+    Returns folder where hashed copies of assets are built.
+    '''
+    assets_path = CONFIG.main.assets_path or \
+        os.path.join(CONFIG.main.path, "assets")
+    return os.path.join(assets_path, DIST_FOLDER)
+
+
+def build_assets(static_path, dist_path=None):
+    '''
+    Builds hashed and compressed copies of compressible assets of
+    *static_path* inside *dist_path* (see get_dist_path) and fills the
+    manifest. Copies that already exist are not built again. If copies
+    cannot be written, manifest is left empty: assets are served from
+    their regular URLs.
+    '''
+    if dist_path is None:
+        dist_path = get_dist_path()
+
+    try:
+        built = _build_assets(static_path, dist_path)
+    except (IOError, OSError), e:
+        manifest.clear()
+        logger.warning("Static assets cannot be built in %s, they are "
+                       "served without hashed copies: %s" % (dist_path, e))
+        return
+
+    logger.info("%d static assets built, %d up to date." %
+                (built, len(manifest) - built))
+
+
+def _build_assets(static_path, dist_path):
+    built = 0
+    for dirpath, dirnames, filenames in os.walk(static_path):
+        # Left by versions that built copies inside static folder.
+        if dirpath == static_path and DIST_FOLDER in dirnames:
+            dirnames.remove(DIST_FOLDER)
+
+        for filename in filenames:
+            if os.path.splitext(filename)[1] not in ASSET_EXTENSIONS:
+                continue
+
+            source = os.path.join(dirpath, filename)
+            path = os.path.relpath(source, static_path).replace(os.sep, "/")
+            with open(source, "rb") as source_file:
+                content = source_file.read()
+
+            hashed_path = get_hashed_name(path, content)
+            target = os.path.join(dist_path, hashed_path)
+            if not os.path.isfile(target):
+                if not os.path.isdir(os.path.dirname(target)):
+                    os.makedirs(os.path.dirname(target))
+                if path.endswith(".css"):
+                    content = rewrite_css_urls(path, content)
+                with open(target, "wb") as target_file:
+                    target_file.write(content)
+                write_compressed(target, content)
+                built += 1
+
+            manifest[path] = "%s/%s" % (DIST_FOLDER, hashed_path)
+    return built
+
+
+def asset_url(path):
+    '''
+    Returns URL of hashed copy of the *path* asset, or its regular URL if
+    it was not built.
+    '''
+    hashed_path = manifest.get(path)
+    if hashed_path is None:
+        return "static/" + path
+    return hashed_path
+
+
+def precompile_templates(routes):
+    '''
+    Loads and compiles templates of handlers of *routes*, where Tornado
+    loaders would look for them at first rendering. Handler modules are not
+    imported.
+    '''
+    nb_templates = 0
+    template_paths = set()
+    for route in routes:
+        handler = route[1]
+        if isinstance(handler, LazyHandler):
+            template_path = handler.get_module_path()
+        elif issubclass(handler, RequestHandler):
+            template_path = os.path.dirname(inspect.getfile(handler))
+        else:
+            continue
+
+        templates_dir = os.path.join(template_path, "templates")
+        if template_path in template_paths or \
+           not os.path.isdir(templates_dir):
+            continue
+        template_paths.add(template_path)
+
+        with RequestHandler._template_loader_lock:
+            loader = RequestHandler._template_loaders.get(template_path)
+            if loader is None:
+                loader = template.Loader(template_path)
+                RequestHandler._template_loaders[template_path] = loader
+
+            for filename in sorted(os.listdir(templates_dir)):
+                if filename.endswith(".html"):
+                    name = "templates/" + filename
+                    try:
+                        loader.load(name)
+                        nb_templates += 1
+                    except Exception, e:
+                        # Some templates are only included by other ones.
+                        loader.templates.pop(name, None)
+                        logger.debug("Template %s cannot be compiled: %s" %
+                                     (os.path.join(templates_dir, filename),
+                                      e))
+
+    logger.info("%d templates compiled." % nb_templates)
+
+
+class NewebeStaticFileHandler(StaticFileHandler):
+    '''
+    Static file handler that serves precompressed siblings of assets when
+    client accepts their encoding. Hashed copies of the dist folder
+    (*hashed* handler) are cached by browsers without limit.
+    '''
+
+    def initialize(self, path, default_filename=None, hashed=False):
+        StaticFileHandler.initialize(self, path, default_filename)
+        self.hashed = hashed
+
+    def validate_absolute_path(self, root, absolute_path):
+        absolute_path = StaticFileHandler.validate_absolute_path(
+            self, root, absolute_path)
+        self.original_path = absolute_path
+        self.content_encoding = None
+
+        if absolute_path is not None and CONFIG.main.gzip:
+            accepted = self.request.headers.get("Accept-Encoding", "")
+            for encoding, extension in ENCODINGS:
+                if encoding in accepted and \
+                   os.path.isfile(absolute_path + extension):
+                    self.content_encoding = encoding
+                    return absolute_path + extension
+        return absolute_path
+
+    def get_content_type(self):
+        mime_type, encoding = mimetypes.guess_type(self.original_path)
+        return mime_type
+
+    def set_extra_headers(self, path):
+        if self.content_encoding is not None:
+            self.set_header("Content-Encoding", self.content_encoding)
+
+    def get_cache_time(self, path, modified, mime_type):
+        if self.hashed:
+            return self.CACHE_MAX_AGE
+        return StaticFileHandler.get_cache_time(self, path, modified,
+                                                mime_type)
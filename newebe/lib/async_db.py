@@ -0,0 +1,64 @@
+"""
+Non-blocking access to CouchDB for Tornado handlers.
+
+couchdbkit performs synchronous HTTP calls. To avoid stalling the IOLoop
+while CouchDB answers, blocking database work is sent to a thread pool.
+Functions of this module return futures that can be yielded from
+coroutines:
+
+    @asynchronous
+    @gen.coroutine
+    def get(self):
+        docs = yield async_db.run(MicroPostManager.get_list)
+        self.return_documents(docs)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from couchdbkit.client import ViewResults
+
+from newebe.config import CONFIG
+from newebe.lib.metrics import RequestContext, get_request_stats
+
+
+# Created at first use, once config is loaded.
+executor = None
+
+# Whoosh allows only one writer at a time, so index modifications are
+# serialized in a dedicated thread. Created at first use, like *executor*.
+index_executor = None
+
+
+def _call(func, args, kwargs, stats=None):
+    '''
+    Calls *func* with given arguments. View results are lazy, they are
+    fetched here to make sure that HTTP requests are done inside the worker
+    thread. CouchDB calls are counted in *stats*, statistics of the request
+    that submitted *func*.
+    '''
+    with RequestContext(stats):
+        result = func(*args, **kwargs)
+        if isinstance(result, ViewResults):
+            result = result.all()
+        return result
+
+
+def run(func, *args, **kwargs):
+    '''
+    Runs *func* inside database thread pool. Returns a future resolved with
+    *func* result.
+    '''
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(CONFIG.db.workers)
+    return executor.submit(_call, func, args, kwargs, get_request_stats())
+
+
+def run_indexing(func, *args, **kwargs):
+    '''
+    Runs *func*, an index modification, inside the index writer thread.
+    Returns a future resolved with *func* result.
+    '''
+    global index_executor
+    if index_executor is None:
+        index_executor = ThreadPoolExecutor(1)
+    return index_executor.submit(_call, func, args, kwargs)
@@ -0,0 +1,195 @@
+"""
+Change stream of the Newebe database.
+
+A watcher follows the CouchDB _changes feed (long polling) and publishes
+every document modification on the "changes" topic of the event channel.
+Websocket clients subscribed to this topic get incremental events for any
+streamed document type:
+
+    {"seq": 42, "id": "...", "deleted": false, "docType": "Activity",
+     "doc": {...}}
+
+The *seq* field is a resume token: a client that reconnects with
+?since=<last received seq> first gets the events it missed.
+
+For every modified document, whatever its type, an event is also published
+on the "invalidate" topic to drop cached data that depend on it.
+"""
+
+import time
+import urllib
+import logging
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.escape import json_decode
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+from newebe.config import CONFIG
+from newebe.lib.events import channel
+from newebe.lib.memory_couchdb import MemoryAsyncHTTPClient, is_memory_uri
+
+logger = logging.getLogger("newebe.lib")
+
+# Document types sent to websocket clients. Other documents (like user
+# profile which contains password hash) are never streamed.
+STREAMED_TYPES = ["MicroPost", "Activity", "Picture", "Common", "Note",
+                  "Contact"]
+
+
+def get_change_event(change):
+    '''
+    Converts a row of CouchDB _changes feed to a change event. Returns None
+    if document should not be streamed.
+    '''
+    if change["id"].startswith("_design/"):
+        return None
+
+    event = {
+        "seq": change["seq"],
+        "id": change["id"],
+        "deleted": change.get("deleted", False)
+    }
+
+    if not event["deleted"]:
+        doc = dict(change.get("doc") or {})
+        if doc.get("doc_type") not in STREAMED_TYPES:
+            return None
+
+        doc.pop("_attachments", None)
+        event["docType"] = doc["doc_type"]
+        event["doc"] = doc
+
+    return event
+
+
+def get_changes(db, since, limit=None):
+    '''
+    Returns change events that occured on *db* after sequence *since*, the
+    last sequence read and True if there are more changes to read. Blocking,
+    it should be run inside database thread pool.
+    '''
+    if limit is None:
+        limit = CONFIG.main.changes_catchup_limit
+
+    result = db.res.get("_changes", since=since, limit=limit,
+                        include_docs="true").json_body
+    events = []
+    for change in result["results"]:
+        event = get_change_event(change)
+        if event is not None:
+            events.append(event)
+
+    return events, result["last_seq"], len(result["results"]) >= limit
+
+
+class ChangesWatcher(object):
+    '''
+    Follows CouchDB _changes feed without blocking the IOLoop and publishes
+    change events on the event channel. Only one worker runs the watcher,
+    the channel forwards events to the other ones.
+    '''
+
+    def __init__(self, uri=None, dbname=None):
+        self.uri = uri
+        self.dbname = dbname
+        self.since = None
+        self.running = False
+        self.client = None
+
+    def get_db_url(self):
+        return "%s/%s" % ((self.uri or CONFIG.db.uri).rstrip("/"),
+                          self.dbname or CONFIG.db.name)
+
+    def get_feed_request(self):
+        '''
+        Builds long polling request that waits for changes following
+        current sequence.
+        '''
+        timeout = CONFIG.db.changes_timeout
+        params = urllib.urlencode({
+            "feed": "longpoll",
+            "include_docs": "true",
+            "since": self.since,
+            "timeout": timeout * 1000
+        })
+        return HTTPRequest("%s/_changes?%s" % (self.get_db_url(), params),
+                           request_timeout=timeout + 10)
+
+    @gen.coroutine
+    def wait(self):
+        '''
+        Waits a bit before retrying a failed request.
+        '''
+        io_loop = IOLoop.instance()
+        yield gen.Task(io_loop.add_timeout, time.time() + 5)
+
+    @gen.coroutine
+    def start(self, since=None):
+        '''
+        Follows changes feed from sequence *since* (current database
+        sequence by default) until watcher is stopped.
+        '''
+        self.running = True
+        # Client is created here, not at import: it would create the IOLoop
+        # before workers are forked. Long polling request always holds a
+        # connection, so the watcher does not share the default client with
+        # handlers.
+        if is_memory_uri(self.get_db_url()):
+            # In-memory database has no HTTP changes feed.
+            self.client = MemoryAsyncHTTPClient(force_instance=True)
+        else:
+            self.client = AsyncHTTPClient(force_instance=True)
+
+        while self.since is None and self.running:
+            if since is not None:
+                self.since = since
+                break
+            response = yield gen.Task(self.client.fetch, self.get_db_url())
+            if response.error:
+                logger.error("Cannot read database sequence: %s" %
+                             response.error)
+                yield self.wait()
+            else:
+                self.since = json_decode(response.body)["update_seq"]
+
+        while self.running:
+            response = yield gen.Task(self.client.fetch,
+                                      self.get_feed_request())
+            if not self.running:
+                break
+
+            if response.error:
+                logger.error("Changes feed failed: %s" % response.error)
+                yield self.wait()
+                continue
+
+            result = json_decode(response.body)
+            for change in result["results"]:
+                self.publish_invalidation(change)
+                event = get_change_event(change)
+                if event is not None:
+                    try:
+                        channel.publish("changes", event)
+                    except Exception:
+                        logger.exception("Change %s cannot be published" %
+                                         change["id"])
+            self.since = result["last_seq"]
+
+    def publish_invalidation(self, change):
+        '''
+        Tells every worker that a document of given type changed, so cached
+        data depending on it are dropped. Unlike change events, it is sent
+        for any document type.
+        '''
+        if not change["id"].startswith("_design/"):
+            doc_type = None
+            if not change.get("deleted"):
+                doc_type = (change.get("doc") or {}).get("doc_type")
+            channel.publish("invalidate", {"docType": doc_type})
+
+    def stop(self):
+        self.running = False
+
+
+changes_watcher = ChangesWatcher()
@@ -0,0 +1,183 @@
+"""
+Health of contacts, seen from requests sent to them.
+
+Each contact has a circuit breaker. While a contact answers, its circuit is
+closed. When too many of its last requests fail (connection errors,
+timeouts, server errors), its circuit opens: requests to this contact are
+not sent anymore. Deliveries (micropost, picture, common broadcasts...) are
+kept and other requests fail immediately instead of waiting for a
+timeout. After a delay, that doubles each time the circuit opens again,
+the circuit half-opens: one request is sent to probe the contact. If it
+succeeds, the circuit closes and kept deliveries are sent; otherwise it
+opens again.
+
+Health is tracked in memory, by worker.
+"""
+
+import time
+import logging
+
+from collections import deque
+
+from tornado.ioloop import IOLoop
+
+from newebe.config import CONFIG
+
+logger = logging.getLogger("newebe.lib")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# Weight of last request in average latency.
+LATENCY_WEIGHT = 0.2
+
+
+class ContactHealth(object):
+    '''
+    Error rate, latency and circuit state of a contact.
+    '''
+
+    def __init__(self, url, name=None):
+        self.url = url
+        self.name = name
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=CONFIG.main.contact_health_window)
+        self.latency = None
+        self.openings = 0
+        self.probe_date = None
+        self.probing = False
+        self.timeout = None
+        self.deferred = deque()
+
+    def get_error_rate(self):
+        if not self.outcomes:
+            return 0.
+        return self.outcomes.count(False) / float(len(self.outcomes))
+
+    def allow_request(self):
+        '''
+        Returns True if a request can be sent to the contact. Only one
+        request is allowed while the circuit is half-open.
+        '''
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def defer(self, send):
+        '''
+        Keeps *send*, a function that sends a delivery, until the circuit
+        half-opens. Returns False if too many deliveries are kept already.
+        '''
+        if len(self.deferred) >= CONFIG.main.contact_deferred_limit:
+            return False
+        self.deferred.append(send)
+        return True
+
+    def record(self, success, duration=None):
+        '''
+        Records result of a request sent to the contact and updates circuit
+        state.
+        '''
+        self.outcomes.append(success)
+        if duration is not None:
+            if self.latency is None:
+                self.latency = duration
+            else:
+                self.latency = LATENCY_WEIGHT * duration + \
+                    (1 - LATENCY_WEIGHT) * self.latency
+
+        if success:
+            if self.state != CLOSED:
+                self.close()
+        elif self.state == HALF_OPEN:
+            self.open()
+        elif self.state == CLOSED and \
+                self.outcomes.count(False) >= \
+                CONFIG.main.contact_failure_threshold and \
+                self.get_error_rate() >= CONFIG.main.contact_error_rate:
+            self.open()
+
+    def open(self):
+        self.state = OPEN
+        self.probing = False
+        self.openings += 1
+        delay = min(CONFIG.main.contact_circuit_reset *
+                    2 ** (self.openings - 1),
+                    CONFIG.main.contact_circuit_max_reset)
+        self.probe_date = time.time() + delay
+        self.timeout = IOLoop.instance().add_timeout(
+            self.probe_date, self.half_open)
+        logger.warning("Contact %s is unavailable, next try in %ds." %
+                       (self.url, delay))
+
+    def half_open(self):
+        '''
+        Sends first kept delivery to probe the contact.
+        '''
+        self.timeout = None
+        self.state = HALF_OPEN
+        self.probing = False
+        if self.deferred:
+            self.probing = True
+            self.deferred.popleft()()
+
+    def close(self):
+        '''
+        Closes circuit and sends kept deliveries.
+        '''
+        if self.timeout is not None:
+            IOLoop.instance().remove_timeout(self.timeout)
+            self.timeout = None
+        self.state = CLOSED
+        self.probing = False
+        self.openings = 0
+        self.probe_date = None
+        self.outcomes.clear()
+        logger.info("Contact %s is available again." % self.url)
+
+        while self.deferred and self.state == CLOSED:
+            self.deferred.popleft()()
+
+    def get_status(self):
+        return {
+            "url": self.url,
+            "name": self.name,
+            "state": self.state,
+            "errorRate": self.get_error_rate(),
+            "latency": self.latency,
+            "requests": len(self.outcomes),
+            "deferred": len(self.deferred),
+            "nextProbe": self.probe_date
+        }
+
+
+class ContactHealthRegistry(object):
+    '''
+    Health of every contact requested by current worker, by contact URL.
+    '''
+
+    def __init__(self):
+        self.contacts = {}
+
+    def get(self, contact):
+        health = self.contacts.get(contact.url)
+        if health is None:
+            health = ContactHealth(contact.url, contact.name)
+            self.contacts[contact.url] = health
+        return health
+
+    def get_status(self):
+        return [health.get_status() for health in self.contacts.values()]
+
+    def clear(self):
+        for health in self.contacts.values():
+            if health.timeout is not None:
+                IOLoop.instance().remove_timeout(health.timeout)
+        self.contacts.clear()
+
+
+contact_health = ContactHealthRegistry()
@@ -0,0 +1,210 @@
+"""
+Connection layer between Newebe documents and the CouchDB server.
+
+All Newebe documents share a single CouchDB resource that keeps its HTTP
+connections alive inside a bounded pool. Requests that fail because of a
+reset connection are retried by the underlying HTTP client. Every view call
+made through this resource is timed, so slow views can be spotted from logs
+or from the view statistics report. Every call is counted in server metrics.
+
+With the memory:// database URI, resources send their requests to the
+in-memory CouchDB (see memory_couchdb.py) instead of a CouchDB server.
+"""
+
+import time
+import logging
+import mimetypes
+
+from couchdbkit import Server
+from couchdbkit.resource import CouchdbResource
+from restkit.conn import Connection
+from socketpool import ConnectionPool
+
+from newebe.config import CONFIG
+from newebe.lib.metrics import metrics
+from newebe.lib.memory_couchdb import MemoryClient, is_memory_uri
+
+logger = logging.getLogger("newebe.lib")
+
+
+class ViewStats(object):
+    '''
+    Collects call count and latency for each CouchDB view queried by Newebe.
+    '''
+
+    def __init__(self, slow_threshold=None):
+        '''
+        *slow_threshold* is the duration (in seconds) above which a view call
+        is logged as slow. If it is not set, config value is used.
+        '''
+        self.slow_threshold = slow_threshold
+        self.views = dict()
+
+    def record(self, view, duration):
+        '''
+        Stores a call to *view* that lasted *duration* seconds.
+        '''
+        stats = self.views.get(view)
+        if stats is None:
+            stats = {"view": view, "count": 0, "total": 0.0, "max": 0.0}
+            self.views[view] = stats
+
+        stats["count"] += 1
+        stats["total"] += duration
+        if duration > stats["max"]:
+            stats["max"] = duration
+
+        threshold = self.slow_threshold
+        if threshold is None:
+            threshold = CONFIG.db.slow_view_threshold
+        if threshold is not None and duration > threshold:
+            logger.warning("Slow view %s: %.3fs" % (view, duration))
+
+    def report(self):
+        '''
+        Returns view statistics as a list of dicts, slowest views (by mean
+        latency) first.
+        '''
+        report = []
+        for stats in self.views.values():
+            line = stats.copy()
+            line["mean"] = stats["total"] / stats["count"]
+            report.append(line)
+
+        report.sort(key=lambda line: line["mean"], reverse=True)
+        return report
+
+    def reset(self):
+        '''
+        Clears collected statistics.
+        '''
+        self.views = dict()
+
+
+view_stats = ViewStats()
+
+
+def get_view_name(path):
+    '''
+    Extracts view name (design/view) from a CouchDB request path. Returns None
+    if path does not target a view.
+    '''
+    if not isinstance(path, basestring) or "_view/" not in path:
+        return None
+
+    parts = path.split("/")
+    try:
+        design = parts[parts.index("_design") + 1]
+        view = parts[parts.index("_view") + 1]
+    except (ValueError, IndexError):
+        return None
+    return "%s/%s" % (design, view)
+
+
+class NewebeCouchdbResource(CouchdbResource):
+    '''
+    CouchDB resource that records latency of every request, by view for
+    view requests.
+    '''
+
+    def request(self, method, path=None, *args, **kwargs):
+        start = time.time()
+        try:
+            return CouchdbResource.request(self, method, path, *args, **kwargs)
+        finally:
+            duration = time.time() - start
+            metrics.observe_db_call(duration)
+            view = get_view_name(path)
+            if view is not None:
+                view_stats.record(view, duration)
+
+
+class MemoryCouchdbResource(NewebeCouchdbResource):
+    '''
+    Resource of which requests are served by the in-memory CouchDB.
+    '''
+
+    def __init__(self, uri, **client_opts):
+        NewebeCouchdbResource.__init__(self, uri, **client_opts)
+        self.client = MemoryClient()
+
+
+def get_pool(max_size=None, keepalive=None):
+    '''
+    Builds a pool of keep-alive connections to CouchDB. Connections are
+    reused during *keepalive* seconds.
+    '''
+    if max_size is None:
+        max_size = CONFIG.db.pool_size
+    if keepalive is None:
+        keepalive = CONFIG.db.keepalive
+
+    return ConnectionPool(factory=Connection,
+                          max_size=max_size,
+                          max_lifetime=keepalive,
+                          backend="thread")
+
+
+def get_resource(uri=None, pool=None, timeout=None, max_tries=None):
+    '''
+    Returns a CouchDB resource bound to a connection pool. Requests that fail
+    because of a socket error (like a connection reset) are retried up to
+    *max_tries* times. For a memory:// *uri*, returns a resource of the
+    in-memory CouchDB.
+    '''
+    if uri is None:
+        uri = CONFIG.db.uri
+    if is_memory_uri(uri):
+        return MemoryCouchdbResource(uri)
+    if pool is None:
+        pool = get_pool()
+    if timeout is None:
+        timeout = CONFIG.db.timeout
+    if max_tries is None:
+        max_tries = CONFIG.db.max_tries
+
+    return NewebeCouchdbResource(uri, pool=pool, timeout=timeout,
+                                 max_tries=max_tries)
+
+
+def get_server(uri=None, **kwargs):
+    '''
+    Returns a CouchDB server which uses a pooled resource.
+    '''
+    if uri is None:
+        uri = CONFIG.db.uri
+    return Server(uri, resource_instance=get_resource(uri, **kwargs))
+
+
+def save_with_attachments(document, attachments):
+    '''
+    Saves *document* with *attachments* (a dict of file name -> content)
+    inlined, in a single request instead of one per attachment. Content
+    types are guessed from file names. Blocking.
+    '''
+    doc_attachments = document._doc.setdefault("_attachments", {})
+    previous = dict((name, doc_attachments.get(name)) for name in attachments)
+    for name, content in attachments.items():
+        doc_attachments[name] = {
+            "content_type": mimetypes.guess_type(name)[0] or
+                "application/octet-stream",
+            "data": content
+        }
+
+    try:
+        document.save()
+    except Exception:
+        for name, attachment in previous.items():
+            if attachment is None:
+                del doc_attachments[name]
+            else:
+                doc_attachments[name] = attachment
+        raise
+
+    # Content is encoded in place by couchdbkit, it must not be sent again
+    # on next saves.
+    for name in attachments:
+        doc_attachments[name] = {
+            "content_type": doc_attachments[name]["content_type"],
+            "stub": True
+        }
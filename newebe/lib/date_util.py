@@ -4,13 +4,20 @@ import pytz
 from newebe.config import CONFIG
 
 utc = pytz.utc
-timezone = pytz.timezone(CONFIG.main.timezone)
 
 DB_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 URL_DATETIME_FORMAT = "%Y-%m-%d-%H-%M-%S"
 DISPLAY_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 
+def get_timezone():
+    '''
+    Returns timezone set in newebe settings file. It is read at each call
+    so it is never read before config is loaded.
+    '''
+    return pytz.timezone(CONFIG.main.timezone)
+
+
 def get_date_from_db_date(date):
     '''
     Convert string date at database format (%Y-%m-%d-%H-%M-%S) to date object.
@@ -44,22 +51,26 @@ def get_db_date_from_url_date(urlDate):
     return get_db_date_from_date(date)
 
 
-def convert_utc_date_to_timezone(utc_date, tz=timezone):
+def convert_utc_date_to_timezone(utc_date, tz=None):
     '''
     Convert UTC date to timezone set in newebe settings file
     '''
+    if tz is None:
+        tz = get_timezone()
     return utc_date.replace(tzinfo=pytz.utc).astimezone(tz)
 
 
-def convert_timezone_date_to_utc(date, tz=timezone):
+def convert_timezone_date_to_utc(date, tz=None):
     '''
     Convert timezone (set in newebe settings file) date to UTC date.
     '''
+    if tz is None:
+        tz = get_timezone()
     date = tz.localize(date)
     return date.astimezone(pytz.utc)
 
 
-def get_db_utc_date_from_url_date(urlDate, tz=timezone):
+def get_db_utc_date_from_url_date(urlDate, tz=None):
     '''
     3 steps convertion :
     * from url date to date object
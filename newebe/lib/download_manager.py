@@ -0,0 +1,185 @@
+"""
+Downloads of files (pictures, commons) stored by contacts.
+
+Requests for a file that is already being downloaded wait for the running
+download instead of starting a new one. Downloads run at most
+*CONFIG.main.contact_download_concurrency* at a time for each contact,
+others are queued. Response bodies are streamed to a spool file (kept in
+memory while small) and processing of the downloaded file (thumbnails,
+attachments) is done in the database thread pool:
+
+    @gen.coroutine
+    def download_picture(picture, contact, body):
+        yield download_manager.download(
+            picture._id, contact, "pictures/contact/download/", body,
+            functools.partial(save_picture, picture))
+
+In-flight downloads are tracked by worker.
+"""
+
+import sys
+import time
+import logging
+import tempfile
+
+from collections import deque
+
+from tornado import gen
+from tornado.concurrent import TracebackFuture
+from tornado.httpclient import HTTPRequest
+
+from newebe.config import CONFIG
+from newebe.lib import async_db
+from newebe.lib.http_util import ContactClient
+
+logger = logging.getLogger("newebe.lib")
+
+
+class Download(object):
+    '''
+    Download of a file from a contact. Its future resolves with the result
+    of *process*, called with the downloaded file.
+    '''
+
+    def __init__(self, key, contact, path, body, process):
+        self.key = key
+        self.contact = contact
+        self.path = path
+        self.body = body
+        self.process = process
+
+        self.future = TracebackFuture()
+        self.state = "queued"
+        self.size = None
+        self.received = 0
+        self.start = None
+
+    def on_header(self, line):
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            self.size = int(value.strip())
+
+    def get_progress(self):
+        '''
+        Returns download state and received bytes.
+        '''
+        return {
+            "key": self.key,
+            "contact": self.contact.name,
+            "state": self.state,
+            "size": self.size,
+            "received": self.received,
+            "duration": self.start and time.time() - self.start
+        }
+
+
+class DownloadManager(object):
+    '''
+    Runs downloads from contacts, with bounded parallelism by contact.
+    '''
+
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency
+        self.downloads = {}
+        self.queues = {}
+        self.running = {}
+
+    def get_concurrency(self):
+        if self.concurrency is None:
+            return CONFIG.main.contact_download_concurrency
+        return self.concurrency
+
+    def download(self, key, contact, path, body, process):
+        '''
+        Downloads file identified by *key* by posting *body* to *path* of
+        *contact*. Returns a future resolved with the result of *process*,
+        a blocking function that receives the downloaded file. If *key* is
+        already downloading, future of running download is returned.
+        '''
+        download = self.downloads.get(key)
+        if download is None:
+            download = Download(key, contact, path, body, process)
+            self.downloads[key] = download
+            self.queues.setdefault(contact.key, deque()).append(download)
+            self.start_next(contact.key)
+        return download.future
+
+    def is_downloading(self, key):
+        return key in self.downloads
+
+    def start_next(self, contact_key):
+        '''
+        Starts queued downloads of given contact while its parallel download
+        limit is not reached.
+        '''
+        queue = self.queues.get(contact_key)
+        while queue and \
+                self.running.get(contact_key, 0) < self.get_concurrency():
+            self.running[contact_key] = self.running.get(contact_key, 0) + 1
+            self.run(queue.popleft())
+
+        if not queue:
+            self.queues.pop(contact_key, None)
+
+    @gen.coroutine
+    def run(self, download):
+        try:
+            result = yield self.fetch(download)
+            download.state = "done"
+            download.future.set_result(result)
+        except Exception:
+            download.state = "failed"
+            logger.exception("Download of %s from %s failed." %
+                             (download.key, download.contact.url))
+            download.future.set_exc_info(sys.exc_info())
+        finally:
+            del self.downloads[download.key]
+            contact_key = download.contact.key
+            self.running[contact_key] -= 1
+            if not self.running[contact_key]:
+                del self.running[contact_key]
+            self.start_next(contact_key)
+
+    @gen.coroutine
+    def fetch(self, download):
+        '''
+        Streams body of download response to a spool file then processes it
+        inside the database thread pool.
+        '''
+        spool = tempfile.SpooledTemporaryFile(
+            max_size=CONFIG.main.download_spool_size, dir=CONFIG.main.path)
+
+        def on_chunk(chunk):
+            spool.write(chunk)
+            download.received += len(chunk)
+
+        try:
+            request = HTTPRequest(
+                download.contact.url + download.path, method="POST",
+                body=download.body,
+                headers={"Content-Type": "application/json"},
+                header_callback=download.on_header,
+                streaming_callback=on_chunk,
+                request_timeout=CONFIG.main.download_timeout,
+                validate_cert=False)
+
+            download.state = "downloading"
+            download.start = time.time()
+            yield ContactClient().fetch(download.contact, request)
+
+            download.state = "processing"
+            spool.seek(0)
+            result = yield async_db.run(download.process, spool)
+            raise gen.Return(result)
+        finally:
+            spool.close()
+
+    def get_progress(self):
+        '''
+        Returns progress of running and queued downloads.
+        '''
+        return [download.get_progress()
+                for download in self.downloads.values()]
+
+
+download_manager = DownloadManager()
@@ -0,0 +1,167 @@
+"""
+Event channel shared by Newebe worker processes.
+
+When Newebe is served by several processes, websocket clients are spread
+among workers. Events (like a new micropost) are published on this channel:
+they are dispatched to local subscribers and sent through Unix datagram
+sockets to every other worker, which dispatch them to their own subscribers.
+
+When only one process serves Newebe, the channel is never started and
+events are only dispatched locally. Events can be published from any thread,
+subscribers are always called from the IOLoop.
+"""
+
+import os
+import errno
+import socket
+import logging
+import tempfile
+
+from tornado.ioloop import IOLoop
+from tornado.escape import json_encode, json_decode
+
+from newebe.config import CONFIG
+
+logger = logging.getLogger("newebe.lib")
+
+# Maximum size of a datagram read from the channel socket.
+MAX_EVENT_SIZE = 1024 * 1024
+
+
+class EventChannel(object):
+    '''
+    Publish/subscribe channel between Newebe worker processes.
+    '''
+
+    def __init__(self):
+        self.subscribers = dict()
+        self.worker_id = 0
+        self.nb_workers = 1
+        self.socket = None
+        self.io_loop = None
+
+    def get_socket_path(self, worker_id):
+        '''
+        Returns path of the socket on which worker *worker_id* listens.
+        '''
+        runpath = CONFIG.main.runpath or tempfile.gettempdir()
+        return os.path.join(runpath, "newebe.%s.%d.sock" %
+                            (CONFIG.main.port, worker_id))
+
+    def start(self, worker_id, nb_workers, io_loop=None):
+        '''
+        Opens the socket of current worker and listens for events sent by
+        other workers.
+        '''
+        self.worker_id = worker_id
+        self.nb_workers = nb_workers
+
+        path = self.get_socket_path(worker_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.setblocking(0)
+        self.socket.bind(path)
+
+        self.io_loop = io_loop or IOLoop.instance()
+        self.io_loop.add_handler(self.socket.fileno(), self._on_readable,
+                                 IOLoop.READ)
+        logger.info("Worker %d listens for events on %s" % (worker_id, path))
+
+    def is_main_worker(self):
+        '''
+        Returns True for the first worker, which runs tasks that must not be
+        duplicated among workers.
+        '''
+        return self.worker_id == 0
+
+    def is_index_writer(self):
+        '''
+        Only one worker (the first one) is allowed to write in the search
+        index.
+        '''
+        return self.is_main_worker()
+
+    def subscribe(self, topic, callback):
+        '''
+        Registers *callback*, it will be called with message of each event
+        published on *topic*.
+        '''
+        self.subscribers.setdefault(topic, []).append(callback)
+
+    def publish(self, topic, message):
+        '''
+        Dispatches *message* to subscribers of *topic* of every worker.
+        *message* must be JSON serializable. Local subscribers get it even if
+        it cannot be sent to other workers.
+        '''
+        self._dispatch_later(topic, message)
+        if self.socket is not None:
+            for worker_id in range(self.nb_workers):
+                if worker_id != self.worker_id:
+                    self._send(worker_id, topic, message)
+
+    def send(self, worker_id, topic, message):
+        '''
+        Dispatches *message* to subscribers of *topic* of given worker only.
+        '''
+        if self.socket is None or worker_id == self.worker_id:
+            self._dispatch_later(topic, message)
+        else:
+            self._send(worker_id, topic, message)
+
+    def _send(self, worker_id, topic, message):
+        data = json_encode({"topic": topic, "message": message})
+        if len(data) > MAX_EVENT_SIZE:
+            logger.error("Event %s is too large to be sent to worker %d "
+                         "(%d bytes)" % (topic, worker_id, len(data)))
+            return
+
+        try:
+            self.socket.sendto(data, self.get_socket_path(worker_id))
+        except socket.error, e:
+            if e.args[0] in (errno.ENOENT, errno.ECONNREFUSED,
+                             errno.EAGAIN, errno.EWOULDBLOCK,
+                             errno.EMSGSIZE, errno.ENOBUFS):
+                logger.warning("Event %s cannot be sent to worker %d: %s" %
+                               (topic, worker_id, e))
+            else:
+                raise
+
+    def _on_readable(self, fd, events):
+        while True:
+            try:
+                data = self.socket.recv(MAX_EVENT_SIZE)
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+
+            event = json_decode(data)
+            self._dispatch(event["topic"], event["message"])
+
+    def _dispatch_later(self, topic, message):
+        io_loop = self.io_loop or IOLoop.instance()
+        io_loop.add_callback(self._dispatch, topic, message)
+
+    def _dispatch(self, topic, message):
+        for callback in self.subscribers.get(topic, []):
+            try:
+                callback(message)
+            except Exception:
+                logger.exception("Event %s subscriber failed" % topic)
+
+    def close(self):
+        '''
+        Closes and removes the socket of current worker.
+        '''
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+            path = self.get_socket_path(self.worker_id)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+channel = EventChannel()
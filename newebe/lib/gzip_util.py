@@ -0,0 +1,57 @@
+import gzip
+
+from StringIO import StringIO
+
+from tornado.web import GZipContentEncoding
+
+from newebe.config import CONFIG
+
+
+class NewebeGZipContentEncoding(GZipContentEncoding):
+    '''
+    Compresses responses with gzip when client accepts it. Only responses
+    of which content type is listed in config (JSON, HTML, CSS...) and which
+    are larger than config threshold are compressed: images are already
+    compressed, small bodies do not benefit from it.
+    '''
+
+    def __init__(self, request):
+        GZipContentEncoding.__init__(self, request)
+        self.CONTENT_TYPES = set(CONFIG.main.gzip_content_types)
+        self.MIN_LENGTH = CONFIG.main.gzip_min_length
+
+
+def is_compressible(content_type, body):
+    '''
+    Returns True if a body of type *content_type* should be compressed
+    before being sent.
+    '''
+    content_type = content_type.split(";")[0].strip()
+    return content_type in CONFIG.main.gzip_content_types \
+        and len(body) >= CONFIG.main.gzip_min_length
+
+
+def compress(data):
+    '''
+    Returns *data* (a string) compressed with gzip.
+    '''
+    buf = StringIO()
+    gzip_file = gzip.GzipFile(mode="wb", fileobj=buf)
+    gzip_file.write(data)
+    gzip_file.close()
+    return buf.getvalue()
+
+
+def decompress(data, max_size=None):
+    '''
+    Returns uncompressed content of *data*, a gzip compressed string. Raises
+    ValueError if uncompressed content is larger than *max_size* bytes.
+    '''
+    content = gzip.GzipFile(mode="rb", fileobj=StringIO(data))
+    if max_size is None:
+        return content.read()
+
+    result = content.read(max_size + 1)
+    if len(result) > max_size:
+        raise ValueError("Uncompressed body is too large")
+    return result
@@ -1,10 +1,26 @@
 import logging
 
-from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.concurrent import TracebackFuture, chain_future
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPResponse, \
+    HTTPError
 from upload_util import encode_multipart_formdata
 
+from newebe.lib import gzip_util
+from newebe.lib.contact_health import contact_health
+from newebe.lib.metrics import metrics, phase
+
 logger = logging.getLogger(__name__)
 
+# Response header through which a Newebe tells that it accepts gzip
+# compressed request bodies.
+GZIP_SUPPORT_HEADER = "X-Newebe-Accept-Encoding"
+
+# URLs of contacts that accept gzip compressed request bodies. A contact is
+# added once one of its responses carries the GZIP_SUPPORT_HEADER.
+gzip_contacts = set()
+
 
 class ContactClient(object):
     '''
@@ -27,7 +43,7 @@ class ContactClient(object):
         '''
         url = contact.url + path
         request = HTTPRequest(url, validate_cert=False)
-        return self.client.fetch(self, request)
+        return self.fetch(contact, request)
 
     def post(self, contact, path, body, callback=None):
         '''
@@ -35,13 +51,15 @@ class ContactClient(object):
         '''
         url = contact.url + path
         request = HTTPRequest(url, method="POST", body=body,
+                              headers={"Content-Type": "application/json"},
                               validate_cert=False)
         self.contacts[request] = contact
 
+        defer = callback is None
         if not callback:
             callback = self.on_contact_response
 
-        return self.client.fetch(request, callback)
+        return self.fetch(contact, request, callback, defer)
 
     def put(self, contact, path, body, callback=None):
         '''
@@ -49,13 +67,15 @@ class ContactClient(object):
         '''
         url = contact.url + path
         request = HTTPRequest(url, method="PUT", body=body,
+                              headers={"Content-Type": "application/json"},
                               validate_cert=False)
         self.contacts[request] = contact
 
+        defer = callback is None
         if not callback:
             callback = self.on_contact_response
 
-        return self.client.fetch(request, callback)
+        return self.fetch(contact, request, callback, defer)
 
     def post_files(self, contact, path, fields={}, files={}, callback=None):
         '''
@@ -70,10 +90,30 @@ class ContactClient(object):
                               body=body, headers=headers, validate_cert=False)
         self.contacts[request] = contact
 
+        defer = callback is None
+        if not callback:
+            callback = self.on_contact_response
+
+        return self.fetch(contact, request, callback, defer)
+
+    def put_files(self, contact, path, fields={}, files={}, callback=None):
+        '''
+        Put file and fields to given contact.
+        '''
+        (contentType, body) = encode_multipart_formdata(fields=fields,
+                                                        files=files)
+        headers = {'Content-Type': contentType}
+
+        url = contact.url + path
+        request = HTTPRequest(url=url, method="PUT",
+                              body=body, headers=headers, validate_cert=False)
+        self.contacts[request] = contact
+
+        defer = callback is None
         if not callback:
             callback = self.on_contact_response
 
-        return self.client.fetch(request, callback)
+        return self.fetch(contact, request, callback, defer)
 
     def delete(self, contact, path, body, extra=None):
         '''
@@ -82,11 +122,85 @@ class ContactClient(object):
         '''
         url = contact.url + path
         request = HTTPRequest(url, method="PUT", body=body,
+                              headers={"Content-Type": "application/json"},
                               validate_cert=False)
         self.contacts[request] = contact
         self.extra = extra
 
-        return self.client.fetch(request, self.on_contact_response)
+        return self.fetch(contact, request, self.on_contact_response,
+                          defer=True)
+
+    def fetch(self, contact, request, callback=None, defer=False):
+        '''
+        Sends *request* to *contact*. Body is compressed if contact accepts
+        gzip and if body type and size are worth it (JPEG uploads are not
+        compressed for instance).
+
+        If contact circuit is open, deliveries (*defer*, requests of which
+        nobody waits for the answer) are sent once it half-opens, other
+        requests fail immediately.
+
+        Time spent here counts in the fan-out phase of current request.
+        '''
+        with phase("fanout"):
+            return self._fetch(contact, request, callback, defer)
+
+    def _fetch(self, contact, request, callback, defer):
+        health = contact_health.get(contact)
+        if health.allow_request():
+            return self.send(contact, request, callback, health)
+
+        if defer:
+            future = TracebackFuture()
+
+            def send():
+                chain_future(self.send(contact, request, callback, health),
+                             future)
+
+            if health.defer(send):
+                return future
+
+        return self.reject(request, callback)
+
+    def send(self, contact, request, callback, health):
+        content_type = request.headers.get("Content-Type", "")
+        if contact.url in gzip_contacts and request.body \
+           and gzip_util.is_compressible(content_type, request.body):
+            request.body = gzip_util.compress(request.body)
+            request.headers["Content-Encoding"] = "gzip"
+
+        def on_response(response):
+            success = response.code != 599 and response.code < 500
+            health.record(success, response.request_time)
+            if response.request_time is not None:
+                metrics.observe_contact_request(success,
+                                                response.request_time)
+            self.check_gzip_support(contact, response)
+            if callback is not None:
+                callback(response)
+
+        return self.client.fetch(request, on_response)
+
+    def reject(self, request, callback):
+        '''
+        Fails *request* without sending it, like a connection error would.
+        '''
+        response = HTTPResponse(
+            request, 599, error=HTTPError(599, "Contact is unavailable"))
+        future = TracebackFuture()
+        future.set_exception(response.error)
+        if callback is not None:
+            IOLoop.instance().add_callback(callback, response)
+        return future
+
+    def check_gzip_support(self, contact, response):
+        '''
+        Remembers if *contact* advertises that it accepts compressed
+        requests.
+        '''
+        if response.headers is not None and \
+           "gzip" in response.headers.get(GZIP_SUPPORT_HEADER, ""):
+            gzip_contacts.add(contact.url)
 
     def on_contact_response(self, response, **kwargs):
         '''
@@ -108,3 +222,23 @@ class ContactClient(object):
             logger.info("Request successfully sent to %s." % contact.name)
 
         del self.contacts[response.request]
+
+
+@gen.coroutine
+def run_concurrently(func, items, concurrency):
+    '''
+    Calls coroutine *func* for every item of *items*, with at most
+    *concurrency* calls running at the same time. A failing call does not
+    stop the other ones.
+    '''
+    items = iter(items)
+
+    @gen.coroutine
+    def consume():
+        for item in items:
+            try:
+                yield func(item)
+            except Exception:
+                logger.exception("Concurrent call failed")
+
+    yield [consume() for i in range(max(1, concurrency))]
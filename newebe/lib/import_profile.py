@@ -0,0 +1,69 @@
+"""
+Import time profiler, an equivalent of python -X importtime (not available
+with Python 2).
+
+Run it from the newebe folder to see which modules slow down server
+startup:
+
+    python -m newebe.lib.import_profile newebe.newebe_server
+
+Each line gives the cumulative time spent importing a module, including
+the modules it imports.
+"""
+
+import sys
+import time
+import __builtin__
+
+
+class ImportProfiler(object):
+    '''
+    Records how long first import of each module takes.
+    '''
+
+    def __init__(self):
+        self.timings = {}
+        self.original_import = None
+
+    def start(self):
+        self.original_import = __builtin__.__import__
+        __builtin__.__import__ = self.profiled_import
+
+    def stop(self):
+        __builtin__.__import__ = self.original_import
+
+    def profiled_import(self, name, *args, **kwargs):
+        if name in sys.modules:
+            return self.original_import(name, *args, **kwargs)
+
+        start = time.time()
+        try:
+            return self.original_import(name, *args, **kwargs)
+        finally:
+            if name in sys.modules and name not in self.timings:
+                self.timings[name] = time.time() - start
+
+    def profile(self, module_name):
+        '''
+        Imports *module_name* while recording import times.
+        '''
+        self.start()
+        try:
+            __import__(module_name)
+        finally:
+            self.stop()
+
+    def report(self, limit=30):
+        '''
+        Returns lines (cumulative time, module name) of the *limit* slowest
+        imports.
+        '''
+        timings = sorted(self.timings.items(), key=lambda item: -item[1])
+        return ["%9.1fms  %s" % (duration * 1000, name)
+                for name, duration in timings[:limit]]
+
+
+if __name__ == '__main__':
+    profiler = ImportProfiler()
+    profiler.profile(sys.argv[1])
+    print "\n".join(profiler.report())
@@ -4,6 +4,7 @@ import time
 import logging
 
 
+from tornado.concurrent import Future
 from tornado.httpclient import HTTPClient
 from lxml import html
 
@@ -16,6 +17,9 @@ from whoosh.support.charset import accent_map
 from whoosh.analysis import RegexTokenizer
 from whoosh.analysis import CharsetFilter, LowercaseFilter, StopFilter
 from newebe.lib.stopwords import stoplists
+from newebe.lib import async_db
+from newebe.lib.events import channel
+from newebe.lib.metrics import metrics
 
 from newebe.config import CONFIG
 
@@ -72,7 +76,7 @@ class Indexer():
                                         docType=u"micropost",
                                         docId=unicode(post._id),
                                         tags=post.tags)
-        self.writer.commit()
+        self._commit()
 
     def index_micropost(self, micropost, checkUrl=True):
         """
@@ -89,7 +93,7 @@ class Indexer():
                                     docType=u"micropost",
                                     docId=unicode(micropost._id),
                                     tags=micropost.tags)
-        self.writer.commit()
+        self._commit()
 
     def search_microposts(self, word):
         """
@@ -112,7 +116,16 @@ class Indexer():
 
         self.writer = self.index.writer()
         self.writer.delete_by_term("docId", unicode(doc._id))
+        self._commit()
+
+    def _commit(self):
+        """
+        Commits current writer and records commit duration.
+        """
+
+        start = time.time()
         self.writer.commit()
+        metrics.observe_index_commit(time.time() - start)
 
     def _extract_urls(self, text):
         """
@@ -148,3 +161,73 @@ class Indexer():
                 logger.error("A problem occured while indexing micropost links")
 
         return text
+
+
+class IndexedDocument(object):
+    """
+    Minimal document built from index events sent by other workers: it
+    contains only fields required for indexation.
+    """
+
+    def __init__(self, _id, content=u"", tags=None):
+        self._id = _id
+        self.content = content
+        self.tags = tags or []
+
+
+class IndexWriter(object):
+    """
+    Whoosh index supports only one writer. When Newebe runs several worker
+    processes, index modifications are sent to the first worker which
+    applies them in its index writer thread.
+    """
+
+    def index_micropost(self, micropost):
+        """
+        Adds given micropost to index. Returns a future resolved once the
+        micropost is indexed (or sent to the index writer worker).
+        """
+
+        if channel.is_index_writer():
+            return async_db.run_indexing(Indexer().index_micropost, micropost)
+        else:
+            return self._send("index", micropost)
+
+    def remove_doc(self, doc):
+        """
+        Removes given doc from index. Returns a future resolved once the
+        doc is removed (or its removal sent to the index writer worker).
+        """
+
+        if channel.is_index_writer():
+            return async_db.run_indexing(Indexer().remove_doc, doc)
+        else:
+            return self._send("remove", doc)
+
+    def _send(self, action, doc):
+        channel.send(0, "index", {
+            "action": action,
+            "_id": doc._id,
+            "content": getattr(doc, "content", u""),
+            "tags": getattr(doc, "tags", [])
+        })
+
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def on_index_event(self, message):
+        """
+        Applies index modification sent by another worker.
+        """
+
+        doc = IndexedDocument(message["_id"], message["content"],
+                              message["tags"])
+        if message["action"] == "index":
+            self.index_micropost(doc)
+        else:
+            self.remove_doc(doc)
+
+
+index_writer = IndexWriter()
+channel.subscribe("index", index_writer.on_index_event)
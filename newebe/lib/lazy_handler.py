@@ -0,0 +1,73 @@
+"""
+Lazy loading of request handlers.
+
+Handler modules of Newebe applications pull heavy dependencies (PIL, lxml,
+whoosh, markdown, couchdbkit...). Routes reference handlers by name, so
+a handler module is imported when one of its routes is requested for the
+first time instead of when the server starts. Handlers built by a lazy
+handler know the route pattern they were built for.
+"""
+
+import os
+import importlib
+
+from tornado.util import import_object
+
+
+class LazyHandler(object):
+    '''
+    Stands for a handler class inside routes. Tornado calls it like a
+    handler class to build the handler of each request.
+    '''
+
+    def __init__(self, name):
+        '''
+        *name* is the full name of handler class, like
+        newebe.apps.news.handlers.NewsHandler.
+        '''
+        self.name = name
+        self.module_name = name.rsplit(".", 1)[0]
+        self.handler_class = None
+        self.route = None
+
+    def get_handler_class(self):
+        '''
+        Returns handler class, imports its module if it is not done yet.
+        '''
+        if self.handler_class is None:
+            self.handler_class = import_object(self.name)
+        return self.handler_class
+
+    def get_module_path(self):
+        '''
+        Returns folder of handler module without importing it (only its
+        package is imported).
+        '''
+        package = importlib.import_module(self.module_name.rsplit(".", 1)[0])
+        return os.path.dirname(package.__file__)
+
+    def __call__(self, application, request, **kwargs):
+        handler = self.get_handler_class()(application, request, **kwargs)
+        handler.route = self.route
+        return handler
+
+    def __repr__(self):
+        return "LazyHandler(%s)" % self.name
+
+
+def set_routes(routes):
+    '''
+    Gives to lazy handlers of *routes* their route pattern.
+    '''
+    for route in routes:
+        if isinstance(route[1], LazyHandler):
+            route[1].route = route[0]
+
+
+def get_handler(name):
+    '''
+    Returns lazy handler for *name*, a handler of a Newebe application given
+    as app.HandlerClass (news.NewsHandler for instance).
+    '''
+    app, handler_class = name.split(".")
+    return LazyHandler("newebe.apps.%s.handlers.%s" % (app, handler_class))
@@ -0,0 +1,75 @@
+"""
+Markdown rendering of micropost and note contents.
+
+Rendering markdown is slow on long contents, so HTML is computed once when
+a document is saved (or ingested) and stored in its *htmlContent* field.
+Documents saved before this field existed are rendered on demand and kept
+in a bounded cache keyed by document ID and revision.
+
+Raw HTML written inside microposts (and other documents coming from
+contacts) is escaped, like the web client does before rendering. Notes are
+written by the owner with a rich text editor, so their HTML is kept.
+"""
+
+import markdown
+
+from collections import OrderedDict
+
+from newebe.config import CONFIG
+
+
+def render(content, escape=True):
+    '''
+    Returns HTML corresponding to *content* markdown. Raw HTML is escaped
+    unless *escape* is False.
+    '''
+    if not content:
+        return u""
+    if escape:
+        return markdown.markdown(content, safe_mode="escape")
+    return markdown.markdown(content)
+
+
+class RenderCache(object):
+    '''
+    Bounded LRU cache of rendered contents keyed by document ID and
+    revision.
+    '''
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get_max_size(self):
+        if self.max_size is None:
+            return CONFIG.main.markdown_cache_size
+        return self.max_size
+
+    def get_html(self, document):
+        '''
+        Returns rendered content of *document*, from its stored field if
+        it is set, from cache or by rendering it otherwise.
+        '''
+        if document.htmlContent:
+            return document.htmlContent
+
+        key = (document._id, document._doc.get("_rev"))
+        html = self.entries.pop(key, None)
+        if html is None:
+            html = render(document.content)
+
+        if self.get_max_size() > 0:
+            self.entries[key] = html
+            while len(self.entries) > self.get_max_size():
+                self.entries.popitem(last=False)
+        return html
+
+
+render_cache = RenderCache()
+
+
+def get_html(document):
+    '''
+    Returns rendered content of *document* (a micropost or a note).
+    '''
+    return render_cache.get_html(document)
@@ -0,0 +1,1110 @@
+"""
+In-memory CouchDB, to run tests and benchmarks without a CouchDB server.
+
+It serves, inside the Newebe process, the part of the CouchDB HTTP API
+used by couchdbkit and Newebe: databases, documents and their revisions,
+attachments (inline or standalone), _all_docs, _bulk_docs, _changes
+(normal and long polling feeds) and view queries (key, keys, startkey,
+endkey, startkey_docid, endkey_docid, inclusive_end, descending, skip,
+limit, include_docs, reduce, group and group_level).
+
+Views are computed with the Python equivalents of design document map
+functions (see memory_views.py), for views of design documents stored in
+the database. Like CouchDB, a view index is updated when the view is
+queried, with documents changed since the previous query. Keys are sorted
+following CouchDB collation, except that strings are compared case
+insensitively then by case instead of with full ICU rules. Old revisions
+are not kept.
+
+It is selected with the memory:// database URI (and nothing after it):
+
+    python newebe_server.py --dburi=memory://
+
+Resources built by couchdb_util send their requests to a MemoryClient
+instead of an HTTP client, and the changes watcher reads the changes feed
+through a MemoryAsyncHTTPClient. Data live as long as the process and are
+not shared between processes, so Newebe runs a single worker with this
+backend.
+"""
+
+import json
+import time
+import uuid
+import base64
+import bisect
+import hashlib
+import httplib
+import logging
+import urllib
+import urlparse
+import threading
+
+from StringIO import StringIO
+
+from tornado.httputil import HTTPHeaders
+from tornado.httpclient import AsyncHTTPClient, HTTPResponse
+
+from newebe.lib.memory_views import get_view
+
+logger = logging.getLogger("newebe.lib")
+
+SCHEME = "memory:"
+
+# Bounds of document ids inside view sort keys.
+MIN_ID = (0,)
+MAX_ID = (2,)
+
+# Parameters of view and _all_docs queries that take JSON keys.
+KEY_PARAMS = ("key", "keys", "startkey", "endkey")
+
+# Parameters that are never decoded as JSON.
+STRING_PARAMS = ("rev", "startkey_docid", "endkey_docid", "feed")
+
+
+def is_memory_uri(uri):
+    '''
+    Returns True if database *uri* selects the in-memory CouchDB.
+    '''
+    return uri is not None and uri.startswith(SCHEME)
+
+
+class CouchdbError(Exception):
+    '''
+    Error answered with HTTP status *code* and a CouchDB error body.
+    '''
+
+    def __init__(self, code, error, reason):
+        Exception.__init__(self, reason)
+        self.code = code
+        self.error = error
+        self.reason = reason
+
+
+def not_found(reason="missing"):
+    return CouchdbError(404, "not_found", reason)
+
+
+def conflict():
+    return CouchdbError(409, "conflict", "Document update conflict.")
+
+
+def bad_request(reason):
+    return CouchdbError(400, "bad_request", reason)
+
+
+def collate(value):
+    '''
+    Returns the sort key of JSON *value*: null first, then booleans,
+    numbers, strings, arrays and objects.
+    '''
+    if value is None:
+        return (0,)
+    if value is False:
+        return (1, 0)
+    if value is True:
+        return (1, 1)
+    if isinstance(value, (int, long, float)):
+        return (2, value)
+    if isinstance(value, basestring):
+        return (3, value.lower(), value.swapcase())
+    if isinstance(value, (list, tuple)):
+        return (4, tuple(collate(item) for item in value))
+    return (5, tuple((collate(key), collate(item))
+                     for key, item in sorted(value.items())))
+
+
+def get_sort_key(key, docid=None, bound=MIN_ID):
+    '''
+    Returns the position of a view row in its index: rows are sorted by key
+    then by document id. Without *docid*, returns *bound* of rows emitted
+    with *key*.
+    '''
+    if docid is None:
+        return (collate(key), bound)
+    return (collate(key), (1, docid))
+
+
+def decode_params(query):
+    '''
+    Returns parameters of a query string. Values are JSON when they can be
+    decoded (numbers, booleans, keys), strings otherwise.
+    '''
+    params = {}
+    for name, value in urlparse.parse_qsl(query, keep_blank_values=True):
+        if name in STRING_PARAMS:
+            params[name] = value
+            continue
+        try:
+            params[name] = json.loads(value)
+        except ValueError:
+            if name in KEY_PARAMS:
+                raise bad_request("Invalid JSON value for %s." % name)
+            params[name] = value
+    return params
+
+
+def decode_json(body):
+    try:
+        return json.loads(body or "null")
+    except ValueError:
+        raise bad_request("invalid UTF-8 JSON")
+
+
+class StoredDocument(object):
+    '''
+    Last revision of a document. *body* is the document as CouchDB returns
+    it, with attachment stubs. It is shared by view rows, so it is never
+    modified: a new revision is a new StoredDocument.
+    '''
+
+    __slots__ = ("id", "rev", "body", "attachments", "deleted", "seq")
+
+    def __init__(self, docid, rev, body, attachments, deleted, seq):
+        self.id = docid
+        self.rev = rev
+        self.body = body
+        self.attachments = attachments
+        self.deleted = deleted
+        self.seq = seq
+
+    def get_number(self):
+        '''
+        Returns the number of revisions of the document.
+        '''
+        return int(self.rev.split("-", 1)[0])
+
+    def get_body(self, with_attachments=False):
+        '''
+        Returns document body, with attachment contents instead of stubs if
+        *with_attachments* is True.
+        '''
+        if not with_attachments or not self.attachments:
+            return self.body
+        body = dict(self.body)
+        body["_attachments"] = dict(
+            (name, {"content_type": attachment["content_type"],
+                    "data": base64.b64encode(attachment["data"]),
+                    "digest": attachment["digest"],
+                    "revpos": attachment["revpos"]})
+            for name, attachment in self.attachments.items())
+        return body
+
+
+def get_attachment(content, content_type, revpos):
+    return {
+        "content_type": content_type,
+        "data": content,
+        "digest": "md5-" + base64.b64encode(hashlib.md5(content).digest()),
+        "revpos": revpos
+    }
+
+
+def get_stub(attachment):
+    return {
+        "content_type": attachment["content_type"],
+        "length": len(attachment["data"]),
+        "digest": attachment["digest"],
+        "revpos": attachment["revpos"],
+        "stub": True
+    }
+
+
+class ViewIndex(object):
+    '''
+    Rows emitted by the map function of a view, sorted by key then by
+    document id.
+    '''
+
+    def __init__(self, map_function, design_rev):
+        self.map_function = map_function
+        self.design_rev = design_rev
+        self.seq = 0
+        self.sort_keys = []
+        self.rows = []
+        self.doc_keys = {}
+
+    def map(self, stored):
+        '''
+        Returns sort keys and rows emitted for *stored* document. A document
+        on which the map function fails emits nothing, like in CouchDB.
+        '''
+        try:
+            emitted = self.map_function(stored.body) or []
+        except Exception:
+            logger.debug("Map function failed on document %s" % stored.id,
+                         exc_info=True)
+            return []
+        return [(get_sort_key(key, stored.id), (key, stored.id, value))
+                for key, value in emitted]
+
+    def update(self, database):
+        '''
+        Maps documents changed since last update.
+        '''
+        changed = [stored for stored in database.get_changed(self.seq)
+                   if not stored.id.startswith("_design/")]
+
+        if not self.seq:
+            entries = []
+            for stored in changed:
+                if not stored.deleted:
+                    mapped = self.map(stored)
+                    self.doc_keys[stored.id] = [key for key, row in mapped]
+                    entries.extend(mapped)
+            entries.sort(key=lambda entry: entry[0])
+            self.sort_keys = [key for key, row in entries]
+            self.rows = [row for key, row in entries]
+        else:
+            for stored in changed:
+                self.remove(stored.id)
+                if not stored.deleted:
+                    self.add(stored)
+        self.seq = database.update_seq
+
+    def add(self, stored):
+        mapped = self.map(stored)
+        self.doc_keys[stored.id] = [key for key, row in mapped]
+        for sort_key, row in mapped:
+            index = bisect.bisect_right(self.sort_keys, sort_key)
+            self.sort_keys.insert(index, sort_key)
+            self.rows.insert(index, row)
+
+    def remove(self, docid):
+        for sort_key in self.doc_keys.pop(docid, []):
+            index = bisect.bisect_left(self.sort_keys, sort_key)
+            del self.sort_keys[index]
+            del self.rows[index]
+
+    def get_rows(self, params, keys=None):
+        '''
+        Returns rows selected by query *params* (before skip and limit) and
+        the offset of the first one.
+        '''
+        descending = params.get("descending") is True
+        if keys is not None:
+            rows = []
+            for key in keys:
+                start = bisect.bisect_left(self.sort_keys,
+                                           get_sort_key(key, bound=MIN_ID))
+                end = bisect.bisect_right(self.sort_keys,
+                                          get_sort_key(key, bound=MAX_ID))
+                selected = self.rows[start:end]
+                if descending:
+                    selected.reverse()
+                rows.extend(selected)
+            return rows, 0
+
+        return get_range(self.sort_keys, self.rows, params, descending)
+
+
+def get_range(sort_keys, rows, params, descending):
+    '''
+    Returns *rows* between startkey and endkey *params*, with the offset
+    of the first one. *sort_keys* are the sorted positions of *rows*.
+    '''
+    start_key = params.get("startkey")
+    end_key = params.get("endkey")
+    has_start = "startkey" in params
+    has_end = "endkey" in params
+    if "key" in params:
+        start_key = end_key = params["key"]
+        has_start = has_end = True
+    start_docid = params.get("startkey_docid")
+    end_docid = params.get("endkey_docid")
+    inclusive_end = params.get("inclusive_end") is not False
+
+    low, high = 0, len(rows)
+    if not descending:
+        if has_start:
+            low = bisect.bisect_left(
+                sort_keys, get_sort_key(start_key, start_docid, MIN_ID))
+        if has_end:
+            if inclusive_end:
+                high = bisect.bisect_right(
+                    sort_keys, get_sort_key(end_key, end_docid, MAX_ID))
+            else:
+                high = bisect.bisect_left(
+                    sort_keys, get_sort_key(end_key, end_docid, MIN_ID))
+    else:
+        if has_start:
+            high = bisect.bisect_right(
+                sort_keys, get_sort_key(start_key, start_docid, MAX_ID))
+        if has_end:
+            if inclusive_end:
+                low = bisect.bisect_left(
+                    sort_keys, get_sort_key(end_key, end_docid, MIN_ID))
+            else:
+                low = bisect.bisect_right(
+                    sort_keys, get_sort_key(end_key, end_docid, MAX_ID))
+
+    if low >= high:
+        return [], low if not descending else len(rows) - high
+    selected = rows[low:high]
+    if descending:
+        selected.reverse()
+        return selected, len(rows) - high
+    return selected, low
+
+
+def get_id_range(docids, params):
+    '''
+    Returns sorted *docids* between startkey and endkey *params*.
+    '''
+    start = params.get("key", params.get("startkey"))
+    end = params.get("key", params.get("endkey"))
+    inclusive_end = params.get("inclusive_end") is not False
+    if params.get("descending") is True:
+        docids = list(reversed(docids))
+        before_start = lambda docid: docid > start
+        after_end = lambda docid: docid < end or \
+            (docid == end and not inclusive_end)
+    else:
+        before_start = lambda docid: docid < start
+        after_end = lambda docid: docid > end or \
+            (docid == end and not inclusive_end)
+
+    selected = []
+    for docid in docids:
+        if start is not None and before_start(docid):
+            continue
+        if end is not None and after_end(docid):
+            break
+        selected.append(docid)
+    return selected
+
+
+def paginate(rows, params):
+    skip = params.get("skip") or 0
+    limit = params.get("limit")
+    if limit is None:
+        return rows[skip:]
+    return rows[skip:skip + limit]
+
+
+def get_group_key(key, group_level):
+    '''
+    Returns the key of the reduce group of a row emitted with *key*. A
+    *group_level* of None groups rows by exact key.
+    '''
+    if group_level is None:
+        return key
+    if not group_level:
+        return None
+    if isinstance(key, list):
+        return key[:group_level]
+    return key
+
+
+def run_reduce(reduce, keys, values):
+    if reduce == "_sum":
+        return sum(values)
+    if reduce == "_count":
+        return len(values)
+    if reduce == "_stats":
+        return {"sum": sum(values), "count": len(values),
+                "min": min(values), "max": max(values),
+                "sumsqr": sum(value * value for value in values)}
+    if callable(reduce):
+        return reduce(keys, values)
+    raise CouchdbError(500, "unsupported_reduce",
+                       "Reduce %s is not supported." % reduce)
+
+
+def reduce_rows(rows, reduce, params):
+    '''
+    Returns reduced rows of a view query.
+    '''
+    if params.get("group") is True:
+        group_level = None
+    else:
+        group_level = params.get("group_level") or 0
+
+    groups = []
+    for key, docid, value in rows:
+        group_key = get_group_key(key, group_level)
+        if not groups or groups[-1][0] != group_key:
+            groups.append((group_key, [], []))
+        groups[-1][1].append([key, docid])
+        groups[-1][2].append(value)
+
+    return [{"key": group_key, "value": run_reduce(reduce, keys, values)}
+            for group_key, keys, values in groups]
+
+
+class MemoryDatabase(object):
+    '''
+    Documents of a database, their changes and view indexes. Requests are
+    served from several threads (database thread pool, IOLoop), so every
+    access is done while holding the database lock.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.RLock()
+        self.docs = {}
+        self.update_seq = 0
+        # Sequence of every write and id of written document, with entries
+        # of documents written again since.
+        self.seqs = []
+        self.seq_ids = []
+        self.indexes = {}
+        self.watchers = []
+
+    def get_info(self):
+        with self.lock:
+            deleted = len([stored for stored in self.docs.values()
+                           if stored.deleted])
+            return {
+                "db_name": self.name,
+                "doc_count": len(self.docs) - deleted,
+                "doc_del_count": deleted,
+                "update_seq": self.update_seq,
+                "disk_size": 0
+            }
+
+    def get(self, docid, rev=None):
+        '''
+        Returns last revision of document *docid*.
+        '''
+        stored = self.docs.get(docid)
+        if stored is None:
+            raise not_found("missing")
+        if stored.deleted and rev is None:
+            raise not_found("deleted")
+        if rev is not None and rev != stored.rev:
+            raise not_found("missing")
+        return stored
+
+    def save(self, doc, rev=None):
+        '''
+        Saves JSON *doc* as a new revision of its document and returns it.
+        *rev* is the revision being updated when *doc* has no _rev field.
+        '''
+        docid = doc.get("_id")
+        if not isinstance(docid, basestring) or not docid:
+            raise bad_request("Document id must be a string.")
+        if docid.startswith("_") and not docid.startswith("_design/") \
+           and not docid.startswith("_local/"):
+            raise bad_request(
+                "Only reserved document ids may start with underscore.")
+
+        with self.lock:
+            current = self.docs.get(docid)
+            rev = doc.get("_rev") or rev
+            if current is not None and not current.deleted:
+                if rev != current.rev:
+                    raise conflict()
+            elif rev is not None and (current is None or rev != current.rev):
+                raise conflict()
+
+            number = current.get_number() + 1 if current is not None else 1
+            deleted = doc.get("_deleted") is True
+            if deleted:
+                if current is None or current.deleted:
+                    raise not_found("missing")
+                body = {"_id": docid, "_deleted": True}
+                attachments = {}
+            else:
+                body = dict((name, value) for name, value in doc.items()
+                            if name not in ("_rev", "_attachments"))
+                attachments = self.get_attachments(
+                    doc.get("_attachments"), current, number)
+            return self.write(docid, number, body, attachments, deleted)
+
+    def get_attachments(self, doc_attachments, current, number):
+        '''
+        Returns attachments of a new document revision: inline attachments
+        of *doc_attachments* and attachments of *current* revision for which
+        it has a stub.
+        '''
+        attachments = {}
+        for name, attachment in (doc_attachments or {}).items():
+            if attachment.get("stub"):
+                if current is None or name not in current.attachments:
+                    raise CouchdbError(412, "missing_stub",
+                                       "Attachment %s has no content." % name)
+                attachments[name] = current.attachments[name]
+            else:
+                try:
+                    content = base64.b64decode(attachment.get("data") or "")
+                except TypeError:
+                    raise bad_request("Invalid attachment data for %s." %
+                                      name)
+                attachments[name] = get_attachment(
+                    content, attachment.get("content_type") or
+                    "application/octet-stream", number)
+        return attachments
+
+    def write(self, docid, number, body, attachments, deleted):
+        '''
+        Stores a new document revision and notifies change watchers.
+        '''
+        digest = hashlib.md5(json.dumps(
+            [body, sorted((name, attachment["digest"])
+                          for name, attachment in attachments.items())],
+            sort_keys=True))
+        rev = "%d-%s" % (number, digest.hexdigest())
+        body["_rev"] = rev
+        if attachments:
+            body["_attachments"] = dict(
+                (name, get_stub(attachment))
+                for name, attachment in attachments.items())
+
+        self.update_seq += 1
+        stored = StoredDocument(docid, rev, body, attachments, deleted,
+                                self.update_seq)
+        self.docs[docid] = stored
+        self.seqs.append(self.update_seq)
+        self.seq_ids.append(docid)
+        if len(self.seqs) > 2 * len(self.docs) + 1000:
+            self.compact_seqs()
+
+        watchers = self.watchers
+        self.watchers = []
+        for callback in watchers:
+            callback()
+        return stored
+
+    def compact_seqs(self):
+        '''
+        Drops sequence entries of documents written again since.
+        '''
+        entries = [(seq, docid) for seq, docid in zip(self.seqs, self.seq_ids)
+                   if self.docs[docid].seq == seq]
+        self.seqs = [seq for seq, docid in entries]
+        self.seq_ids = [docid for seq, docid in entries]
+
+    def get_changed(self, since, limit=None):
+        '''
+        Returns documents written after sequence *since*, in write order.
+        '''
+        changed = []
+        start = bisect.bisect_right(self.seqs, since)
+        for seq, docid in zip(self.seqs[start:], self.seq_ids[start:]):
+            stored = self.docs[docid]
+            if stored.seq == seq:
+                changed.append(stored)
+                if limit is not None and len(changed) >= limit:
+                    break
+        return changed
+
+    def get_changes(self, params):
+        '''
+        Returns the changes feed following sequence "since" of *params*.
+        '''
+        with self.lock:
+            since = params.get("since") or 0
+            if since == "now":
+                since = self.update_seq
+            results = []
+            for stored in self.get_changed(since, params.get("limit")):
+                change = {"seq": stored.seq, "id": stored.id,
+                          "changes": [{"rev": stored.rev}]}
+                if stored.deleted:
+                    change["deleted"] = True
+                if params.get("include_docs") is True:
+                    change["doc"] = stored.body
+                results.append(change)
+            last_seq = results[-1]["seq"] if results else since
+            return {"results": results, "last_seq": last_seq}
+
+    def watch(self, since, callback):
+        '''
+        Calls *callback* (from the writing thread) once a document is written
+        after sequence *since*.
+        '''
+        with self.lock:
+            if self.update_seq > since:
+                callback()
+            else:
+                self.watchers.append(callback)
+
+    def unwatch(self, callback):
+        with self.lock:
+            if callback in self.watchers:
+                self.watchers.remove(callback)
+
+    def delete(self, docid, rev):
+        with self.lock:
+            return self.save({"_id": docid, "_deleted": True}, rev)
+
+    def put_attachment(self, docid, name, content, content_type, rev):
+        '''
+        Adds attachment *name* to document *docid*, which is created if it
+        does not exist.
+        '''
+        with self.lock:
+            current = self.docs.get(docid)
+            if current is None or current.deleted:
+                if rev is not None:
+                    raise conflict()
+                body = {"_id": docid}
+                attachments = {}
+            else:
+                if rev != current.rev:
+                    raise conflict()
+                body = dict(current.body)
+                attachments = dict(current.attachments)
+            body.pop("_rev", None)
+            body.pop("_attachments", None)
+
+            number = current.get_number() + 1 if current is not None else 1
+            attachments[name] = get_attachment(
+                content, content_type or "application/octet-stream", number)
+            return self.write(docid, number, body, attachments, False)
+
+    def delete_attachment(self, docid, name, rev):
+        with self.lock:
+            current = self.get(docid)
+            if rev != current.rev:
+                raise conflict()
+            if name not in current.attachments:
+                raise not_found("Document is missing attachment")
+            body = dict(current.body)
+            body.pop("_rev", None)
+            body.pop("_attachments", None)
+            attachments = dict(current.attachments)
+            del attachments[name]
+            return self.write(docid, current.get_number() + 1, body,
+                              attachments, False)
+
+    def get_all_docs(self, params, keys=None):
+        with self.lock:
+            rows = []
+            if keys is not None:
+                for key in keys:
+                    stored = self.docs.get(key)
+                    if stored is None:
+                        rows.append({"key": key, "error": "not_found"})
+                    elif stored.deleted:
+                        rows.append({"id": key, "key": key, "value": {
+                            "rev": stored.rev, "deleted": True}, "doc": None})
+                    else:
+                        rows.append(self.get_all_docs_row(stored, params))
+                return {"total_rows": len(self.docs), "offset": 0,
+                        "rows": paginate(rows, params)}
+
+            docids = sorted(docid for docid, stored in self.docs.items()
+                            if not stored.deleted)
+            rows = [self.get_all_docs_row(self.docs[docid], params)
+                    for docid in paginate(get_id_range(docids, params),
+                                          params)]
+            return {"total_rows": len(docids), "offset": 0, "rows": rows}
+
+    def get_all_docs_row(self, stored, params):
+        row = {"id": stored.id, "key": stored.id,
+               "value": {"rev": stored.rev}}
+        if params.get("include_docs") is True:
+            row["doc"] = stored.body
+        return row
+
+    def query_view(self, design, name, params, keys=None):
+        '''
+        Returns result of view *name* of *design* document for query
+        *params*.
+        '''
+        with self.lock:
+            design_doc = self.get("_design/" + design)
+            if name not in design_doc.body.get("views", {}):
+                raise not_found("missing_named_view")
+            view = get_view(design, name)
+            if view is None:
+                raise CouchdbError(
+                    500, "unsupported_view",
+                    "View %s/%s has no Python equivalent." % (design, name))
+            map_function, reduce = view
+
+            index = self.indexes.get((design, name))
+            if index is None or index.design_rev != design_doc.rev:
+                index = ViewIndex(map_function, design_doc.rev)
+                self.indexes[(design, name)] = index
+            index.update(self)
+
+            rows, offset = index.get_rows(params, keys)
+            if reduce is not None and params.get("reduce") is not False:
+                if params.get("include_docs") is True:
+                    raise CouchdbError(400, "query_parse_error",
+                                       "include_docs is invalid for reduce")
+                return {"rows": paginate(reduce_rows(rows, reduce, params),
+                                         params)}
+
+            result_rows = []
+            for key, docid, value in paginate(rows, params):
+                row = {"id": docid, "key": key, "value": value}
+                if params.get("include_docs") is True:
+                    row["doc"] = self.get_linked_doc(docid, value)
+                result_rows.append(row)
+            result = {"total_rows": len(index.rows), "offset": offset,
+                      "rows": result_rows}
+            if params.get("update_seq") is True:
+                result["update_seq"] = self.update_seq
+            return result
+
+    def get_linked_doc(self, docid, value):
+        '''
+        Returns document included in a view row: the one of which id is
+        emitted as _id of row value, else the one that emitted the row.
+        '''
+        if isinstance(value, dict) and isinstance(value.get("_id"),
+                                                  basestring):
+            docid = value["_id"]
+        stored = self.docs.get(docid)
+        if stored is None or stored.deleted:
+            return None
+        return stored.body
+
+
+class LongPoll(object):
+    '''
+    Answer to a long polling changes request that has no change to return
+    yet: the client waits for a write to *database* after *since*, during
+    *timeout* seconds at most, then sends the request again.
+    '''
+
+    def __init__(self, database, since, timeout):
+        self.database = database
+        self.since = since
+        self.timeout = timeout
+
+
+def json_response(code, result, headers=None):
+    response_headers = {"content-type": "application/json"}
+    response_headers.update(headers or {})
+    return code, response_headers, json.dumps(result)
+
+
+def get_header(headers, name):
+    '''
+    Returns value of header *name* from request *headers* (dict or list of
+    pairs, any case).
+    '''
+    if hasattr(headers, "items"):
+        headers = headers.items()
+    for header, value in headers or []:
+        if header.lower() == name:
+            return value
+    return None
+
+
+class MemoryServer(object):
+    '''
+    Databases of the in-memory CouchDB, and dispatch of CouchDB API
+    requests to them.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.databases = {}
+
+    def reset(self):
+        '''
+        Deletes every database.
+        '''
+        with self.lock:
+            self.databases = {}
+
+    def get_database(self, name):
+        database = self.databases.get(name)
+        if database is None:
+            raise not_found("no_db_file")
+        return database
+
+    def handle(self, method, url, body=None, headers=None, longpoll=True):
+        '''
+        Serves a CouchDB API request sent to *url*. Returns status code,
+        headers and body of the response, or a LongPoll if the request is a
+        long polling changes request that must wait (when *longpoll* is
+        True).
+        '''
+        path, query = (url[len(SCHEME):].split("?", 1) + [""])[:2]
+        parts = [urllib.unquote(part) for part in path.split("/") if part]
+        try:
+            params = decode_params(query)
+            return self.route(method, parts, params, body, headers, longpoll)
+        except CouchdbError as error:
+            return json_response(error.code, {"error": error.error,
+                                              "reason": error.reason})
+
+    def route(self, method, parts, params, body, headers, longpoll):
+        if not parts:
+            return json_response(200, {"couchdb": "Welcome",
+                                       "version": "1.6.1"})
+        if parts == ["_all_dbs"]:
+            with self.lock:
+                return json_response(200, sorted(self.databases))
+        if parts == ["_uuids"]:
+            count = params.get("count") or 1
+            return json_response(200, {"uuids": [uuid.uuid4().hex
+                                                 for i in range(count)]})
+        if parts[0].startswith("_"):
+            raise not_found("missing")
+
+        if len(parts) == 1:
+            return self.route_database(method, parts[0], params, body)
+
+        database = self.get_database(parts[0])
+        if parts[1] == "_design":
+            if len(parts) < 3:
+                raise not_found("missing")
+            docid = "_design/" + parts[2]
+            rest = parts[3:]
+            if rest and rest[0] == "_view" and len(rest) == 2:
+                return self.route_view(method, database, parts[2], rest[1],
+                                       params, body)
+        elif parts[1] == "_local" and len(parts) > 2:
+            docid = "_local/" + parts[2]
+            rest = parts[3:]
+        elif parts[1].startswith("_"):
+            return self.route_special(method, database, parts[1], params,
+                                      body, longpoll)
+        else:
+            docid = parts[1]
+            rest = parts[2:]
+
+        if rest:
+            return self.route_attachment(method, database, docid,
+                                         "/".join(rest), params, body,
+                                         headers)
+        return self.route_document(method, database, docid, params, body)
+
+    def route_database(self, method, name, params, body):
+        with self.lock:
+            if method == "PUT":
+                if name in self.databases:
+                    raise CouchdbError(412, "file_exists",
+                                       "The database could not be created, "
+                                       "the file already exists.")
+                self.databases[name] = MemoryDatabase(name)
+                return json_response(201, {"ok": True})
+            database = self.get_database(name)
+            if method == "DELETE":
+                del self.databases[name]
+                return json_response(200, {"ok": True})
+
+        if method in ("GET", "HEAD"):
+            return json_response(200, database.get_info())
+        if method == "POST":
+            doc = decode_json(body)
+            doc.setdefault("_id", uuid.uuid4().hex)
+            stored = database.save(doc)
+            return json_response(201, {"ok": True, "id": stored.id,
+                                       "rev": stored.rev})
+        raise CouchdbError(405, "method_not_allowed",
+                           "Only GET,HEAD,POST,PUT,DELETE allowed")
+
+    def route_special(self, method, database, name, params, body,
+                      longpoll):
+        if name == "_all_docs":
+            keys = params.get("keys")
+            if method == "POST":
+                keys = decode_json(body).get("keys")
+            return json_response(200, database.get_all_docs(params, keys))
+
+        if name == "_bulk_docs" and method == "POST":
+            results = []
+            for doc in decode_json(body).get("docs", []):
+                doc.setdefault("_id", uuid.uuid4().hex)
+                try:
+                    stored = database.save(doc)
+                    results.append({"id": stored.id, "rev": stored.rev})
+                except CouchdbError as error:
+                    results.append({"id": doc.get("_id"),
+                                    "error": error.error,
+                                    "reason": error.reason})
+            return json_response(201, results)
+
+        if name == "_changes":
+            result = database.get_changes(params)
+            if longpoll and params.get("feed") == "longpoll" and \
+               not result["results"]:
+                return LongPoll(database, result["last_seq"],
+                                (params.get("timeout") or 60000) / 1000.)
+            return json_response(200, result)
+
+        if name == "_ensure_full_commit":
+            return json_response(201, {"ok": True,
+                                       "instance_start_time": "0"})
+        if name in ("_compact", "_view_cleanup"):
+            return json_response(202, {"ok": True})
+        raise not_found("missing")
+
+    def route_view(self, method, database, design, name, params, body):
+        keys = params.get("keys")
+        if method == "POST":
+            keys = decode_json(body).get("keys")
+        return json_response(200, database.query_view(design, name, params,
+                                                      keys))
+
+    def route_document(self, method, database, docid, params, body):
+        if method in ("GET", "HEAD"):
+            with database.lock:
+                stored = database.get(docid, params.get("rev"))
+                doc = stored.get_body(params.get("attachments") is True)
+            return json_response(200, doc, {"etag": '"%s"' % stored.rev})
+        if method == "PUT":
+            doc = decode_json(body)
+            if not isinstance(doc, dict):
+                raise bad_request("Document must be a JSON object")
+            doc["_id"] = docid
+            stored = database.save(doc, params.get("rev"))
+            return json_response(201, {"ok": True, "id": docid,
+                                       "rev": stored.rev},
+                                 {"etag": '"%s"' % stored.rev})
+        if method == "DELETE":
+            stored = database.delete(docid, params.get("rev"))
+            return json_response(200, {"ok": True, "id": docid,
+                                       "rev": stored.rev})
+        raise CouchdbError(405, "method_not_allowed",
+                           "Only GET,HEAD,PUT,DELETE allowed")
+
+    def route_attachment(self, method, database, docid, name, params, body,
+                         headers):
+        if method in ("GET", "HEAD"):
+            with database.lock:
+                stored = database.get(docid, params.get("rev"))
+                attachment = stored.attachments.get(name)
+            if attachment is None:
+                raise not_found("Document is missing attachment")
+            return 200, {"content-type": attachment["content_type"],
+                         "etag": '"%s"' % attachment["digest"]}, \
+                attachment["data"]
+        if method == "PUT":
+            if hasattr(body, "read"):
+                body = body.read()
+            if isinstance(body, unicode):
+                body = body.encode("utf-8")
+            stored = database.put_attachment(
+                docid, name, body or "", get_header(headers, "content-type"),
+                params.get("rev"))
+            return json_response(201, {"ok": True, "id": docid,
+                                       "rev": stored.rev})
+        if method == "DELETE":
+            stored = database.delete_attachment(docid, name,
+                                                params.get("rev"))
+            return json_response(200, {"ok": True, "id": docid,
+                                       "rev": stored.rev})
+        raise CouchdbError(405, "method_not_allowed",
+                           "Only GET,HEAD,PUT,DELETE allowed")
+
+
+memory_server = MemoryServer()
+
+
+class MemoryResponse(object):
+    '''
+    Response of the in-memory CouchDB, with the interface of restkit
+    responses used by couchdbkit.
+    '''
+
+    def __init__(self, code, headers, body):
+        self.status_int = code
+        self.status = "%d %s" % (code, httplib.responses.get(code, ""))
+        self.headers = headers
+        self.body = body
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            return self.headers.get(key)
+
+    def __contains__(self, key):
+        return key in self.headers
+
+    def can_read(self):
+        return True
+
+    def body_string(self, charset=None, unicode_errors="strict"):
+        if charset is not None:
+            try:
+                return self.body.decode(charset, unicode_errors)
+            except UnicodeDecodeError:
+                pass
+        return self.body
+
+    def body_stream(self):
+        return StringIO(self.body)
+
+    @property
+    def json_body(self):
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return self.body
+
+    def skip_body(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryClient(object):
+    '''
+    Replaces the HTTP client of a couchdbkit resource: requests are served
+    by the in-memory CouchDB, in the calling thread. A long polling changes
+    request blocks until a document is written or its timeout expires.
+    '''
+
+    def __init__(self, server=None):
+        self.server = server or memory_server
+
+    def request(self, url, method="GET", body=None, headers=None):
+        if hasattr(body, "read"):
+            body = body.read()
+        response = self.server.handle(method, url, body, headers)
+        if isinstance(response, LongPoll):
+            event = threading.Event()
+            response.database.watch(response.since, event.set)
+            event.wait(response.timeout)
+            response.database.unwatch(event.set)
+            response = self.server.handle(method, url, body, headers,
+                                          longpoll=False)
+        return MemoryResponse(*response)
+
+
+class MemoryAsyncHTTPClient(AsyncHTTPClient):
+    '''
+    Asynchronous HTTP client which sends requests to the in-memory CouchDB.
+    A long polling changes request is answered from the IOLoop once a
+    document is written or its timeout expires.
+    '''
+
+    def initialize(self, io_loop, defaults=None, server=None):
+        AsyncHTTPClient.initialize(self, io_loop, defaults=defaults)
+        self.server = server or memory_server
+
+    def fetch_impl(self, request, callback):
+        start = time.time()
+
+        def respond(longpoll=True):
+            response = self.server.handle(request.method, request.url,
+                                          request.body, request.headers,
+                                          longpoll)
+            if isinstance(response, LongPoll):
+                wait(response)
+                return
+            code, headers, body = response
+            callback(HTTPResponse(
+                request, code, headers=HTTPHeaders(headers),
+                buffer=StringIO(body), effective_url=request.url,
+                request_time=time.time() - start))
+
+        def wait(poll):
+            state = {"done": False}
+
+            def on_write():
+                self.io_loop.add_callback(finish)
+
+            def finish():
+                if not state["done"]:
+                    state["done"] = True
+                    self.io_loop.remove_timeout(timeout)
+                    poll.database.unwatch(on_write)
+                    respond(longpoll=False)
+
+            timeout = self.io_loop.add_timeout(time.time() + poll.timeout,
+                                               finish)
+            poll.database.watch(poll.since, on_write)
+
+        respond()
@@ -0,0 +1,297 @@
+"""
+Python equivalents of the map and reduce functions of application design
+documents (apps/*/_design/views), used by the in-memory CouchDB (see
+lib/memory_couchdb.py) which cannot run JavaScript.
+
+A map function takes a document and returns the (key, value) pairs it
+emits. Like CouchDB does for JavaScript errors, the in-memory database
+skips documents for which a map function raises (missing field...), so
+functions below access fields the way map.js files do: doc["field"] where
+JavaScript would fail on a missing field, doc.get("field") where it would
+emit undefined (null).
+
+A reduce is either the name of a CouchDB builtin reduce or a function
+called with keys and values of a group.
+
+When a map.js file changes, its equivalent here must change too.
+"""
+
+
+def is_type(doc, doc_type):
+    return doc.get("doc_type") == doc_type
+
+
+def is_true(value):
+    '''
+    Same as JavaScript true == value.
+    '''
+    return value is not None and value == True
+
+
+def is_false(value):
+    '''
+    Same as JavaScript false == value.
+    '''
+    return value is not None and value == False
+
+
+def get_tagged_rows(doc):
+    '''
+    Emits [tag, date] for each tag of *doc*, "all" if it has no tags.
+    '''
+    tags = doc.get("tags")
+    if tags is None:
+        tags = ["all"]
+        doc = dict(doc, tags=tags)
+    return [([tag, doc.get("date")], doc) for tag in tags]
+
+
+def get_attachments_size(doc):
+    return sum(attachment["length"]
+               for attachment in (doc.get("_attachments") or {}).values())
+
+
+# activities
+
+def activities_all(doc):
+    if is_type(doc, "Activity"):
+        return [(doc.get("date"), doc)]
+
+
+def activities_full(doc):
+    if is_type(doc, "Activity"):
+        return [(doc["_id"], doc)]
+
+
+def activities_mine(doc):
+    if is_type(doc, "Activity") and doc.get("isMine"):
+        return [(doc.get("date"), doc)]
+
+
+def activities_others(doc):
+    if is_type(doc, "Activity") and not doc.get("isMine"):
+        return [(doc.get("date"), doc)]
+
+
+# commons and pictures (same views)
+
+def get_file_views(doc_type):
+    '''
+    Returns map functions of views shared by commons and pictures.
+    '''
+
+    def all_files(doc):
+        if is_type(doc, doc_type):
+            return [(doc["_id"], doc)]
+
+    def contact_size(doc):
+        if is_type(doc, doc_type) and is_false(doc.get("isMine")):
+            return [(doc["_id"], get_attachments_size(doc))]
+
+    def contact(doc):
+        if is_type(doc, doc_type) and is_false(doc.get("isMine")):
+            return [([doc.get("authorKey"), doc.get("date")], doc)]
+
+    def last(doc):
+        if is_type(doc, doc_type):
+            return [(doc.get("date"), doc)]
+
+    def mine_tags(doc):
+        if is_type(doc, doc_type) and is_true(doc.get("isMine")):
+            return get_tagged_rows(doc)
+
+    def owner(doc):
+        if is_type(doc, doc_type) and is_true(doc.get("isMine")):
+            return [(doc.get("date"), doc)]
+
+    def tags(doc):
+        if is_type(doc, doc_type):
+            return get_tagged_rows(doc)
+
+    def to_download(doc):
+        if is_type(doc, doc_type) and is_false(doc.get("isMine")) and \
+           not doc.get("isFile"):
+            return [(doc.get("date"), doc)]
+
+    return {
+        "all": (all_files, None),
+        "contact-size": (contact_size, "_sum"),
+        "contact": (contact, None),
+        "last": (last, None),
+        "mine-tags": (mine_tags, None),
+        "owner": (owner, None),
+        "tags": (tags, None),
+        "to-download": (to_download, None)
+    }
+
+
+# core
+
+def core_contact(doc):
+    if is_type(doc, "Contact"):
+        return [(doc.get("slug"), doc)]
+
+
+def core_contactdocs(doc):
+    if not doc.get("isMine") and doc.get("doc_type") in \
+       ("MicroPost", "Picture", "Common"):
+        return [([doc["doc_type"], doc.get("authorKey"), doc.get("date")],
+                 None)]
+
+
+def core_contacttagged(doc):
+    if is_type(doc, "Contact"):
+        return [(tag, doc) for tag in doc["tags"]]
+
+
+def core_contacttagnames(doc):
+    if is_type(doc, "ContactTag"):
+        return [(doc.get("name"), doc)]
+
+
+def core_contacttags(doc):
+    if is_type(doc, "ContactTag"):
+        return [(doc["_id"], doc)]
+
+
+def core_lastsequence(doc):
+    if is_type(doc, "LastSequence"):
+        return [(doc.get("contactKey"), doc)]
+
+
+def core_pending(doc):
+    if is_type(doc, "Contact") and doc.get("state") in ("Pending", "Error"):
+        return [(doc.get("slug"), doc)]
+
+
+def core_requested(doc):
+    if is_type(doc, "Contact") and doc.get("state") == "Wait for approval":
+        return [(doc.get("slug"), doc)]
+
+
+def core_tags(doc):
+    # map.js emits an undefined variable: CouchDB fails on every
+    # ContactTag, so the view is always empty.
+    return []
+
+
+def core_tags_reduce(keys, values):
+    return True
+
+
+def core_trusted(doc):
+    if is_type(doc, "Contact") and doc.get("state") == "Trusted":
+        return [(doc.get("key"), doc)]
+
+
+def core_user(doc):
+    if is_type(doc, "User"):
+        return [(doc.get("name"), doc)]
+
+
+# news
+
+def news_all(doc):
+    if is_type(doc, "MicroPost"):
+        return [(doc.get("date"), doc)]
+
+
+def news_common(doc):
+    if is_type(doc, "MicroPost"):
+        return [(common, doc) for common in doc["commons_to_download"]]
+
+
+def news_contact(doc):
+    if is_type(doc, "MicroPost"):
+        return [([doc.get("authorKey"), doc.get("date")], doc)]
+
+
+def news_full(doc):
+    if is_type(doc, "MicroPost"):
+        return [(doc["_id"], doc)]
+
+
+def news_mine_tags(doc):
+    if is_type(doc, "MicroPost") and is_true(doc.get("isMine")):
+        return get_tagged_rows(doc)
+
+
+def news_mine(doc):
+    if is_type(doc, "MicroPost") and doc.get("isMine"):
+        return [(doc.get("date"), doc)]
+
+
+def news_picture(doc):
+    if is_type(doc, "MicroPost"):
+        return [(picture, doc) for picture in doc["pictures_to_download"]]
+
+
+def news_tags(doc):
+    if is_type(doc, "MicroPost"):
+        return get_tagged_rows(doc)
+
+
+# notes
+
+def notes_mine(doc):
+    if is_type(doc, "Note") and doc.get("isMine"):
+        return [(doc["_id"], doc)]
+
+
+def notes_mine_sort_date(doc):
+    if is_type(doc, "Note") and doc.get("isMine"):
+        return [(doc.get("lastModified"), doc)]
+
+
+def notes_mine_sort_title(doc):
+    if is_type(doc, "Note") and doc.get("isMine"):
+        return [(doc.get("title"), doc)]
+
+
+# Map function and reduce of each view, by design document name.
+VIEWS = {
+    "activities": {
+        "all": (activities_all, None),
+        "full": (activities_full, None),
+        "mine": (activities_mine, None),
+        "others": (activities_others, None)
+    },
+    "commons": get_file_views("Common"),
+    "core": {
+        "contact": (core_contact, None),
+        "contactdocs": (core_contactdocs, None),
+        "contacttagged": (core_contacttagged, None),
+        "contacttagnames": (core_contacttagnames, None),
+        "contacttags": (core_contacttags, None),
+        "lastsequence": (core_lastsequence, None),
+        "pending": (core_pending, None),
+        "requested": (core_requested, None),
+        "tags": (core_tags, core_tags_reduce),
+        "trusted": (core_trusted, None),
+        "user": (core_user, None)
+    },
+    "news": {
+        "all": (news_all, None),
+        "common": (news_common, None),
+        "contact": (news_contact, None),
+        "full": (news_full, None),
+        "mine-tags": (news_mine_tags, None),
+        "mine": (news_mine, None),
+        "picture": (news_picture, None),
+        "tags": (news_tags, None)
+    },
+    "notes": {
+        "mine": (notes_mine, None),
+        "mine_sort_date": (notes_mine_sort_date, None),
+        "mine_sort_title": (notes_mine_sort_title, None)
+    },
+    "pictures": get_file_views("Picture")
+}
+
+
+def get_view(design, name):
+    '''
+    Returns map function and reduce of view *name* of *design* document,
+    None if it has no Python equivalent.
+    '''
+    return VIEWS.get(design, {}).get(name)
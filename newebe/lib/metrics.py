@@ -0,0 +1,316 @@
+"""
+Server metrics, exported at Prometheus text format.
+
+NewebeHandler records, for every request, its duration and status, and the
+number and duration of CouchDB calls done to serve it. These metrics are
+labelled with the route pattern of the handler (from routes.py). Requests
+sent to contacts, IOLoop lag and search index commits are recorded too.
+Gauges (connected websocket clients...) are read when metrics are
+exported.
+
+CouchDB calls are attributed to the request being served through a stack
+context: request statistics are current while request callbacks run on the
+IOLoop thread and while functions it sends to the database thread pool run.
+Time spent in other phases of the request (authentication, serialization,
+fan-out to contacts) is added to its statistics the same way, so slow
+requests can be logged with their timings. Types of the documents it
+modifies are recorded too, so its handler drops cached responses that
+depend on them.
+
+Recording a value updates a few counters in memory, so metrics are always
+on (see benchmarks/metrics.py). They are kept by worker, with a worker
+label.
+"""
+
+import time
+import bisect
+import functools
+import threading
+
+from contextlib import contextmanager
+
+from tornado.stack_context import StackContext
+
+from newebe.lib.events import channel
+
+# Upper bounds of duration histogram buckets, in seconds.
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+                    2.5, 5, 10)
+
+# Upper bounds of CouchDB calls by request histogram buckets.
+CALL_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+local = threading.local()
+lock = threading.Lock()
+
+
+# Phases of requests, reported for slow requests.
+PHASES = ("auth", "serialization", "fanout")
+
+
+class RequestStats(object):
+    '''
+    CouchDB calls done while serving a request, time spent in its other
+    phases and types of the documents it modified.
+    '''
+
+    __slots__ = ("db_calls", "db_time", "phases", "doc_types")
+
+    def __init__(self):
+        self.db_calls = 0
+        self.db_time = 0.
+        self.phases = {}
+        self.doc_types = set()
+
+    def get_summary(self):
+        '''
+        Returns phase timings as a readable string.
+        '''
+        timings = ["db %.3fs in %d calls" % (self.db_time, self.db_calls)]
+        timings.extend("%s %.3fs" % (name, self.phases.get(name, 0.))
+                       for name in PHASES)
+        return ", ".join(timings)
+
+
+class RequestContext(object):
+    '''
+    Makes *stats* the statistics of current request, inside a stack
+    context or a database thread.
+    '''
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(local, "stats", None)
+        local.stats = self.stats
+
+    def __exit__(self, type, value, traceback):
+        local.stats = self.previous
+
+
+def get_request_stats():
+    '''
+    Returns statistics of the request being served, None outside requests.
+    '''
+    return getattr(local, "stats", None)
+
+
+def request_context(stats):
+    '''
+    Returns a stack context in which *stats* are current request statistics.
+    '''
+    return StackContext(functools.partial(RequestContext, stats))
+
+
+@contextmanager
+def phase(name):
+    '''
+    Adds time spent inside the block to phase *name* of current request.
+    '''
+    start = time.time()
+    try:
+        yield
+    finally:
+        stats = get_request_stats()
+        if stats is not None:
+            duration = time.time() - start
+            with lock:
+                stats.phases[name] = stats.phases.get(name, 0.) + duration
+
+
+def record_write(doc_type):
+    '''
+    Adds *doc_type* to types of documents modified by current request.
+    '''
+    stats = get_request_stats()
+    if stats is not None:
+        with lock:
+            stats.doc_types.add(doc_type)
+
+
+def escape(value):
+    return unicode(value).replace(u"\\", u"\\\\").replace(u"\n", u"\\n") \
+        .replace(u'"', u'\\"')
+
+
+def format_labels(names, values):
+    if not names:
+        return u""
+    return u"{%s}" % u",".join(u'%s="%s"' % (name, escape(value))
+                               for name, value in zip(names, values))
+
+
+class Histogram(object):
+    '''
+    Count of observed values by bucket, with their sum.
+    '''
+
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, buckets):
+        # Last count is for values above the highest bucket.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.
+
+
+class MetricFamily(object):
+    '''
+    Counter or histogram, with a value by set of labels.
+    '''
+
+    def __init__(self, name, kind, description, label_names=(),
+                 buckets=None):
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.label_names = ("worker",) + tuple(label_names)
+        self.buckets = buckets
+        self.values = {}
+
+    def inc(self, labels=(), value=1):
+        with lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def observe(self, labels, value):
+        with lock:
+            histogram = self.values.get(labels)
+            if histogram is None:
+                histogram = Histogram(self.buckets)
+                self.values[labels] = histogram
+            histogram.counts[bisect.bisect_left(self.buckets, value)] += 1
+            histogram.sum += value
+
+    def get_samples(self, worker):
+        '''
+        Returns (name, label names, label values, value) of every sample.
+        '''
+        with lock:
+            if self.kind == "histogram":
+                values = [(labels, (list(value.counts), value.sum))
+                          for labels, value in self.values.items()]
+            else:
+                values = self.values.items()
+
+        names = self.label_names
+        for labels, value in sorted(values, key=lambda item: item[0]):
+            labels = (worker,) + labels
+            if self.kind != "histogram":
+                yield self.name, names, labels, value
+                continue
+
+            total = 0
+            counts, value_sum = value
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                total += count
+                yield self.name + "_bucket", names + ("le",), \
+                    labels + (bound,), total
+            yield self.name + "_sum", names, labels, value_sum
+            yield self.name + "_count", names, labels, total
+
+
+class Metrics(object):
+    '''
+    Metrics of current worker.
+    '''
+
+    def __init__(self):
+        self.requests = MetricFamily(
+            "newebe_http_requests_total", "counter",
+            "Requests served, by route, method and status.",
+            ("route", "method", "code"))
+        self.request_duration = MetricFamily(
+            "newebe_http_request_duration_seconds", "histogram",
+            "Duration of served requests.", ("route", "method"),
+            DURATION_BUCKETS)
+        self.request_db_calls = MetricFamily(
+            "newebe_http_request_couchdb_calls", "histogram",
+            "CouchDB calls done to serve a request.", ("route",),
+            CALL_BUCKETS)
+        self.request_db_time = MetricFamily(
+            "newebe_http_request_couchdb_seconds", "histogram",
+            "Time spent in CouchDB calls to serve a request.", ("route",),
+            DURATION_BUCKETS)
+        self.db_calls = MetricFamily(
+            "newebe_couchdb_calls_total", "counter",
+            "CouchDB calls, inside and outside requests.")
+        self.db_time = MetricFamily(
+            "newebe_couchdb_seconds_total", "counter",
+            "Time spent in CouchDB calls, inside and outside requests.")
+        self.contact_requests = MetricFamily(
+            "newebe_contact_request_duration_seconds", "histogram",
+            "Duration of requests sent to contacts.", ("outcome",),
+            DURATION_BUCKETS)
+        self.loop_lag = MetricFamily(
+            "newebe_ioloop_lag_seconds", "histogram",
+            "Delay of IOLoop timeouts.", (), DURATION_BUCKETS)
+        self.index_commits = MetricFamily(
+            "newebe_index_commit_duration_seconds", "histogram",
+            "Duration of search index commits.", (), DURATION_BUCKETS)
+        self.families = [
+            self.requests, self.request_duration, self.request_db_calls,
+            self.request_db_time, self.db_calls, self.db_time,
+            self.contact_requests, self.loop_lag, self.index_commits
+        ]
+        self.gauges = []
+
+    def gauge(self, name, description, get_value):
+        '''
+        Registers a gauge, *get_value* is called on export to read it.
+        '''
+        self.gauges.append((name, description, get_value))
+
+    def observe_request(self, route, method, code, duration, stats):
+        self.requests.inc((route, method, code))
+        self.request_duration.observe((route, method), duration)
+        self.request_db_calls.observe((route,), stats.db_calls)
+        self.request_db_time.observe((route,), stats.db_time)
+
+    def observe_db_call(self, duration):
+        '''
+        Records a CouchDB call, and adds it to statistics of current request
+        if there is one.
+        '''
+        self.db_calls.inc()
+        self.db_time.inc((), duration)
+        stats = get_request_stats()
+        if stats is not None:
+            with lock:
+                stats.db_calls += 1
+                stats.db_time += duration
+
+    def observe_contact_request(self, success, duration):
+        outcome = "success" if success else "failure"
+        self.contact_requests.observe((outcome,), duration)
+
+    def observe_loop_lag(self, lag):
+        self.loop_lag.observe((), lag)
+
+    def observe_index_commit(self, duration):
+        self.index_commits.observe((), duration)
+
+    def export(self):
+        '''
+        Returns metrics at Prometheus text format.
+        '''
+        worker = channel.worker_id
+        lines = []
+        for family in self.families:
+            lines.append(u"# HELP %s %s" % (family.name, family.description))
+            lines.append(u"# TYPE %s %s" % (family.name, family.kind))
+            for name, names, labels, value in family.get_samples(worker):
+                lines.append(u"%s%s %r" % (
+                    name, format_labels(names, labels), float(value)))
+
+        for name, description, get_value in self.gauges:
+            lines.append(u"# HELP %s %s" % (name, description))
+            lines.append(u"# TYPE %s gauge" % name)
+            lines.append(u"%s%s %r" % (
+                name, format_labels(("worker",), (worker,)),
+                float(get_value())))
+
+        return u"\n".join(lines) + u"\n"
+
+
+metrics = Metrics()
@@ -3,6 +3,7 @@ import string
 import random
 
 from StringIO import StringIO
+from collections import OrderedDict
 from PIL import Image
 
 from newebe.config import CONFIG
@@ -40,3 +41,89 @@ class Resizer(object):
         os.remove(filepath)
 
         return filebuffer
+
+
+# Transpositions turning an image clockwise by the given number of degrees.
+ROTATIONS = {
+    90: Image.ROTATE_270,
+    180: Image.ROTATE_180,
+    270: Image.ROTATE_90,
+}
+
+# Prefixes of picture renditions (thumbnail and preview) that are small
+# enough to be kept in memory once rotated.
+RENDITION_PREFIXES = ("th_", "prev_")
+
+
+def get_next_orientation(orientation):
+    '''
+    Returns orientation of a picture after a quarter turn on the right.
+    '''
+    return ((orientation or 0) + 90) % 360
+
+
+def rotate(image_file, orientation):
+    '''
+    Returns content of *image_file* turned clockwise by *orientation*
+    degrees. Transposition moves pixels without resampling them and the
+    stored file is never modified, so image is encoded only once whatever
+    the number of rotations.
+    '''
+    if not orientation:
+        return image_file
+
+    image = Image.open(StringIO(image_file))
+    image_format = image.format or "JPEG"
+    image = image.transpose(ROTATIONS[orientation])
+    buffer = StringIO()
+    image.save(buffer, image_format, quality=90)
+    return buffer.getvalue()
+
+
+class RotationCache(object):
+    '''
+    Bounded LRU cache of rotated renditions keyed by picture ID, file name
+    and orientation.
+    '''
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get_max_size(self):
+        if self.max_size is None:
+            return CONFIG.main.picture_rotation_cache_size
+        return self.max_size
+
+    def get(self, key):
+        content = self.entries.pop(key, None)
+        if content is not None:
+            self.entries[key] = content
+        return content
+
+    def set(self, key, content):
+        if self.get_max_size() > 0:
+            self.entries[key] = content
+            while len(self.entries) > self.get_max_size():
+                self.entries.popitem(last=False)
+
+
+rotation_cache = RotationCache()
+
+
+def get_oriented_attachment(picture, filename):
+    '''
+    Returns *filename* attachment of *picture* turned following picture
+    orientation. Blocking, it should run inside the database thread pool.
+    '''
+    orientation = picture.orientation or 0
+    if not orientation:
+        return picture.fetch_attachment(filename)
+
+    key = (picture._id, filename, orientation)
+    content = rotation_cache.get(key)
+    if content is None:
+        content = rotate(picture.fetch_attachment(filename), orientation)
+        if filename.startswith(RENDITION_PREFIXES):
+            rotation_cache.set(key, content)
+    return content
@@ -0,0 +1,233 @@
+"""
+Background prefetch of files (pictures, commons) shared by contacts.
+
+Contact pictures and commons are received without their file, which is
+downloaded when the owner asks for it. When *CONFIG.main.prefetch* is set,
+the prefetcher downloads these files in background, one at a time, every
+*CONFIG.main.prefetch_interval* seconds:
+
+* files of contacts the owner looks at most and most recent files first,
+* no more than *CONFIG.main.prefetch_bytes_per_hour* bytes per hour,
+* no download once contact files use *CONFIG.main.prefetch_disk_budget*
+  bytes of database,
+* no download while average request latency is above
+  *CONFIG.main.prefetch_max_latency* seconds (the server is busy serving
+  the owner or contacts), unless no request was served for a whole
+  interval.
+
+Sources of files to prefetch are objects with three methods:
+*get_candidates(limit)* and *get_disk_usage()* (blocking) and
+*download(document)* (coroutine returning the downloaded size).
+
+Prefetch runs on the main worker. Other workers send it views of contact
+files through the event channel. Latency is measured from requests served
+by the main worker.
+"""
+
+import time
+import logging
+import datetime
+
+from collections import deque
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.util import import_object
+
+from newebe.config import CONFIG
+from newebe.lib import async_db
+from newebe.lib.events import channel
+
+logger = logging.getLogger("newebe.lib")
+
+SOURCES = [
+    "newebe.apps.pictures.handlers.PicturePrefetchSource",
+    "newebe.apps.commons.handlers.CommonPrefetchSource",
+]
+
+# Weight of last request in average latency.
+LATENCY_WEIGHT = 0.1
+
+# Delay before trying again to prefetch a file that failed.
+FAILURE_DELAY = 3600
+
+
+class Prefetcher(object):
+    '''
+    Downloads contact files in background, within bandwidth, disk and
+    latency budgets.
+    '''
+
+    def __init__(self):
+        self.sources = []
+        self.started = False
+        self.running = False
+        self.state = "stopped"
+        self.latency = None
+        self.last_request = 0
+        self.contact_views = {}
+        self.downloads = deque()
+        self.failures = {}
+        self.prefetched = 0
+
+    def start(self, sources=SOURCES):
+        '''
+        Loads sources and schedules first prefetch.
+        '''
+        self.sources = [import_object(source)() for source in sources]
+        self.started = True
+        self.state = "waiting"
+        self.schedule()
+
+    def schedule(self):
+        IOLoop.instance().add_timeout(
+            time.time() + CONFIG.main.prefetch_interval, self.run)
+
+    def record_request(self, duration):
+        '''
+        Updates average latency with the *duration* of a served request.
+        '''
+        if not self.started:
+            return
+
+        self.last_request = time.time()
+        if self.latency is None:
+            self.latency = duration
+        else:
+            self.latency = LATENCY_WEIGHT * duration + \
+                (1 - LATENCY_WEIGHT) * self.latency
+
+    def record_view(self, contact_key):
+        '''
+        Counts a view of a file shared by given contact.
+        '''
+        if CONFIG.main.prefetch:
+            channel.send(0, "contact_view", contact_key)
+
+    def on_contact_view(self, contact_key):
+        self.contact_views[contact_key] = \
+            self.contact_views.get(contact_key, 0) + 1
+
+    def get_hour_usage(self, now=None):
+        '''
+        Returns number of bytes downloaded during last hour.
+        '''
+        now = now or time.time()
+        while self.downloads and self.downloads[0][0] < now - 3600:
+            self.downloads.popleft()
+        return sum(size for date, size in self.downloads)
+
+    def is_idle(self):
+        '''
+        Returns True if average latency is low or if no request was served
+        since last prefetch.
+        '''
+        return self.latency is None or \
+            self.latency < CONFIG.main.prefetch_max_latency or \
+            self.last_request < time.time() - CONFIG.main.prefetch_interval
+
+    def get_score(self, document, now=None):
+        '''
+        Returns priority of *document*: higher for documents of most viewed
+        contacts, lower for old documents.
+        '''
+        now = now or datetime.datetime.utcnow()
+        age = 0
+        if document.date is not None:
+            age = max(0, (now - document.date).total_seconds() / 86400.)
+        views = self.contact_views.get(document.authorKey, 0)
+        return (1. + views) / (1. + age)
+
+    def get_candidates(self, sources_candidates):
+        '''
+        Returns (source, document) pairs sorted by priority, without
+        documents that failed recently.
+        '''
+        now = time.time()
+        self.failures = dict(
+            (key, date) for key, date in self.failures.items()
+            if date >= now - FAILURE_DELAY)
+        candidates = [
+            (source, document)
+            for source, documents in sources_candidates
+            for document in documents
+            if document._id not in self.failures
+        ]
+        utc_now = datetime.datetime.utcnow()
+        candidates.sort(
+            key=lambda candidate: -self.get_score(candidate[1], utc_now))
+        return candidates
+
+    def check_budget(self, disk_usage):
+        '''
+        Returns the reason why prefetch must stop, None if it can go on.
+        '''
+        if not self.is_idle():
+            return "paused: high latency"
+        if self.get_hour_usage() >= CONFIG.main.prefetch_bytes_per_hour:
+            return "paused: hourly budget reached"
+        if disk_usage >= CONFIG.main.prefetch_disk_budget:
+            return "stopped: disk budget reached"
+        return None
+
+    @gen.coroutine
+    def run(self):
+        '''
+        Downloads files of sources by priority until there is nothing left
+        to download or a budget is reached.
+        '''
+        if self.running:
+            return
+
+        self.running = True
+        try:
+            disk_usage = 0
+            sources_candidates = []
+            for source in self.sources:
+                disk_usage += yield async_db.run(source.get_disk_usage)
+                documents = yield async_db.run(
+                    source.get_candidates, CONFIG.main.prefetch_batch)
+                sources_candidates.append((source, documents))
+
+            for source, document in self.get_candidates(sources_candidates):
+                reason = self.check_budget(disk_usage)
+                if reason is not None:
+                    self.state = reason
+                    break
+
+                self.state = "downloading"
+                try:
+                    size = yield source.download(document)
+                except Exception:
+                    self.failures[document._id] = time.time()
+                    continue
+
+                self.downloads.append((time.time(), size))
+                self.prefetched += 1
+                disk_usage += size
+            else:
+                self.state = "waiting"
+
+        except Exception:
+            logger.exception("Contact files cannot be prefetched.")
+            self.state = "waiting"
+        finally:
+            self.running = False
+            self.schedule()
+
+    def get_status(self):
+        '''
+        Returns prefetch state and counters.
+        '''
+        return {
+            "enabled": self.started,
+            "state": self.state,
+            "latency": self.latency,
+            "hourUsage": self.get_hour_usage(),
+            "prefetched": self.prefetched,
+            "failures": len(self.failures)
+        }
+
+
+prefetcher = Prefetcher()
+channel.subscribe("contact_view", prefetcher.on_contact_view)
@@ -0,0 +1,230 @@
+"""
+Profiling of a running Newebe, started from admin endpoints.
+
+* The sampling profiler records stacks of every thread (IOLoop, database
+  thread pool...) every *CONFIG.main.profiler_interval* seconds during a
+  given duration. Stacks are returned in collapsed format, one line per
+  stack with its sample count, as read by flamegraph.pl or speedscope.
+* The request profiler runs cProfile for the next requests of a route.
+  Profiling is enabled only while callbacks of these requests run on the
+  IOLoop thread (through a stack context), so requests served meanwhile
+  are not profiled. Work done in the database thread pool is not profiled
+  either (see request phase timings for that). Statistics are returned as
+  a pstats dump:
+
+      python -c "import pstats; pstats.Stats('newebe.pstats').print_stats()"
+
+One profiling of each kind can run at a time. Profiling is done by worker:
+only requests served by the worker that started it are profiled.
+"""
+
+import os
+import sys
+import time
+import marshal
+import cProfile
+import functools
+import threading
+
+from tornado import stack_context
+from tornado.ioloop import IOLoop
+from tornado.concurrent import TracebackFuture
+
+from newebe.config import CONFIG
+
+
+def get_frame_name(frame):
+    '''
+    Returns name of *frame* function, with the end of its file path.
+    '''
+    code = frame.f_code
+    path = "/".join(code.co_filename.split(os.sep)[-2:])
+    return "%s:%s" % (path, code.co_name)
+
+
+def get_collapsed_stacks(stacks):
+    '''
+    Returns *stacks* (sample count by stack) in collapsed format.
+    '''
+    return "".join("%s %d\n" % (stack, count)
+                   for stack, count in sorted(stacks.items()))
+
+
+class SamplingProfiler(object):
+    '''
+    Samples stacks of every thread from a dedicated thread.
+    '''
+
+    def __init__(self):
+        self.future = None
+
+    def is_running(self):
+        return self.future is not None
+
+    def start(self, duration, interval=None):
+        '''
+        Samples stacks during *duration* seconds. Returns a future resolved
+        with collapsed stacks.
+        '''
+        if interval is None:
+            interval = CONFIG.main.profiler_interval
+
+        io_loop = IOLoop.instance()
+        self.future = TracebackFuture()
+        future = self.future
+
+        def run():
+            stacks = self.sample(duration, interval)
+            io_loop.add_callback(self.stop, future, stacks)
+
+        thread = threading.Thread(target=run, name="newebe-profiler")
+        thread.daemon = True
+        thread.start()
+        return future
+
+    def sample(self, duration, interval):
+        '''
+        Returns sample count by stack, stacks are frame names separated by
+        semicolons, thread name first.
+        '''
+        own_id = threading.current_thread().ident
+        stacks = {}
+        end = time.time() + duration
+        while time.time() < end:
+            names = dict((thread.ident, thread.name)
+                         for thread in threading.enumerate())
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    stack.append(get_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stack = ";".join(reversed(stack))
+                stacks[stack] = stacks.get(stack, 0) + 1
+            time.sleep(interval)
+        return stacks
+
+    def stop(self, future, stacks):
+        self.future = None
+        future.set_result(get_collapsed_stacks(stacks))
+
+
+class ProfileContext(object):
+    '''
+    Enables a request profile while a callback of a profiled request runs.
+    '''
+
+    def __init__(self, profile):
+        self.profile = profile
+
+    def __enter__(self):
+        self.profile.enable()
+
+    def __exit__(self, type, value, traceback):
+        self.profile.disable()
+
+
+class RequestProfile(object):
+    '''
+    cProfile of the next *count* requests of *route*.
+    '''
+
+    def __init__(self, route, count):
+        self.route = route
+        self.remaining = count
+        self.running = 0
+        self.depth = 0
+        self.profiler = cProfile.Profile()
+        self.future = TracebackFuture()
+        self.timeout = None
+
+    def context(self):
+        '''
+        Returns a stack context that profiles request callbacks.
+        '''
+        return stack_context.StackContext(
+            functools.partial(ProfileContext, self))
+
+    def enable(self):
+        if not self.depth and not self.future.done():
+            self.profiler.enable()
+        self.depth += 1
+
+    def disable(self):
+        self.depth -= 1
+        if not self.depth:
+            self.profiler.disable()
+
+    def request_started(self):
+        self.remaining -= 1
+        self.running += 1
+
+    def request_finished(self):
+        self.running -= 1
+        if not self.remaining and not self.running:
+            self.stop()
+
+    def stop(self):
+        '''
+        Resolves profile future with a pstats dump of profiled requests.
+        '''
+        if self.future.done():
+            return
+        if self.timeout is not None:
+            IOLoop.instance().remove_timeout(self.timeout)
+            self.timeout = None
+
+        self.profiler.create_stats()
+        self.future.set_result(marshal.dumps(self.profiler.stats))
+
+
+class RequestProfiler(object):
+    '''
+    Starts request profiles and gives them the requests to profile.
+    '''
+
+    def __init__(self):
+        self.profile = None
+
+    def is_running(self):
+        return self.profile is not None
+
+    def start(self, route, count, duration):
+        '''
+        Profiles next *count* requests of *route*, or requests of *route*
+        received during *duration* seconds if there are less. Returns a
+        future resolved with a pstats dump.
+        '''
+        profile = RequestProfile(route, count)
+        self.profile = profile
+
+        # Timeout must not run inside the context of the request that
+        # started profiling.
+        with stack_context.NullContext():
+            profile.timeout = IOLoop.instance().add_timeout(
+                time.time() + duration, profile.stop)
+        profile.future.add_done_callback(self.on_profile_done)
+        return profile.future
+
+    def on_profile_done(self, future):
+        if self.profile is not None and self.profile.future is future:
+            self.profile = None
+
+    def get_profile(self, route):
+        '''
+        Returns the profile that must record a request of *route*, None if
+        this request is not profiled.
+        '''
+        profile = self.profile
+        if profile is not None and profile.route == route and \
+           profile.remaining > 0:
+            profile.request_started()
+            return profile
+        return None
+
+
+sampling_profiler = SamplingProfiler()
+request_profiler = RequestProfiler()
@@ -0,0 +1,203 @@
+"""
+Rate limiting and load shedding of requests sent by contacts.
+
+Endpoints that contacts use to push data (microposts, pictures, commons,
+synchronization and contact requests) write to CouchDB, to the search
+index and build thumbnails. To keep a misbehaving contact from saturating
+the server, their handler methods are decorated with *rate_limited*:
+
+* each client IP and each contact key (taken from request data) gets a
+  token bucket. Requests beyond its rate are rejected with a 429 status,
+* while the IOLoop is late (lag above *CONFIG.main.shed_loop_lag*) or too
+  many limited requests are being processed, new requests are rejected
+  with a 503 status.
+
+Both responses give a Retry-After delay. Counters are kept by worker.
+"""
+
+import math
+import time
+import functools
+
+from collections import OrderedDict
+
+from tornado.escape import json_decode, json_encode
+from tornado.ioloop import IOLoop
+
+from newebe.config import CONFIG
+from newebe.lib.metrics import metrics
+
+# Content type of document batches sent one JSON object per line.
+NDJSON_TYPE = "application/x-ndjson"
+
+# Delay between two IOLoop lag measures.
+LAG_INTERVAL = 0.5
+
+REASONS = {
+    429: "Too Many Requests",
+    503: "Service Unavailable"
+}
+
+
+class TokenBucket(object):
+    '''
+    Allows *rate* requests per second on average, with bursts of *capacity*
+    requests.
+    '''
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = self.capacity
+        self.updated = time.time()
+
+    def consume(self, now=None):
+        '''
+        Takes a token. Returns 0 if a token was available, else the number of
+        seconds to wait for the next one.
+        '''
+        now = now or time.time()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter(object):
+    '''
+    Token buckets by client IP and contact key, IOLoop lag and in-flight
+    request count.
+    '''
+
+    def __init__(self):
+        self.buckets = OrderedDict()
+        self.in_flight = 0
+        self.loop_lag = 0
+        self.expected = None
+        self.counters = {
+            "accepted": 0,
+            "ip": 0,
+            "contact": 0,
+            "loopLag": 0,
+            "inFlight": 0
+        }
+
+    def start(self):
+        '''
+        Starts measuring IOLoop lag.
+        '''
+        self.expected = time.time() + LAG_INTERVAL
+        IOLoop.instance().add_timeout(self.expected, self.measure_lag)
+
+    def measure_lag(self):
+        now = time.time()
+        self.loop_lag = max(0, now - self.expected)
+        metrics.observe_loop_lag(self.loop_lag)
+        self.expected = now + LAG_INTERVAL
+        IOLoop.instance().add_timeout(self.expected, self.measure_lag)
+
+    def get_bucket(self, key, rate, capacity):
+        bucket = self.buckets.pop(key, None)
+        if bucket is None:
+            bucket = TokenBucket(rate, capacity)
+        self.buckets[key] = bucket
+        while len(self.buckets) > CONFIG.main.rate_limit_buckets:
+            self.buckets.popitem(last=False)
+        return bucket
+
+    def check(self, ip, contact_key=None):
+        '''
+        Returns None if request can be processed, else a (status, reason,
+        retry after) tuple.
+        '''
+        if self.loop_lag > CONFIG.main.shed_loop_lag:
+            self.counters["loopLag"] += 1
+            return (503, "Server is overloaded.",
+                    CONFIG.main.shed_retry_after)
+        if self.in_flight >= CONFIG.main.shed_in_flight:
+            self.counters["inFlight"] += 1
+            return (503, "Server is overloaded.",
+                    CONFIG.main.shed_retry_after)
+
+        delay = self.get_bucket(
+            ("ip", ip), CONFIG.main.ip_rate, CONFIG.main.ip_burst).consume()
+        if delay:
+            self.counters["ip"] += 1
+            return (429, "Too many requests.", delay)
+
+        if contact_key:
+            delay = self.get_bucket(
+                ("contact", contact_key), CONFIG.main.contact_rate,
+                CONFIG.main.contact_burst).consume()
+            if delay:
+                self.counters["contact"] += 1
+                return (429, "Too many requests.", delay)
+
+        self.counters["accepted"] += 1
+        self.in_flight += 1
+        return None
+
+    def release(self):
+        self.in_flight -= 1
+
+    def metrics(self):
+        metrics = dict(self.counters)
+        metrics["currentLoopLag"] = self.loop_lag
+        metrics["currentInFlight"] = self.in_flight
+        return metrics
+
+
+rate_limiter = RateLimiter()
+
+
+def get_contact_key(request):
+    '''
+    Returns key of the contact that sends *request*, read from its JSON
+    body, from the first line of its NDJSON body (document batches) or from
+    its json field (file uploads). Returns None if it is not found.
+    '''
+    try:
+        if "json" in request.arguments:
+            data = json_decode(request.arguments["json"][0])
+        elif request.headers.get("Content-Type", "").startswith(
+                NDJSON_TYPE):
+            data = json_decode(request.body.split("\n", 1)[0])
+        elif request.body:
+            data = json_decode(request.body)
+        else:
+            return None
+    except ValueError:
+        return None
+
+    if isinstance(data, dict):
+        return data.get("authorKey") or data.get("key")
+    return None
+
+
+def rate_limited(method):
+    '''
+    Decorator for methods of Newebe handlers called by contacts: requests
+    are rejected when their sender exceeds its rate or when server is
+    overloaded.
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        rejection = rate_limiter.check(self.request.remote_ip,
+                                       get_contact_key(self.request))
+        if rejection is not None:
+            status, reason, retry_after = rejection
+            # Tornado does not know 429 status, its reason must be given.
+            self.set_status(status, REASONS[status])
+            self.set_header("Retry-After", int(math.ceil(retry_after)))
+            self.set_header("Content-Type", "application/json")
+            self.write(json_encode({"error": reason}))
+            self.finish()
+        else:
+            self.rate_limited = True
+            return method(self, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,147 @@
+"""
+Server-side cache of JSON responses.
+
+Timelines (microposts, activities, pictures...) are polled far more often
+than they change. Responses of GET handlers decorated with *cached* are kept
+in memory, keyed by request URI (route and cursor), until a document of a
+type they depend on is modified. Modifications are known through
+invalidation events published by the changes watcher (see
+newebe.lib.changes), so every worker drops its stale entries.
+
+Invalidations are counted per document type. A response is stored only if
+no document it depends on was invalidated while it was computed, otherwise
+a stale body could be cached after the invalidation that should drop it.
+
+Each cached response gets an ETag: a client that sends it back in
+If-None-Match receives a 304 response without any database query.
+"""
+
+import hashlib
+import functools
+
+from collections import OrderedDict
+
+from newebe.config import CONFIG
+from newebe.lib.events import channel
+
+
+class CacheEntry(object):
+
+    def __init__(self, body, doc_types):
+        self.body = body
+        self.doc_types = doc_types
+        self.etag = '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+class ResponseCache(object):
+    '''
+    Bounded LRU cache of response bodies, invalidated by document type.
+    '''
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        # Invalidation counts, by document type and for full clears.
+        self.generations = {}
+        self.clears = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_max_size(self):
+        if self.max_size is None:
+            return CONFIG.main.response_cache_size
+        return self.max_size
+
+    def get(self, key):
+        '''
+        Returns entry stored for *key* or None.
+        '''
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.entries[key] = entry
+            self.hits += 1
+        return entry
+
+    def get_generation(self, doc_types):
+        '''
+        Returns a value that changes each time documents of *doc_types* are
+        invalidated.
+        '''
+        return (self.clears,) + tuple(
+            self.generations.get(doc_type, 0) for doc_type in doc_types)
+
+    def set(self, key, body, doc_types, generation=None):
+        '''
+        Stores *body*, which depends on documents of *doc_types*, for *key*.
+        Returns stored entry.
+
+        If *generation* is given (read before computing *body*) and documents
+        of *doc_types* were invalidated since, nothing is stored and None is
+        returned.
+        '''
+        if generation is not None and \
+           generation != self.get_generation(doc_types):
+            return None
+
+        entry = CacheEntry(body, doc_types)
+        max_size = self.get_max_size()
+        if max_size > 0:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, doc_type=None):
+        '''
+        Removes entries that depend on *doc_type* documents. If no type is
+        given, every entry is removed.
+        '''
+        if doc_type is None:
+            self.clear()
+        else:
+            self.generations[doc_type] = self.generations.get(doc_type, 0) + 1
+            for key, entry in self.entries.items():
+                if doc_type in entry.doc_types:
+                    del self.entries[key]
+
+    def clear(self):
+        self.clears += 1
+        self.entries.clear()
+
+    def on_invalidate_event(self, event):
+        self.invalidate(event.get("docType"))
+
+
+response_cache = ResponseCache()
+channel.subscribe("invalidate", response_cache.on_invalidate_event)
+
+
+def cached(*doc_types):
+    '''
+    Decorator for GET methods of Newebe handlers: JSON responses are served
+    from the response cache until a document of one of *doc_types* changes.
+    '''
+    def decorator(method):
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = self.request.uri
+            entry = response_cache.get(key)
+
+            if entry is not None:
+                self.etag = entry.etag
+                self.set_header("Content-Type", "application/json")
+                self.write(entry.body)
+                self.finish()
+            else:
+                self.cache_key = key
+                self.cache_doc_types = doc_types
+                self.cache_generation = response_cache.get_generation(
+                    doc_types)
+                return method(self, *args, **kwargs)
+
+        return wrapper
+    return decorator
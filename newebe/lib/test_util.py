@@ -2,36 +2,71 @@ import hashlib
 
 from nose.tools import assert_in
 from lettuce import world
-from couchdbkit import Server
 from tornado.escape import json_decode
 from tornado.httpclient import HTTPClient, HTTPRequest
 
-from newebe.config import CONFIG
-from newebe.settings import COUCHDB_DB_NAME
+from newebe.config import CONFIG, load_config
+load_config()
+
 from newebe.apps.profile.models import UserManager, User
+from newebe.lib.couchdb_util import get_server
+from newebe.lib.memory_couchdb import is_memory_uri
+from newebe.tools.syncdb import CouchdbkitHandler
 
 ROOT_URL = u"http://localhost:8888/"
 SECOND_NEWEBE_ROOT_URL = u"http://localhost:8889/"
 
-server = Server()
-server2 = Server()
-db = server.get_or_create_db(CONFIG.db.name)
-db2 = server.get_or_create_db(CONFIG.db.name + "2")
-print db2
+# Created at first use, once config is loaded.
+server = None
+databases = {}
+
+
+def get_test_db(name):
+    '''
+    Returns test database called *name*, creates it if it does not exist.
+    '''
+    global server
+    if server is None:
+        server = get_server()
+
+    if name not in databases:
+        databases[name] = server.get_or_create_db(name)
+
+        # With the in-memory database (memory:// database URI), tests run
+        # without CouchDB: design documents are pushed to the new database
+        # first.
+        if is_memory_uri(CONFIG.db.uri):
+            CouchdbkitHandler().sync_all_app(
+                CONFIG.db.uri, name, CONFIG.db.views)
+    return databases[name]
+
+
+def get_db():
+    '''
+    Returns database of the first Newebe test instance.
+    '''
+    return get_test_db(CONFIG.db.name)
+
+
+def get_db2():
+    '''
+    Returns database of the second Newebe test instance.
+    '''
+    return get_test_db(CONFIG.db.name + "2")
 
 
-def reset_documents(cls, get_func, database=db):
+def reset_documents(cls, get_func, database=None):
     '''
     Clear all documents corresponding to *cls*.
     '''
 
-    cls._db = database
+    cls._db = database or get_db()
     docs = get_func()
     while docs:
         for doc in docs:
             doc.delete()
         docs = get_func()
-    cls._db = db
+    cls._db = get_db()
 
 
 class NewebeClient(HTTPClient):
@@ -76,7 +111,7 @@ class NewebeClient(HTTPClient):
         '''
 
         self.root_url = url
-        User._db = db2
+        User._db = get_db2()
 
         self.user = UserManager.getUser()
         if self.user:
@@ -91,7 +126,7 @@ class NewebeClient(HTTPClient):
             description="my description"
         )
         self.user.save()
-        User._db = db
+        User._db = get_db()
 
     def get(self, url):
         '''
@@ -0,0 +1,22 @@
+Feature: Static assets building
+
+    Scenario: Build hashed and compressed copies of assets
+        Given I have a static folder with a script and a stylesheet
+        When I build assets
+        Then manifest links script to its hashed copy
+        And hashed copy of script has a gzip sibling
+        And URL of script points to its hashed copy
+        And relative URLs of stylesheet copy are absolute
+
+    Scenario: Change hash when asset changes
+        Given I have a static folder with a script and a stylesheet
+        When I build assets
+        And script content changes
+        And I build assets
+        Then manifest links script to its new hashed copy
+
+    Scenario: Serve regular assets when copies cannot be written
+        Given I have a static folder with a script and a stylesheet
+        And assets folder cannot be written
+        When I build assets
+        Then URL of script is its regular URL
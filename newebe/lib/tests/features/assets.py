@@ -0,0 +1,98 @@
+import os
+import gzip
+import shutil
+import tempfile
+
+from lettuce import step, world, after
+
+from newebe.lib import assets
+
+SCRIPT = "var newebe = true;"
+STYLESHEET = "body { background: url('../images/bg.png'); }"
+
+
+@after.each_scenario
+def remove_static_folder(scenario):
+    if getattr(world, "static_path", None):
+        shutil.rmtree(world.static_path)
+        world.static_path = None
+    if getattr(world, "assets_path", None):
+        if os.path.isdir(world.assets_path):
+            shutil.rmtree(world.assets_path)
+        else:
+            os.remove(world.assets_path)
+        world.assets_path = None
+
+
+def write_file(path, content):
+    path = os.path.join(world.static_path, path)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as static_file:
+        static_file.write(content)
+
+
+@step(u'Given I have a static folder with a script and a stylesheet')
+def given_i_have_a_static_folder(step):
+    world.static_path = tempfile.mkdtemp()
+    world.assets_path = tempfile.mkdtemp()
+    world.dist_path = os.path.join(world.assets_path, assets.DIST_FOLDER)
+    write_file("javascripts/app.js", SCRIPT)
+    write_file("stylesheets/app.css", STYLESHEET)
+    world.script = SCRIPT
+
+
+@step(u'I build assets')
+def i_build_assets(step):
+    assets.manifest.clear()
+    assets.build_assets(world.static_path, world.dist_path)
+
+
+@step(u'assets folder cannot be written')
+def assets_folder_cannot_be_written(step):
+    # A file in place of the folder fails even for root.
+    os.rmdir(world.assets_path)
+    open(world.assets_path, "w").close()
+
+
+@step(u'Then URL of script is its regular URL')
+def then_url_of_script_is_its_regular_url(step):
+    assert not os.path.exists(world.dist_path)
+    assert assets.asset_url("javascripts/app.js") == \
+        "static/javascripts/app.js"
+
+
+@step(u'script content changes')
+def script_content_changes(step):
+    world.script = SCRIPT + " var updated = true;"
+    write_file("javascripts/app.js", world.script)
+
+
+@step(u'Then manifest links script to its (?:new )?hashed copy')
+def then_manifest_links_script_to_its_hashed_copy(step):
+    expected = "dist/" + assets.get_hashed_name("javascripts/app.js",
+                                                world.script)
+    assert assets.manifest["javascripts/app.js"] == expected
+
+
+@step(u'hashed copy of script has a gzip sibling')
+def hashed_copy_of_script_has_a_gzip_sibling(step):
+    path = os.path.join(world.assets_path,
+                        assets.manifest["javascripts/app.js"])
+    assert gzip.GzipFile(path + ".gz").read() == SCRIPT
+
+
+@step(u'URL of script points to its hashed copy')
+def url_of_script_points_to_its_hashed_copy(step):
+    assert assets.asset_url("javascripts/app.js") == \
+        assets.manifest["javascripts/app.js"]
+    assert assets.asset_url("javascripts/missing.js") == \
+        "static/javascripts/missing.js"
+
+
+@step(u'relative URLs of stylesheet copy are absolute')
+def relative_urls_of_stylesheet_copy_are_absolute(step):
+    path = os.path.join(world.assets_path,
+                        assets.manifest["stylesheets/app.css"])
+    with open(path) as stylesheet:
+        assert "url('/static/images/bg.png')" in stylesheet.read()
@@ -0,0 +1,21 @@
+Feature: Change stream of the database
+
+    Scenario: Convert a document change to an event
+        Given I have a change of a "MicroPost" document with attachments
+        When I convert it to a change event
+        Then event contains the document without attachments
+
+    Scenario: Private documents are not streamed
+        Given I have a change of a "User" document
+        When I convert it to a change event
+        Then there is no event
+
+    Scenario: Design documents are not streamed
+        Given I have a change of a design document
+        When I convert it to a change event
+        Then there is no event
+
+    Scenario: Stream a deletion
+        Given I have a deletion change
+        When I convert it to a change event
+        Then event is a deletion
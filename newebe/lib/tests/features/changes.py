@@ -0,0 +1,71 @@
+from lettuce import step, world
+
+from newebe.lib.changes import get_change_event
+
+
+@step(u'Given I have a change of a "(.*)" document with attachments')
+def given_i_have_a_change_with_attachments(step, doc_type):
+    world.change = {
+        "seq": 12,
+        "id": "doc1",
+        "doc": {
+            "_id": "doc1",
+            "doc_type": doc_type,
+            "content": "hello",
+            "_attachments": {"file.png": {"stub": True}}
+        }
+    }
+
+
+@step(u'Given I have a change of a "(.*)" document$')
+def given_i_have_a_change_of_a_document(step, doc_type):
+    world.change = {
+        "seq": 12,
+        "id": "doc1",
+        "doc": {"_id": "doc1", "doc_type": doc_type}
+    }
+
+
+@step(u'Given I have a change of a design document')
+def given_i_have_a_change_of_a_design_document(step):
+    world.change = {
+        "seq": 12,
+        "id": "_design/core",
+        "doc": {"_id": "_design/core"}
+    }
+
+
+@step(u'Given I have a deletion change')
+def given_i_have_a_deletion_change(step):
+    world.change = {
+        "seq": 12,
+        "id": "doc1",
+        "deleted": True,
+        "doc": {"_id": "doc1", "_deleted": True}
+    }
+
+
+@step(u'When I convert it to a change event')
+def when_i_convert_it_to_a_change_event(step):
+    world.event = get_change_event(world.change)
+
+
+@step(u'Then event contains the document without attachments')
+def then_event_contains_the_document_without_attachments(step):
+    assert 12 == world.event["seq"]
+    assert "MicroPost" == world.event["docType"]
+    assert "hello" == world.event["doc"]["content"]
+    assert "_attachments" not in world.event["doc"]
+    assert "_attachments" in world.change["doc"]
+
+
+@step(u'Then there is no event')
+def then_there_is_no_event(step):
+    assert world.event is None
+
+
+@step(u'Then event is a deletion')
+def then_event_is_a_deletion(step):
+    assert world.event["deleted"]
+    assert "doc1" == world.event["id"]
+    assert "doc" not in world.event
@@ -0,0 +1,27 @@
+Feature: Gzip compression of request and response bodies
+
+    Scenario: Compress and uncompress a body
+        Given I have a JSON body of 2000 bytes
+        When I compress it
+        Then compressed body is smaller
+        And uncompressed body is the original one
+
+    Scenario: Refuse too large uncompressed bodies
+        Given I have a JSON body of 2000 bytes
+        When I compress it
+        Then uncompressing it with a limit of 1000 bytes fails
+
+    Scenario: Skip bodies that are not worth compressing
+        Given I have a JSON body of 2000 bytes
+        Then a "application/json; charset=UTF-8" body is compressible
+        And a "image/jpeg" body is not compressible
+        Given I have a JSON body of 100 bytes
+        Then a "application/json" body is not compressible
+
+    Scenario: Compress requests to contacts that accept compressed requests
+        Given a contact that answers with "X-Newebe-Accept-Encoding" header set to "gzip"
+        When I receive its response
+        Then requests to this contact are compressed
+        Given a contact that answers with "Content-Encoding" header set to "gzip"
+        When I receive its response
+        Then requests to this contact are not compressed
@@ -0,0 +1,71 @@
+from lettuce import step, world
+from tornado.httputil import HTTPHeaders
+from tornado.httpclient import HTTPRequest, HTTPResponse
+
+from newebe.lib import gzip_util
+from newebe.lib.http_util import ContactClient, gzip_contacts
+from newebe.apps.contacts.models import Contact
+
+
+@step(u'Given I have a JSON body of (\d+) bytes')
+def given_i_have_a_json_body(step, size):
+    world.body = ('{"content": "%s"}' % ("a" * int(size)))[:int(size)]
+
+
+@step(u'When I compress it')
+def when_i_compress_it(step):
+    world.compressed = gzip_util.compress(world.body)
+
+
+@step(u'Then compressed body is smaller')
+def then_compressed_body_is_smaller(step):
+    assert len(world.compressed) < len(world.body)
+
+
+@step(u'And uncompressed body is the original one')
+def and_uncompressed_body_is_the_original_one(step):
+    assert world.body == gzip_util.decompress(world.compressed)
+
+
+@step(u'Then uncompressing it with a limit of (\d+) bytes fails')
+def then_uncompressing_it_with_a_limit_fails(step, max_size):
+    try:
+        gzip_util.decompress(world.compressed, int(max_size))
+        assert False
+    except ValueError:
+        pass
+
+
+@step(u'a "(.*)" body is compressible')
+def a_body_is_compressible(step, content_type):
+    assert gzip_util.is_compressible(content_type, world.body)
+
+
+@step(u'a "(.*)" body is not compressible')
+def a_body_is_not_compressible(step, content_type):
+    assert not gzip_util.is_compressible(content_type, world.body)
+
+
+@step(u'Given a contact that answers with "(.*)" header set to "(.*)"')
+def given_a_contact_that_answers_with_header(step, name, value):
+    world.contact = Contact(name="Contact", url="http://contact.example/")
+    gzip_contacts.discard(world.contact.url)
+    request = HTTPRequest(world.contact.url)
+    world.response = HTTPResponse(request, 200,
+                                  headers=HTTPHeaders({name: value}))
+
+
+@step(u'When I receive its response')
+def when_i_receive_its_response(step):
+    ContactClient().check_gzip_support(world.contact, world.response)
+
+
+@step(u'Then requests to this contact are compressed')
+def then_requests_to_this_contact_are_compressed(step):
+    assert world.contact.url in gzip_contacts
+    gzip_contacts.discard(world.contact.url)
+
+
+@step(u'Then requests to this contact are not compressed')
+def then_requests_to_this_contact_are_not_compressed(step):
+    assert world.contact.url not in gzip_contacts
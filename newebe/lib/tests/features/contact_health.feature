@@ -0,0 +1,18 @@
+Feature: Contact health
+
+    Scenario: Keep deliveries while a contact is down and send them once it recovers
+        Given a stub contact is running
+        And contact circuits open after 2 failures and are probed after 0.2 seconds
+        When I deliver 1 microposts to the stub contact
+        Then stub contact received 1 microposts
+        And stub contact circuit is "closed"
+        When stub contact goes down
+        And I deliver 2 microposts to the stub contact
+        Then stub contact circuit is "open"
+        When I deliver a micropost to the stub contact while it is down
+        Then 1 deliveries to stub contact are kept
+        And requests waiting for an answer from stub contact fail immediately
+        When stub contact recovers
+        Then kept delivery is sent to stub contact
+        And stub contact received 2 microposts
+        And stub contact circuit is "closed"
@@ -0,0 +1,112 @@
+import time
+
+from lettuce import step, world
+
+from tornado.web import Application, RequestHandler
+from tornado.ioloop import IOLoop
+from tornado.httpserver import HTTPServer
+from tornado.httpclient import HTTPError
+
+from newebe.config import CONFIG
+from newebe.lib.http_util import ContactClient
+from newebe.lib.contact_health import contact_health
+
+STUB_PORT = 18891
+
+
+class StubContact(object):
+    key = "stub"
+    name = "Stub"
+    url = "http://127.0.0.1:%d/" % STUB_PORT
+
+
+class StubMicropostHandler(RequestHandler):
+
+    def post(self):
+        world.received_microposts += 1
+        self.write('{"success": true}')
+
+
+def start_stub_contact():
+    world.stub_server = HTTPServer(Application([
+        ('/microposts/contacts/$', StubMicropostHandler),
+    ]))
+    world.stub_server.listen(STUB_PORT, "127.0.0.1")
+
+
+def deliver_micropost():
+    return ContactClient().post(StubContact(), "microposts/contacts/", "{}")
+
+
+@step(u'Given a stub contact is running')
+def given_a_stub_contact_is_running(step):
+    world.received_microposts = 0
+    contact_health.clear()
+    start_stub_contact()
+
+
+@step(u'contact circuits open after (\d+) failures and are probed after ([\d.]+) seconds')
+def contact_circuits_open_after(step, failures, delay):
+    CONFIG.main.contact_failure_threshold = int(failures)
+    CONFIG.main.contact_error_rate = 0.5
+    CONFIG.main.contact_circuit_reset = float(delay)
+
+
+@step(u'I deliver (\d+) microposts to the stub contact')
+def when_i_deliver_microposts(step, nb_microposts):
+    for i in range(int(nb_microposts)):
+        try:
+            IOLoop.instance().run_sync(deliver_micropost, timeout=5)
+        except HTTPError:
+            pass
+
+
+@step(u'stub contact received (\d+) microposts')
+def stub_contact_received(step, nb_microposts):
+    assert world.received_microposts == int(nb_microposts)
+
+
+@step(u'stub contact circuit is "(.*)"')
+def stub_contact_circuit_is(step, state):
+    assert contact_health.get(StubContact()).state == state
+
+
+@step(u'When stub contact goes down')
+def when_stub_contact_goes_down(step):
+    world.stub_server.stop()
+
+
+@step(u'When I deliver a micropost to the stub contact while it is down')
+def when_i_deliver_a_micropost_while_down(step):
+    world.kept_delivery = deliver_micropost()
+    assert not world.kept_delivery.done()
+
+
+@step(u'Then (\d+) deliveries to stub contact are kept')
+def then_deliveries_are_kept(step, nb_deliveries):
+    status = contact_health.get(StubContact()).get_status()
+    assert status["deferred"] == int(nb_deliveries)
+
+
+@step(u'requests waiting for an answer from stub contact fail immediately')
+def requests_waiting_for_an_answer_fail(step):
+    responses = []
+    start = time.time()
+    ContactClient().post(StubContact(), "microposts/contacts/", "{}",
+                         responses.append)
+    IOLoop.instance().run_sync(lambda: None)
+    assert responses[0].code == 599
+    assert time.time() - start < 0.1
+
+
+@step(u'When stub contact recovers')
+def when_stub_contact_recovers(step):
+    start_stub_contact()
+
+
+@step(u'Then kept delivery is sent to stub contact')
+def then_kept_delivery_is_sent(step):
+    response = IOLoop.instance().run_sync(
+        lambda: world.kept_delivery, timeout=5)
+    assert response.code == 200
+    world.stub_server.stop()
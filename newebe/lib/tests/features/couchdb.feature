@@ -0,0 +1,15 @@
+Feature: CouchDB view statistics
+
+    Scenario: Record view latencies
+        Given I have an empty view statistics collector
+        When I record a call of 0.2 seconds to "news/all"
+        And I record a call of 0.4 seconds to "news/all"
+        And I record a call of 0.1 seconds to "core/user"
+        Then "news/all" has 2 calls and a mean of 0.3 seconds
+        And "news/all" is the first view of the report
+
+    Scenario: Extract view name from request path
+        When I extract view name from "/newebe/_design/news/_view/all"
+        Then I get "news/all" as view name
+        When I extract view name from "/newebe/abc123"
+        Then I get no view name
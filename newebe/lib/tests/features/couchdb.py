@@ -0,0 +1,41 @@
+from lettuce import step, world
+
+from newebe.lib.couchdb_util import ViewStats, get_view_name
+
+
+@step(u'Given I have an empty view statistics collector')
+def given_i_have_an_empty_view_statistics_collector(step):
+    world.view_stats = ViewStats(slow_threshold=1)
+
+
+@step(u'I record a call of ([0-9.]+) seconds to "(.*)"')
+def i_record_a_call_to_view(step, duration, view):
+    world.view_stats.record(view, float(duration))
+
+
+@step(u'Then "(.*)" has (\d+) calls and a mean of ([0-9.]+) seconds')
+def then_view_has_calls_and_mean(step, view, count, mean):
+    stats = [line for line in world.view_stats.report()
+             if line["view"] == view][0]
+    assert stats["count"] == int(count)
+    assert abs(stats["mean"] - float(mean)) < 0.0001
+
+
+@step(u'And "(.*)" is the first view of the report')
+def and_view_is_the_first_view_of_the_report(step, view):
+    assert world.view_stats.report()[0]["view"] == view
+
+
+@step(u'When I extract view name from "(.*)"')
+def when_i_extract_view_name_from_path(step, path):
+    world.view_name = get_view_name(path)
+
+
+@step(u'Then I get "(.*)" as view name')
+def then_i_get_view_name(step, view):
+    assert world.view_name == view
+
+
+@step(u'Then I get no view name')
+def then_i_get_no_view_name(step):
+    assert world.view_name is None
@@ -0,0 +1,17 @@
+Feature: Download manager
+
+    Scenario: Share running download and queue downloads of a contact
+        Given I have a download manager allowing 2 downloads by contact
+        When I download "picture1" from "contact1"
+        And I download "picture2" from "contact1"
+        And I download "picture3" from "contact1"
+        And I download "picture4" from "contact2"
+        And I download "picture1" from "contact1"
+        Then 4 downloads are in progress
+        And "picture1" downloads share the same future
+        And "picture3" download is queued
+        And "picture4" download is started
+        When "picture1" download finishes
+        Then "picture1" download result is "picture1 processed"
+        And 3 downloads are in progress
+        And "picture3" download is started
@@ -0,0 +1,76 @@
+from lettuce import step, world
+
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+from newebe.lib.download_manager import DownloadManager
+
+
+class FakeContact(object):
+
+    def __init__(self, key):
+        self.key = key
+        self.name = key
+        self.url = "http://%s/" % key
+
+
+class FakeDownloadManager(DownloadManager):
+    '''
+    Download manager of which downloads finish when tests decide it.
+    '''
+
+    def __init__(self, concurrency):
+        DownloadManager.__init__(self, concurrency)
+        self.fetches = {}
+
+    def fetch(self, download):
+        download.state = "downloading"
+        self.fetches[download.key] = Future()
+        return self.fetches[download.key]
+
+
+@step(u'Given I have a download manager allowing (\d+) downloads by contact')
+def given_i_have_a_download_manager(step, concurrency):
+    world.download_manager = FakeDownloadManager(int(concurrency))
+    world.futures = {}
+
+
+@step(u'I download "(.*)" from "(.*)"')
+def i_download_from(step, key, contact_key):
+    future = world.download_manager.download(
+        key, FakeContact(contact_key), "pictures/contact/download/", "{}",
+        None)
+    world.futures.setdefault(key, []).append(future)
+
+
+@step(u'(\d+) downloads are in progress')
+def downloads_are_in_progress(step, nb_downloads):
+    assert len(world.download_manager.get_progress()) == int(nb_downloads)
+
+
+@step(u'"(.*)" downloads share the same future')
+def downloads_share_the_same_future(step, key):
+    futures = world.futures[key]
+    assert len(futures) == 2
+    assert futures[0] is futures[1]
+
+
+@step(u'"(.*)" download is (queued|started)')
+def download_is(step, key, state):
+    download = world.download_manager.downloads[key]
+    if state == "queued":
+        assert download.state == "queued"
+    else:
+        assert download.state == "downloading"
+
+
+@step(u'When "(.*)" download finishes')
+def when_download_finishes(step, key):
+    world.download_manager.fetches[key].set_result(key + " processed")
+    IOLoop.instance().run_sync(lambda: world.futures[key][0])
+
+
+@step(u'Then "(.*)" download result is "(.*)"')
+def then_download_result_is(step, key, result):
+    assert world.futures[key][0].result() == result
+    assert not world.download_manager.is_downloading(key)
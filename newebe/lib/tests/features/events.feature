@@ -0,0 +1,25 @@
+Feature: Event channel between worker processes
+
+    Scenario: Publish an event in a single process
+        Given I have an event channel that is not started
+        And I subscribe to "microposts" events
+        When I publish "hello" on "microposts"
+        Then I received "hello"
+
+    Scenario: Publish an event to another worker
+        Given I have two started event channels
+        And I subscribe to "microposts" events on second channel
+        When I publish "hello" on "microposts" from first channel
+        Then I received "hello"
+
+    Scenario: Publish an event too large for other workers
+        Given I have two started event channels
+        And I subscribe to "pictures" events on both channels
+        When I publish a 300000 bytes message on "pictures" from first channel
+        Then only first channel received this message
+
+    Scenario: Publish an event larger than a datagram read
+        Given I have two started event channels
+        And I subscribe to "pictures" events on both channels
+        When I publish a 2000000 bytes message on "pictures" from first channel
+        Then only first channel received this message
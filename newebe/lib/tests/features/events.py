@@ -0,0 +1,83 @@
+import tempfile
+
+from lettuce import step, world, after
+from tornado.ioloop import IOLoop
+
+from newebe.config import CONFIG
+from newebe.lib.events import EventChannel
+
+
+def on_event(message):
+    world.received.append(message)
+
+
+@after.each_scenario
+def close_channels(scenario):
+    for channel in getattr(world, "channels", []):
+        channel.close()
+    world.channels = []
+
+
+@step(u'Given I have an event channel that is not started')
+def given_i_have_an_event_channel_that_is_not_started(step):
+    world.channels = [EventChannel()]
+    world.received = []
+
+
+@step(u'Given I have two started event channels')
+def given_i_have_two_started_event_channels(step):
+    CONFIG.main.runpath = tempfile.gettempdir()
+    world.io_loop = IOLoop()
+    world.channels = [EventChannel(), EventChannel()]
+    world.channels[0].start(0, 2, world.io_loop)
+    world.channels[1].start(1, 2, world.io_loop)
+    world.received = []
+
+
+@step(u'And I subscribe to "(.*)" events$')
+def and_i_subscribe_to_events(step, topic):
+    world.channels[0].subscribe(topic, on_event)
+
+
+@step(u'And I subscribe to "(.*)" events on second channel')
+def and_i_subscribe_to_events_on_second_channel(step, topic):
+    world.channels[1].subscribe(topic, on_event)
+
+
+@step(u'When I publish "(.*)" on "(.*)"$')
+def when_i_publish_on_topic(step, message, topic):
+    world.channels[0].publish(topic, message)
+    io_loop = IOLoop.instance()
+    io_loop.add_callback(io_loop.stop)
+    io_loop.start()
+
+
+@step(u'And I subscribe to "(.*)" events on both channels')
+def and_i_subscribe_to_events_on_both_channels(step, topic):
+    for channel in world.channels:
+        channel.subscribe(topic, on_event)
+
+
+@step(u'When I publish a (\d+) bytes message on "(.*)" from first channel')
+def when_i_publish_a_message_from_first_channel(step, size, topic):
+    world.message = "x" * int(size)
+    world.channels[0].publish(topic, world.message)
+    world.io_loop.add_timeout(world.io_loop.time() + 0.2, world.io_loop.stop)
+    world.io_loop.start()
+
+
+@step(u'Then only first channel received this message')
+def then_only_first_channel_received_this_message(step):
+    assert world.received == [world.message]
+
+
+@step(u'When I publish "(.*)" on "(.*)" from first channel')
+def when_i_publish_on_topic_from_first_channel(step, message, topic):
+    world.channels[0].publish(topic, message)
+    world.io_loop.add_timeout(world.io_loop.time() + 0.2, world.io_loop.stop)
+    world.io_loop.start()
+
+
+@step(u'Then I received "(.*)"')
+def then_i_received(step, message):
+    assert world.received == [message]
@@ -0,0 +1,15 @@
+Feature: Server import time
+
+    Scenario: Start server without loading application dependencies
+        When I profile import of "newebe.newebe_server"
+        Then I print import time report
+        And "PIL" is not imported
+        And "lxml" is not imported
+        And "whoosh" is not imported
+        And "markdown" is not imported
+        And "newebe.apps.news.handlers" is not imported
+
+    Scenario: Load handler module at first request
+        Given I have a lazy handler for "news.NewsHandler"
+        When I get its handler class
+        Then its module is "newebe.apps.news.handlers"
@@ -0,0 +1,53 @@
+import os
+import sys
+import json
+import subprocess
+
+from lettuce import step, world
+
+from newebe.lib.lazy_handler import get_handler
+
+# Profiling is done in a separate interpreter: modules already imported by
+# the test runner would not be imported again.
+PROFILE_SCRIPT = """
+import sys, json
+from newebe.lib.import_profile import ImportProfiler
+profiler = ImportProfiler()
+profiler.profile(sys.argv[1])
+print json.dumps({"modules": sys.modules.keys(),
+                  "report": profiler.report()})
+"""
+
+
+@step(u'When I profile import of "(.*)"')
+def when_i_profile_import_of(step, module_name):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+    output = subprocess.check_output(
+        [sys.executable, "-c", PROFILE_SCRIPT, module_name], env=env)
+    world.profile = json.loads(output.splitlines()[-1])
+
+
+@step(u'Then I print import time report')
+def then_i_print_import_time_report(step):
+    print "\n".join(world.profile["report"])
+
+
+@step(u'"(.*)" is not imported')
+def is_not_imported(step, module_name):
+    assert module_name not in world.profile["modules"]
+
+
+@step(u'Given I have a lazy handler for "(.*)"')
+def given_i_have_a_lazy_handler_for(step, name):
+    world.handler = get_handler(name)
+
+
+@step(u'When I get its handler class')
+def when_i_get_its_handler_class(step):
+    world.handler_class = world.handler.get_handler_class()
+
+
+@step(u'Then its module is "(.*)"')
+def then_its_module_is(step, module_name):
+    assert world.handler_class.__module__ == module_name
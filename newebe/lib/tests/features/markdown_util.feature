@@ -0,0 +1,26 @@
+Feature: Markdown rendering
+
+    Scenario: Escape raw HTML while rendering markdown
+        When I render "Some *text* <script>alert(1)</script>"
+        Then rendered HTML contains "<em>text</em>"
+        And rendered HTML does not contain "<script>"
+
+    Scenario: Keep raw HTML of notes
+        When I render "Some *text* <u>underlined</u>" without escaping
+        Then rendered HTML contains "<em>text</em>"
+        And rendered HTML contains "<u>underlined</u>"
+
+    Scenario: Use HTML stored inside document
+        Given I have a micropost with "*stored*" as stored HTML
+        When I get micropost HTML
+        Then rendered HTML is "*stored*"
+
+    Scenario: Render again documents of which revision changed
+        Given I have a micropost saved without HTML
+        When I get micropost HTML
+        And micropost content changes without new revision
+        And I get micropost HTML
+        Then rendered HTML contains "first"
+        When micropost content changes with a new revision
+        And I get micropost HTML
+        Then rendered HTML contains "second"
@@ -0,0 +1,62 @@
+from lettuce import step, world
+
+from newebe.lib import markdown_util
+from newebe.apps.news.models import MicroPost
+
+
+def get_micropost(content, html=None):
+    micropost = MicroPost(content=content, htmlContent=html)
+    micropost._doc["_id"] = "markdown-test"
+    micropost._doc["_rev"] = "1-a"
+    return micropost
+
+
+@step(u'When I render "(.*)"$')
+def when_i_render(step, content):
+    world.html = markdown_util.render(content)
+
+
+@step(u'When I render "(.*)" without escaping')
+def when_i_render_without_escaping(step, content):
+    world.html = markdown_util.render(content, escape=False)
+
+
+@step(u'rendered HTML contains "(.*)"')
+def then_rendered_html_contains(step, text):
+    assert text in world.html
+
+
+@step(u'rendered HTML does not contain "(.*)"')
+def rendered_html_does_not_contain(step, text):
+    assert text not in world.html
+
+
+@step(u'Then rendered HTML is "(.*)"')
+def then_rendered_html_is(step, html):
+    assert html == world.html
+
+
+@step(u'Given I have a micropost with "(.*)" as stored HTML')
+def given_i_have_a_micropost_with_stored_html(step, html):
+    world.micropost = get_micropost("content", html)
+
+
+@step(u'Given I have a micropost saved without HTML')
+def given_i_have_a_micropost_saved_without_html(step):
+    world.micropost = get_micropost("first")
+
+
+@step(u'I get micropost HTML')
+def i_get_micropost_html(step):
+    world.html = markdown_util.get_html(world.micropost)
+
+
+@step(u'micropost content changes without new revision')
+def micropost_content_changes_without_new_revision(step):
+    world.micropost.content = "second"
+
+
+@step(u'micropost content changes with a new revision')
+def micropost_content_changes_with_a_new_revision(step):
+    world.micropost.content = "second"
+    world.micropost._doc["_rev"] = "2-b"
@@ -0,0 +1,38 @@
+Feature: In-memory CouchDB
+
+    Scenario: Save documents with revisions
+        Given I have an empty in-memory database with design documents
+        When I save a document "doc1" in the in-memory database
+        And I update document "doc1" in the in-memory database
+        Then document "doc1" is at revision 2 in the in-memory database
+        And saving an outdated revision of "doc1" is a conflict
+
+    Scenario: Store attachments
+        Given I have an empty in-memory database with design documents
+        When I save a picture with an inline attachment in the in-memory database
+        And I add a thumbnail to this picture
+        Then both picture attachments can be read from the in-memory database
+        And contact pictures size is the sum of attachment sizes
+
+    Scenario: Query views through document managers
+        Given I have an empty in-memory database with design documents
+        When I post 12 microposts in the in-memory database
+        Then in-memory latest microposts are the 10 last ones, newest first
+        And in-memory microposts following the 5th one are the 4 previous ones
+        And in-memory microposts can be read by their ids
+
+    Scenario: Follow changes
+        Given I have an empty in-memory database with design documents
+        When I save 3 documents in bulk in the in-memory database
+        And I delete one of them from the in-memory database
+        Then in-memory changes feed lists 3 documents, one deleted
+        And a long polling request returns once a document is saved
+
+    Scenario: Every design view has a Python equivalent
+        When I list views of every design document
+        Then each view has a Python equivalent
+
+    Scenario: Models use the database of the config file
+        Given a config file that selects the in-memory database
+        When a process imports models then loads this config file
+        Then its microposts are saved in the in-memory database
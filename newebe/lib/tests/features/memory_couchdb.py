@@ -0,0 +1,249 @@
+import os
+import sys
+import time
+import datetime
+import tempfile
+import importlib
+import threading
+import subprocess
+
+from os import listdir
+from os.path import dirname, join, isdir
+
+from lettuce import step, world
+from couchdbkit.exceptions import ResourceConflict
+
+import newebe
+
+from newebe.config import CONFIG
+from newebe.tools.syncdb import CouchdbkitHandler
+from newebe.lib.couchdb_util import get_server
+from newebe.lib.memory_views import get_view
+from newebe.apps.news.models import MicroPost, MicroPostManager
+from newebe.apps.pictures.models import Picture, PictureManager
+
+URI = "memory://"
+DB_NAME = "newebe_memory_test"
+
+# Run in a new process: models are imported before config is loaded, like
+# lettuce and newebe_server.py do.
+CONFIG_CHECK = """
+import sys
+from newebe.apps.news.models import MicroPost
+from newebe.config import load_config
+
+load_config(["newebe", "--configfile=%s"])
+MicroPost(author="Owner", content="Post").save()
+db = MicroPost.get_db()
+sys.stdout.write("%%s %%s" %% (db.res.__class__.__name__, db.dbname))
+"""
+
+
+def use_memory_db(cls, func, *args, **kwargs):
+    '''
+    Runs *func* while documents of *cls* are stored in the in-memory
+    database.
+    '''
+    previous = getattr(cls, "_db", None)
+    cls._db = world.memory_db
+    try:
+        return func(*args, **kwargs)
+    finally:
+        cls._db = previous
+
+
+@step(u'Given I have an empty in-memory database with design documents')
+def given_i_have_an_empty_in_memory_database(step):
+    server = get_server(URI)
+    if DB_NAME in server:
+        server.delete_db(DB_NAME)
+    world.memory_db = server.get_or_create_db(DB_NAME)
+    CouchdbkitHandler().sync_all_app(URI, DB_NAME, CONFIG.db.views)
+
+
+@step(u'When I save a document "(.*)" in the in-memory database')
+def when_i_save_a_document_in_the_in_memory_database(step, docid):
+    world.doc = {"_id": docid, "value": 1}
+    world.memory_db.save_doc(world.doc)
+    world.first_rev = world.doc["_rev"]
+
+
+@step(u'And I update document "(.*)" in the in-memory database')
+def and_i_update_document_in_the_in_memory_database(step, docid):
+    doc = world.memory_db.open_doc(docid)
+    doc["value"] = 2
+    world.memory_db.save_doc(doc)
+
+
+@step(u'Then document "(.*)" is at revision (\d+) in the in-memory database')
+def then_document_is_at_revision(step, docid, number):
+    doc = world.memory_db.open_doc(docid)
+    assert doc["_rev"].startswith(number + "-")
+    assert doc["value"] == 2
+
+
+@step(u'And saving an outdated revision of "(.*)" is a conflict')
+def and_saving_an_outdated_revision_is_a_conflict(step, docid):
+    try:
+        world.memory_db.save_doc({"_id": docid, "_rev": world.first_rev})
+        assert False
+    except ResourceConflict:
+        pass
+
+
+@step(u'When I save a picture with an inline attachment in the in-memory')
+def when_i_save_a_picture_with_an_inline_attachment(step):
+    world.picture = Picture(
+        author="Contact", authorKey="contact", title="Picture",
+        path="pic.jpg", isMine=False, date=datetime.datetime.utcnow())
+    world.picture._doc["_attachments"] = {
+        "pic.jpg": {"content_type": "image/jpeg", "data": "\xff\xd8\x00jpeg"}
+    }
+    use_memory_db(Picture, world.picture.save)
+
+
+@step(u'And I add a thumbnail to this picture')
+def and_i_add_a_thumbnail_to_this_picture(step):
+    use_memory_db(Picture, world.picture.put_attachment, "thumb",
+                  "th_pic.jpg")
+
+
+@step(u'Then both picture attachments can be read from the in-memory')
+def then_both_picture_attachments_can_be_read(step):
+    picture = use_memory_db(Picture, PictureManager.get_picture,
+                            world.picture._id)
+    assert sorted(picture._doc["_attachments"]) == ["pic.jpg", "th_pic.jpg"]
+    assert use_memory_db(Picture, picture.fetch_attachment, "pic.jpg") == \
+        "\xff\xd8\x00jpeg"
+    assert use_memory_db(Picture, picture.fetch_attachment,
+                         "th_pic.jpg") == "thumb"
+
+
+@step(u'And contact pictures size is the sum of attachment sizes')
+def and_contact_pictures_size_is_the_sum_of_attachment_sizes(step):
+    rows = world.memory_db.view("pictures/contact-size").all()
+    assert rows == [{"key": None, "value": 12}]
+
+
+@step(u'When I post (\d+) microposts in the in-memory database')
+def when_i_post_microposts_in_the_in_memory_database(step, count):
+    world.microposts = []
+    for i in range(int(count)):
+        micropost = MicroPost(
+            author="Owner", authorKey="owner", content="Post %d" % i,
+            isMine=True, date=datetime.datetime(2014, 1, 1, 12, i))
+        use_memory_db(MicroPost, micropost.save)
+        world.microposts.append(micropost)
+
+
+@step(u'Then in-memory latest microposts are the (\d+) last ones, newest')
+def then_in_memory_latest_microposts_are_the_last_ones(step, count):
+    microposts = use_memory_db(MicroPost, lambda: list(
+        MicroPostManager.get_list(limit=int(count))))
+    expected = list(reversed(world.microposts))[:int(count)]
+    assert [micropost._id for micropost in microposts] == \
+        [micropost._id for micropost in expected]
+
+
+@step(u'And in-memory microposts following the (\d+)th one are the (\d+)')
+def and_in_memory_microposts_following_are_the_previous_ones(
+        step, index, count):
+    start = world.microposts[int(index) - 1]
+    microposts = use_memory_db(MicroPost, lambda: list(
+        MicroPostManager.get_list(startKey=start._doc["date"],
+                                  limit=int(count))))
+    # Start micropost is returned first (pagination).
+    expected = list(reversed(world.microposts[:int(index)]))
+    assert [micropost._id for micropost in microposts] == \
+        [micropost._id for micropost in expected]
+
+
+@step(u'And in-memory microposts can be read by their ids')
+def and_in_memory_microposts_can_be_read_by_their_ids(step):
+    ids = [world.microposts[3]._id, "unknown", world.microposts[1]._id]
+    microposts = use_memory_db(MicroPost, lambda: list(
+        MicroPostManager.get_microposts(ids)))
+    assert [micropost.content for micropost in microposts] == \
+        ["Post 3", "Post 1"]
+
+
+@step(u'When I save (\d+) documents in bulk in the in-memory database')
+def when_i_save_documents_in_bulk(step, count):
+    world.start_seq = world.memory_db.info()["update_seq"]
+    world.docs = [{"_id": "bulk%d" % i, "doc_type": "Note"}
+                  for i in range(int(count))]
+    world.memory_db.save_docs(world.docs)
+
+
+@step(u'And I delete one of them from the in-memory database')
+def and_i_delete_one_of_them(step):
+    world.memory_db.delete_doc(world.docs[0])
+
+
+@step(u'Then in-memory changes feed lists (\d+) documents, one deleted')
+def then_in_memory_changes_feed_lists_documents(step, count):
+    result = world.memory_db.res.get("_changes", since=world.start_seq,
+                                     include_docs="true").json_body
+    changes = result["results"]
+    assert [change["id"] for change in changes] == \
+        ["bulk1", "bulk2", "bulk0"]
+    assert changes[-1]["deleted"]
+    assert changes[0]["doc"]["doc_type"] == "Note"
+    world.last_seq = result["last_seq"]
+
+
+@step(u'And a long polling request returns once a document is saved')
+def and_a_long_polling_request_returns_once_a_document_is_saved(step):
+    db = world.memory_db
+
+    def save():
+        time.sleep(0.2)
+        db.save_doc({"_id": "late"})
+    threading.Thread(target=save).start()
+
+    start = time.time()
+    result = world.memory_db.res.get("_changes", since=world.last_seq,
+                                     feed="longpoll", timeout=10000).json_body
+    assert [change["id"] for change in result["results"]] == ["late"]
+    assert time.time() - start < 5
+
+
+@step(u'When I list views of every design document')
+def when_i_list_views_of_every_design_document(step):
+    world.design_views = []
+    for app in CONFIG.db.views:
+        module = importlib.import_module(app)
+        views_path = join(dirname(module.__file__), "_design", "views")
+        if isdir(views_path):
+            world.design_views.extend(
+                (app.split(".")[-1], view) for view in listdir(views_path))
+    assert world.design_views
+
+
+@step(u'Then each view has a Python equivalent')
+def then_each_view_has_a_python_equivalent(step):
+    missing = [view for view in world.design_views if get_view(*view) is None]
+    assert not missing, missing
+
+
+@step(u'Given a config file that selects the in-memory database')
+def given_a_config_file_that_selects_the_in_memory_database(step):
+    config_file, world.config_path = tempfile.mkstemp(suffix=".yaml")
+    os.write(config_file, 'db:\n  uri: "memory://"\n  name: "from_config"\n')
+    os.close(config_file)
+
+
+@step(u'When a process imports models then loads this config file')
+def when_a_process_imports_models_then_loads_this_config_file(step):
+    env = dict(os.environ, PYTHONPATH=dirname(dirname(newebe.__file__)))
+    try:
+        world.output = subprocess.check_output(
+            [sys.executable, "-c", CONFIG_CHECK % world.config_path],
+            env=env, stderr=open(os.devnull, "w"))
+    finally:
+        os.remove(world.config_path)
+
+
+@step(u'Then its microposts are saved in the in-memory database')
+def then_its_microposts_are_saved_in_the_in_memory_database(step):
+    assert world.output == "MemoryCouchdbResource from_config", world.output
@@ -0,0 +1,12 @@
+Feature: Metrics
+
+    Scenario: Record requests and their CouchDB calls by route
+        Given a server with an instrumented route is running
+        When I request the instrumented route 2 times
+        Then metrics count 2 requests to the instrumented route with status 200
+        And metrics count 3 CouchDB calls for each request to the instrumented route
+        And metrics are exported at Prometheus text format
+
+    Scenario: Record requests sent to contacts
+        Given a contact request that failed after 0.2 seconds
+        Then metrics count 1 contact request with outcome "failure"
@@ -0,0 +1,102 @@
+import re
+
+from lettuce import step, world
+
+from tornado import gen
+from tornado.web import Application, asynchronous
+from tornado.ioloop import IOLoop
+from tornado.httpserver import HTTPServer
+from tornado.httpclient import AsyncHTTPClient
+
+from newebe.lib import async_db
+from newebe.lib.metrics import metrics
+from newebe.lib.lazy_handler import LazyHandler, set_routes
+from newebe.apps.core.handlers import NewebeHandler
+
+INSTRUMENTED_PORT = 18893
+ROUTE = '/instrumented/$'
+
+SAMPLE = re.compile(r'^[a-z_]+(\{[a-z]+="[^"]*"(,[a-z]+="[^"]*")*\})? '
+                    r'[0-9.e+-]+$')
+
+
+def call_db():
+    metrics.observe_db_call(0.001)
+
+
+class InstrumentedHandler(NewebeHandler):
+
+    @asynchronous
+    @gen.coroutine
+    def get(self):
+        call_db()
+        yield async_db.run(call_db)
+        call_db()
+        self.return_success("Done.")
+
+
+def get_sample(name, **labels):
+    for line in metrics.export().split("\n"):
+        if line.startswith(name + "{") and \
+           all('%s="%s"' % label in line for label in labels.items()):
+            return float(line.rsplit(" ", 1)[1])
+    return 0
+
+
+@step(u'Given a server with an instrumented route is running')
+def given_a_server_with_an_instrumented_route(step):
+    handler = LazyHandler("newebe.tests.InstrumentedHandler")
+    handler.handler_class = InstrumentedHandler
+    routes = [(ROUTE, handler)]
+    set_routes(routes)
+    world.instrumented_server = HTTPServer(Application(routes))
+    world.instrumented_server.listen(INSTRUMENTED_PORT, "127.0.0.1")
+
+
+@step(u'I request the instrumented route (\d+) times')
+def i_request_the_instrumented_route(step, nb_requests):
+    client = AsyncHTTPClient()
+    for i in range(int(nb_requests)):
+        IOLoop.instance().run_sync(lambda: client.fetch(
+            "http://127.0.0.1:%d/instrumented/" % INSTRUMENTED_PORT))
+    world.instrumented_server.stop()
+
+
+@step(u'metrics count (\d+) requests to the instrumented route with status (\d+)')
+def metrics_count_requests(step, nb_requests, status):
+    count = get_sample("newebe_http_requests_total", route=ROUTE,
+                       method="GET", code=status)
+    assert count == int(nb_requests)
+    count = get_sample("newebe_http_request_duration_seconds_count",
+                       route=ROUTE, method="GET")
+    assert count == int(nb_requests)
+
+
+@step(u'metrics count (\d+) CouchDB calls for each request to the instrumented route')
+def metrics_count_couchdb_calls(step, nb_calls):
+    nb_requests = get_sample("newebe_http_request_couchdb_calls_count",
+                             route=ROUTE)
+    nb_all_calls = get_sample("newebe_http_request_couchdb_calls_sum",
+                              route=ROUTE)
+    assert nb_all_calls == int(nb_calls) * nb_requests
+
+
+@step(u'metrics are exported at Prometheus text format')
+def metrics_are_exported_at_prometheus_format(step):
+    for line in metrics.export().strip().split("\n"):
+        assert line.startswith("# HELP ") or line.startswith("# TYPE ") \
+            or SAMPLE.match(line), line
+
+
+@step(u'Given a contact request that failed after ([\d.]+) seconds')
+def given_a_contact_request_that_failed(step, duration):
+    world.contact_requests = get_sample(
+        "newebe_contact_request_duration_seconds_count", outcome="failure")
+    metrics.observe_contact_request(False, float(duration))
+
+
+@step(u'metrics count (\d+) contact request with outcome "(.*)"')
+def metrics_count_contact_requests(step, nb_requests, outcome):
+    count = get_sample("newebe_contact_request_duration_seconds_count",
+                       outcome=outcome)
+    assert count - world.contact_requests == int(nb_requests)
@@ -4,3 +4,19 @@ Feature: Resizing images
         Given I have a test image
         When I resize it to 300 x 300
         Then I have a 300 x 300 image
+
+    Scenario: Rotating image following orientation
+        Given I have a test image
+        When I rotate it following a 90 degrees orientation
+        Then I have a rotated image of 1200 x 1920
+
+    Scenario: Turning orientation a quarter on the right
+        When I turn a picture of orientation 270
+        Then its orientation is 0
+
+    Scenario: Keeping last rotated renditions
+        Given I have a rotation cache of 1 entries
+        When I cache a rendition of "picture1"
+        And I cache a rendition of "picture2"
+        Then rendition of "picture1" is not cached
+        And rendition of "picture2" is cached
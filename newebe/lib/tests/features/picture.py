@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
+from StringIO import StringIO
+
 from lettuce import step, world
+from PIL import Image
 
-from newebe.lib.picture import Resizer
+from newebe.lib.picture import Resizer, RotationCache, rotate, \
+    get_next_orientation
 
 @step(u'Given I have a test image')
 def given_i_have_a_test_image(step):
@@ -16,3 +20,37 @@ def when_i_resize_it_to_300_x_300(step):
 @step(u'Then I have a 300 x 300 image')
 def then_i_have_a_300_x_300_image(step):
     world.resized_image.size = (300, 300)
+
+@step(u'When I rotate it following a (\d+) degrees orientation')
+def when_i_rotate_it_following_orientation(step, orientation):
+    world.rotated_image = Image.open(StringIO(
+        rotate(world.test_image.read(), int(orientation))))
+
+@step(u'Then I have a rotated image of (\d+) x (\d+)')
+def then_i_have_a_rotated_image(step, width, height):
+    assert world.rotated_image.size == (int(width), int(height))
+
+@step(u'When I turn a picture of orientation (\d+)')
+def when_i_turn_a_picture_of_orientation(step, orientation):
+    world.orientation = get_next_orientation(int(orientation))
+
+@step(u'Then its orientation is (\d+)')
+def then_its_orientation_is(step, orientation):
+    assert world.orientation == int(orientation)
+
+@step(u'Given I have a rotation cache of (\d+) entries')
+def given_i_have_a_rotation_cache(step, size):
+    world.rotation_cache = RotationCache(int(size))
+
+@step(u'I cache a rendition of "(.*)"')
+def i_cache_a_rendition_of(step, picture_id):
+    world.rotation_cache.set((picture_id, "th_test.jpg", 90), "content")
+
+@step(u'rendition of "(.*)" is cached')
+def rendition_is_cached(step, picture_id):
+    assert world.rotation_cache.get((picture_id, "th_test.jpg", 90)) \
+        is not None
+
+@step(u'rendition of "(.*)" is not cached')
+def rendition_is_not_cached(step, picture_id):
+    assert world.rotation_cache.get((picture_id, "th_test.jpg", 90)) is None
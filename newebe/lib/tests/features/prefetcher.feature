@@ -0,0 +1,19 @@
+Feature: Background prefetch of contact files
+
+    Scenario: Prefetch files of most viewed contacts and recent files first
+        Given I have a prefetcher
+        And "contact2" files were viewed 3 times
+        When I sort files "old1" of "contact1" posted 1 days ago, "new1" of "contact1" posted 0 days ago and "old2" of "contact2" posted 1 days ago
+        Then files are prefetched in order "old2", "new1", "old1"
+
+    Scenario: Pause prefetch when budgets are reached
+        Given I have a prefetcher
+        When 10 bytes were prefetched during last hour with a budget of 10 bytes
+        Then prefetch is "paused: hourly budget reached"
+        When contact files use 20 bytes with a disk budget of 10 bytes
+        Then prefetch is "stopped: disk budget reached"
+
+    Scenario: Pause prefetch when server is slow
+        Given I have a prefetcher
+        When requests take 2 seconds with a maximum latency of 1 second
+        Then prefetch is "paused: high latency"
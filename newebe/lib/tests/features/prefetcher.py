@@ -0,0 +1,72 @@
+import time
+import datetime
+
+from lettuce import step, world
+
+from newebe.config import CONFIG
+from newebe.lib.prefetcher import Prefetcher
+
+
+class FakeDocument(object):
+
+    def __init__(self, _id, authorKey, days):
+        self._id = _id
+        self.authorKey = authorKey
+        self.date = datetime.datetime.utcnow() - \
+            datetime.timedelta(days=days)
+
+
+@step(u'Given I have a prefetcher')
+def given_i_have_a_prefetcher(step):
+    world.prefetcher = Prefetcher()
+    world.prefetcher.started = True
+    world.disk_usage = 0
+    CONFIG.main.prefetch_bytes_per_hour = 1000
+    CONFIG.main.prefetch_disk_budget = 1000
+    CONFIG.main.prefetch_max_latency = 1
+
+
+@step(u'"(.*)" files were viewed (\d+) times')
+def files_were_viewed(step, contact_key, nb_views):
+    for i in range(int(nb_views)):
+        world.prefetcher.on_contact_view(contact_key)
+
+
+@step(u'When I sort files "(.*)" of "(.*)" posted (\d+) days ago, "(.*)" of "(.*)" posted (\d+) days ago and "(.*)" of "(.*)" posted (\d+) days ago')
+def when_i_sort_files(step, *args):
+    documents = [FakeDocument(args[i], args[i + 1], int(args[i + 2]))
+                 for i in range(0, len(args), 3)]
+    world.candidates = world.prefetcher.get_candidates([(None, documents)])
+
+
+@step(u'Then files are prefetched in order "(.*)", "(.*)", "(.*)"')
+def then_files_are_prefetched_in_order(step, *keys):
+    assert [document._id for source, document in world.candidates] == \
+        list(keys)
+
+
+@step(u'When (\d+) bytes were prefetched during last hour with a budget of (\d+) bytes')
+def when_bytes_were_prefetched(step, size, budget):
+    world.prefetcher.downloads.append((time.time() - 7200, int(size)))
+    world.prefetcher.downloads.append((time.time(), int(size)))
+    CONFIG.main.prefetch_bytes_per_hour = int(budget)
+    assert world.prefetcher.get_hour_usage() == int(size)
+
+
+@step(u'When contact files use (\d+) bytes with a disk budget of (\d+) bytes')
+def when_contact_files_use(step, size, budget):
+    CONFIG.main.prefetch_bytes_per_hour = 1000
+    CONFIG.main.prefetch_disk_budget = int(budget)
+    world.disk_usage = int(size)
+
+
+@step(u'When requests take (\d+) seconds with a maximum latency of (\d+) second')
+def when_requests_take(step, duration, max_latency):
+    CONFIG.main.prefetch_max_latency = int(max_latency)
+    for i in range(3):
+        world.prefetcher.record_request(int(duration))
+
+
+@step(u'Then prefetch is "(.*)"')
+def then_prefetch_is(step, state):
+    assert world.prefetcher.check_budget(world.disk_usage) == state
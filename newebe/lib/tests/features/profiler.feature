@@ -0,0 +1,18 @@
+Feature: Profiler
+
+    Scenario: Profile next requests of a route
+        Given a server with a profiled route is running
+        When I profile the next 2 requests of the profiled route
+        And I request the profiled route 3 times
+        Then profile has 2 calls to "compute_answer"
+
+    Scenario: Sample stacks of every thread
+        When I sample stacks during 0.2 seconds while a thread runs "spin"
+        Then sampled stacks are at collapsed format
+        And sampled stacks contain "spin"
+
+    Scenario: Log phase timings of slow requests
+        Given a server with a profiled route is running
+        And requests longer than 0 seconds are slow
+        When I request the profiled route 1 times
+        Then a slow request to the profiled route is logged with its phase timings
@@ -0,0 +1,135 @@
+import re
+import time
+import pstats
+import logging
+import tempfile
+import threading
+
+from lettuce import step, world
+
+from tornado.web import Application
+from tornado.ioloop import IOLoop
+from tornado.httpserver import HTTPServer
+from tornado.httpclient import AsyncHTTPClient
+
+from newebe.config import CONFIG
+from newebe.lib.profiler import sampling_profiler, request_profiler
+from newebe.lib.lazy_handler import LazyHandler, set_routes
+from newebe.apps.core.handlers import NewebeHandler
+
+PROFILED_PORT = 18894
+ROUTE = '/profiled/$'
+
+
+def compute_answer():
+    return sum(range(1000))
+
+
+class ProfiledHandler(NewebeHandler):
+
+    def get(self):
+        self.return_json({"answer": compute_answer()})
+
+
+class LogRecorder(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@step(u'Given a server with a profiled route is running')
+def given_a_server_with_a_profiled_route(step):
+    handler = LazyHandler("newebe.tests.ProfiledHandler")
+    handler.handler_class = ProfiledHandler
+    routes = [(ROUTE, handler)]
+    set_routes(routes)
+    world.profiled_server = HTTPServer(Application(routes))
+    world.profiled_server.listen(PROFILED_PORT, "127.0.0.1")
+
+
+@step(u'I profile the next (\d+) requests of the profiled route')
+def i_profile_the_next_requests(step, nb_requests):
+    world.profile = request_profiler.start(ROUTE, int(nb_requests), 10)
+
+
+@step(u'I request the profiled route (\d+) times')
+def i_request_the_profiled_route(step, nb_requests):
+    client = AsyncHTTPClient()
+    for i in range(int(nb_requests)):
+        IOLoop.instance().run_sync(lambda: client.fetch(
+            "http://127.0.0.1:%d/profiled/" % PROFILED_PORT))
+    world.profiled_server.stop()
+
+
+@step(u'profile has (\d+) calls to "(.*)"')
+def profile_has_calls_to(step, nb_calls, function):
+    assert world.profile.done()
+    assert not request_profiler.is_running()
+
+    dump = tempfile.NamedTemporaryFile()
+    dump.write(world.profile.result())
+    dump.flush()
+    stats = pstats.Stats(dump.name)
+    dump.close()
+
+    calls = [value[1] for key, value in stats.stats.items()
+             if key[2] == function]
+    assert calls == [int(nb_calls)], calls
+
+
+@step(u'I sample stacks during ([\d.]+) seconds while a thread runs "(.*)"')
+def i_sample_stacks(step, duration, function):
+    running = [True]
+
+    def spin():
+        while running[0]:
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=spin, name="spinner")
+    thread.start()
+    try:
+        world.stacks = IOLoop.instance().run_sync(
+            lambda: sampling_profiler.start(float(duration), 0.01),
+            timeout=5)
+    finally:
+        running[0] = False
+        thread.join()
+    assert not sampling_profiler.is_running()
+
+
+@step(u'sampled stacks are at collapsed format')
+def sampled_stacks_are_at_collapsed_format(step):
+    lines = world.stacks.strip().split("\n")
+    assert lines
+    for line in lines:
+        assert re.match(r'^[^;]+(;[^;]+)* \d+$', line), line
+
+
+@step(u'sampled stacks contain "(.*)"')
+def sampled_stacks_contain(step, function):
+    assert re.search(r'^spinner;.*:%s \d+$' % function, world.stacks,
+                     re.M)
+
+
+@step(u'requests longer than (\d+) seconds are slow')
+def requests_longer_than_are_slow(step, threshold):
+    world.slow_request_threshold = CONFIG.main.slow_request_threshold
+    CONFIG.main.slow_request_threshold = int(threshold)
+    world.log_recorder = LogRecorder()
+    logging.getLogger("newebe.core").addHandler(world.log_recorder)
+
+
+@step(u'a slow request to the profiled route is logged with its phase timings')
+def a_slow_request_is_logged(step):
+    logging.getLogger("newebe.core").removeHandler(world.log_recorder)
+    CONFIG.main.slow_request_threshold = world.slow_request_threshold
+
+    messages = [message for message in world.log_recorder.messages
+                if message.startswith("Slow request GET /profiled/$")]
+    assert len(messages) == 1, world.log_recorder.messages
+    assert re.search(r'db [\d.]+s in 0 calls, auth [\d.]+s, '
+                     r'serialization [\d.]+s, fanout [\d.]+s', messages[0])
@@ -0,0 +1,26 @@
+Feature: Rate limiting
+
+    Scenario: Reject contacts that send too many requests
+        Given a server with a rate limited contact endpoint is running
+        And clients can send 3 requests in a burst
+        When a contact sends 5 requests to the limited endpoint
+        Then 3 requests are accepted
+        And 2 requests are rejected with status 429 and a retry delay
+        And 2 rejections by client are counted
+
+    Scenario: Shed load while the server is late
+        Given a server with a rate limited contact endpoint is running
+        And clients can send 100 requests in a burst
+        When the server loop is late by 2 seconds
+        And a contact sends 2 requests to the limited endpoint
+        Then 0 requests are accepted
+        And 2 requests are rejected with status 503 and a retry delay
+        And 2 rejections for loop lag are counted
+
+    Scenario: Shed synchronization requests while the server is late
+        Given a server with a rate limited contact endpoint is running
+        When the server loop is late by 2 seconds
+        And a contact sends a request to each synchronization endpoint
+        Then 0 requests are accepted
+        And 2 requests are rejected with status 503 and a retry delay
+        And 2 rejections for loop lag are counted
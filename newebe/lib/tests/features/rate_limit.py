@@ -0,0 +1,120 @@
+from lettuce import after, step, world
+
+from tornado.web import Application
+from tornado.ioloop import IOLoop
+from tornado.httpserver import HTTPServer
+from tornado.httpclient import AsyncHTTPClient, HTTPError
+
+from newebe.config import CONFIG
+from newebe.apps.core.handlers import NewebeHandler
+from newebe.lib.rate_limit import rate_limiter, rate_limited, NDJSON_TYPE
+from newebe.apps.sync.handlers import SynchronizeChangesHandler, \
+    SynchronizeBatchHandler
+
+LIMITED_PORT = 18892
+
+# Settings changed by scenarios, restored after each of them.
+LIMIT_SETTINGS = ("ip_rate", "ip_burst", "contact_burst")
+
+
+class LimitedHandler(NewebeHandler):
+
+    @rate_limited
+    def post(self):
+        self.return_success("Received.")
+
+
+@after.each_scenario
+def restore_limits(scenario):
+    CONFIG.main.update(getattr(world, "limits", {}))
+    world.limits = {}
+    rate_limiter.buckets.clear()
+    rate_limiter.loop_lag = 0
+
+
+@step(u'Given a server with a rate limited contact endpoint is running')
+def given_a_server_with_a_rate_limited_endpoint(step):
+    rate_limiter.buckets.clear()
+    rate_limiter.loop_lag = 0
+    world.counters = rate_limiter.metrics()
+    world.limits = dict((name, CONFIG.main[name]) for name in LIMIT_SETTINGS)
+    CONFIG.main.ip_rate = 0.01
+    CONFIG.main.contact_burst = 100
+    world.limited_server = HTTPServer(Application([
+        ('/limited/$', LimitedHandler),
+        ('/synchronize/contact/changes/$', SynchronizeChangesHandler),
+        ('/synchronize/contact/batch/$', SynchronizeBatchHandler),
+    ]))
+    world.limited_server.listen(LIMITED_PORT, "127.0.0.1")
+
+
+@step(u'clients can send (\d+) requests in a burst')
+def clients_can_send_requests_in_a_burst(step, burst):
+    CONFIG.main.ip_burst = int(burst)
+
+
+@step(u'the server loop is late by (\d+) seconds')
+def the_server_loop_is_late(step, lag):
+    rate_limiter.loop_lag = float(lag)
+
+
+@step(u'a contact sends (\d+) requests to the limited endpoint')
+def a_contact_sends_requests(step, nb_requests):
+    world.responses = []
+    client = AsyncHTTPClient()
+    for i in range(int(nb_requests)):
+        try:
+            response = IOLoop.instance().run_sync(lambda: client.fetch(
+                "http://127.0.0.1:%d/limited/" % LIMITED_PORT,
+                method="POST", body='{"authorKey": "contact"}'))
+        except HTTPError as error:
+            response = error.response
+        world.responses.append(response)
+    world.limited_server.stop()
+    rate_limiter.loop_lag = 0
+
+
+@step(u'a contact sends a request to each synchronization endpoint')
+def a_contact_sends_a_request_to_each_synchronization_endpoint(step):
+    world.responses = []
+    client = AsyncHTTPClient()
+    requests = [
+        ("changes", '{"key": "contact", "since": "0"}', "application/json"),
+        ("batch", '{"key": "contact"}\n', NDJSON_TYPE)
+    ]
+    for path, body, content_type in requests:
+        try:
+            response = IOLoop.instance().run_sync(lambda: client.fetch(
+                "http://127.0.0.1:%d/synchronize/contact/%s/" % (
+                    LIMITED_PORT, path),
+                method="POST", body=body,
+                headers={"Content-Type": content_type}))
+        except HTTPError as error:
+            response = error.response
+        world.responses.append(response)
+    world.limited_server.stop()
+    rate_limiter.loop_lag = 0
+
+
+@step(u'Then (\d+) requests are accepted')
+def then_requests_are_accepted(step, nb_requests):
+    accepted = [response for response in world.responses
+                if response.code == 200]
+    assert len(accepted) == int(nb_requests)
+    assert rate_limiter.in_flight == 0
+
+
+@step(u'(\d+) requests are rejected with status (\d+) and a retry delay')
+def requests_are_rejected(step, nb_requests, status):
+    rejected = [response for response in world.responses
+                if response.code == int(status)]
+    assert len(rejected) == int(nb_requests)
+    for response in rejected:
+        assert int(response.headers["Retry-After"]) > 0
+
+
+@step(u'(\d+) rejections (by client|for loop lag) are counted')
+def rejections_are_counted(step, nb_rejections, reason):
+    counter = {"by client": "ip", "for loop lag": "loopLag"}[reason]
+    rejections = rate_limiter.metrics()[counter] - world.counters[counter]
+    assert rejections == int(nb_rejections)
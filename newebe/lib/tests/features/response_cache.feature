@@ -0,0 +1,48 @@
+Feature: Server-side response cache
+
+    Scenario: Serve a cached response until its documents change
+        Given I have a response cache of 10 entries
+        And I cache "/microposts/all/" depending on "MicroPost"
+        And I cache "/notes/all/" depending on "Note"
+        When a "MicroPost" document changes
+        Then "/microposts/all/" is not cached
+        And "/notes/all/" is cached
+
+    Scenario: Drop every response when a document is deleted
+        Given I have a response cache of 10 entries
+        And I cache "/microposts/all/" depending on "MicroPost"
+        And I cache "/notes/all/" depending on "Note"
+        When a document is deleted
+        Then "/microposts/all/" is not cached
+        And "/notes/all/" is not cached
+
+    Scenario: Do not cache responses computed while their documents changed
+        Given I have a response cache of 10 entries
+        When I start computing "/microposts/all/" depending on "MicroPost"
+        And I start computing "/notes/all/" depending on "Note"
+        And a "MicroPost" document changes
+        And I finish computing "/microposts/all/"
+        And I finish computing "/notes/all/"
+        Then "/microposts/all/" is not cached
+        And "/notes/all/" is cached
+        When I start computing "/notes/all/" depending on "Note"
+        And a document is deleted
+        And I finish computing "/notes/all/"
+        Then "/notes/all/" is not cached
+
+    Scenario: Drop least recently used responses
+        Given I have a response cache of 2 entries
+        And I cache "/microposts/all/" depending on "MicroPost"
+        And I cache "/notes/all/" depending on "Note"
+        And "/microposts/all/" is cached
+        And I cache "/pictures/all/" depending on "Picture"
+        Then "/notes/all/" is not cached
+        And "/microposts/all/" is cached
+
+    Scenario: Drop responses that depend on documents written by a request
+        Given a server with a picture writing route is running
+        And I cache "/microposts/all/" depending on "MicroPost"
+        And I cache "/pictures/all/" depending on "Picture"
+        When I post a picture to the picture writing route
+        Then "/pictures/all/" is not cached
+        And "/microposts/all/" is cached
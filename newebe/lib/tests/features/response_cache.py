@@ -0,0 +1,97 @@
+import datetime
+
+from lettuce import step, world
+
+from tornado import gen
+from tornado.web import Application, asynchronous
+from tornado.ioloop import IOLoop
+from tornado.httpserver import HTTPServer
+from tornado.httpclient import AsyncHTTPClient
+
+from newebe.lib import async_db
+from newebe.lib.couchdb_util import get_server
+from newebe.lib.response_cache import ResponseCache, response_cache
+from newebe.apps.core.handlers import NewebeHandler
+from newebe.apps.pictures.models import Picture
+
+WRITING_PORT = 18895
+
+
+class PictureWritingHandler(NewebeHandler):
+
+    @asynchronous
+    @gen.coroutine
+    def post(self):
+        picture = Picture(
+            author="Contact", authorKey="contact", title="Picture",
+            path="pic.jpg", isMine=False, date=datetime.datetime.utcnow())
+        yield async_db.run(picture.save)
+        self.return_success("Picture saved.")
+
+
+@step(u'Given I have a response cache of (\d+) entries')
+def given_i_have_a_response_cache(step, size):
+    world.cache = ResponseCache(int(size))
+    world.computations = {}
+
+
+@step(u'Given a server with a picture writing route is running')
+def given_a_server_with_a_picture_writing_route(step):
+    world.cache = response_cache
+    world.cache.clear()
+    world.writing_server = HTTPServer(Application([
+        ('/pictures/$', PictureWritingHandler)
+    ]))
+    world.writing_server.listen(WRITING_PORT, "127.0.0.1")
+
+
+@step(u'I cache "(.*)" depending on "(.*)"')
+def i_cache_depending_on(step, key, doc_type):
+    entry = world.cache.set(key, '{"rows": []}', [doc_type])
+    assert entry.etag.startswith('"')
+
+
+@step(u'I start computing "(.*)" depending on "(.*)"')
+def i_start_computing_depending_on(step, key, doc_type):
+    world.computations[key] = \
+        ([doc_type], world.cache.get_generation([doc_type]))
+
+
+@step(u'I finish computing "(.*)"')
+def i_finish_computing(step, key):
+    doc_types, generation = world.computations.pop(key)
+    world.cache.set(key, '{"rows": []}', doc_types, generation)
+
+
+@step(u'a "(.*)" document changes')
+def when_a_document_changes(step, doc_type):
+    world.cache.on_invalidate_event({"docType": doc_type})
+
+
+@step(u'When I post a picture to the picture writing route')
+def when_i_post_a_picture_to_the_picture_writing_route(step):
+    previous = getattr(Picture, "_db", None)
+    Picture._db = get_server("memory://").get_or_create_db("response_cache")
+    try:
+        response = IOLoop.instance().run_sync(lambda: AsyncHTTPClient().fetch(
+            "http://127.0.0.1:%d/pictures/" % WRITING_PORT, method="POST",
+            body=""))
+        assert response.code == 200
+    finally:
+        Picture._db = previous
+        world.writing_server.stop()
+
+
+@step(u'a document is deleted')
+def when_a_document_is_deleted(step):
+    world.cache.on_invalidate_event({"docType": None})
+
+
+@step(u'^(?:Then|And) "(.*)" is cached$')
+def is_cached(step, key):
+    assert world.cache.get(key) is not None
+
+
+@step(u'^(?:Then|And) "(.*)" is not cached$')
+def is_not_cached(step, key):
+    assert world.cache.get(key) is None
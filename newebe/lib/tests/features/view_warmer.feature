@@ -0,0 +1,19 @@
+Feature: View warm-up
+
+    Scenario: Warm views up once enough documents were written
+        Given I have a started view warmer with a threshold of 3 writes
+        When 2 documents are written
+        Then views are not warmed up
+        And 2 writes are pending
+        When 1 documents are written
+        Then views are warmed up
+
+    Scenario: Ignore writes while view warmer is not started
+        Given I have a view warmer with a threshold of 3 writes
+        When 5 documents are written
+        Then views are not warmed up
+        And 0 writes are pending
+
+    Scenario: Query one view per design document
+        When I get design views of "newebe.apps.news"
+        Then I get one view of "news" design document
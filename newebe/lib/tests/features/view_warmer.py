@@ -0,0 +1,66 @@
+from lettuce import step, world
+
+from newebe.config import CONFIG
+from newebe.lib.view_warmer import ViewWarmer, get_design_views
+
+
+class FakeViewWarmer(ViewWarmer):
+    '''
+    View warmer that records warm-ups instead of querying CouchDB.
+    '''
+
+    def warm(self):
+        self.warmups += 1
+        self.pending_writes = 0
+        self.first_write = None
+
+
+@step(u'Given I have a view warmer with a threshold of (\d+) writes')
+def given_i_have_a_view_warmer(step, threshold):
+    CONFIG.db.warmup_threshold = int(threshold)
+    CONFIG.db.warmup_delay = 0
+    world.view_warmer = FakeViewWarmer()
+
+
+@step(u'Given I have a started view warmer with a threshold of (\d+) writes')
+def given_i_have_a_started_view_warmer(step, threshold):
+    given_i_have_a_view_warmer(step, threshold)
+    world.view_warmer.start()
+
+
+@step(u'When (\d+) documents are written')
+def when_documents_are_written(step, nb_docs):
+    for i in range(int(nb_docs)):
+        world.view_warmer.on_invalidate_event({"docType": "MicroPost"})
+
+
+@step(u'Then views are not warmed up')
+def then_views_are_not_warmed_up(step):
+    assert world.view_warmer.metrics()["warmups"] == 0
+
+
+@step(u'Then views are warmed up')
+def then_views_are_warmed_up(step):
+    metrics = world.view_warmer.metrics()
+    assert metrics["warmups"] == 1
+    assert metrics["pendingWrites"] == 0
+    assert metrics["lag"] is None
+
+
+@step(u'(\d+) writes are pending')
+def writes_are_pending(step, nb_writes):
+    metrics = world.view_warmer.metrics()
+    assert metrics["pendingWrites"] == int(nb_writes)
+    if metrics["pendingWrites"]:
+        assert metrics["lag"] >= 0
+
+
+@step(u'When I get design views of "(.*)"')
+def when_i_get_design_views(step, app):
+    world.design_views = get_design_views([app])
+
+
+@step(u'Then I get one view of "(.*)" design document')
+def then_i_get_one_view_of_design_document(step, design):
+    assert len(world.design_views) == 1
+    assert world.design_views[0].startswith(design + "/")
@@ -0,0 +1,63 @@
+Feature: Websocket broadcast hub
+
+    Scenario: Broadcast an event to subscribed clients
+        Given I have a websocket hub with a queue size of 2
+        And a client subscribed to "microposts"
+        And a client subscribed to "contacts"
+        When I broadcast 1 event on "microposts"
+        Then first client received 1 message
+        And second client received 0 message
+
+    Scenario: Drop oldest messages of a slow client
+        Given I have a websocket hub with a queue size of 2
+        And a slow client subscribed to "microposts"
+        When I broadcast 4 events on "microposts"
+        Then hub metrics show 1 dropped and 2 queued messages
+
+    Scenario: Disconnect a slow client
+        Given I have a websocket hub with a queue size of 2
+        And queue policy is "disconnect"
+        And a slow client subscribed to "microposts"
+        When I broadcast 4 events on "microposts"
+        Then first client is closed
+        And hub metrics show 0 clients
+
+    Scenario: Queue events of a paused client
+        Given I have a websocket hub with a queue size of 2
+        And a paused client subscribed to "changes"
+        When I broadcast 1 event on "changes"
+        Then hub metrics show 0 dropped and 1 queued messages
+        When I resume first client
+        Then first client received 1 message
+
+    Scenario: Keep broadcasting when a client cannot be written to
+        Given I have a websocket hub with a queue size of 2
+        And a broken client subscribed to "microposts"
+        And a client subscribed to "microposts"
+        When I broadcast 1 event on "microposts"
+        Then first client is closed
+        And second client received 1 message
+        And hub metrics show 1 clients
+
+    Scenario: Disconnect a paused client instead of dropping its events
+        Given I have a websocket hub with a queue size of 2
+        And a paused client subscribed to "changes"
+        When I broadcast 3 events on "changes"
+        Then first client is closed
+        And hub metrics show 0 clients
+
+    Scenario: Keep pinging when a client cannot be pinged
+        Given I have a websocket hub with a queue size of 2
+        And a broken client subscribed to "microposts"
+        And a client subscribed to "microposts"
+        When I ping clients
+        Then first client is closed
+        And second client was pinged
+        And hub metrics show 1 clients
+
+    Scenario: Accept only lists of topics as subscriptions
+        Then '["microposts", "pictures"]' is a list of topics
+        And '[]' is a list of topics
+        And '"microposts"' is not a list of topics
+        And '[["microposts"]]' is not a list of topics
+        And '{"microposts": true}' is not a list of topics
@@ -0,0 +1,157 @@
+from lettuce import step, world, after
+from tornado.escape import json_decode
+from tornado.iostream import StreamClosedError
+
+from newebe.config import CONFIG
+from newebe.lib.websocket_hub import WebsocketHub, POLICY_DROP, \
+    is_topic_list
+
+
+class FakeStream(object):
+    '''
+    Stream that flushes its data immediately, unless it is slow.
+    '''
+
+    def __init__(self, slow):
+        self.slow = slow
+
+    def write(self, data, callback=None):
+        if not self.slow and callback is not None:
+            callback()
+
+
+class FakeConnection(object):
+
+    def __init__(self, slow=False):
+        self.stream = FakeStream(slow)
+        self.messages = []
+        self.closed = False
+        self.pings = 0
+
+    def write_message(self, message):
+        self.messages.append(message)
+
+    def ping(self, data):
+        self.pings += 1
+
+    def close(self):
+        self.closed = True
+
+
+class BrokenConnection(FakeConnection):
+    '''
+    Connection of which stream was closed by the client.
+    '''
+
+    def write_message(self, message):
+        raise StreamClosedError()
+
+    def ping(self, data):
+        raise StreamClosedError()
+
+
+@after.each_scenario
+def stop_hub(scenario):
+    CONFIG.main.websocket_queue_policy = POLICY_DROP
+    if getattr(world, "hub", None) is not None and world.hub.pinger:
+        world.hub.pinger.stop()
+
+
+@step(u'Given I have a websocket hub with a queue size of (\d+)')
+def given_i_have_a_websocket_hub(step, size):
+    CONFIG.main.websocket_queue_size = int(size)
+    world.hub = WebsocketHub()
+    world.connections = []
+
+
+@step(u'And queue policy is "(.*)"')
+def and_queue_policy_is(step, policy):
+    CONFIG.main.websocket_queue_policy = policy
+
+
+@step(u'And a client subscribed to "(.*)"')
+def and_a_client_subscribed_to(step, topic):
+    connection = FakeConnection()
+    world.hub.register(connection, [topic])
+    world.connections.append(connection)
+
+
+@step(u'And a slow client subscribed to "(.*)"')
+def and_a_slow_client_subscribed_to(step, topic):
+    connection = FakeConnection(slow=True)
+    world.hub.register(connection, [topic])
+    world.connections.append(connection)
+
+
+@step(u'And a broken client subscribed to "(.*)"')
+def and_a_broken_client_subscribed_to(step, topic):
+    connection = BrokenConnection()
+    world.hub.register(connection, [topic])
+    world.connections.append(connection)
+
+
+@step(u'And a paused client subscribed to "(.*)"')
+def and_a_paused_client_subscribed_to(step, topic):
+    connection = FakeConnection()
+    world.hub.register(connection, [topic], paused=True)
+    world.connections.append(connection)
+
+
+@step(u'When I resume first client')
+def when_i_resume_first_client(step):
+    world.hub.resume(world.connections[0])
+
+
+@step(u'When I broadcast (\d+) events? on "(.*)"')
+def when_i_broadcast_events(step, nb_events, topic):
+    for i in range(int(nb_events)):
+        world.hub.broadcast(topic, {"index": i})
+
+
+@step(u'Then first client received (\d+) messages?')
+def then_first_client_received(step, nb_messages):
+    messages = world.connections[0].messages
+    assert int(nb_messages) == len(messages)
+    assert '{"index": 0}' == messages[0]
+
+
+@step(u'And second client received (\d+) messages?')
+def and_second_client_received(step, nb_messages):
+    assert int(nb_messages) == len(world.connections[1].messages)
+
+
+@step(u'Then hub metrics show (\d+) dropped and (\d+) queued messages')
+def then_hub_metrics_show_dropped_and_queued(step, dropped, queued):
+    metrics = world.hub.metrics()
+    assert int(dropped) == metrics["dropped"]
+    assert int(queued) == metrics["queued"]
+
+
+@step(u'Then first client is closed')
+def then_first_client_is_closed(step):
+    assert world.connections[0].closed
+
+
+@step(u'And hub metrics show (\d+) clients')
+def and_hub_metrics_show_clients(step, nb_clients):
+    assert int(nb_clients) == world.hub.metrics()["clients"]
+
+
+@step(u'When I ping clients')
+def when_i_ping_clients(step):
+    world.hub.ping_clients()
+
+
+@step(u'And second client was pinged')
+def and_second_client_was_pinged(step):
+    assert 1 == world.connections[1].pings
+
+
+@step(u"'(.*)' is a list of topics")
+def is_a_list_of_topics(step, value):
+    assert is_topic_list(json_decode(value))
+
+
+@step(u"'(.*)' is not a list of topics")
+def is_not_a_list_of_topics(step, value):
+    assert not is_topic_list(json_decode(value))
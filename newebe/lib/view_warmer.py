@@ -0,0 +1,164 @@
+"""
+Background update of CouchDB view indexes.
+
+CouchDB updates a view index when the view is queried after documents were
+written. After a burst of writes (posts received from contacts for
+instance) the next user request would pay for the whole index update. The
+view warmer counts writes seen on the changes feed and, once their number
+reaches a threshold (or after a delay), queries one view of each design
+document so indexes are up to date before users read them.
+
+The warmer runs on the main worker, next to the changes watcher. Its lag is
+the time between the first write not yet indexed and the end of the
+warm-up that indexed it.
+"""
+
+import time
+import logging
+import importlib
+
+from os import listdir
+from os.path import dirname, join, isdir
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from newebe.config import CONFIG
+from newebe.lib import async_db
+from newebe.lib.events import channel
+from newebe.lib.couchdb_util import get_server
+
+logger = logging.getLogger("newebe.lib")
+
+
+def get_design_views(apps):
+    '''
+    Returns a view name (design/view) for each design document of *apps*
+    (application module names). Views of a design document share the same
+    index, querying one of them updates all of them.
+    '''
+    design_views = []
+    for app in apps:
+        module = importlib.import_module(app)
+        views_path = join(dirname(module.__file__), "_design", "views")
+        if isdir(views_path) and listdir(views_path):
+            design_views.append("%s/%s" % (app.split(".")[-1],
+                                           sorted(listdir(views_path))[0]))
+    return design_views
+
+
+def query_views(db, design_views):
+    '''
+    Queries every view of *design_views* without fetching any row. Blocking:
+    it returns once CouchDB updated their indexes.
+    '''
+    for view in design_views:
+        db.view(view, limit=0).all()
+
+
+class ViewWarmer(object):
+    '''
+    Counts document writes and updates view indexes when they are numerous
+    enough.
+    '''
+
+    def __init__(self):
+        self.started = False
+        self.running = False
+        self.pending_writes = 0
+        self.first_write = None
+        self.timeout = None
+        self.db = None
+
+        self.warmups = 0
+        self.last_lag = None
+        self.last_duration = None
+
+    def start(self):
+        '''
+        Enables warm-ups in current worker.
+        '''
+        self.started = True
+
+    def on_invalidate_event(self, event):
+        '''
+        Called for each document write seen on the changes feed.
+        '''
+        if not self.started:
+            return
+
+        self.pending_writes += 1
+        if self.first_write is None:
+            self.first_write = time.time()
+
+        if self.pending_writes >= CONFIG.db.warmup_threshold:
+            self.warm()
+        elif self.timeout is None and CONFIG.db.warmup_delay:
+            self.timeout = IOLoop.instance().add_timeout(
+                time.time() + CONFIG.db.warmup_delay, self.on_timeout)
+
+    def on_timeout(self):
+        self.timeout = None
+        if self.pending_writes:
+            self.warm()
+
+    @gen.coroutine
+    def warm(self):
+        '''
+        Updates indexes of every design document through the database
+        thread pool. Writes received meanwhile trigger another warm-up.
+        '''
+        if self.running:
+            return
+
+        if self.timeout is not None:
+            IOLoop.instance().remove_timeout(self.timeout)
+            self.timeout = None
+
+        self.running = True
+        first_write = self.first_write
+        self.pending_writes = 0
+        self.first_write = None
+        start = time.time()
+
+        try:
+            if self.db is None:
+                self.db = get_server().get_db(CONFIG.db.name)
+            yield async_db.run(query_views, self.db,
+                               get_design_views(CONFIG.db.views))
+
+            self.warmups += 1
+            self.last_duration = time.time() - start
+            if first_write is not None:
+                self.last_lag = time.time() - first_write
+            logger.info("Views warmed up in %.2fs." % self.last_duration)
+        except Exception:
+            logger.exception("Views cannot be warmed up.")
+        finally:
+            self.running = False
+
+        if self.pending_writes >= CONFIG.db.warmup_threshold:
+            self.warm()
+
+    def metrics(self):
+        '''
+        Returns warm-up counters. *lag* is the age of the oldest write not
+        indexed yet.
+        '''
+        lag = None
+        if self.first_write is not None:
+            lag = time.time() - self.first_write
+
+        return {
+            "enabled": self.started,
+            "running": self.running,
+            "pendingWrites": self.pending_writes,
+            "lag": lag,
+            "lastLag": self.last_lag,
+            "lastDuration": self.last_duration,
+            "warmups": self.warmups
+        }
+
+
+view_warmer = ViewWarmer()
+channel.subscribe("invalidate", view_warmer.on_invalidate_event)
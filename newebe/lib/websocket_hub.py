@@ -0,0 +1,238 @@
+"""
+Broadcast hub for websocket clients.
+
+Events published on the event channel (see newebe.lib.events) are forwarded
+by the hub to the websocket clients subscribed to the event topic. Each
+event is encoded once, whatever the number of clients. Every client gets a
+bounded send queue: when a slow client lets its queue fill up, the oldest
+messages are dropped or the client is disconnected, depending on
+configuration. Paused clients (catching up missed changes) are always
+disconnected instead of losing messages. Clients are pinged regularly and
+closed if they stop answering.
+"""
+
+import time
+import logging
+
+from collections import deque
+
+from tornado.escape import json_encode, utf8
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from newebe.config import CONFIG
+from newebe.lib.events import channel
+
+logger = logging.getLogger("newebe.lib")
+
+TOPICS = ["microposts", "contacts", "activities", "pictures", "changes"]
+
+POLICY_DROP = "drop"
+POLICY_DISCONNECT = "disconnect"
+
+
+def is_topic_list(value):
+    '''
+    True if *value*, read from a client message, is a list of topic names.
+    '''
+    return isinstance(value, list) and \
+        all(isinstance(topic, basestring) for topic in value)
+
+
+class HubClient(object):
+    '''
+    Send queue of a websocket client. *connection* is the websocket handler
+    of the client.
+    '''
+
+    def __init__(self, connection, topics, max_size, paused=False):
+        self.connection = connection
+        self.topics = set(topics)
+        self.queue = deque()
+        self.max_size = max_size
+        self.sending = False
+        self.paused = paused
+        self.last_pong = time.time()
+
+    def is_full(self):
+        return len(self.queue) >= self.max_size
+
+    def push(self, data):
+        '''
+        Adds *data* to send queue then sends it if connection is ready.
+        '''
+        self.queue.append(data)
+        self.flush()
+
+    def drop_oldest(self):
+        self.queue.popleft()
+
+    def flush(self):
+        '''
+        Writes next queued message. Only one message is buffered by the
+        connection stream at a time, others wait in the bounded queue.
+        Nothing is written while client is paused.
+        '''
+        if not self.sending and not self.paused and self.queue:
+            self.sending = True
+            self.connection.write_message(self.queue.popleft())
+            self.connection.stream.write(b"", self.on_flushed)
+
+    def on_flushed(self):
+        self.sending = False
+        self.flush()
+
+
+class WebsocketHub(object):
+    '''
+    Keeps track of connected websocket clients and broadcasts events to
+    them.
+    '''
+
+    def __init__(self):
+        self.clients = dict()
+        self.sent = 0
+        self.dropped = 0
+        self.disconnected = 0
+        self.pinger = None
+
+    def register(self, connection, topics, paused=False):
+        '''
+        Registers websocket *connection* as subscriber to *topics*. If
+        *paused* is True, events are queued until client is resumed.
+        '''
+        self.clients[connection] = HubClient(
+            connection, topics, CONFIG.main.websocket_queue_size, paused)
+
+        if self.pinger is None:
+            self.pinger = PeriodicCallback(
+                self.ping_clients,
+                CONFIG.main.websocket_ping_interval * 1000,
+                io_loop=IOLoop.instance())
+            self.pinger.start()
+
+    def resume(self, connection):
+        '''
+        Sends events queued while *connection* was paused.
+        '''
+        client = self.clients.get(connection)
+        if client is not None:
+            client.paused = False
+            client.flush()
+
+    def unregister(self, connection):
+        '''
+        Removes *connection* from hub clients.
+        '''
+        if connection in self.clients:
+            del self.clients[connection]
+
+    def subscribe(self, connection, topics):
+        client = self.clients.get(connection)
+        if client is not None:
+            client.topics.update(
+                [topic for topic in topics if topic in TOPICS])
+
+    def unsubscribe(self, connection, topics):
+        client = self.clients.get(connection)
+        if client is not None:
+            client.topics.difference_update(topics)
+
+    def broadcast(self, topic, message):
+        '''
+        Sends *message* (a string or a dict) to every client subscribed to
+        *topic*. Message is encoded once for all clients. A client that
+        cannot be written to is disconnected.
+        '''
+        if not isinstance(message, basestring):
+            message = json_encode(message)
+        data = utf8(message)
+
+        for client in self.clients.values():
+            if topic in client.topics:
+                if client.is_full():
+                    # Paused clients are catching up from a sequence: they
+                    # reconnect from it rather than silently miss events.
+                    if client.paused or \
+                            CONFIG.main.websocket_queue_policy == \
+                            POLICY_DISCONNECT:
+                        self.disconnect(client, "send queue is full")
+                        continue
+                    client.drop_oldest()
+                    self.dropped += 1
+
+                try:
+                    client.push(data)
+                except Exception:
+                    # Other clients must still get the message.
+                    logger.exception("Websocket message cannot be sent")
+                    self.disconnect(client, "message cannot be sent")
+                    continue
+                self.sent += 1
+
+    def disconnect(self, client, reason):
+        '''
+        Closes connection of given client.
+        '''
+        logger.info("Websocket client disconnected: %s" % reason)
+        self.unregister(client.connection)
+        self.disconnected += 1
+        try:
+            client.connection.close()
+        except Exception:
+            logger.warning("Websocket connection cannot be closed properly")
+
+    def on_pong(self, connection):
+        client = self.clients.get(connection)
+        if client is not None:
+            client.last_pong = time.time()
+
+    def ping_clients(self):
+        '''
+        Pings every client. Clients that did not answer to the two previous
+        pings or that cannot be pinged are disconnected.
+        '''
+        timeout = time.time() - 2 * CONFIG.main.websocket_ping_interval
+        for client in self.clients.values():
+            if client.last_pong < timeout:
+                self.disconnect(client, "no pong received")
+            else:
+                try:
+                    client.connection.ping(b"newebe")
+                except Exception:
+                    # Other clients must still be pinged.
+                    logger.exception("Websocket ping cannot be sent")
+                    self.disconnect(client, "ping cannot be sent")
+
+    def metrics(self):
+        '''
+        Returns counters describing hub state.
+        '''
+        topics = dict((topic, 0) for topic in TOPICS)
+        queued = 0
+        for client in self.clients.values():
+            queued += len(client.queue)
+            for topic in client.topics:
+                topics[topic] += 1
+
+        return {
+            "clients": len(self.clients),
+            "topics": topics,
+            "queued": queued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "disconnected": self.disconnected
+        }
+
+
+hub = WebsocketHub()
+
+
+def broadcast_event(topic):
+    '''
+    Returns a channel subscriber that broadcasts events of *topic* to hub
+    clients.
+    '''
+    return lambda message: hub.broadcast(topic, message)
+
+for topic in TOPICS:
+    channel.subscribe(topic, broadcast_event(topic))
@@ -1,16 +1,31 @@
 #!/usr/bin/python
 
+import time
 import logging
+import socket
 import sys, os
 
+from contextlib import contextmanager
+
 from tornado.ioloop import IOLoop
 from tornado.httpserver import HTTPServer
-from tornado.web import Application
+from tornado.web import Application, ChunkedTransferEncoding
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes, task_id, cpu_count
 
 sys.path.append("../")
-from newebe.config import CONFIG
+from newebe.config import CONFIG, load_config
 from newebe.routes import routes
 from newebe.tools.syncdb import CouchdbkitHandler
+from newebe.lib.events import channel
+from newebe.lib.changes import changes_watcher
+from newebe.lib.view_warmer import view_warmer
+from newebe.lib.prefetcher import prefetcher
+from newebe.lib.rate_limit import rate_limiter
+from newebe.lib.gzip_util import NewebeGZipContentEncoding
+from newebe.lib.memory_couchdb import is_memory_uri
+from newebe.lib.lazy_handler import set_routes, get_handler
+from newebe.lib import assets
 
 import newebe
 
@@ -33,19 +48,105 @@ class Newebe(Application):
 
         settings = {
           "static_path": path,
+          "static_handler_class": assets.NewebeStaticFileHandler,
           "cookie_secret": CONFIG.security.cookie_key,
           "login_url": "/#login",
         }
+        transforms = [ChunkedTransferEncoding]
+        if CONFIG.main.gzip:
+            transforms.insert(0, NewebeGZipContentEncoding)
+
+        # Hashed copies of assets are built outside of the package, which
+        # may not be writable.
+        dist_path = assets.get_dist_path()
+        app_routes = routes + [
+            (r"/%s/(.*)" % assets.DIST_FOLDER,
+             assets.NewebeStaticFileHandler,
+             {"path": dist_path, "hashed": True})
+        ]
+
+        # Request metrics are labelled with route patterns.
+        set_routes(app_routes)
         Application.__init__(self,
-                             routes,
+                             app_routes,
+                             transforms=transforms,
                              debug=CONFIG.main.debug,
                              **settings)
 
+        # In debug mode, assets and templates are reloaded when modified.
+        if not CONFIG.main.debug:
+            assets.build_assets(path, dist_path)
+            assets.precompile_templates(app_routes)
+
 def init_db():
     couchdbkit_handler = CouchdbkitHandler()
-    couchdbkit_handler.sync_all_app(CONFIG.db.uri,
-                                    CONFIG.db.name,
-                                    CONFIG.db.views)
+    pushed = couchdbkit_handler.sync_all_app(CONFIG.db.uri,
+                                             CONFIG.db.name,
+                                             CONFIG.db.views)
+    logger.info("Design documents pushed: %s." % (", ".join(pushed) or "none"))
+
+
+@contextmanager
+def startup_phase(name):
+    '''
+    Logs duration of a startup phase.
+    '''
+    start = time.time()
+    yield
+    logger.info("Startup phase %s done in %.2fs." %
+                (name, time.time() - start))
+
+def bind_reuseport_socket(port):
+    '''
+    Binds a listening socket with SO_REUSEPORT option: each worker gets its
+    own socket on the same port and the kernel balances connections among
+    them.
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setblocking(0)
+    sock.bind(("", port))
+    sock.listen(128)
+    return [sock]
+
+
+def start_workers(nb_workers):
+    '''
+    Forks *nb_workers* processes (one per CPU if *nb_workers* is 0) that
+    serve Newebe on the same port. Parent process stays as supervisor and
+    restarts workers that die. Returns listening sockets of current worker.
+    '''
+    if hasattr(socket, "SO_REUSEPORT"):
+        fork_processes(nb_workers)
+        sockets = bind_reuseport_socket(CONFIG.main.port)
+    else:
+        sockets = bind_sockets(CONFIG.main.port)
+        fork_processes(nb_workers)
+
+    if nb_workers == 0:
+        nb_workers = cpu_count()
+    channel.start(task_id(), nb_workers)
+    return sockets
+
+
+def start_metrics_server(ssl_options):
+    '''
+    Serves metrics of current worker on its own port (metrics port plus
+    worker number). On the main port, a scrape only gets metrics of the
+    worker that accepts the connection.
+    '''
+    metrics_routes = [('/metrics/$', get_handler("core.MetricsHandler"))]
+    set_routes(metrics_routes)
+    metrics_app = Application(metrics_routes,
+                              cookie_secret=CONFIG.security.cookie_key,
+                              login_url="/#login")
+    port = CONFIG.main.metrics_port + channel.worker_id
+    metrics_server = HTTPServer(metrics_app, ssl_options=ssl_options)
+    metrics_server.listen(port)
+    logger.info("Serves metrics of worker %d on port %d." %
+                (channel.worker_id, port))
+
 
 class NewebeIOLoop(IOLoop):
     '''
@@ -62,10 +163,14 @@ if __name__ == '__main__':
     as a Newebe instance.
     '''
 
+    load_config()
+
     # Application server setup
     logger = logging.getLogger("newebe")
     logger.info("Sets up application server.")
-    tornado_app = Newebe()
+    startup = time.time()
+    with startup_phase("application setup"):
+        tornado_app = Newebe()
 
     if not CONFIG.main.debug:
         # Send log ouptut to a file.
@@ -80,8 +185,17 @@ if __name__ == '__main__':
         logger.addHandler(hdlr)
         logger.setLevel(logging.INFO)
 
+    # In-memory database starts empty and lives in this process only.
+    memory_db = is_memory_uri(CONFIG.db.uri)
+    if memory_db and CONFIG.main.workers != 1:
+        logger.warning("In-memory database cannot be shared by workers, "
+                       "Newebe runs a single worker.")
+        CONFIG.main.workers = 1
+
+    if not CONFIG.main.debug or memory_db:
         # Sync Couch DB views
-        init_db()
+        with startup_phase("design documents sync"):
+            init_db()
 
     try:
         # SSL mode only in production
@@ -102,17 +216,38 @@ if __name__ == '__main__':
             ssl_options = None
 
         # Server running.
-        http_server = HTTPServer(tornado_app, xheaders=True,
-                                 ssl_options = ssl_options)
+        if CONFIG.main.workers != 1 and not CONFIG.main.debug:
+            sockets = start_workers(CONFIG.main.workers)
+            http_server = HTTPServer(tornado_app, xheaders=True,
+                                     ssl_options = ssl_options)
+            http_server.add_sockets(sockets)
+            logger.info("Starts Newebe worker %d on port %d." %
+                        (task_id(), CONFIG.main.port))
 
-        http_server.listen(CONFIG.main.port)
-        logger.info("Starts Newebe on port %d." % CONFIG.main.port)
+        else:
+            http_server = HTTPServer(tornado_app, xheaders=True,
+                                     ssl_options = ssl_options)
+            http_server.listen(CONFIG.main.port)
+            logger.info("Starts Newebe on port %d." % CONFIG.main.port)
+        if CONFIG.main.metrics_port:
+            start_metrics_server(ssl_options)
+        logger.info("Newebe started in %.2fs." % (time.time() - startup))
         ioloop = NewebeIOLoop.instance()
+        rate_limiter.start()
+        if channel.is_main_worker():
+            ioloop.add_callback(changes_watcher.start)
+            if not CONFIG.main.debug:
+                view_warmer.start()
+                ioloop.add_callback(view_warmer.warm)
+            if CONFIG.main.prefetch:
+                prefetcher.start()
         ioloop.start()
 
 
     except KeyboardInterrupt, e:
+        changes_watcher.stop()
         ioloop.stop()
+        channel.close()
         print ""
         logger.info("Server stopped.")
 
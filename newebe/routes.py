@@ -1,117 +1,141 @@
 import sys
 sys.path.append("../")
 
-from newebe.apps.contacts import handlers as contacts
-from newebe.apps.profile import handlers as profile
-from newebe.apps.auth import handlers as auth
-from newebe.apps.news import handlers as news
-from newebe.apps.activities import handlers as activities
-from newebe.apps.notes import handlers as notes
-from newebe.apps.pictures import handlers as pictures
-from newebe.apps.commons import handlers as commons
-from newebe.apps.core import handlers as core
-from newebe.apps.sync import handlers as sync
+from newebe.lib.lazy_handler import get_handler
 
 
 routes = [
-    ('/', core.IndexTHandler),
-    ('/login/', auth.LoginHandler),
-    ('/login/json/', auth.LoginJsonHandler),
-    ('/logout/', auth.LogoutHandler),
-    ('/register/', auth.RegisterTHandler),
-    ('/register/password/', auth.RegisterPasswordTHandler),
-    ('/register/password/content/', auth.RegisterPasswordContentTHandler),
-    ('/user/password/', auth.UserPasswordHandler),
-    ('/user/state/', auth.UserStateHandler),
+    ('/', get_handler("core.IndexTHandler")),
+    ('/publisher/$', get_handler("core.NewebePublishingHandler")),
+    ('/publisher/metrics/$', get_handler("core.PublisherMetricsHandler")),
+    ('/db/metrics/$', get_handler("core.DatabaseMetricsHandler")),
+    ('/downloads/$', get_handler("core.DownloadsHandler")),
+    ('/metrics/$', get_handler("core.MetricsHandler")),
+    ('/profiler/sample/$', get_handler("core.ProfilerSamplingHandler")),
+    ('/profiler/requests/$', get_handler("core.ProfilerRequestsHandler")),
+    ('/changes/publisher/$', get_handler("core.ChangesPublishingHandler")),
+    ('/login/', get_handler("auth.LoginHandler")),
+    ('/login/json/', get_handler("auth.LoginJsonHandler")),
+    ('/logout/', get_handler("auth.LogoutHandler")),
+    ('/register/', get_handler("auth.RegisterTHandler")),
+    ('/register/password/', get_handler("auth.RegisterPasswordTHandler")),
+    ('/register/password/content/',
+        get_handler("auth.RegisterPasswordContentTHandler")),
+    ('/user/password/', get_handler("auth.UserPasswordHandler")),
+    ('/user/state/', get_handler("auth.UserStateHandler")),
 
-    ('/user/$', profile.UserHandler),
-    ('/user/picture$', profile.ProfilePictureHandler),
-    ('/user/picture.jpg$', profile.ProfilePictureHandler),
+    ('/user/$', get_handler("profile.UserHandler")),
+    ('/user/picture$', get_handler("profile.ProfilePictureHandler")),
+    ('/user/picture.jpg$', get_handler("profile.ProfilePictureHandler")),
 
-    ('/contacts/update-profile/$', contacts.ContactUpdateHandler),
+    ('/contacts/update-profile/$',
+        get_handler("contacts.ContactUpdateHandler")),
     ('/contacts/update-profile/picture/$',
-        contacts.ContactPictureUpdateHandler),
-    ('/contacts/pending/$', contacts.ContactsPendingHandler),
-    ('/contacts/requested/$', contacts.ContactsRequestedHandler),
-    ('/contacts/trusted/$', contacts.ContactsTrustedHandler),
-    ('/contacts/confirm/$', contacts.ContactConfirmHandler),
-    ('/contacts/request/$', contacts.ContactPushHandler),
-    ('/contacts/publisher/', contacts.ContactPublishingHandler),
-    ('/contacts/tags/$', contacts.ContactTagsHandler),
-    ('/contacts/tags/([0-9A-Za-z-]+)$', contacts.ContactTagsHandler),
-    ('/contacts/$', contacts.ContactsHandler),
-    ('/contacts/([0-9A-Za-z-]+)/retry/$', contacts.ContactRetryHandler),
-    ('/contacts/([0-9A-Za-z-]+)/tags/$', contacts.ContactTagHandler),
-    ('/contacts/([0-9A-Za-z-]+)$', contacts.ContactHandler),
+        get_handler("contacts.ContactPictureUpdateHandler")),
+    ('/contacts/pending/$', get_handler("contacts.ContactsPendingHandler")),
+    ('/contacts/requested/$',
+        get_handler("contacts.ContactsRequestedHandler")),
+    ('/contacts/trusted/$', get_handler("contacts.ContactsTrustedHandler")),
+    ('/contacts/health/$', get_handler("contacts.ContactsHealthHandler")),
+    ('/contacts/limits/$', get_handler("contacts.ContactsLimitsHandler")),
+    ('/contacts/confirm/$', get_handler("contacts.ContactConfirmHandler")),
+    ('/contacts/request/$', get_handler("contacts.ContactPushHandler")),
+    ('/contacts/publisher/', get_handler("contacts.ContactPublishingHandler")),
+    ('/contacts/tags/$', get_handler("contacts.ContactTagsHandler")),
+    ('/contacts/tags/([0-9A-Za-z-]+)$',
+        get_handler("contacts.ContactTagsHandler")),
+    ('/contacts/$', get_handler("contacts.ContactsHandler")),
+    ('/contacts/([0-9A-Za-z-]+)/retry/$',
+        get_handler("contacts.ContactRetryHandler")),
+    ('/contacts/([0-9A-Za-z-]+)/tags/$',
+        get_handler("contacts.ContactTagHandler")),
+    ('/contacts/([0-9A-Za-z-]+)$', get_handler("contacts.ContactHandler")),
 
-    ('/activities/', activities.ActivityPageHandler),
-    ('/activities/content/', activities.ActivityContentHandler),
-    ('/activities/all/', activities.ActivityHandler),
-    ('/activities/all/([0-9\-]+)/', activities.ActivityHandler),
-    ('/activities/mine/', activities.MyActivityHandler),
-    ('/activities/mine/([0-9\-]+)/', activities.MyActivityHandler),
+    ('/activities/', get_handler("activities.ActivityPageHandler")),
+    ('/activities/content/', get_handler("activities.ActivityContentHandler")),
+    ('/activities/all/', get_handler("activities.ActivityHandler")),
+    ('/activities/all/([0-9\-]+)/', get_handler("activities.ActivityHandler")),
+    ('/activities/mine/', get_handler("activities.MyActivityHandler")),
+    ('/activities/mine/([0-9\-]+)/',
+        get_handler("activities.MyActivityHandler")),
 
-    ('/synchronize/', sync.SynchronizeHandler),
-    ('/synchronize/contact/', sync.SynchronizeContactHandler),
+    ('/synchronize/', get_handler("sync.SynchronizeHandler")),
+    ('/synchronize/contact/', get_handler("sync.SynchronizeContactHandler")),
+    ('/synchronize/contact/changes/',
+        get_handler("sync.SynchronizeChangesHandler")),
+    ('/synchronize/contact/batch/',
+        get_handler("sync.SynchronizeBatchHandler")),
 
-    ('/microposts/all/$', news.NewsHandler),
-    ('/microposts/all/([0-9\-]+)/$', news.NewsHandler),
-    ('/microposts/all/([0-9\-]+)/tags/([0-9a-z]+)/$', news.NewsHandler),
-    ('/microposts/mine/([0-9\-]+)/$', news.MyNewsHandler),
-    ('/microposts/mine/([0-9\-]+)/tags/([0-9a-z]+)/$', news.MyNewsHandler),
-    ('/microposts/mine/$', news.MyNewsHandler),
-    ('/microposts/contacts/$', news.NewsContactHandler),
-    ('/microposts/contacts/attach/$', news.MicropostContactAttachedFileHandler),
-    ('/microposts/$', news.NewsTHandler),
-    ('/microposts/publisher/', news.MicropostPublishingHandler),
-    ('/microposts/content/$', news.NewsContentTHandler),
-    ('/microposts/tutorial/1/$', news.NewsTutorial1THandler),
-    ('/microposts/tutorial/2/$', news.NewsTutorial2THandler),
-    ('/microposts/search/$', news.NewsSearchHandler),
-    ('/microposts/([0-9a-z]+)/retry/$', news.NewsRetryHandler),
-    ('/microposts/([0-9a-z]+)/$', news.MicropostHandler),
-    ('/microposts/([0-9a-z]+)/html/$', news.MicropostTHandler),
+    ('/microposts/all/$', get_handler("news.NewsHandler")),
+    ('/microposts/all/([0-9\-]+)/$', get_handler("news.NewsHandler")),
+    ('/microposts/all/([0-9\-]+)/tags/([0-9a-z]+)/$',
+        get_handler("news.NewsHandler")),
+    ('/microposts/mine/([0-9\-]+)/$', get_handler("news.MyNewsHandler")),
+    ('/microposts/mine/([0-9\-]+)/tags/([0-9a-z]+)/$',
+        get_handler("news.MyNewsHandler")),
+    ('/microposts/mine/$', get_handler("news.MyNewsHandler")),
+    ('/microposts/contacts/$', get_handler("news.NewsContactHandler")),
+    ('/microposts/contacts/attach/$',
+        get_handler("news.MicropostContactAttachedFileHandler")),
+    ('/microposts/$', get_handler("news.NewsTHandler")),
+    ('/microposts/publisher/', get_handler("news.MicropostPublishingHandler")),
+    ('/microposts/content/$', get_handler("news.NewsContentTHandler")),
+    ('/microposts/tutorial/1/$', get_handler("news.NewsTutorial1THandler")),
+    ('/microposts/tutorial/2/$', get_handler("news.NewsTutorial2THandler")),
+    ('/microposts/search/$', get_handler("news.NewsSearchHandler")),
+    ('/microposts/([0-9a-z]+)/retry/$', get_handler("news.NewsRetryHandler")),
+    ('/microposts/([0-9a-z]+)/$', get_handler("news.MicropostHandler")),
+    ('/microposts/([0-9a-z]+)/html/$', get_handler("news.MicropostTHandler")),
     ('/microposts/([0-9a-z]+)/attach/download/$',
-        news.MicropostDlAttachedFileHandler),
+        get_handler("news.MicropostDlAttachedFileHandler")),
     ('/microposts/([0-9a-z]+)/attach/(.+)$',
-        news.MicropostAttachedFileHandler),
+        get_handler("news.MicropostAttachedFileHandler")),
 
-    ('/notes/all/', notes.NotesHandler),
-    ('/notes/all/order-by-title/', notes.NotesHandler),
-    ('/notes/all/order-by-date/', notes.NotesByDateHandler),
-    ('/notes/all/([0-9a-z]+)', notes.NoteHandler),
+    ('/notes/all/', get_handler("notes.NotesHandler")),
+    ('/notes/all/order-by-title/', get_handler("notes.NotesHandler")),
+    ('/notes/all/order-by-date/', get_handler("notes.NotesByDateHandler")),
+    ('/notes/all/([0-9a-z]+)', get_handler("notes.NoteHandler")),
 
-    ('/pictures/all/$', pictures.PicturesHandler),
-    ('/pictures/all/([0-9\-]+)/$', pictures.PicturesHandler),
-    ('/pictures/all/([0-9\-]+)/tags/([0-9a-z]+)/$', pictures.PicturesHandler),
-    ('/pictures/mine/$', pictures.PicturesMyHandler),
-    ('/pictures/mine/([0-9\-]+)/$', pictures.PicturesMyHandler),
+    ('/pictures/all/$', get_handler("pictures.PicturesHandler")),
+    ('/pictures/all/([0-9\-]+)/$', get_handler("pictures.PicturesHandler")),
+    ('/pictures/all/([0-9\-]+)/tags/([0-9a-z]+)/$',
+        get_handler("pictures.PicturesHandler")),
+    ('/pictures/mine/$', get_handler("pictures.PicturesMyHandler")),
+    ('/pictures/mine/([0-9\-]+)/$', get_handler("pictures.PicturesMyHandler")),
     ('/pictures/mine/([0-9\-]+)/tags/([0-9a-z]+)/$',
-        pictures.PicturesMyHandler),
-    ('/pictures/fileuploader/$', pictures.PicturesQQHandler),
-    ('/pictures/contact/$', pictures.PictureContactHandler),
-    ('/pictures/contact/download/$', pictures.PictureContactDownloadHandler),
-    ('/pictures/([0-9a-z]+)$', pictures.PictureHandler),
-    ('/pictures/([0-9a-z]+)/retry/$', pictures.PictureRetryHandler),
-    ('/pictures/([0-9a-z]+)/download/$', pictures.PictureDownloadHandler),
-    ('/pictures/([0-9a-z]+)/rotate/$', pictures.PictureRotateHandler),
-    ('/pictures/([0-9a-z]+)/(.+)', pictures.PictureFileHandler),
+        get_handler("pictures.PicturesMyHandler")),
+    ('/pictures/fileuploader/$', get_handler("pictures.PicturesQQHandler")),
+    ('/pictures/contact/$', get_handler("pictures.PictureContactHandler")),
+    ('/pictures/contact/download/$',
+        get_handler("pictures.PictureContactDownloadHandler")),
+    ('/pictures/([0-9a-z]+)$', get_handler("pictures.PictureHandler")),
+    ('/pictures/([0-9a-z]+)/retry/$',
+        get_handler("pictures.PictureRetryHandler")),
+    ('/pictures/([0-9a-z]+)/download/$',
+        get_handler("pictures.PictureDownloadHandler")),
+    ('/pictures/([0-9a-z]+)/rotate/$',
+        get_handler("pictures.PictureRotateHandler")),
+    ('/pictures/([0-9a-z]+)/(.+)', get_handler("pictures.PictureFileHandler")),
 
-    ('/commons/all/([0-9\-]+)/tags/([0-9a-z]+)/$', commons.CommonsHandler),
-    ('/commons/all/$', commons.CommonsHandler),
-    ('/commons/all/html/$', commons.CommonRowsTHandler),
-    ('/commons/all/([0-9\-]+)/$', commons.CommonsHandler),
-    ('/commons/mine/$', commons.CommonsMyHandler),
-    ('/commons/mine/([0-9\-]+)/$', commons.CommonsMyHandler),
+    ('/commons/all/([0-9\-]+)/tags/([0-9a-z]+)/$',
+        get_handler("commons.CommonsHandler")),
+    ('/commons/all/$', get_handler("commons.CommonsHandler")),
+    ('/commons/all/html/$', get_handler("commons.CommonRowsTHandler")),
+    ('/commons/all/([0-9\-]+)/$', get_handler("commons.CommonsHandler")),
+    ('/commons/mine/$', get_handler("commons.CommonsMyHandler")),
+    ('/commons/mine/([0-9\-]+)/$', get_handler("commons.CommonsMyHandler")),
     ('/commons/mine/([0-9\-]+)/tags/([0-9a-z]+)/$',
-        commons.CommonsMyHandler),
-    ('/commons/fileuploader/$', commons.CommonsQQHandler),
-    ('/commons/contact/$', commons.CommonContactHandler),
-    ('/commons/contact/download/$', commons.CommonContactDownloadHandler),
-    ('/commons/content/$', commons.CommonsContentTHandler),
-    ('/commons/([0-9a-z]+)/$', commons.CommonHandler),
-    ('/commons/([0-9a-z]+)/retry/$', commons.CommonRetryHandler),
-    ('/commons/([0-9a-z]+)/download/$', commons.CommonDownloadHandler),
-    ('/commons/([0-9a-z]+)/(.+)', commons.CommonFileHandler),
-    ('/commons/$', commons.CommonsTHandler),
+        get_handler("commons.CommonsMyHandler")),
+    ('/commons/fileuploader/$', get_handler("commons.CommonsQQHandler")),
+    ('/commons/contact/$', get_handler("commons.CommonContactHandler")),
+    ('/commons/contact/download/$',
+        get_handler("commons.CommonContactDownloadHandler")),
+    ('/commons/content/$', get_handler("commons.CommonsContentTHandler")),
+    ('/commons/([0-9a-z]+)/$', get_handler("commons.CommonHandler")),
+    ('/commons/([0-9a-z]+)/retry/$',
+        get_handler("commons.CommonRetryHandler")),
+    ('/commons/([0-9a-z]+)/download/$',
+        get_handler("commons.CommonDownloadHandler")),
+    ('/commons/([0-9a-z]+)/(.+)', get_handler("commons.CommonFileHandler")),
+    ('/commons/$', get_handler("commons.CommonsTHandler")),
 ]
@@ -0,0 +1,59 @@
+"""
+Tool to render markdown content of microposts and notes saved before their
+HTML was stored inside documents. Documents are updated by batches with
+bulk requests.
+
+Run it from the newebe folder while CouchDB is running:
+
+    python tools/render_markdown.py [--force]
+"""
+
+import sys
+sys.path.append("../")
+
+from tornado.options import define, options
+
+define('force', default=False,
+       help="Render again documents of which HTML is already stored")
+define('batch', default=200, help="Number of documents saved per request")
+
+from couchdbkit import Server
+from newebe.config import CONFIG, load_config
+from newebe.lib import markdown_util
+
+VIEWS = ["news/all", "notes/mine"]
+
+
+def render_documents(db, view, batch_size, force=False):
+    '''
+    Renders content of documents returned by *view* and saves them by
+    batches of *batch_size*. Returns the number of updated documents.
+    '''
+    docs = []
+    nb_docs = 0
+    for row in db.view(view):
+        doc = row["value"]
+        if force or "htmlContent" not in doc:
+            # Notes are written by the owner, their raw HTML is kept.
+            doc["htmlContent"] = markdown_util.render(
+                doc.get("content"), escape=doc.get("doc_type") != "Note")
+            docs.append(doc)
+
+        if len(docs) >= batch_size:
+            db.save_docs(docs)
+            nb_docs += len(docs)
+            docs = []
+
+    if docs:
+        db.save_docs(docs)
+        nb_docs += len(docs)
+    return nb_docs
+
+
+if __name__ == '__main__':
+    load_config()
+    db = Server(CONFIG.db.uri).get_db(CONFIG.db.name)
+
+    for view in VIEWS:
+        nb_docs = render_documents(db, view, options.batch, options.force)
+        print "%d documents of `%s` rendered." % (nb_docs, view)
@@ -6,16 +6,24 @@ Code adapted from Django Coucdhbkit handler.
 """
 
 import sys
-from os.path import dirname, join, isdir
+import hashlib
+import importlib
+from os import walk
+from os.path import dirname, join, isdir, relpath
 sys.path.append("../")
 
 from couchdbkit import Server
 from couchdbkit import push
-from couchdbkit.resource import CouchdbResource
-from newebe.config import CONFIG
+from couchdbkit.exceptions import ResourceNotFound
+from newebe.config import CONFIG, load_config
+from newebe.lib.couchdb_util import get_resource
 
 COUCHDB_TIMEOUT = 300
 
+# Design document field that stores hash of the design folder it was pushed
+# from.
+HASH_FIELD = "newebe_hash"
+
 class CouchdbkitHandler(object):
 
     # share state between instances
@@ -32,46 +40,86 @@ class CouchdbkitHandler(object):
 
     def sync_all_app(self, uri, dbname, views):
         '''
-        Create a database session for each databases, then start the syncing
-        process.
-        Databases are described by tuples containing the application name and
-        the database URL in which views must be synchronized.
+        Create a database session, then start the syncing process for each
+        application. Returns the name of design documents that were pushed.
         @param uri: Uri of the couchdb server
         @param dbname: Database name
-        @param views: Name of the views
+        @param views: Module names of applications
         '''
+        res = get_resource(uri, timeout=COUCHDB_TIMEOUT)
+        server = Server(uri, resource_instance=res)
+        db = server.get_or_create_db(dbname)
+
+        pushed = []
         for view in views:
-            res = CouchdbResource(uri, timeout=COUCHDB_TIMEOUT)
-            server = Server(uri, resource_instance=res)
-            self.sync(server, dbname, view, views[view])
+            if self.sync(db, view, importlib.import_module(view)):
+                pushed.append(view.split(".")[-1])
+        return pushed
+
+    def get_design_path(self, module):
+        '''
+        Returns _design folder of application *module*.
+        '''
+        return join(dirname(module.__file__), "_design")
+
+    def get_design_hash(self, design_path):
+        '''
+        Returns a hash of every file (names and contents) of *design_path*
+        folder.
+        '''
+        design_hash = hashlib.sha1()
+        for dirpath, dirnames, filenames in sorted(walk(design_path)):
+            for filename in sorted(filenames):
+                path = join(dirpath, filename)
+                design_hash.update(relpath(path, design_path))
+                with open(path, "rb") as design_file:
+                    design_hash.update(design_file.read())
+        return design_hash.hexdigest()
 
-    def sync(self, server, dbname, view, module, verbosity=2):
+    def sync(self, db, view, module, verbosity=2):
         """
-        Used to sync views of all applications and eventually create
-        database.
-        @param server: couchdb server object
-        @param dbname: name of the database
+        Used to sync views of an application. Design document is pushed
+        only if design folder changed since last push: pushing a design
+        document makes CouchDB rebuild its view indexes. Returns True if
+        design document was pushed.
+        @param db: couchdb database object
         @param view: 'view' name
         @param module: module, provided here to calculate each view's
         _design/ path.
         """
-        print "Sync `%s` in CouchDB server." % view
-        db = server.get_or_create_db(dbname)
-
-        app_module_path = module.__name__
-        app_name = app_module_path.split(".")[-1]
-        app_dir = dirname(module.__file__)
-        design_path = join(app_dir, "_design")
+        app_name = module.__name__.split(".")[-1]
+        design_path = self.get_design_path(module)
+        docid = "_design/%s" % app_name
 
         if not isdir(design_path):
             print >> sys.stderr,  \
                  "%s doesn't exists, doc wasn't synchronized" % design_path
-        else:
-            push(design_path, db, force=True, docid="_design/%s" % app_name)
+            return False
+
+        design_hash = self.get_design_hash(design_path)
+        try:
+            design_doc = db.open_doc(docid)
+        except ResourceNotFound:
+            design_doc = {}
+
+        if design_doc.get(HASH_FIELD) == design_hash:
+            print "`%s` is up to date." % view
+            return False
+
+        print "Sync `%s` in CouchDB server." % view
+        push(design_path, db, force=True, docid=docid)
+
+        # Changing a field that is not a view does not rebuild indexes.
+        design_doc = db.open_doc(docid)
+        design_doc[HASH_FIELD] = design_hash
+        db.save_doc(design_doc)
 
         print "Sync of `%s` done." % view
+        return True
+
 
 if __name__ == '__main__':
+    load_config()
     couchdbkit_handler = CouchdbkitHandler()
     couchdbkit_handler.sync_all_app(CONFIG.db.uri,
                                     CONFIG.db.name,